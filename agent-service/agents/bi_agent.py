@@ -562,7 +562,7 @@ async def generate_bi_report(store_id: str, db_conn=None) -> bool:
     """
     import json
     import anthropic
-    from telegram import Bot
+    from agents.telegram_outbound import PRIORITY_REPORT, outbound
 
     supabase = db_conn or _get_supabase()
 
@@ -658,8 +658,9 @@ Format as a clear Telegram message with emojis. Keep it under 500 words."""
         if not bot_token:
             logger.error("generate_bi_report: OWNER_BOT_TOKEN not set")
             return False
-        bot = Bot(token=bot_token)
-        await bot.send_message(chat_id=chat_id, text=final_report, parse_mode="Markdown")
+        await outbound.send(
+            bot_token, chat_id, final_report, priority=PRIORITY_REPORT, parse_mode="Markdown"
+        )
         logger.info("BI report sent to store %s", store_id)
         return True
     except Exception as exc:
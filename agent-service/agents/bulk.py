@@ -0,0 +1,18 @@
+"""
+Bulk Query Helpers
+Chunking shared by the agents' set-based reads and writes.
+"""
+
+from __future__ import annotations
+
+from typing import Iterator
+
+# Max ids per ``in_`` filter / keys per MGET / rows per bulk insert, keeps
+# request URLs and payloads bounded for stores with thousands of rows
+BULK_CHUNK_SIZE = 500
+
+
+def chunks(items: list, size: int = BULK_CHUNK_SIZE) -> Iterator[list]:
+    """Consecutive slices of ``items`` with at most ``size`` elements."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
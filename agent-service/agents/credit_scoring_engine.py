@@ -0,0 +1,434 @@
+"""
+Bulk Credit Scoring Engine
+Scores every customer of a store from grouped payment/order aggregates
+with NumPy and bulk-writes only the scores and limits that changed.
+Also predicts default risk for a whole store (4.7) and caches the result
+in Redis until the next payment or order event for that store.
+
+The module has no intra-package imports so owner-service can load it
+directly from agent-service/agents (see routers/credit.py).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 4.1 Scoring constants
+BASE_SCORE = 50.0
+PAYMENT_WEIGHT = 30.0          # max +30 / -30
+MAX_FREQUENCY_SCORE = 10.0     # order_count / 2, capped
+MAX_SPENDING_SCORE = 10.0      # total_spent / 1000, capped
+
+# 4.2 Limit tiers
+HIGH_TIER_SCORE, HIGH_TIER_LIMIT = 70.0, 5000.0
+MID_TIER_SCORE, MID_TIER_LIMIT = 50.0, 2000.0
+
+# 4.7 Default-risk weights and thresholds
+DEFAULT_RISK_SCORE = 50.0       # used when a customer has no credit_score yet
+OVERDUE_AFTER_DAYS = 30
+HIGH_RISK_PROBABILITY = 0.6
+MEDIUM_RISK_PROBABILITY = 0.3
+RECOMMENDED_ACTIONS = {
+    "high": "suspend_credit_and_contact_immediately",
+    "medium": "send_firm_reminder_and_monitor",
+    "low": "continue_normal_operations",
+}
+
+# Store-wide risk predictions, invalidated by payment/order events; the TTL
+# is only a safety net for writes that bypass invalidation
+RISK_CACHE_KEY = "credit_risk:{store_id}"
+RISK_CACHE_TTL_SECONDS = 24 * 3600
+
+_cache_client = None
+
+
+def _get_supabase():
+    from supabase import create_client
+    return create_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_KEY"),
+    )
+
+
+def _get_cache():
+    """Lazily create a Redis client (None when Redis is unavailable)."""
+    global _cache_client
+    if _cache_client is None:
+        try:
+            import redis
+            _cache_client = redis.Redis.from_url(
+                os.getenv("REDIS_URL", "redis://localhost:6379"),
+                decode_responses=True,
+            )
+        except Exception as exc:
+            logger.warning("credit risk cache unavailable: %s", exc)
+    return _cache_client
+
+
+# ---------------------------------------------------------------------------
+# Vectorized formula
+# ---------------------------------------------------------------------------
+
+def score_from_aggregates(total_payments, on_time_payments, order_count, total_spent):
+    """
+    Vectorized 4.1 credit score. Accepts scalars or equal-length arrays.
+
+    payment_score = (on_time - late) / total * 30, where late = total - on_time
+    """
+    total = np.asarray(total_payments, dtype=float)
+    on_time = np.asarray(on_time_payments, dtype=float)
+    orders = np.asarray(order_count, dtype=float)
+    spent = np.asarray(total_spent, dtype=float)
+
+    payment_score = np.where(
+        total > 0,
+        (2 * on_time - total) / np.maximum(total, 1.0) * PAYMENT_WEIGHT,
+        0.0,
+    )
+    frequency_score = np.minimum(orders / 2, MAX_FREQUENCY_SCORE)
+    spending_score = np.minimum(spent / 1000, MAX_SPENDING_SCORE)
+    return np.clip(BASE_SCORE + payment_score + frequency_score + spending_score, 0.0, 100.0)
+
+
+def limit_from_scores(scores):
+    """Vectorized 4.2 credit limit tiers. Accepts a scalar or an array."""
+    s = np.asarray(scores, dtype=float)
+    return np.where(
+        s >= HIGH_TIER_SCORE,
+        HIGH_TIER_LIMIT,
+        np.where(s >= MID_TIER_SCORE, MID_TIER_LIMIT, 0.0),
+    )
+
+
+def default_probability_from_aggregates(
+    credit_scores, suspended, total_payments, late_payments, overdue_orders
+):
+    """
+    Vectorized 4.7.2 default probability (0-1). Accepts scalars or arrays.
+
+    Missing/zero credit scores count as DEFAULT_RISK_SCORE, matching
+    predict_default_risk.
+    """
+    score = np.asarray(credit_scores, dtype=float)
+    score = np.where(score > 0, score, DEFAULT_RISK_SCORE)
+    is_suspended = np.asarray(suspended, dtype=bool)
+    total = np.asarray(total_payments, dtype=float)
+    late = np.asarray(late_payments, dtype=float)
+    overdue = np.asarray(overdue_orders, dtype=float)
+
+    risk = np.where(score < 40, 0.35, np.where(score < 55, 0.15, 0.0))
+    risk = risk + np.where(is_suspended, 0.30, 0.0)
+
+    late_ratio = late / np.maximum(total, 1.0)
+    risk = risk + np.where(
+        total > 0,
+        np.where(late_ratio > 0.5, 0.25, np.where(late_ratio > 0.25, 0.10, 0.0)),
+        0.05,  # no payment history — slight risk
+    )
+    risk = risk + np.minimum(overdue * 0.10, 0.30)
+    return np.clip(risk, 0.0, 1.0)
+
+
+def risk_indicators_for(credit_score, suspended, total_payments, late_payments, overdue_orders) -> list:
+    """4.7.1 Risk indicators for a single customer."""
+    score = float(credit_score or 0) or DEFAULT_RISK_SCORE
+    indicators = []
+    if score < 40:
+        indicators.append("low_credit_score")
+    elif score < 55:
+        indicators.append("below_average_credit_score")
+    if suspended:
+        indicators.append("credit_currently_suspended")
+    if total_payments:
+        late_ratio = late_payments / total_payments
+        if late_ratio > 0.5:
+            indicators.append("high_late_payment_ratio")
+        elif late_ratio > 0.25:
+            indicators.append("moderate_late_payment_ratio")
+    else:
+        indicators.append("no_payment_history")
+    if overdue_orders:
+        indicators.append(f"overdue_orders_{int(overdue_orders)}")
+    return indicators
+
+
+def risk_level_for(probability: float) -> str:
+    """4.7.3 Flag high-risk customers."""
+    if probability >= HIGH_RISK_PROBABILITY:
+        return "high"
+    if probability >= MEDIUM_RISK_PROBABILITY:
+        return "medium"
+    return "low"
+
+
+# ---------------------------------------------------------------------------
+# Grouped loads
+# ---------------------------------------------------------------------------
+
+def load_store_aggregates(
+    store_id: str,
+    customer_ids: Optional[Iterable[str]] = None,
+    db_conn=None,
+) -> dict:
+    """
+    Load credit inputs for a store (or a subset of its customers) with two
+    grouped queries and return them as aligned NumPy arrays.
+
+    Returns:
+        {
+            "customer_ids": list[str],
+            "credit_score", "credit_limit", "credit_suspended",
+            "order_count", "total_spent",
+            "total_payments", "on_time_payments", "late_payments": np.ndarray,
+        }
+    """
+    supabase = db_conn or _get_supabase()
+    params = {"p_store_id": store_id}
+    if customer_ids is not None:
+        params["p_customer_ids"] = list(customer_ids)
+
+    order_rows = supabase.rpc("credit_order_aggregates", params).execute().data or []
+    payment_rows = supabase.rpc("credit_payment_aggregates", params).execute().data or []
+
+    ids = [row["customer_id"] for row in order_rows]
+    index = {cid: i for i, cid in enumerate(ids)}
+    n = len(ids)
+
+    total_payments = np.zeros(n)
+    on_time_payments = np.zeros(n)
+    late_payments = np.zeros(n)
+    for row in payment_rows:
+        i = index.get(row["customer_id"])
+        if i is None:
+            continue
+        total_payments[i] = row.get("total_payments") or 0
+        on_time_payments[i] = row.get("on_time_payments") or 0
+        late_payments[i] = row.get("late_payments") or 0
+
+    return {
+        "store_id": store_id,
+        "customer_ids": ids,
+        "credit_score": np.array(
+            [r["credit_score"] if r.get("credit_score") is not None else -1 for r in order_rows],
+            dtype=float,
+        ),
+        "credit_limit": np.array([float(r.get("credit_limit") or 0) for r in order_rows]),
+        "credit_suspended": np.array([bool(r.get("credit_suspended")) for r in order_rows], dtype=bool),
+        "order_count": np.array([float(r.get("order_count") or 0) for r in order_rows]),
+        "total_spent": np.array([float(r.get("total_spent") or 0) for r in order_rows]),
+        "total_payments": total_payments,
+        "on_time_payments": on_time_payments,
+        "late_payments": late_payments,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Scoring + bulk write
+# ---------------------------------------------------------------------------
+
+def _score_and_write(aggregates: dict, restore_suspended: bool, db_conn) -> dict:
+    ids = aggregates["customer_ids"]
+    if not ids:
+        return {"customers_scored": 0, "customers_updated": 0, "scores": {}}
+
+    scores = score_from_aggregates(
+        aggregates["total_payments"],
+        aggregates["on_time_payments"],
+        aggregates["order_count"],
+        aggregates["total_spent"],
+    )
+    # Stored as INTEGER (truncated), matching the per-customer path
+    int_scores = scores.astype(int)
+    limits = limit_from_scores(scores)
+
+    changed = (int_scores != aggregates["credit_score"]) | (limits != aggregates["credit_limit"])
+    restore = aggregates["credit_suspended"] & restore_suspended
+    to_write = np.flatnonzero(changed | restore)
+
+    updates = [
+        {
+            "id": ids[i],
+            "credit_score": int(int_scores[i]),
+            "credit_limit": float(limits[i]),
+            "credit_suspended": False if restore[i] else None,
+        }
+        for i in to_write
+    ]
+    if updates:
+        db_conn.rpc("apply_credit_scores", {"p_updates": json.dumps(updates)}).execute()
+        invalidate_store_risk(aggregates.get("store_id"))
+        _notify_customers_changed([u["id"] for u in updates])
+
+    return {
+        "customers_scored": len(ids),
+        "customers_updated": len(updates),
+        "restored": [ids[i] for i in np.flatnonzero(restore)],
+        "scores": {
+            ids[i]: {"credit_score": int(int_scores[i]), "credit_limit": float(limits[i])}
+            for i in range(len(ids))
+        },
+    }
+
+
+def rescore_store(store_id: str, db_conn=None) -> dict:
+    """
+    Bulk rescore job: score every customer of a store and write back only
+    changed scores/limits. Costs two grouped reads and at most one write.
+    """
+    supabase = db_conn or _get_supabase()
+    try:
+        aggregates = load_store_aggregates(store_id, db_conn=supabase)
+        result = _score_and_write(aggregates, restore_suspended=False, db_conn=supabase)
+        logger.info(
+            "Credit rescore for store %s: %d scored, %d updated",
+            store_id, result["customers_scored"], result["customers_updated"],
+        )
+        result.pop("restored", None)
+        return {"store_id": store_id, **result}
+    except Exception as exc:
+        logger.error("rescore_store error for store %s: %s", store_id, exc)
+        return {"store_id": store_id, "error": str(exc)}
+
+
+def rescore_customers(
+    store_id: str,
+    customer_ids: Iterable[str],
+    restore_suspended: bool = False,
+    db_conn=None,
+) -> dict:
+    """
+    Incremental update for a handful of customers (e.g. per payment.received).
+
+    Args:
+        restore_suspended: Also clear credit_suspended for suspended customers
+                           (4.6.2 auto-restore after payment).
+
+    Returns the same shape as rescore_store; ``scores`` maps customer_id to
+    {"credit_score", "credit_limit"} and ``restored`` lists restored ids.
+    """
+    supabase = db_conn or _get_supabase()
+    aggregates = load_store_aggregates(store_id, customer_ids=customer_ids, db_conn=supabase)
+    return _score_and_write(aggregates, restore_suspended=restore_suspended, db_conn=supabase)
+
+
+# ---------------------------------------------------------------------------
+# 4.7 Store-wide default-risk prediction
+# ---------------------------------------------------------------------------
+
+def load_overdue_counts(store_id: str, ids: list, db_conn) -> np.ndarray:
+    """Unpaid orders older than OVERDUE_AFTER_DAYS per customer, aligned to ids."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=OVERDUE_AFTER_DAYS)).isoformat()
+    rows = (
+        db_conn.rpc(
+            "credit_overdue_aggregates", {"p_store_id": store_id, "p_cutoff": cutoff}
+        ).execute().data
+        or []
+    )
+    index = {cid: i for i, cid in enumerate(ids)}
+    counts = np.zeros(len(ids))
+    for row in rows:
+        i = index.get(row["customer_id"])
+        if i is not None:
+            counts[i] = row.get("overdue_orders") or 0
+    return counts
+
+
+def predict_default_risk_bulk(store_id: str, db_conn=None, cache=None) -> list:
+    """
+    4.7 Predict default risk for every customer of a store.
+
+    Three grouped reads (orders, payments, overdue orders), one vectorized
+    pass, sorted by default_probability (highest first). Results are cached
+    under credit_risk:{store_id} until invalidate_store_risk() is called.
+
+    Returns a list of:
+        {
+            "customer_id", "credit_score", "credit_limit", "credit_suspended",
+            "overdue_orders", "default_probability", "risk_level",
+            "risk_indicators", "recommended_action",
+        }
+    """
+    cache = cache if cache is not None else _get_cache()
+    key = RISK_CACHE_KEY.format(store_id=store_id)
+    if cache is not None:
+        try:
+            cached = cache.get(key)
+            if cached:
+                return json.loads(cached)
+        except Exception as exc:
+            logger.warning("credit risk cache read failed: %s", exc)
+
+    supabase = db_conn or _get_supabase()
+    aggregates = load_store_aggregates(store_id, db_conn=supabase)
+    ids = aggregates["customer_ids"]
+    overdue = load_overdue_counts(store_id, ids, supabase)
+
+    probabilities = np.round(
+        default_probability_from_aggregates(
+            aggregates["credit_score"],
+            aggregates["credit_suspended"],
+            aggregates["total_payments"],
+            aggregates["late_payments"],
+            overdue,
+        ),
+        3,
+    )
+
+    results = []
+    for i in np.argsort(-probabilities, kind="stable"):
+        probability = float(probabilities[i])
+        score = aggregates["credit_score"][i]
+        level = risk_level_for(probability)
+        results.append({
+            "customer_id": ids[i],
+            "credit_score": int(score) if score >= 0 else None,
+            "credit_limit": float(aggregates["credit_limit"][i]),
+            "credit_suspended": bool(aggregates["credit_suspended"][i]),
+            "overdue_orders": int(overdue[i]),
+            "default_probability": probability,
+            "risk_level": level,
+            "risk_indicators": risk_indicators_for(
+                max(score, 0),
+                aggregates["credit_suspended"][i],
+                aggregates["total_payments"][i],
+                aggregates["late_payments"][i],
+                overdue[i],
+            ),
+            "recommended_action": RECOMMENDED_ACTIONS[level],
+        })
+
+    if cache is not None:
+        try:
+            cache.set(key, json.dumps(results), ex=RISK_CACHE_TTL_SECONDS)
+        except Exception as exc:
+            logger.warning("credit risk cache write failed: %s", exc)
+    return results
+
+
+def _notify_customers_changed(customer_ids: list) -> None:
+    """Let the customer bot drop cached rows whose credit fields changed."""
+    try:
+        from cache_events import publish_customers_changed
+    except ImportError:
+        # Loaded from agents/ alone (owner-service publishes for itself)
+        return
+    publish_customers_changed(customer_ids)
+
+
+def invalidate_store_risk(store_id: str, cache=None) -> None:
+    """Drop cached risk predictions after a payment/order/credit change."""
+    cache = cache if cache is not None else _get_cache()
+    if cache is None or not store_id:
+        return
+    try:
+        cache.delete(RISK_CACHE_KEY.format(store_id=store_id))
+    except Exception as exc:
+        logger.warning("credit risk cache invalidation failed: %s", exc)
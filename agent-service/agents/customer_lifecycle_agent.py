@@ -12,6 +12,8 @@ from typing import Optional
 
 from supabase import create_client
 
+from cache_events import publish_customers_changed
+
 logger = logging.getLogger(__name__)
 
 
@@ -116,6 +118,9 @@ class VIPDetector:
                 else:
                     updated_non_vip += 1
 
+            # Bot caches hold is_vip on the customer row
+            publish_customers_changed([c["id"] for c in customers])
+
             logger.info(
                 "VIP update for store %s: %d VIP, %d non-VIP",
                 store_id,
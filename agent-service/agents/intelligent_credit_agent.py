@@ -13,6 +13,20 @@ from typing import Optional
 
 from supabase import create_client
 
+from agents import response_histogram
+from agents.bulk import chunks
+from cache_events import publish_customers_changed
+from agents.credit_scoring_engine import (
+    OVERDUE_AFTER_DAYS,
+    RECOMMENDED_ACTIONS,
+    default_probability_from_aggregates,
+    invalidate_store_risk,
+    limit_from_scores,
+    risk_indicators_for,
+    risk_level_for,
+    score_from_aggregates,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -39,9 +53,6 @@ def calculate_credit_score(customer_id: str, db_conn=None) -> float:
     """
     supabase = db_conn or _get_supabase()
 
-    # 4.1.1 Base score
-    base_score = 50.0
-
     # Fetch payment history
     try:
         ph_result = (
@@ -55,14 +66,9 @@ def calculate_credit_score(customer_id: str, db_conn=None) -> float:
         logger.error("calculate_credit_score: payment_history fetch error: %s", exc)
         payment_history = []
 
-    # 4.1.2 Payment history score
+    # 4.1.2 Payment history aggregates (on time = paid within 7 days)
     total_payments = len(payment_history)
-    if total_payments > 0:
-        on_time = sum(1 for p in payment_history if (p.get("days_to_payment") or 0) <= 7)
-        late = sum(1 for p in payment_history if (p.get("days_to_payment") or 0) > 7)
-        payment_score = ((on_time - late) / total_payments) * 30
-    else:
-        payment_score = 0.0
+    on_time = sum(1 for p in payment_history if (p.get("days_to_payment") or 0) <= 7)
 
     # Fetch orders
     try:
@@ -77,17 +83,12 @@ def calculate_credit_score(customer_id: str, db_conn=None) -> float:
         logger.error("calculate_credit_score: orders fetch error: %s", exc)
         orders = []
 
-    # 4.1.3 Order frequency score
+    # 4.1.3 / 4.1.4 Order frequency and spending aggregates
     order_count = len(orders)
-    frequency_score = min(order_count / 2, 10.0)
-
-    # 4.1.4 Spending score
     total_spent = sum(float(o.get("total_amount", 0)) for o in orders)
-    spending_score = min(total_spent / 1000, 10.0)
 
-    # 4.1.5 Clamp between 0-100
-    final_score = base_score + payment_score + frequency_score + spending_score
-    return max(0.0, min(100.0, final_score))
+    # 4.1.5 Same formula as the bulk engine (clamped 0-100)
+    return float(score_from_aggregates(total_payments, on_time, order_count, total_spent))
 
 
 # ---------------------------------------------------------------------------
@@ -102,12 +103,7 @@ def calculate_credit_limit(credit_score: float) -> float:
     4.2.2 Score 50-69: ₹2000
     4.2.3 Score < 50: Cash only (0)
     """
-    if credit_score >= 70:
-        return 5000.0
-    elif credit_score >= 50:
-        return 2000.0
-    else:
-        return 0.0
+    return float(limit_from_scores(credit_score))
 
 
 # ---------------------------------------------------------------------------
@@ -163,6 +159,13 @@ def get_optimal_reminder_time(customer_id: str, db_conn=None) -> str:
     4.5.1-4.5.3 Learn optimal notification time per customer.
     Returns HH:MM string (24h). Defaults to 18:00 if no data.
     """
+    # Fast path: precomputed Redis response-hour histogram (shared with 8.1.2)
+    hour_counts = response_histogram.get_cached_hour_counts(customer_id, db_conn=db_conn)
+    if hour_counts is not None:
+        if not hour_counts:
+            return "18:00"
+        return f"{max(hour_counts, key=hour_counts.get):02d}:00"
+
     supabase = db_conn or _get_supabase()
     try:
         result = (
@@ -207,6 +210,7 @@ def auto_suspend_credit(customer_id: str, db_conn=None) -> bool:
         supabase.table("customers").update(
             {"credit_suspended": True}
         ).eq("id", customer_id).execute()
+        publish_customers_changed([customer_id])
 
         # Log the suspension event
         logger.info("Credit suspended for customer %s", customer_id)
@@ -234,6 +238,7 @@ def auto_restore_credit(customer_id: str, db_conn=None) -> bool:
                 "credit_limit": new_limit,
             }
         ).eq("id", customer_id).execute()
+        publish_customers_changed([customer_id])
 
         logger.info(
             "Credit restored for customer %s — score=%.1f limit=%.0f",
@@ -264,8 +269,6 @@ def predict_default_risk(customer_id: str, db_conn=None) -> dict:
         }
     """
     supabase = db_conn or _get_supabase()
-    risk_indicators: list[str] = []
-    risk_score = 0.0
 
     # 4.7.1 Identify risk indicators
     try:
@@ -281,22 +284,9 @@ def predict_default_risk(customer_id: str, db_conn=None) -> dict:
         logger.error("predict_default_risk: customer fetch error: %s", exc)
         customer = {}
 
-    credit_score = float(customer.get("credit_score") or 50)
+    credit_score = float(customer.get("credit_score") or 0)
     is_suspended = bool(customer.get("credit_suspended", False))
 
-    # Low credit score
-    if credit_score < 40:
-        risk_score += 0.35
-        risk_indicators.append("low_credit_score")
-    elif credit_score < 55:
-        risk_score += 0.15
-        risk_indicators.append("below_average_credit_score")
-
-    # Currently suspended
-    if is_suspended:
-        risk_score += 0.30
-        risk_indicators.append("credit_currently_suspended")
-
     # Payment history
     try:
         ph_result = (
@@ -308,24 +298,15 @@ def predict_default_risk(customer_id: str, db_conn=None) -> dict:
         payment_history = ph_result.data or []
     except Exception:
         payment_history = []
-
-    if payment_history:
-        late_count = sum(1 for p in payment_history if p.get("was_late"))
-        late_ratio = late_count / len(payment_history)
-        if late_ratio > 0.5:
-            risk_score += 0.25
-            risk_indicators.append("high_late_payment_ratio")
-        elif late_ratio > 0.25:
-            risk_score += 0.10
-            risk_indicators.append("moderate_late_payment_ratio")
-    else:
-        # No payment history — slight risk
-        risk_score += 0.05
-        risk_indicators.append("no_payment_history")
+    total_payments = len(payment_history)
+    late_count = sum(1 for p in payment_history if p.get("was_late"))
 
     # Outstanding overdue orders
+    overdue_count = 0
     try:
-        cutoff = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+        cutoff = (
+            datetime.now(timezone.utc) - timedelta(days=OVERDUE_AFTER_DAYS)
+        ).isoformat()
         overdue_result = (
             supabase.table("orders")
             .select("id")
@@ -335,36 +316,26 @@ def predict_default_risk(customer_id: str, db_conn=None) -> dict:
             .execute()
         )
         overdue_count = len(overdue_result.data or [])
-        if overdue_count > 0:
-            risk_score += min(overdue_count * 0.10, 0.30)
-            risk_indicators.append(f"overdue_orders_{overdue_count}")
     except Exception:
         pass
 
-    # 4.7.2 Calculate default probability (clamp 0-1)
-    default_probability = max(0.0, min(1.0, risk_score))
-
-    # 4.7.3 Flag high-risk customers
-    if default_probability >= 0.6:
-        risk_level = "high"
-    elif default_probability >= 0.3:
-        risk_level = "medium"
-    else:
-        risk_level = "low"
+    # 4.7.2 Calculate default probability (same formula as the bulk predictor)
+    default_probability = float(
+        default_probability_from_aggregates(
+            credit_score, is_suspended, total_payments, late_count, overdue_count
+        )
+    )
 
-    # 4.7.4 Recommend actions
-    if risk_level == "high":
-        recommended_action = "suspend_credit_and_contact_immediately"
-    elif risk_level == "medium":
-        recommended_action = "send_firm_reminder_and_monitor"
-    else:
-        recommended_action = "continue_normal_operations"
+    # 4.7.3 Flag high-risk customers / 4.7.4 Recommend actions
+    risk_level = risk_level_for(default_probability)
 
     return {
         "default_probability": round(default_probability, 3),
         "risk_level": risk_level,
-        "risk_indicators": risk_indicators,
-        "recommended_action": recommended_action,
+        "risk_indicators": risk_indicators_for(
+            credit_score, is_suspended, total_payments, late_count, overdue_count
+        ),
+        "recommended_action": RECOMMENDED_ACTIONS[risk_level],
     }
 
 
@@ -372,15 +343,49 @@ def predict_default_risk(customer_id: str, db_conn=None) -> dict:
 # 4.4.1 / 4.9 Main Collection Cycle
 # ---------------------------------------------------------------------------
 
+def _fetch_sent_reminders(supabase, order_ids: list) -> set:
+    """Return {(order_id, reminder_type)} already logged for the given orders."""
+    sent = set()
+    for chunk in chunks(order_ids):
+        result = (
+            supabase.table("payment_reminders")
+            .select("order_id, reminder_type")
+            .in_("order_id", chunk)
+            .execute()
+        )
+        for row in result.data or []:
+            sent.add((row.get("order_id"), row.get("reminder_type")))
+    return sent
+
+
+def _bulk_suspend_credit(supabase, customer_ids: list) -> list:
+    """Suspend credit for customers not yet suspended. Returns newly suspended ids."""
+    suspended = []
+    for chunk in chunks(customer_ids):
+        result = (
+            supabase.table("customers")
+            .update({"credit_suspended": True})
+            .in_("id", chunk)
+            .eq("credit_suspended", False)
+            .execute()
+        )
+        suspended.extend(row["id"] for row in (result.data or []) if row.get("id"))
+    return suspended
+
+
 def run_collection_cycle(store_id: str, db_conn=None) -> dict:
     """
     4.4.1 Main collection loop: find overdue orders and apply strategy.
+
+    Set-based: one read for unpaid credit orders, one for reminders already
+    sent, one bulk suspend for customers with 30+ day orders (each customer
+    once) and one bulk reminder insert. Reminders already sent for an order's
+    current tier are skipped.
+
     Returns summary of actions taken.
     """
     supabase = db_conn or _get_supabase()
     actions_taken = []
-    suspended_count = 0
-    reminders_sent = 0
 
     try:
         # Get all unpaid credit orders for the store
@@ -398,6 +403,8 @@ def run_collection_cycle(store_id: str, db_conn=None) -> dict:
         return {"error": str(exc), "actions_taken": []}
 
     now = datetime.now(timezone.utc)
+    reminders = []
+    to_suspend: dict[str, None] = {}  # ordered set of customer ids
 
     for order in orders:
         try:
@@ -410,24 +417,17 @@ def run_collection_cycle(store_id: str, db_conn=None) -> dict:
 
             strategy = get_collection_strategy(days_overdue)
 
-            # 4.4.5 Day 30+: auto-suspend
+            # 4.4.5 Day 30+: auto-suspend (deduped per customer)
             if strategy.get("action") == "suspend_credit":
-                auto_suspend_credit(customer_id, db_conn=supabase)
-                suspended_count += 1
-
-            # Log reminder
-            try:
-                supabase.table("payment_reminders").insert(
-                    {
-                        "customer_id": customer_id,
-                        "order_id": order["id"],
-                        "reminder_type": strategy["reminder_type"],
-                    }
-                ).execute()
-                reminders_sent += 1
-            except Exception as exc:
-                logger.warning("Failed to log reminder: %s", exc)
+                to_suspend[customer_id] = None
 
+            reminders.append(
+                {
+                    "customer_id": customer_id,
+                    "order_id": order["id"],
+                    "reminder_type": strategy["reminder_type"],
+                }
+            )
             actions_taken.append(
                 {
                     "order_id": order["id"],
@@ -440,17 +440,48 @@ def run_collection_cycle(store_id: str, db_conn=None) -> dict:
         except Exception as exc:
             logger.error("run_collection_cycle: order processing error: %s", exc)
 
+    # Skip reminders already logged for the order's current tier
+    try:
+        sent = _fetch_sent_reminders(supabase, [r["order_id"] for r in reminders])
+    except Exception as exc:
+        logger.warning("run_collection_cycle: reminder lookup error: %s", exc)
+        sent = set()
+    new_reminders = [
+        r for r in reminders if (r["order_id"], r["reminder_type"]) not in sent
+    ]
+
+    suspended = []
+    if to_suspend:
+        try:
+            suspended = _bulk_suspend_credit(supabase, list(to_suspend))
+            if suspended:
+                invalidate_store_risk(store_id)
+                publish_customers_changed(suspended)
+        except Exception as exc:
+            logger.error("run_collection_cycle: bulk suspend error: %s", exc)
+
+    reminders_sent = 0
+    for chunk in chunks(new_reminders):
+        try:
+            supabase.table("payment_reminders").insert(chunk).execute()
+            reminders_sent += len(chunk)
+        except Exception as exc:
+            logger.warning("Failed to log reminders: %s", exc)
+
     logger.info(
-        "Collection cycle for store %s: %d orders processed, %d reminders, %d suspended",
+        "Collection cycle for store %s: %d orders processed, %d reminders "
+        "(%d already sent), %d suspended",
         store_id,
         len(orders),
         reminders_sent,
-        suspended_count,
+        len(reminders) - len(new_reminders),
+        len(suspended),
     )
     return {
         "orders_processed": len(orders),
         "reminders_sent": reminders_sent,
-        "suspended_count": suspended_count,
+        "reminders_skipped": len(reminders) - len(new_reminders),
+        "suspended_count": len(suspended),
         "actions_taken": actions_taken,
     }
 
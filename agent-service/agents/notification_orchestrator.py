@@ -6,11 +6,21 @@ personalization, and performance monitoring for customer notifications.
 
 from __future__ import annotations
 
+import json
 import logging
 import os
 from datetime import datetime, timezone, timedelta
 from typing import Optional
 
+from agents import response_histogram
+from agents.bulk import chunks
+from agents.notification_scheduler import (
+    cancel_notifications,
+    next_send_time,
+    schedule_notification,
+    schedule_notifications,
+)
+
 logger = logging.getLogger(__name__)
 
 # Priority levels (higher = more important)
@@ -35,6 +45,32 @@ SEND_WINDOW_END = 21    # 9 PM
 # 8.2.1 Max messages per customer per day
 MAX_MESSAGES_PER_DAY = 3
 
+# 8.2.1 Redis fatigue counter: one key per customer per UTC day, expired a
+# day after it was created so yesterday's counters clean themselves up
+FATIGUE_KEY = "notif_fatigue:{customer_id}:{day}"
+FATIGUE_TTL_SECONDS = 2 * 24 * 3600
+
+# 8.4 Cached notification preferences (invalidated on update)
+PREFS_CACHE_KEY = "notif_prefs:{customer_id}"
+PREFS_CACHE_TTL_SECONDS = 6 * 3600
+
+# Atomically check the daily limit and count the message.
+# KEYS[1] = counter key
+# ARGV[1] = daily limit, ARGV[2] = TTL seconds, ARGV[3] = "1" to count even
+#           when the limit is reached (critical/high priority override)
+# Returns the new count, or -1 if the limit is reached and nothing was counted.
+_FATIGUE_SCRIPT = """
+local count = tonumber(redis.call('GET', KEYS[1]) or '0')
+if count >= tonumber(ARGV[1]) and ARGV[3] ~= '1' then
+    return -1
+end
+count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+end
+return count
+"""
+
 
 def _get_supabase():
     from supabase import create_client
@@ -44,6 +80,16 @@ def _get_supabase():
     )
 
 
+def _get_redis():
+    """Return the shared sync Redis client, or None if Redis is unavailable."""
+    try:
+        from redis_client import get_sync_client
+        return get_sync_client()
+    except Exception as exc:
+        logger.debug("Redis unavailable for notifications: %s", exc)
+        return None
+
+
 # ---------------------------------------------------------------------------
 # 8.1 Timing Optimization
 # ---------------------------------------------------------------------------
@@ -69,11 +115,14 @@ def track_response_time(
                 "response_hour": response_hour,
             }
         ).eq("id", notification_id).execute()
-        return True
     except Exception as exc:
         logger.error("track_response_time error: %s", exc)
         return False
 
+    # 8.1.2 Keep the precomputed histogram in step (one BITFIELD increment)
+    response_histogram.record_response(customer_id, response_hour)
+    return True
+
 
 def get_optimal_send_time(customer_id: str, db_conn=None) -> str:
     """
@@ -81,6 +130,11 @@ def get_optimal_send_time(customer_id: str, db_conn=None) -> str:
     8.1.3 Defaults to 18:00 if no data; always within 9 AM - 9 PM window.
     Returns HH:MM string (24h).
     """
+    # Fast path: precomputed Redis histogram (no history scan)
+    hour_counts = response_histogram.get_cached_hour_counts(customer_id, db_conn=db_conn)
+    if hour_counts is not None:
+        return optimal_time_from_counts(hour_counts)
+
     supabase = db_conn or _get_supabase()
     try:
         result = (
@@ -103,21 +157,29 @@ def get_optimal_send_time(customer_id: str, db_conn=None) -> str:
             if h is not None:
                 hour_counts[h] = hour_counts.get(h, 0) + 1
 
-        if not hour_counts:
-            return "18:00"
-
-        # 8.1.2 Find hour with most responses
-        best_hour = max(hour_counts, key=hour_counts.get)
-
-        # 8.1.3 Enforce 9 AM - 9 PM window
-        best_hour = max(SEND_WINDOW_START, min(SEND_WINDOW_END - 1, best_hour))
-        return f"{best_hour:02d}:00"
+        return optimal_time_from_counts(hour_counts)
 
     except Exception as exc:
         logger.error("get_optimal_send_time error: %s", exc)
         return "18:00"
 
 
+def optimal_time_from_counts(hour_counts: dict[int, int]) -> str:
+    """
+    8.1.2 Pick the hour with most responses from an hour -> count histogram.
+    8.1.3 Defaults to 18:00 and clamps to the 9 AM - 9 PM window.
+    """
+    if not hour_counts:
+        return "18:00"
+
+    # 8.1.2 Find hour with most responses
+    best_hour = max(hour_counts, key=hour_counts.get)
+
+    # 8.1.3 Enforce 9 AM - 9 PM window
+    best_hour = max(SEND_WINDOW_START, min(SEND_WINDOW_END - 1, best_hour))
+    return f"{best_hour:02d}:00"
+
+
 def is_within_send_window(hour: int) -> bool:
     """8.1.3 Return True if the given hour is within the 9 AM - 9 PM send window."""
     return SEND_WINDOW_START <= hour < SEND_WINDOW_END
@@ -154,6 +216,41 @@ def can_send_notification(customer_id: str, db_conn=None) -> bool:
     return get_messages_sent_today(customer_id, db_conn) < MAX_MESSAGES_PER_DAY
 
 
+def reserve_notification_slot(
+    customer_id: str,
+    force: bool = False,
+    redis_client=None,
+) -> Optional[bool]:
+    """
+    8.2.1 Check the daily limit and count one message in a single atomic
+    Redis call (no notification_history scan).
+
+    Args:
+        force: Count the message even if the limit is reached (used for
+               critical/high priority sends that override the limit).
+
+    Returns True if the message was counted, False if the customer already
+    reached MAX_MESSAGES_PER_DAY, or None if Redis is unavailable (callers
+    fall back to can_send_notification).
+    """
+    redis = redis_client or _get_redis()
+    if redis is None:
+        return None
+    key = FATIGUE_KEY.format(
+        customer_id=customer_id,
+        day=datetime.now(timezone.utc).strftime("%Y%m%d"),
+    )
+    try:
+        count = redis.eval(
+            _FATIGUE_SCRIPT, 1, key,
+            MAX_MESSAGES_PER_DAY, FATIGUE_TTL_SECONDS, "1" if force else "0",
+        )
+        return int(count) != -1
+    except Exception as exc:
+        logger.warning("reserve_notification_slot: Redis error, using DB count: %s", exc)
+        return None
+
+
 def get_priority_value(priority_label: str) -> int:
     """8.2.2 Convert priority label to numeric value (critical > high > medium > low)."""
     return PRIORITY_FROM_LABEL.get(priority_label.lower(), PRIORITY_LOW)
@@ -165,9 +262,13 @@ def queue_notification(
     priority: str = "medium",
     notification_type: str = "general",
     db_conn=None,
+    status: str = "queued",
 ) -> Optional[str]:
     """
     8.2.3 Queue a non-urgent notification for later delivery.
+
+    status is "queued" for rows that can still be merged into a batch and
+    "scheduled" for batch rows already handed to the delivery scheduler.
     Returns the notification id.
     """
     supabase = db_conn or _get_supabase()
@@ -180,7 +281,7 @@ def queue_notification(
                     "message": message,
                     "priority": priority,
                     "notification_type": notification_type,
-                    "status": "queued",
+                    "status": status,
                     "responded": False,
                 }
             )
@@ -283,6 +384,178 @@ def combine_messages(notifications: list[dict]) -> str:
     return "\n\n".join(parts)
 
 
+def get_response_hour_counts(
+    customer_ids: list[str],
+    db_conn=None,
+    redis_client=None,
+) -> dict[str, dict[int, int]]:
+    """
+    8.1.2 Response-hour histograms for many customers: one MGET of the
+    precomputed Redis histograms, DB backfill only for customers without one.
+    Returns {customer_id: {hour: count}}.
+    """
+    histograms = response_histogram.get_histograms(
+        customer_ids, db_conn=db_conn, redis_client=redis_client
+    )
+    return {
+        cid: response_histogram.to_hour_counts(counts)
+        for cid, counts in histograms.items()
+    }
+
+
+def _batch_content(pending: list[dict]) -> dict:
+    """Combined message and highest priority of one customer's batch."""
+    return {
+        "message": combine_messages(pending),
+        "priority": PRIORITY_LABELS.get(
+            max(get_priority_value(n.get("priority", "low")) for n in pending),
+            "medium",
+        ),
+    }
+
+
+def _trim_store_batches(
+    supabase,
+    by_customer: dict[str, list[dict]],
+    batches: list[tuple],
+    marked: set[str],
+) -> list[tuple]:
+    """
+    Rewrite batch rows whose originals were not all marked as batched, and
+    delete those left with none. Returns the (batch_id, send_at) pairs to keep.
+    """
+    kept = []
+    dropped = []
+    for pending, (batch_id, send_at) in zip(by_customer.values(), batches):
+        remaining = [n for n in pending if n.get("id") in marked]
+        if not remaining:
+            if batch_id:
+                dropped.append(batch_id)
+            continue
+        if len(remaining) < len(pending) and batch_id:
+            supabase.table("notification_history").update(
+                _batch_content(remaining)
+            ).eq("id", batch_id).execute()
+        kept.append((batch_id, send_at))
+    for ids in chunks(dropped):
+        supabase.table("notification_history").delete().in_("id", ids).execute()
+    return kept
+
+
+def _undo_store_batch(supabase, batch_ids: list[str], marked_ids: list[str]) -> None:
+    """Best-effort rollback of a failed flush: drop batch rows, requeue originals."""
+    try:
+        for ids in chunks(batch_ids):
+            supabase.table("notification_history").delete().in_("id", ids).execute()
+        for ids in chunks(marked_ids):
+            supabase.table("notification_history").update(
+                {"status": "queued"}
+            ).in_("id", ids).eq("status", "batched").execute()
+    except Exception as exc:
+        logger.error("batch_store_notifications: rollback error: %s", exc)
+
+
+def batch_store_notifications(store_id: str, db_conn=None, redis_client=None) -> dict:
+    """
+    8.3 Store-wide flush: combine every customer's queued notifications into
+    one batch message scheduled at that customer's optimal time.
+
+    One read for all queued rows of the store, one read for response-hour
+    histograms, then one bulk insert of batch rows and one bulk status update
+    of the originals still queued (chunked for very large stores) instead of
+    3-4 queries per customer. Batches are rewritten from the originals that
+    were actually marked. A failed write is rolled back best-effort.
+    """
+    supabase = db_conn or _get_supabase()
+    try:
+        result = (
+            supabase.table("notification_history")
+            .select("id, customer_id, message, priority, customers!inner(store_id)")
+            .eq("customers.store_id", store_id)
+            .eq("status", "queued")
+            .execute()
+        )
+        rows = result.data or []
+    except Exception as exc:
+        logger.error("batch_store_notifications: pending fetch error: %s", exc)
+        return {"store_id": store_id, "error": str(exc)}
+
+    # Group in memory, highest priority first (same order as get_pending_notifications)
+    by_customer: dict[str, list[dict]] = {}
+    for row in rows:
+        by_customer.setdefault(row["customer_id"], []).append(row)
+    for pending in by_customer.values():
+        pending.sort(key=lambda r: get_priority_value(r.get("priority", "low")), reverse=True)
+
+    if not by_customer:
+        return {"store_id": store_id, "customers_batched": 0, "notifications_batched": 0}
+
+    histograms = get_response_hour_counts(list(by_customer), db_conn=supabase)
+
+    batch_rows = []
+    send_times = []
+    for customer_id, pending in by_customer.items():
+        optimal_time = optimal_time_from_counts(histograms.get(customer_id, {}))
+        send_times.append(next_send_time(optimal_time))
+        batch_rows.append(
+            {
+                "customer_id": customer_id,
+                "store_id": store_id,
+                **_batch_content(pending),
+                "notification_type": "batch",
+                "status": "scheduled",
+                "responded": False,
+            }
+        )
+
+    original_ids = [row["id"] for row in rows if row.get("id")]
+    batch_ids: list[Optional[str]] = []
+    marked: list[str] = []
+    try:
+        # Batch rows first: if a write fails the originals are still queued
+        for chunk in chunks(batch_rows):
+            inserted = supabase.table("notification_history").insert(chunk).execute()
+            batch_ids.extend(r.get("id") for r in (inserted.data or []))
+        # Only rows still queued: the delivery scheduler may be sending some
+        for ids in chunks(original_ids):
+            updated = (
+                supabase.table("notification_history")
+                .update({"status": "batched"})
+                .in_("id", ids)
+                .eq("status", "queued")
+                .execute()
+            )
+            marked.extend(r.get("id") for r in (updated.data or []) if r.get("id"))
+        # Rows that left the queue meanwhile (sent by the delivery scheduler)
+        # must not be repeated in the batch: rewrite its text from the rows
+        # actually marked, or drop the batch if none are left.
+        batches = list(zip(batch_ids, send_times))
+        if len(marked) < len(original_ids):
+            logger.warning(
+                "Store %s batch flush: %d notifications left the queue while batching",
+                store_id, len(original_ids) - len(marked),
+            )
+            batches = _trim_store_batches(supabase, by_customer, batches, set(marked))
+    except Exception as exc:
+        logger.error("batch_store_notifications: bulk write error: %s", exc)
+        _undo_store_batch(supabase, [bid for bid in batch_ids if bid], marked)
+        return {"store_id": store_id, "error": str(exc)}
+
+    cancel_notifications(marked, redis_client=redis_client)
+    scheduled = schedule_notifications(batches, redis_client=redis_client)
+
+    logger.info(
+        "Store %s batch flush: %d notifications -> %d batches (%d scheduled)",
+        store_id, len(marked), len(batches), scheduled,
+    )
+    return {
+        "store_id": store_id,
+        "customers_batched": len(batches),
+        "notifications_batched": len(marked),
+        "batches_scheduled": scheduled,
+    }
+
+
 # ---------------------------------------------------------------------------
 # 8.4 Personalization
 # ---------------------------------------------------------------------------
@@ -304,6 +577,44 @@ def get_notification_preferences(customer_id: str, db_conn=None) -> dict:
         return {}
 
 
+def get_cached_notification_preferences(
+    customer_id: str,
+    db_conn=None,
+    redis_client=None,
+) -> dict:
+    """Notification preferences served from Redis, loaded from the DB on a miss."""
+    redis = redis_client or _get_redis()
+    key = PREFS_CACHE_KEY.format(customer_id=customer_id)
+    if redis is not None:
+        try:
+            cached = redis.get(key)
+            if cached is not None:
+                return json.loads(cached)
+        except Exception as exc:
+            logger.warning("notification preferences cache read error: %s", exc)
+            redis = None
+
+    prefs = get_notification_preferences(customer_id, db_conn=db_conn)
+    if redis is not None:
+        try:
+            # Empty preferences are cached too so new customers skip the DB
+            redis.set(key, json.dumps(prefs, default=str), ex=PREFS_CACHE_TTL_SECONDS)
+        except Exception as exc:
+            logger.warning("notification preferences cache write error: %s", exc)
+    return prefs
+
+
+def invalidate_notification_preferences(customer_id: str, redis_client=None) -> None:
+    """Drop cached preferences so the next send reloads them."""
+    redis = redis_client or _get_redis()
+    if redis is None:
+        return
+    try:
+        redis.delete(PREFS_CACHE_KEY.format(customer_id=customer_id))
+    except Exception as exc:
+        logger.warning("notification preferences cache invalidation error: %s", exc)
+
+
 def detect_tone_preference(message_history: list[str]) -> str:
     """
     8.4.1 Detect customer tone preference (formal vs casual) from message history.
@@ -443,6 +754,7 @@ def update_notification_preferences(
     customer_id: str,
     message_history: list[str],
     db_conn=None,
+    redis_client=None,
 ) -> dict:
     """
     8.4.1-8.4.4 Analyze message history and update notification preferences in DB.
@@ -475,6 +787,8 @@ def update_notification_preferences(
     except Exception as exc:
         logger.error("update_notification_preferences error: %s", exc)
 
+    invalidate_notification_preferences(customer_id, redis_client=redis_client)
+
     return prefs
 
 
@@ -649,8 +963,16 @@ class NotificationOrchestrator:
     batching, and personalization for customer notifications.
     """
 
-    def __init__(self, supabase=None):
+    def __init__(self, supabase=None, redis_client=None):
         self.supabase = supabase
+        self._redis = redis_client
+        self._redis_checked = redis_client is not None
+
+    def _get_redis(self):
+        if not self._redis_checked:
+            self._redis = _get_redis()
+            self._redis_checked = True
+        return self._redis
 
     def get_optimal_time(self, customer_id: str) -> str:
         """
@@ -663,6 +985,27 @@ class NotificationOrchestrator:
         """8.3.2 Combine multiple notifications into a single message."""
         return combine_messages(notifications)
 
+    def _queue_for_later(
+        self,
+        customer_id: str,
+        message: str,
+        priority: str,
+        notification_type: str,
+        skip_today: bool = False,
+    ) -> Optional[str]:
+        """
+        8.2.3 Queue a notification and schedule its delivery for the customer's
+        next optimal send time (tomorrow when the daily limit was reached).
+        """
+        notif_id = queue_notification(
+            customer_id, message, priority, notification_type,
+            db_conn=self.supabase,
+        )
+        if notif_id:
+            send_at = next_send_time(self.get_optimal_time(customer_id), skip_today=skip_today)
+            schedule_notification(notif_id, send_at, redis_client=self._get_redis())
+        return notif_id
+
     def batch_notifications(self, customer_id: str) -> Optional[dict]:
         """
         8.3 Collect pending notifications, combine into one message,
@@ -679,22 +1022,26 @@ class NotificationOrchestrator:
 
         # 8.3.3 Schedule at optimal time
         optimal_time = self.get_optimal_time(customer_id)
+        send_at = next_send_time(optimal_time)
 
-        # Mark originals as batched
+        # Mark originals as batched and drop their individual deliveries
         ids = [n["id"] for n in pending if n.get("id")]
         mark_notifications_batched(ids, db_conn=self.supabase)
+        cancel_notifications(ids, redis_client=self._get_redis())
 
-        # Log the batch notification as queued for the optimal time
-        batch_id = log_sent_notification(
-            customer_id=customer_id,
-            message=combined,
-            notification_type="batch",
+        # Store the batch as scheduled and hand it to the delivery scheduler
+        batch_id = queue_notification(
+            customer_id,
+            combined,
             priority=PRIORITY_LABELS.get(
                 max(get_priority_value(n.get("priority", "low")) for n in pending),
                 "medium",
             ),
+            notification_type="batch",
             db_conn=self.supabase,
+            status="scheduled",
         )
+        schedule_notification(batch_id, send_at, redis_client=self._get_redis())
 
         logger.info(
             "Batched %d notifications for customer %s at %s",
@@ -708,9 +1055,16 @@ class NotificationOrchestrator:
             "batch_id": batch_id,
             "message": combined,
             "scheduled_time": optimal_time,
+            "scheduled_at": send_at.isoformat(),
             "notification_count": len(pending),
         }
 
+    def batch_store_notifications(self, store_id: str) -> dict:
+        """8.3 Batch queued notifications for every customer of a store at once."""
+        return batch_store_notifications(
+            store_id, db_conn=self.supabase, redis_client=self._get_redis()
+        )
+
     def send_notification(
         self,
         customer_id: str,
@@ -726,9 +1080,8 @@ class NotificationOrchestrator:
 
         # 8.1.3 Check send window
         if not is_within_send_window(now.hour):
-            notif_id = queue_notification(
+            notif_id = self._queue_for_later(
                 customer_id, message, priority, notification_type,
-                db_conn=self.supabase,
             )
             return {
                 "status": "queued",
@@ -736,24 +1089,35 @@ class NotificationOrchestrator:
                 "notification_id": notif_id,
             }
 
-        # 8.2.1 Check daily limit
-        if not can_send_notification(customer_id, db_conn=self.supabase):
+        # 8.2.1 Check daily limit: atomic Redis counter, DB count as fallback
+        priority_val = get_priority_value(priority)
+        redis = self._get_redis()
+        allowed = (
+            reserve_notification_slot(customer_id, redis_client=redis)
+            if redis is not None else None
+        )
+        if allowed is None:
+            allowed = can_send_notification(customer_id, db_conn=self.supabase)
+        if not allowed:
             # 8.2.3 Queue non-urgent notifications
-            priority_val = get_priority_value(priority)
             if priority_val < PRIORITY_HIGH:
-                notif_id = queue_notification(
+                notif_id = self._queue_for_later(
                     customer_id, message, priority, notification_type,
-                    db_conn=self.supabase,
+                    skip_today=True,
                 )
                 return {
                     "status": "queued",
                     "reason": "daily_limit_reached",
                     "notification_id": notif_id,
                 }
-            # Critical/high priority: send anyway (override limit)
+            # Critical/high priority: send anyway (override limit), still counted
+            if redis is not None:
+                reserve_notification_slot(customer_id, force=True, redis_client=redis)
 
         # Apply personalization
-        prefs = get_notification_preferences(customer_id, db_conn=self.supabase)
+        prefs = get_cached_notification_preferences(
+            customer_id, db_conn=self.supabase, redis_client=redis
+        )
         personalized = personalize_message(
             message,
             tone=prefs.get("tone_preference", "casual"),
@@ -0,0 +1,497 @@
+"""
+Notification Delivery Scheduler (8.3.3)
+Delivers queued and batched customer notifications at their scheduled time.
+
+Due notifications are kept in a Redis sorted set (member = notification_history
+id, score = send timestamp). One loop sleeps until the earliest score or until
+a wake-up is published for a newly scheduled item, pops due ids in batches
+with a Lua script that moves them to an in-flight set, and sends them with
+bounded concurrency. In-flight leases left behind by a crash or restart are
+requeued on start, so nothing needs a periodic notification_history scan.
+If Redis is not reachable at start, the loop retries with backoff.
+
+Every delivery is counted against the customer's daily fatigue counter
+(notification_orchestrator.FATIGUE_KEY), the same one direct sends use,
+once per notification: retries of a failed send reuse the slot taken that
+day. Below-high priority notifications of a customer already at the limit
+move to the same time tomorrow.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Redis keys
+SCHEDULE_KEY = "notif_schedule"        # zset: notification_id -> send timestamp
+INFLIGHT_KEY = "notif_inflight"        # zset: notification_id -> lease expiry
+ATTEMPTS_KEY = "notif_attempts"        # hash: notification_id -> failed attempts
+RESERVED_KEY = "notif_reserved"        # hash: notification_id -> day its fatigue slot was taken
+WAKE_CHANNEL = "notif_schedule:wake"   # pub/sub: a new item was scheduled
+
+# Delivery tuning
+BATCH_SIZE = 100
+SEND_CONCURRENCY = int(os.getenv("NOTIFICATION_SEND_CONCURRENCY", "10"))
+LEASE_SECONDS = 300                    # in-flight items older than this are requeued
+MAX_IDLE_SECONDS = LEASE_SECONDS       # upper bound on a single sleep
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 60
+DEFER_SECONDS = 24 * 3600              # daily limit reached: try again tomorrow
+STARTUP_RETRY_SECONDS = 5              # first retry after a failed start, doubled each time
+MAX_STARTUP_RETRY_SECONDS = 300
+
+# Rows the scheduler may still deliver (batched/sent rows are skipped)
+DELIVERABLE_STATUSES = ("queued", "scheduled")
+
+# KEYS[1] = schedule zset, KEYS[2] = in-flight zset
+# ARGV[1] = now, ARGV[2] = batch size, ARGV[3] = lease expiry
+_POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, id in ipairs(due) do
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('ZADD', KEYS[2], ARGV[3], id)
+end
+return due
+"""
+
+# KEYS[1] = in-flight zset, KEYS[2] = schedule zset, ARGV[1] = now
+_REQUEUE_EXPIRED_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, id in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('ZADD', KEYS[2], ARGV[1], id)
+end
+return #expired
+"""
+
+
+def _get_supabase():
+    from supabase import create_client
+    return create_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_KEY"),
+    )
+
+
+def _get_sync_redis():
+    try:
+        from redis_client import get_sync_client
+        return get_sync_client()
+    except Exception as exc:
+        logger.debug("Redis unavailable for notification scheduling: %s", exc)
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Scheduling API (sync, usable from the orchestrator)
+# ---------------------------------------------------------------------------
+
+def next_send_time(optimal_time: str, now: Optional[datetime] = None, skip_today: bool = False) -> datetime:
+    """
+    Return the next UTC datetime matching an HH:MM optimal send time.
+
+    Args:
+        skip_today: Always pick tomorrow (e.g. the daily limit was reached).
+    """
+    now = now or datetime.now(timezone.utc)
+    hour, minute = (int(part) for part in optimal_time.split(":"))
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if skip_today or target <= now:
+        target += timedelta(days=1)
+    return target
+
+
+def schedule_notification(notification_id: str, send_at: datetime, redis_client=None) -> bool:
+    """Schedule a notification_history row for delivery at send_at."""
+    if not notification_id:
+        return False
+    redis = redis_client or _get_sync_redis()
+    if redis is None:
+        return False
+    score = send_at.timestamp()
+    try:
+        pipe = redis.pipeline()
+        pipe.zadd(SCHEDULE_KEY, {notification_id: score})
+        pipe.publish(WAKE_CHANNEL, score)
+        pipe.execute()
+        return True
+    except Exception as exc:
+        logger.error("schedule_notification error: %s", exc)
+        return False
+
+
+def schedule_notifications(items: Iterable[tuple[str, datetime]], redis_client=None) -> int:
+    """Schedule many (notification_id, send_at) pairs with one ZADD."""
+    mapping = {nid: send_at.timestamp() for nid, send_at in items if nid}
+    if not mapping:
+        return 0
+    redis = redis_client or _get_sync_redis()
+    if redis is None:
+        return 0
+    try:
+        pipe = redis.pipeline()
+        pipe.zadd(SCHEDULE_KEY, mapping)
+        pipe.publish(WAKE_CHANNEL, min(mapping.values()))
+        pipe.execute()
+        return len(mapping)
+    except Exception as exc:
+        logger.error("schedule_notifications error: %s", exc)
+        return 0
+
+
+def cancel_notifications(notification_ids: list[str], redis_client=None) -> None:
+    """Remove notifications from the schedule (e.g. merged into a batch)."""
+    if not notification_ids:
+        return
+    redis = redis_client or _get_sync_redis()
+    if redis is None:
+        return
+    try:
+        pipe = redis.pipeline()
+        pipe.zrem(SCHEDULE_KEY, *notification_ids)
+        pipe.hdel(ATTEMPTS_KEY, *notification_ids)
+        pipe.hdel(RESERVED_KEY, *notification_ids)
+        pipe.execute()
+    except Exception as exc:
+        logger.error("cancel_notifications error: %s", exc)
+
+
+# ---------------------------------------------------------------------------
+# Delivery loop
+# ---------------------------------------------------------------------------
+
+class NotificationDeliveryScheduler:
+    """
+    Background delivery loop for scheduled notifications.
+
+    Usage:
+        scheduler = NotificationDeliveryScheduler()
+        await scheduler.start()   # on app startup
+        await scheduler.stop()    # on shutdown
+    """
+
+    def __init__(
+        self,
+        supabase=None,
+        redis_client=None,
+        bot=None,
+        batch_size: int = BATCH_SIZE,
+        concurrency: int = SEND_CONCURRENCY,
+    ):
+        self.supabase = supabase
+        self._redis = redis_client
+        self._bot = bot
+        self.batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wake = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._running = False
+
+    def _get_redis(self):
+        if self._redis is None:
+            from redis_client import get_async_client
+            self._redis = get_async_client()
+        return self._redis
+
+    def _get_db(self):
+        if self.supabase is None:
+            self.supabase = _get_supabase()
+        return self.supabase
+
+    async def _send_message(self, chat_id, text: str) -> bool:
+        """Send through an injected bot, else the shared outbound service."""
+        if self._bot is not None:
+            await self._bot.send_message(chat_id=chat_id, text=text)
+            return True
+        token = os.getenv("CUSTOMER_BOT_TOKEN", "").strip()
+        if not token:
+            return False
+        from agents.telegram_outbound import PRIORITY_NORMAL, outbound
+        await outbound.send(token, chat_id, text, priority=PRIORITY_NORMAL)
+        return True
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Start the delivery loop; it keeps retrying until Redis is reachable."""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._run())]
+
+    async def _startup(self) -> None:
+        """Requeue leases left by a previous run, then start the wake-up listener."""
+        delay = STARTUP_RETRY_SECONDS
+        while True:
+            try:
+                requeued = await self.requeue_expired()
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Notification scheduler start failed, retrying in %ds: %s", delay, exc)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_STARTUP_RETRY_SECONDS)
+        if requeued:
+            logger.info("Notification scheduler requeued %d in-flight notifications", requeued)
+        self._running = True
+        self._tasks.append(asyncio.create_task(self._listen_for_wakeups()))
+        logger.info("✅ Notification delivery scheduler started")
+
+    async def stop(self) -> None:
+        self._running = False
+        self._wake.set()
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _listen_for_wakeups(self) -> None:
+        """Wake the loop when any process schedules a new notification."""
+        while self._running:
+            pubsub = None
+            try:
+                pubsub = self._get_redis().pubsub()
+                await pubsub.subscribe(WAKE_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._wake.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Notification scheduler wake listener error: %s", exc)
+                await asyncio.sleep(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+    async def _run(self) -> None:
+        await self._startup()
+        while self._running:
+            try:
+                due = await self.pop_due()
+                if due:
+                    await self.deliver_batch(due)
+                    continue
+                await self._sleep_until_next()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.error("Notification scheduler loop error: %s", exc)
+                await asyncio.sleep(5)
+
+    async def _sleep_until_next(self) -> None:
+        """Sleep until the earliest scheduled item is due, or a wake-up arrives."""
+        redis = self._get_redis()
+        await self.requeue_expired()
+        head = await redis.zrange(SCHEDULE_KEY, 0, 0, withscores=True)
+        timeout = MAX_IDLE_SECONDS
+        if head:
+            timeout = max(0.0, min(float(head[0][1]) - time.time(), MAX_IDLE_SECONDS))
+        if timeout <= 0:
+            return
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    # ------------------------------------------------------------------
+    # Redis operations
+    # ------------------------------------------------------------------
+
+    async def pop_due(self, now: Optional[float] = None) -> list[str]:
+        """Atomically move up to batch_size due ids into the in-flight set."""
+        now = now if now is not None else time.time()
+        return list(await self._get_redis().eval(
+            _POP_DUE_SCRIPT, 2, SCHEDULE_KEY, INFLIGHT_KEY,
+            now, self.batch_size, now + LEASE_SECONDS,
+        ) or [])
+
+    async def requeue_expired(self, now: Optional[float] = None) -> int:
+        """Move in-flight ids whose lease expired (crash/restart) back to the schedule."""
+        now = now if now is not None else time.time()
+        return int(await self._get_redis().eval(
+            _REQUEUE_EXPIRED_SCRIPT, 2, INFLIGHT_KEY, SCHEDULE_KEY, now,
+        ) or 0)
+
+    async def _finish(self, ids: list[str]) -> None:
+        if not ids:
+            return
+        redis = self._get_redis()
+        await redis.zrem(INFLIGHT_KEY, *ids)
+        await redis.hdel(ATTEMPTS_KEY, *ids)
+        await redis.hdel(RESERVED_KEY, *ids)
+
+    async def _reserve_slots(self, rows: list[dict]) -> list[bool]:
+        """
+        Count each row against its customer's daily limit (8.2.1). False means
+        the customer is at the limit and the row should wait; Redis errors
+        fail open. A row that already took its slot today (a retry) is not
+        counted again.
+        """
+        from agents.notification_orchestrator import (
+            _FATIGUE_SCRIPT,
+            FATIGUE_KEY,
+            FATIGUE_TTL_SECONDS,
+            MAX_MESSAGES_PER_DAY,
+            PRIORITY_HIGH,
+            get_priority_value,
+        )
+        if not rows:
+            return []
+        redis = self._get_redis()
+        day = datetime.now(timezone.utc).strftime("%Y%m%d")
+        try:
+            reserved = await redis.hmget(RESERVED_KEY, [row["id"] for row in rows])
+        except Exception as exc:
+            logger.warning("Notification scheduler: reserved slots unreadable: %s", exc)
+            reserved = [None] * len(rows)
+        granted: dict[str, str] = {}
+
+        async def reserve(row: dict, reserved_day) -> bool:
+            if isinstance(reserved_day, bytes):
+                reserved_day = reserved_day.decode()
+            if reserved_day == day:
+                return True
+            # Critical/high priority overrides the limit but is still counted
+            force = get_priority_value(row.get("priority") or "low") >= PRIORITY_HIGH
+            key = FATIGUE_KEY.format(customer_id=row.get("customer_id"), day=day)
+            try:
+                count = await redis.eval(
+                    _FATIGUE_SCRIPT, 1, key,
+                    MAX_MESSAGES_PER_DAY, FATIGUE_TTL_SECONDS, "1" if force else "0",
+                )
+            except Exception as exc:
+                logger.warning("Notification %s: fatigue check failed, sending: %s", row.get("id"), exc)
+                return True
+            if int(count) == -1:
+                return False
+            granted[row["id"]] = day
+            return True
+
+        allowed = list(await asyncio.gather(*(reserve(row, d) for row, d in zip(rows, reserved))))
+        if granted:
+            try:
+                await redis.hset(RESERVED_KEY, mapping=granted)
+            except Exception as exc:
+                logger.warning("Notification scheduler: could not record reserved slots: %s", exc)
+        return allowed
+
+    async def _defer(self, ids: list[str]) -> None:
+        """Move in-flight ids back to the schedule, DEFER_SECONDS from now."""
+        if not ids:
+            return
+        redis = self._get_redis()
+        retry_at = time.time() + DEFER_SECONDS
+        await redis.zadd(SCHEDULE_KEY, {nid: retry_at for nid in ids})
+        await redis.zrem(INFLIGHT_KEY, *ids)
+
+    async def _retry_or_fail(self, ids: list[str]) -> list[str]:
+        """Reschedule failed sends with backoff; return ids that gave up."""
+        redis = self._get_redis()
+        failed = []
+        retry: dict[str, float] = {}
+        for nid in ids:
+            attempts = int(await redis.hincrby(ATTEMPTS_KEY, nid, 1))
+            if attempts >= MAX_ATTEMPTS:
+                failed.append(nid)
+            else:
+                retry[nid] = time.time() + RETRY_BACKOFF_SECONDS * attempts
+        if retry:
+            await redis.zadd(SCHEDULE_KEY, retry)
+            await redis.zrem(INFLIGHT_KEY, *retry)
+        return failed
+
+    # ------------------------------------------------------------------
+    # Delivery
+    # ------------------------------------------------------------------
+
+    async def deliver_batch(self, notification_ids: list[str]) -> dict:
+        """
+        Deliver one batch: one read for rows + chat ids, the daily-limit check,
+        bounded-concurrency sends, and one bulk status update per outcome.
+        """
+        supabase = self._get_db()
+        try:
+            result = await asyncio.to_thread(
+                supabase.table("notification_history")
+                .select("id, customer_id, message, status, priority, customers(telegram_chat_id)")
+                .in_("id", notification_ids)
+                .execute
+            )
+            rows = result.data or []
+        except Exception as exc:
+            logger.error("deliver_batch: fetch error: %s", exc)
+            # Leave ids in flight; the lease expiry requeues them
+            return {"sent": 0, "failed": 0, "skipped": 0}
+
+        deliverable = [r for r in rows if r.get("status") in DELIVERABLE_STATUSES]
+        deliverable_ids = {r["id"] for r in deliverable}
+        skipped = [nid for nid in notification_ids if nid not in deliverable_ids]
+
+        # Undeliverable rows (no chat) are not counted against the limit
+        reachable = [r for r in deliverable if (r.get("customers") or {}).get("telegram_chat_id")]
+        allowed = await self._reserve_slots(reachable)
+        deferred = [row["id"] for row, ok in zip(reachable, allowed) if not ok]
+        await self._defer(deferred)
+        deferred_ids = set(deferred)
+        deliverable = [r for r in deliverable if r["id"] not in deferred_ids]
+
+        outcomes = await asyncio.gather(*(self._send(row) for row in deliverable))
+        sent = [row["id"] for row, ok in zip(deliverable, outcomes) if ok is True]
+        undeliverable = [row["id"] for row, ok in zip(deliverable, outcomes) if ok is None]
+        errored = [row["id"] for row, ok in zip(deliverable, outcomes) if ok is False]
+
+        gave_up = await self._retry_or_fail(errored)
+        failed = undeliverable + gave_up
+        try:
+            if sent:
+                await asyncio.to_thread(
+                    supabase.table("notification_history").update(
+                        {"status": "sent", "sent_at": datetime.now(timezone.utc).isoformat()}
+                    ).in_("id", sent).execute
+                )
+            if failed:
+                await asyncio.to_thread(
+                    supabase.table("notification_history").update(
+                        {"status": "failed"}
+                    ).in_("id", failed).execute
+                )
+        except Exception as exc:
+            logger.error("deliver_batch: status update error: %s", exc)
+
+        await self._finish(sent + failed + skipped)
+        logger.info(
+            "Notification batch: %d sent, %d failed, %d retrying, %d deferred, %d skipped",
+            len(sent), len(failed), len(errored) - len(gave_up), len(deferred), len(skipped),
+        )
+        return {"sent": len(sent), "failed": len(failed), "skipped": len(skipped)}
+
+    async def _send(self, row: dict) -> Optional[bool]:
+        """Send one notification. Returns True/False, or None if undeliverable."""
+        chat_id = (row.get("customers") or {}).get("telegram_chat_id")
+        if not chat_id:
+            return None
+        async with self._semaphore:
+            try:
+                if not await self._send_message(chat_id, row.get("message", "")):
+                    return None
+                return True
+            except Exception as exc:
+                logger.warning("Notification %s send failed: %s", row.get("id"), exc)
+                return False
+
+
+# Shared instance started by agent-service main.py
+notification_scheduler = NotificationDeliveryScheduler()
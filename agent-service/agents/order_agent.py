@@ -1,75 +1,190 @@
 from events.event_bus import event_bus, Event
+from agents.credit_scoring_engine import invalidate_store_risk
+from cache_events import bump_catalog_version
 from supabase import create_client
+from typing import Optional
+import json
 import os
 
+# Orders are claimed once in Redis so re-delivered order_created events
+# (retries, duplicate triggers) never touch stock a second time.
+PROCESSED_ORDER_KEY = "order_processed:{order_id}"
+PROCESSED_ORDER_TTL_SECONDS = 7 * 24 * 3600  # 7 days
+
+# The claim value records progress. A failure before stock was touched
+# deletes the claim; a failure after it leaves CLAIM_STOCK_ADJUSTED, and the
+# retry resumes at finalize_order instead of reducing stock again.
+CLAIM_NEW = "new"
+CLAIM_STOCK_ADJUSTED = "stock_adjusted"
+_CLAIM_HELD = "processing"
+
+# KEYS[1] claim key; ARGV[1] TTL seconds; ARGV[2] resumable progress;
+# ARGV[3] held marker; ARGV[4] progress of a fresh claim.
+# Returns the progress to resume from, or false if the order is held or done.
+_CLAIM_LUA = """
+local state = redis.call('GET', KEYS[1])
+if state and state ~= ARGV[2] then
+    return false
+end
+redis.call('SET', KEYS[1], ARGV[3], 'EX', ARGV[1])
+return state or ARGV[4]
+"""
+
+# Fallback when Redis is unreachable: remember recently claimed orders in memory
+_MAX_LOCAL_CLAIMS = 10_000
+
+
 class OrderAgent:
     """Processes orders automatically"""
-    
-    def __init__(self):
+
+    def __init__(self, redis_client=None):
         # Connect to database
         self.supabase = create_client(
             os.getenv("SUPABASE_URL"),
             os.getenv("SUPABASE_KEY")
         )
-        
+        self._redis = redis_client
+        self._local_claims: dict[str, str] = {}
+
         # Subscribe to order events
         event_bus.subscribe("order_created", self.handle_order)
         print("✅ Order Agent ready")
-    
+
+    def _get_redis(self):
+        if self._redis is None:
+            try:
+                from redis_client import get_async_client
+                self._redis = get_async_client()
+            except Exception as e:
+                print(f"⚠️ Redis unavailable for order claims: {e}")
+        return self._redis
+
+    async def claim_order(self, order_id: str) -> Optional[str]:
+        """
+        Claim an order for processing. Returns None if it is already claimed,
+        otherwise the progress to resume from (CLAIM_NEW or CLAIM_STOCK_ADJUSTED).
+        """
+        key = PROCESSED_ORDER_KEY.format(order_id=order_id)
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                state = await redis.eval(
+                    _CLAIM_LUA, 1, key,
+                    PROCESSED_ORDER_TTL_SECONDS, CLAIM_STOCK_ADJUSTED, _CLAIM_HELD, CLAIM_NEW,
+                )
+                if not state:
+                    return None
+                return state.decode() if isinstance(state, bytes) else state
+            except Exception as e:
+                print(f"⚠️ Redis claim failed, using local claims: {e}")
+
+        state = self._local_claims.get(order_id)
+        if state is not None and state != CLAIM_STOCK_ADJUSTED:
+            return None
+        if state is None and len(self._local_claims) >= _MAX_LOCAL_CLAIMS:
+            # Drop the oldest claim (dicts keep insertion order)
+            self._local_claims.pop(next(iter(self._local_claims)))
+        self._local_claims[order_id] = _CLAIM_HELD
+        return state or CLAIM_NEW
+
+    async def release_order(self, order_id: str, progress: str = CLAIM_NEW) -> None:
+        """Undo a claim so a failed order can be retried from ``progress``."""
+        key = PROCESSED_ORDER_KEY.format(order_id=order_id)
+        if progress == CLAIM_NEW:
+            self._local_claims.pop(order_id, None)
+        else:
+            self._local_claims[order_id] = progress
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                if progress == CLAIM_NEW:
+                    await redis.delete(key)
+                else:
+                    await redis.set(key, progress, ex=PROCESSED_ORDER_TTL_SECONDS)
+            except Exception:
+                pass
+
     async def handle_order(self, event: Event):
-        """Process an order"""
-        print(f"🛒 Processing order...")
-        
+        """Process an order exactly once"""
+        payload = event.payload
+        order_id = payload.get("order_id")
+        if not order_id:
+            print("⚠️ order_created event without order_id, skipping")
+            return
+
+        progress = await self.claim_order(order_id)
+        if progress is None:
+            print(f"↩️ Order {order_id[:8]} already processed, skipping")
+            return
+
+        print(f"🛒 Processing order {order_id[:8]}...")
+
         try:
-            payload = event.payload
-            order_id = payload.get("order_id")
             items = payload.get("items", [])
-            
-            # Update inventory for each item
-            for item in items:
-                await self.update_inventory(
-                    event.store_id,
-                    item["product_id"],
-                    item["quantity"]
-                )
-            
-            # Mark order as confirmed
+
+            # customer-service reduces stock when it creates the order; only
+            # producers that did not do so still need the agent to adjust it.
+            if not payload.get("inventory_adjusted") and progress != CLAIM_STOCK_ADJUSTED:
+                self.update_inventory_batch(event.store_id, items)
+                progress = CLAIM_STOCK_ADJUSTED
+
+            await self.finalize_order(event.store_id, order_id, items, payload.get("status"))
+
+        except Exception as e:
+            print(f"❌ Order error: {e}")
+            await self.release_order(order_id, progress)
+
+    async def finalize_order(self, store_id: str, order_id: str,
+                             items: list, status: str = None):
+        """Confirm the order and trigger a single inventory check for all its items"""
+        if status != "confirmed":
             self.supabase.table("orders")\
                 .update({"status": "confirmed"})\
                 .eq("id", order_id)\
+                .neq("status", "confirmed")\
                 .execute()
-            
-            print(f"✅ Order {order_id[:8]} confirmed")
-            
-            # Trigger inventory check
-            await event_bus.publish(Event(
-                type="inventory_updated",
-                store_id=event.store_id,
-                payload={"order_id": order_id}
-            ))
-            
-        except Exception as e:
-            print(f"❌ Order error: {e}")
-    
-    async def update_inventory(self, store_id: str, 
-                             product_id: str, quantity: float):
-        """Reduce inventory"""
-        # Get current stock
-        response = self.supabase.table("inventory")\
-            .select("quantity")\
-            .eq("store_id", store_id)\
-            .eq("product_id", product_id)\
-            .execute()
-        
-        if response.data:
-            current = float(response.data[0]["quantity"])
-            new = current - quantity
-            
-            # Update
-            self.supabase.table("inventory")\
-                .update({"quantity": new})\
-                .eq("store_id", store_id)\
-                .eq("product_id", product_id)\
-                .execute()
-            
-            print(f"📦 Stock updated: {current} → {new}")
\ No newline at end of file
+
+        print(f"✅ Order {order_id[:8]} confirmed")
+
+        # New credit orders change the store's default-risk picture
+        invalidate_store_risk(store_id)
+
+        # One inventory check per order, covering every product it touched
+        await event_bus.publish(Event(
+            type="inventory_updated",
+            store_id=store_id,
+            payload={
+                "order_id": order_id,
+                "product_ids": [item["product_id"] for item in items if item.get("product_id")],
+            }
+        ))
+
+    def update_inventory_batch(self, store_id: str, items: list):
+        """Reduce inventory for every item of an order in one atomic update"""
+        quantities: dict[str, float] = {}
+        for item in items:
+            product_id = item.get("product_id")
+            if product_id:
+                quantities[product_id] = quantities.get(product_id, 0.0) + float(item.get("quantity", 0))
+        if not quantities:
+            return
+
+        # quantity = quantity - ordered in the database (migration 017), so
+        # concurrent orders cannot overwrite each other's stock update
+        response = self.supabase.rpc("decrement_inventory", {
+            "p_store_id": store_id,
+            "p_items": json.dumps([
+                {"product_id": product_id, "quantity": quantity}
+                for product_id, quantity in quantities.items()
+            ]),
+        }).execute()
+
+        for row in response.data or []:
+            new = float(row["quantity"])
+            print(f"📦 Stock updated: {row['product_id'][:8]} → {new}")
+            if new < 0:
+                # Not clamped: a negative stock level is an oversell to resolve
+                print(f"⚠️ Oversold product {row['product_id'][:8]} in store {store_id[:8]}: stock {new}")
+
+        # Cached product catalogs (customer bot) must revalidate
+        bump_catalog_version(store_id)
@@ -11,7 +11,7 @@ import urllib.parse
 from datetime import datetime, timezone
 
 from supabase import create_client
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 from agents.inventory_orchestrator import (
     DemandForecastingModule,
@@ -20,6 +20,7 @@ from agents.inventory_orchestrator import (
 )
 from agents.message_bus.protocol import AgentMessage, AgentName, MessageType
 from agents.message_bus.publisher import AgentMessagePublisher
+from agents.telegram_outbound import PRIORITY_CRITICAL, outbound
 from events.event_types import Event
 
 logger = logging.getLogger(__name__)
@@ -42,8 +43,7 @@ class ReorderAgent:
         self.forecaster = DemandForecastingModule(self.supabase)
         self.decision_engine = ReorderDecisionEngine(self.supabase)
         self.learning = LearningSystem(self.supabase)
-        _token = bot_token or os.getenv("OWNER_BOT_TOKEN", "")
-        self.bot = Bot(token=_token) if _token else None
+        self.bot_token = bot_token or os.getenv("OWNER_BOT_TOKEN", "")
         self.message_bus = AgentMessagePublisher()
         logger.info("✅ ReorderAgent ready")
 
@@ -190,7 +190,7 @@ class ReorderAgent:
         reorder_id: str,
     ) -> None:
         """Send Telegram message with Approve / Edit / Reject inline buttons."""
-        if not self.bot:
+        if not self.bot_token:
             logger.warning("No Telegram bot configured – skipping approval request")
             return
 
@@ -239,9 +239,11 @@ class ReorderAgent:
         )
 
         try:
-            await self.bot.send_message(
-                chat_id=chat_id,
-                text=text,
+            await outbound.send(
+                self.bot_token,
+                chat_id,
+                text,
+                priority=PRIORITY_CRITICAL,
                 parse_mode="Markdown",
                 reply_markup=keyboard,
             )
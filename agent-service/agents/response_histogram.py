@@ -0,0 +1,211 @@
+"""
+Response-Hour Histograms (8.1.2 / 4.5)
+Compact per-customer 24-bucket histograms of notification response hours.
+
+Each customer has one Redis string ``resp_hist:{customer_id}`` holding 24
+saturating u16 counters (48 bytes), incremented with BITFIELD whenever
+track_response_time records a response. Optimal send hours for a whole
+segment are answered with one MGET; customers without a histogram are
+backfilled once from notification_history with a single grouped read.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Iterable, Optional
+
+from agents.bulk import chunks
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_KEY = "resp_hist:{customer_id}"
+HOURS = 24
+BUCKET_BYTES = 2                         # u16 counters
+HISTOGRAM_BYTES = HOURS * BUCKET_BYTES
+
+# Only count into histograms that exist: a missing key is backfilled from
+# notification_history (which already contains the new response) on read.
+# KEYS[1] = histogram key, ARGV[1] = "#<hour>"
+_RECORD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('BITFIELD', KEYS[1], 'OVERFLOW', 'SAT', 'INCRBY', 'u16', ARGV[1], 1)
+end
+return false
+"""
+
+
+def _get_supabase():
+    from supabase import create_client
+    return create_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_KEY"),
+    )
+
+
+def _get_redis():
+    """Binary Redis client (histograms are packed bytes), or None."""
+    try:
+        from redis_client import get_sync_binary_client
+        return get_sync_binary_client()
+    except Exception as exc:
+        logger.debug("Redis unavailable for response histograms: %s", exc)
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Encoding
+# ---------------------------------------------------------------------------
+
+def decode_histogram(raw: Optional[bytes]) -> Optional[list[int]]:
+    """Unpack a BITFIELD u16 string into 24 counts (None if the key is missing)."""
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        raw = raw.encode("latin-1")
+    raw = raw.ljust(HISTOGRAM_BYTES, b"\x00")
+    return [
+        int.from_bytes(raw[h * BUCKET_BYTES:(h + 1) * BUCKET_BYTES], "big")
+        for h in range(HOURS)
+    ]
+
+
+def encode_histogram(counts: list[int]) -> bytes:
+    """Pack 24 counts into the same layout BITFIELD u16 #hour uses."""
+    return b"".join(
+        min(int(c), 0xFFFF).to_bytes(BUCKET_BYTES, "big") for c in counts[:HOURS]
+    ).ljust(HISTOGRAM_BYTES, b"\x00")
+
+
+# ---------------------------------------------------------------------------
+# Writes
+# ---------------------------------------------------------------------------
+
+def record_response(customer_id: str, hour: int, redis_client=None) -> bool:
+    """
+    Increment one customer's counter for ``hour`` (saturates at 65535).
+    Call after the response is stored in notification_history.
+    """
+    if hour is None or not 0 <= int(hour) < HOURS:
+        return False
+    redis = redis_client or _get_redis()
+    if redis is None:
+        return False
+    try:
+        redis.eval(
+            _RECORD_SCRIPT, 1, HISTOGRAM_KEY.format(customer_id=customer_id), f"#{int(hour)}"
+        )
+        return True
+    except Exception as exc:
+        logger.warning("record_response error: %s", exc)
+        return False
+
+
+# ---------------------------------------------------------------------------
+# Reads
+# ---------------------------------------------------------------------------
+
+def load_histograms_from_db(customer_ids: list[str], db_conn=None) -> dict[str, list[int]]:
+    """Build histograms from notification_history with one grouped read per chunk."""
+    supabase = db_conn or _get_supabase()
+    histograms = {cid: [0] * HOURS for cid in customer_ids}
+    for chunk in chunks(list(customer_ids)):
+        try:
+            result = (
+                supabase.table("notification_history")
+                .select("customer_id, response_hour")
+                .in_("customer_id", chunk)
+                .eq("responded", True)
+                .not_.is_("response_hour", "null")
+                .execute()
+            )
+        except Exception as exc:
+            logger.error("load_histograms_from_db error: %s", exc)
+            continue
+        for row in result.data or []:
+            hour = row.get("response_hour")
+            counts = histograms.get(row.get("customer_id"))
+            if counts is not None and hour is not None and 0 <= hour < HOURS:
+                counts[hour] += 1
+    return histograms
+
+
+def get_histograms(
+    customer_ids: Iterable[str],
+    db_conn=None,
+    redis_client=None,
+    backfill: bool = True,
+) -> dict[str, list[int]]:
+    """
+    Return {customer_id: [24 counts]} for a segment with one MGET (chunked).
+
+    Customers without a Redis histogram are loaded from the DB in one grouped
+    read and written back, so later lookups never touch the history table.
+    Without Redis the DB read serves every customer.
+    """
+    ids = list(dict.fromkeys(customer_ids))
+    if not ids:
+        return {}
+    redis = redis_client or _get_redis()
+    if redis is None:
+        return load_histograms_from_db(ids, db_conn=db_conn) if backfill else {}
+
+    histograms: dict[str, list[int]] = {}
+    missing: list[str] = []
+    try:
+        for chunk in chunks(ids):
+            raw_values = redis.mget([HISTOGRAM_KEY.format(customer_id=cid) for cid in chunk])
+            for cid, raw in zip(chunk, raw_values):
+                counts = decode_histogram(raw)
+                if counts is None:
+                    missing.append(cid)
+                else:
+                    histograms[cid] = counts
+    except Exception as exc:
+        logger.warning("get_histograms: Redis error, reading from DB: %s", exc)
+        return load_histograms_from_db(ids, db_conn=db_conn) if backfill else {}
+
+    if missing and backfill:
+        loaded = load_histograms_from_db(missing, db_conn=db_conn)
+        histograms.update(loaded)
+        try:
+            pipe = redis.pipeline()
+            for cid, counts in loaded.items():
+                # NX: never clobber increments recorded since the MGET
+                pipe.set(HISTOGRAM_KEY.format(customer_id=cid), encode_histogram(counts), nx=True)
+            pipe.execute()
+        except Exception as exc:
+            logger.warning("get_histograms: backfill write error: %s", exc)
+    return histograms
+
+
+def get_histogram(customer_id: str, db_conn=None, redis_client=None, backfill: bool = True) -> Optional[list[int]]:
+    """Single-customer convenience wrapper around get_histograms."""
+    return get_histograms(
+        [customer_id], db_conn=db_conn, redis_client=redis_client, backfill=backfill
+    ).get(customer_id)
+
+
+def to_hour_counts(histogram: Optional[list[int]]) -> dict[int, int]:
+    """Convert a 24-bucket histogram into the sparse {hour: count} form."""
+    return {h: c for h, c in enumerate(histogram or []) if c}
+
+
+def get_cached_hour_counts(customer_id: str, db_conn=None, redis_client=None) -> Optional[dict[int, int]]:
+    """
+    Sparse {hour: count} for one customer from the Redis histogram.
+    Returns None when Redis is unavailable so callers keep their DB path.
+    """
+    redis = redis_client or _get_redis()
+    if redis is None:
+        return None
+    try:
+        # The client connects lazily: an unreachable server only shows here
+        raw = redis.mget([HISTOGRAM_KEY.format(customer_id=customer_id)])[0]
+    except Exception as exc:
+        logger.debug("get_cached_hour_counts: Redis error, using DB path: %s", exc)
+        return None
+    if raw is not None:
+        return to_hour_counts(decode_histogram(raw))
+    histogram = get_histogram(customer_id, db_conn=db_conn, redis_client=redis)
+    return None if histogram is None else to_hour_counts(histogram)
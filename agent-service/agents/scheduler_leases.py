@@ -0,0 +1,254 @@
+"""
+Scheduler Leases
+Lets several scheduler replicas share the per-store jobs without sending
+anything twice.
+
+Redis layout (``group`` names one scheduler deployment):
+- sched:members:{group}                    sorted set, member id -> heartbeat expiry
+- sched:leader:{group}                     leader lease (SET NX PX, renewed by its holder)
+- sched:claim:{job}:{store_id}:{run_key}   idempotency key per store and firing
+
+Every live replica sends a heartbeat into the members set. On each firing a
+replica takes the stores it owns under rendezvous hashing over the live
+members, so adding a replica moves only its share of stores. Before touching
+a store it claims (job, store, firing) with SET NX. A store is therefore
+handled at most once per firing, even while membership changes or two
+replicas briefly disagree about the member list. Claims are marked done
+whatever the outcome (a report that timed out may still have been
+delivered). A claim whose worker died expires after the store timeout.
+Once a firing's deadline (window + store timeout) has passed, the leader
+sweeps the stores that still have no claim, such as the shard of a replica
+that vanished; live replicas keep their jittered share of the work.
+
+Without Redis a coordinator behaves like a single replica: it leads, owns
+every store and keeps its claims in memory. If Redis fails mid-run, claims
+fail open (logged): an outage may at worst repeat a store, never skip one.
+
+The module has no intra-package imports. The owner bot loads it straight
+from agent-service/agents.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+LEASE_TTL_SECONDS = 30
+MEMBER_TTL_SECONDS = 30
+HEARTBEAT_INTERVAL_SECONDS = 10
+# Finished claims outlive the firing so a late or restarted replica skips it
+DONE_TTL_SECONDS = 36 * 3600
+# Extra time a running claim is held beyond the store timeout
+CLAIM_GRACE_SECONDS = 60
+
+# Renew only if we still hold the lease
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Release only if we still hold the lease
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def default_member_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def rendezvous_owner(key: str, members: Iterable[str]) -> Optional[str]:
+    """Member with the highest hash score for ``key`` (stable across processes)."""
+    return max(
+        members,
+        key=lambda member: hashlib.sha1(f"{member}|{key}".encode()).digest(),
+        default=None,
+    )
+
+
+class LeaderLease:
+    """A TTL lease in Redis; the holder renews it before it expires."""
+
+    def __init__(self, redis, name: str, holder: str, ttl_seconds: float = LEASE_TTL_SECONDS):
+        self._redis = redis
+        self.key = f"sched:leader:{name}"
+        self.holder = holder
+        self.ttl_seconds = ttl_seconds
+        self._valid_until = 0.0
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    async def try_acquire(self) -> bool:
+        """Take the lease if free, or renew it if already ours."""
+        ttl_ms = int(self.ttl_seconds * 1000)
+        started = time.monotonic()
+        if self._redis is None:
+            self._valid_until = started + self.ttl_seconds
+            return True
+        try:
+            acquired = await self._redis.set(self.key, self.holder, nx=True, px=ttl_ms)
+            if not acquired:
+                acquired = await self._redis.eval(_RENEW_LUA, 1, self.key, self.holder, ttl_ms)
+        except Exception as exc:
+            logger.warning("Leader lease %s check failed: %s", self.key, exc)
+            acquired = False
+        # Count the TTL from before the round-trip so we never overestimate it
+        self._valid_until = started + self.ttl_seconds if acquired else 0.0
+        return bool(acquired)
+
+    async def release(self) -> None:
+        self._valid_until = 0.0
+        if self._redis is None:
+            return
+        try:
+            await self._redis.eval(_RELEASE_LUA, 1, self.key, self.holder)
+        except Exception as exc:
+            logger.warning("Leader lease %s release failed: %s", self.key, exc)
+
+
+class ReplicaCoordinator:
+    """Leadership, store sharding and per-firing claims for StoreJobScheduler."""
+
+    def __init__(self, redis=None, group: str = "scheduler", member_id: Optional[str] = None):
+        self._redis = redis
+        self.group = group
+        self.member_id = member_id or default_member_id()
+        self.lease = LeaderLease(redis, group, self.member_id)
+        self.members_key = f"sched:members:{group}"
+        self.members: list[str] = [self.member_id]
+        self._local_claims: dict[str, float] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------------
+    # Membership and leadership
+    # ------------------------------------------------------------------
+
+    async def heartbeat(self) -> list[str]:
+        """Refresh our membership and the lease; returns the live members."""
+        await self.lease.try_acquire()
+        if self._redis is None:
+            return self.members
+        now = time.time()
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.zadd(self.members_key, {self.member_id: now + MEMBER_TTL_SECONDS})
+            pipe.zremrangebyscore(self.members_key, "-inf", now)
+            pipe.zrange(self.members_key, 0, -1)
+            *_, members = await pipe.execute()
+            self.members = sorted(members) or [self.member_id]
+        except Exception as exc:
+            # Keep the last known members so shards stay where they were
+            logger.warning("Scheduler heartbeat failed: %s", exc)
+        return self.members
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await self.heartbeat()
+            await asyncio.sleep(HEARTBEAT_INTERVAL_SECONDS)
+
+    async def start(self) -> None:
+        await self.heartbeat()
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.get_running_loop().create_task(self._heartbeat_loop())
+
+    async def stop(self) -> None:
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+        await self.lease.release()
+        if self._redis is not None:
+            try:
+                await self._redis.zrem(self.members_key, self.member_id)
+            except Exception:
+                pass
+
+    @property
+    def is_leader(self) -> bool:
+        return self.lease.is_leader
+
+    # ------------------------------------------------------------------
+    # Store selection
+    # ------------------------------------------------------------------
+
+    async def select(self, job: str, stores: list[dict]) -> list[dict]:
+        """Stores this replica runs first: its rendezvous shard."""
+        members = await self.heartbeat()
+        return [s for s in stores if rendezvous_owner(str(s["id"]), members) == self.member_id]
+
+    async def sweep(self, job: str, stores: list[dict], selected: list[dict], run_key: str) -> list[dict]:
+        """
+        Stores outside our shard that nobody has claimed in this firing (leader
+        only). Called once the job's deadline has passed, so these belong to
+        replicas that are gone; on a Redis error nothing is swept.
+        """
+        if not self.is_leader:
+            return []
+        chosen = {id(store) for store in selected}
+        candidates = [store for store in stores if id(store) not in chosen]
+        if not candidates:
+            return []
+        keys = [self.claim_key(job, store.get("id"), run_key) for store in candidates]
+        if self._redis is None:
+            now = time.monotonic()
+            claimed = [self._local_claims.get(key, 0) > now for key in keys]
+        else:
+            try:
+                pipe = self._redis.pipeline(transaction=False)
+                for key in keys:
+                    pipe.exists(key)
+                claimed = await pipe.execute()
+            except Exception as exc:
+                logger.warning("Sweep of %s skipped, claims unreadable: %s", job, exc)
+                return []
+        return [store for store, taken in zip(candidates, claimed) if not taken]
+
+    # ------------------------------------------------------------------
+    # Idempotency
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def claim_key(job: str, store_id, run_key: str) -> str:
+        return f"sched:claim:{job}:{store_id}:{run_key}"
+
+    async def claim(self, job: str, store_id, run_key: str, timeout_seconds: float) -> bool:
+        """True if this replica may run ``job`` for the store in this firing."""
+        key = self.claim_key(job, store_id, run_key)
+        ttl = int(timeout_seconds + CLAIM_GRACE_SECONDS)
+        if self._redis is None:
+            now = time.monotonic()
+            if self._local_claims.get(key, 0) > now:
+                return False
+            self._local_claims = {k: exp for k, exp in self._local_claims.items() if exp > now}
+            self._local_claims[key] = now + ttl
+            return True
+        try:
+            return bool(await self._redis.set(key, f"running:{self.member_id}", nx=True, ex=ttl))
+        except Exception as exc:
+            logger.warning("Claim %s failed, running anyway: %s", key, exc)
+            return True
+
+    async def finish(self, job: str, store_id, run_key: str, status: str) -> None:
+        key = self.claim_key(job, store_id, run_key)
+        if self._redis is None:
+            self._local_claims[key] = time.monotonic() + DONE_TTL_SECONDS
+            return
+        try:
+            await self._redis.set(key, f"done:{status}:{self.member_id}", ex=DONE_TTL_SECONDS)
+        except Exception as exc:
+            logger.warning("Marking claim %s done failed: %s", key, exc)
@@ -0,0 +1,297 @@
+"""
+Store Job Scheduler
+Runs the owner bot's daily per-store jobs on one asyncio event loop.
+
+Each job fires at fixed local times ("HH:MM"). A run loads the store list
+once, gives every store a start slot spread evenly over the job's window
+(with random jitter inside the slot, so the LLM and database see a steady
+trickle instead of a burst) and hands the stores to a bounded pool of
+workers. Every store gets its own timeout, so one slow or failing store
+never holds up the rest. Jobs due at the same time run side by side; a job
+still running when it is due again skips that firing instead of stacking.
+
+Each run is summarised in a JobRun (duration, successes, failures,
+timeouts, how late stores started, slowest store), logged and kept in
+``history``. With enough workers every store finishes within
+``window_seconds + store_timeout`` of the firing time; that is
+``StoreJob.deadline_seconds``, the delivery promise made to owners, and a
+run that misses it is logged as a warning.
+
+With a ``coordinator`` (scheduler_leases.ReplicaCoordinator) several
+replicas share the jobs: each runs its shard of the stores, claims every
+(job, store, firing) before running it so nothing is sent twice, and once
+the deadline has passed the leader sweeps stores nobody claimed.
+
+The module has no intra-package imports. The owner bot loads it straight
+from agent-service/agents.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 10
+DEFAULT_STORE_TIMEOUT_SECONDS = 120.0
+MAX_HISTORY = 200
+# Longest single sleep while waiting for a firing time (re-reads the wall clock)
+MAX_SLEEP_SECONDS = 60.0
+
+StoreRunner = Callable[[dict], Awaitable[Any]]
+StoreLoader = Callable[[], Awaitable[list]]
+
+
+@dataclass
+class StoreJob:
+    """A job that runs ``run_store(store)`` for every store at ``times``."""
+
+    name: str
+    times: Sequence[str]
+    run_store: StoreRunner
+    concurrency: int = DEFAULT_CONCURRENCY
+    window_seconds: float = 0.0
+    store_timeout: float = DEFAULT_STORE_TIMEOUT_SECONDS
+
+    @property
+    def deadline_seconds(self) -> float:
+        return self.window_seconds + self.store_timeout
+
+    def next_fire(self, now: datetime) -> datetime:
+        """Next firing time strictly after ``now`` (local wall clock)."""
+        upcoming = []
+        for at in self.times:
+            hour, minute = (int(part) for part in at.split(":"))
+            fire = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if fire <= now:
+                fire += timedelta(days=1)
+            upcoming.append(fire)
+        return min(upcoming)
+
+
+@dataclass
+class JobRun:
+    """Metrics for one run of a job."""
+
+    job: str
+    started_at: datetime
+    run_key: str = ""
+    stores: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    # Claimed by another replica (or already done in this firing)
+    skipped: int = 0
+    duration_seconds: float = 0.0
+    max_lateness_seconds: float = 0.0
+    slowest_store_seconds: float = 0.0
+    store_seconds: list = field(default_factory=list, repr=False)
+
+    def percentile(self, pct: float) -> float:
+        if not self.store_seconds:
+            return 0.0
+        ordered = sorted(self.store_seconds)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def as_dict(self) -> dict:
+        return {
+            "job": self.job,
+            "started_at": self.started_at.isoformat(),
+            "stores": self.stores,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "skipped": self.skipped,
+            "duration_seconds": round(self.duration_seconds, 3),
+            "max_lateness_seconds": round(self.max_lateness_seconds, 3),
+            "p95_store_seconds": round(self.percentile(95), 3),
+            "slowest_store_seconds": round(self.slowest_store_seconds, 3),
+        }
+
+
+def plan_offsets(count: int, window_seconds: float, rng: Optional[random.Random] = None) -> list[float]:
+    """Start offsets (seconds) for ``count`` stores: one jittered slot each across the window."""
+    if count <= 0:
+        return []
+    if window_seconds <= 0:
+        return [0.0] * count
+    rng = rng or random
+    slot = window_seconds / count
+    return [i * slot + rng.uniform(0, slot) for i in range(count)]
+
+
+class StoreJobScheduler:
+    """Fires StoreJobs at their times and fans each run out over the stores."""
+
+    def __init__(
+        self,
+        load_stores: StoreLoader,
+        rng: Optional[random.Random] = None,
+        clock: Callable[[], datetime] = datetime.now,
+        coordinator=None,
+    ):
+        self._load_stores = load_stores
+        self.coordinator = coordinator
+        self._rng = rng or random.Random()
+        self._clock = clock
+        self.jobs: dict[str, StoreJob] = {}
+        self.history: deque[JobRun] = deque(maxlen=MAX_HISTORY)
+        self._running: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    def add(self, job: StoreJob) -> StoreJob:
+        self.jobs[job.name] = job
+        return job
+
+    # ------------------------------------------------------------------
+    # One run
+    # ------------------------------------------------------------------
+
+    async def run_job(self, job: StoreJob, fired_at: Optional[datetime] = None) -> Optional[JobRun]:
+        """
+        Run ``job`` for every store now (or for this replica's share of them).
+        ``fired_at`` identifies the firing for idempotency; defaults to now.
+        Returns None if the job is already running here.
+        """
+        if job.name in self._running:
+            logger.warning("%s is still running, skipping this firing", job.name)
+            return None
+        self._running.add(job.name)
+        run = JobRun(job=job.name, started_at=self._clock())
+        run.run_key = (fired_at or run.started_at).strftime("%Y-%m-%dT%H:%M")
+        started = time.monotonic()
+        finished = None
+        try:
+            try:
+                stores = list(await self._load_stores())
+            except Exception as exc:
+                logger.error("%s: could not load stores: %s", job.name, exc)
+                stores = []
+            run.stores = len(stores)
+
+            own = stores
+            if self.coordinator is not None:
+                own = await self.coordinator.select(job.name, stores)
+            pending = deque(zip(plan_offsets(len(own), job.window_seconds, self._rng), own))
+
+            async def worker():
+                while pending:
+                    offset, store = pending.popleft()
+                    delay = started + offset - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    else:
+                        run.max_lateness_seconds = max(run.max_lateness_seconds, -delay)
+                    await self._run_store(job, store, run)
+
+            await asyncio.gather(*(worker() for _ in range(min(max(job.concurrency, 1), len(own)))))
+            finished = time.monotonic()
+
+            if self.coordinator is not None and self.coordinator.is_leader and len(own) < len(stores):
+                # Give the other replicas until the deadline to run their shards
+                delay = started + job.deadline_seconds - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                leftovers = await self.coordinator.sweep(job.name, stores, own, run.run_key)
+                if leftovers:
+                    # Offset 0: these are overdue already
+                    pending.extend((0.0, store) for store in leftovers)
+                    await asyncio.gather(*(worker() for _ in range(min(max(job.concurrency, 1), len(leftovers)))))
+                    finished = time.monotonic()
+        finally:
+            # Time spent waiting for the sweep is not part of the run
+            run.duration_seconds = (finished if finished is not None else time.monotonic()) - started
+            self._running.discard(job.name)
+            self._record(job, run)
+        return run
+
+    async def _run_store(self, job: StoreJob, store: dict, run: JobRun) -> None:
+        coordinator = self.coordinator
+        if coordinator is not None and not await coordinator.claim(
+                job.name, store.get("id"), run.run_key, job.store_timeout):
+            run.skipped += 1
+            return
+        status = "ok"
+        store_started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(job.run_store(store), timeout=job.store_timeout)
+            # Agents report handled errors by returning False
+            if result is False:
+                run.failed += 1
+                status = "failed"
+            else:
+                run.succeeded += 1
+        except asyncio.TimeoutError:
+            run.timed_out += 1
+            status = "timed_out"
+            logger.warning("%s timed out after %.0fs for store %s",
+                           job.name, job.store_timeout, store.get("name") or store.get("id"))
+        except Exception as exc:
+            run.failed += 1
+            status = "failed"
+            logger.error("%s failed for store %s: %s", job.name, store.get("name") or store.get("id"), exc)
+        finally:
+            elapsed = time.monotonic() - store_started
+            run.store_seconds.append(elapsed)
+            run.slowest_store_seconds = max(run.slowest_store_seconds, elapsed)
+        if coordinator is not None:
+            await coordinator.finish(job.name, store.get("id"), run.run_key, status)
+
+    def _record(self, job: StoreJob, run: JobRun) -> None:
+        self.history.append(run)
+        logger.info(
+            "%s: %d stores in %.1fs (ok=%d failed=%d timed_out=%d skipped=%d, "
+            "max start lateness %.1fs, p95 store %.1fs)",
+            job.name, run.stores, run.duration_seconds, run.succeeded, run.failed,
+            run.timed_out, run.skipped, run.max_lateness_seconds, run.percentile(95),
+        )
+        if run.duration_seconds > job.deadline_seconds:
+            logger.warning(
+                "%s missed its %.0fs deadline (took %.0fs): raise concurrency or widen the window",
+                job.name, job.deadline_seconds, run.duration_seconds,
+            )
+
+    # ------------------------------------------------------------------
+    # Firing times
+    # ------------------------------------------------------------------
+
+    async def _job_loop(self, job: StoreJob) -> None:
+        while True:
+            fire = job.next_fire(self._clock())
+            while (remaining := (fire - self._clock()).total_seconds()) > 0:
+                await asyncio.sleep(min(remaining, MAX_SLEEP_SECONDS))
+            # Runs that overlap the next firing of the same job are skipped
+            task = asyncio.get_running_loop().create_task(self.run_job(job, fired_at=fire))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def run_forever(self) -> None:
+        """Fire every job at its times until cancelled."""
+        if self.coordinator is not None:
+            await self.coordinator.start()
+        try:
+            await asyncio.gather(*(self._job_loop(job) for job in self.jobs.values()))
+        finally:
+            if self.coordinator is not None:
+                await self.coordinator.stop()
+
+    def last_run(self, name: str) -> Optional[JobRun]:
+        return next((run for run in reversed(self.history) if run.job == name), None)
+
+    def stats(self) -> dict:
+        """Latest run metrics per job, plus jobs in progress."""
+        return {
+            "running": sorted(self._running),
+            "leader": self.coordinator.is_leader if self.coordinator is not None else True,
+            "last_runs": {
+                name: run.as_dict() for name in self.jobs if (run := self.last_run(name))
+            },
+        }
@@ -0,0 +1,478 @@
+"""
+Telegram Outbound Service
+Single delivery path for every bot message the platform sends.
+
+All agents share one pooled ``telegram.Bot`` per token. Messages pass
+through a priority queue, so critical alerts go ahead of reports and
+promos. Each token has a token bucket at Telegram's ~30 msg/s bot limit,
+and each chat has its own FIFO that sends at most one message per second,
+in order. A 429 retry_after pauses the whole token instead of every sender
+retrying on its own.
+
+The bot limit applies to the token, not to a process: agent-service, the
+owner bot and owner-service all send with the same bots. The token bucket
+therefore lives in Redis (one Lua script per acquire) and is shared by every
+process. Without Redis a process falls back to a local bucket at
+1/TELEGRAM_SENDER_PROCESSES of the rate, so the senders together still stay
+under the limit.
+
+The module has no intra-package imports. The owner bot and owner-service
+load it straight from agent-service/agents.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Lower value = delivered first
+PRIORITY_CRITICAL = 0   # approvals, stock and credit alerts
+PRIORITY_NORMAL = 1     # customer notifications
+PRIORITY_REPORT = 2     # daily / BI reports
+PRIORITY_BULK = 3       # promos, lifecycle campaigns
+
+# Telegram limits for bots: ~30 messages/second overall, ~1/second per chat
+GLOBAL_RATE_PER_SECOND = 30.0
+PER_CHAT_INTERVAL_SECONDS = 1.0
+
+# Processes sending with the same bots (agent-service, owner bot,
+# owner-service); each gets this share of the rate when Redis is unreachable
+SENDER_PROCESSES = max(1, int(os.getenv("TELEGRAM_SENDER_PROCESSES", "3")))
+# Shared bucket per token (hashed: the key must not expose the token)
+SHARED_BUCKET_KEY = "tg_rate:{token_id}"
+# After a Redis error, use the local bucket for this long before retrying
+SHARED_BUCKET_RETRY_SECONDS = 30
+
+WORKER_COUNT = 20
+MAX_ATTEMPTS = 3
+MAX_TRACKED_CHATS = 10_000
+
+
+def _retry_after_seconds(exc) -> float:
+    """RetryAfter.retry_after is an int or a timedelta depending on PTB settings."""
+    value = getattr(exc, "retry_after", 1)
+    if hasattr(value, "total_seconds"):
+        return float(value.total_seconds())
+    return float(value)
+
+
+def _build_bot(token: str, pool_size: int):
+    """One Bot with a connection pool sized for the worker count."""
+    from telegram import Bot
+    from telegram.request import HTTPXRequest
+
+    return Bot(token=token, request=HTTPXRequest(connection_pool_size=pool_size))
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, bursts up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for ``seconds`` (Telegram asked us to back off)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# KEYS[1] bucket hash; ARGV[1] rate (tokens/s); ARGV[2] capacity
+# Takes a token and returns 0, or returns the milliseconds to wait.
+# Uses the Redis clock so that every process sees the same time.
+_ACQUIRE_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'paused_until')
+local paused_until = tonumber(state[3]) or 0
+if now < paused_until then
+    return paused_until - now
+end
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', now)
+redis.call('PEXPIRE', KEYS[1], 60000)
+return wait
+"""
+
+# KEYS[1] bucket hash; ARGV[1] pause (ms)
+_PAUSE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local until_ms = now + tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'paused_until')) or 0
+if until_ms > current then
+    redis.call('HSET', KEYS[1], 'paused_until', until_ms, 'tokens', 0, 'updated', now)
+end
+redis.call('PEXPIRE', KEYS[1], math.max(60000, tonumber(ARGV[1]) + 60000))
+return 1
+"""
+
+
+def _build_redis():
+    """Async Redis client for the shared buckets (None if redis is missing)."""
+    try:
+        import redis.asyncio as aioredis
+    except ImportError:
+        return None
+    return aioredis.Redis.from_url(
+        os.getenv("REDIS_URL", "redis://localhost:6379"),
+        socket_connect_timeout=1,
+        socket_timeout=1,
+    )
+
+
+class SharedTokenBucket:
+    """
+    TokenBucket kept in Redis so that every process sending with one token
+    draws from the same tokens. Falls back to ``local`` while Redis fails.
+    """
+
+    def __init__(self, redis, token: str, rate: float, local: TokenBucket,
+                 capacity: Optional[float] = None):
+        token_id = hashlib.sha256(token.encode()).hexdigest()[:16]
+        self.key = SHARED_BUCKET_KEY.format(token_id=token_id)
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._redis = redis
+        self._local = local
+        self._redis_down_until = 0.0
+        self._tasks: set = set()
+
+    def _use_redis(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, exc: Exception) -> None:
+        logger.warning("telegram_outbound: shared rate limit unavailable, using local bucket: %s", exc)
+        self._redis_down_until = time.monotonic() + SHARED_BUCKET_RETRY_SECONDS
+
+    def pause(self, seconds: float) -> None:
+        """Pause every process sending with this token."""
+        self._local.pause(seconds)
+        if self._use_redis():
+            task = asyncio.get_running_loop().create_task(self._pause_shared(seconds))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _pause_shared(self, seconds: float) -> None:
+        try:
+            await self._redis.eval(_PAUSE_LUA, 1, self.key, int(seconds * 1000))
+        except Exception as exc:
+            self._redis_failed(exc)
+
+    async def acquire(self) -> None:
+        while self._use_redis():
+            try:
+                wait_ms = int(await self._redis.eval(_ACQUIRE_LUA, 1, self.key, self.rate, self.capacity))
+            except Exception as exc:
+                self._redis_failed(exc)
+                break
+            if wait_ms <= 0:
+                return
+            await asyncio.sleep(wait_ms / 1000)
+        await self._local.acquire()
+
+
+@dataclass
+class OutboundMessage:
+    """One queued send_message call."""
+
+    token: str
+    chat_id: Any
+    text: str
+    priority: int
+    future: asyncio.Future
+    options: dict = field(default_factory=dict)   # parse_mode, reply_markup, ...
+    plain_fallback: bool = True
+    attempts: int = 0
+    sending: bool = False
+
+
+class TelegramOutbound:
+    """Prioritised, rate-limited sender shared by all agents of a process."""
+
+    def __init__(
+        self,
+        bot_factory: Optional[Callable[[str], Any]] = None,
+        redis_factory: Optional[Callable[[], Any]] = _build_redis,
+        rate: float = GLOBAL_RATE_PER_SECOND,
+        per_chat_interval: float = PER_CHAT_INTERVAL_SECONDS,
+        workers: int = WORKER_COUNT,
+    ):
+        self._bot_factory = bot_factory or (lambda token: _build_bot(token, workers))
+        self._redis_factory = redis_factory
+        self._rate = rate
+        self._per_chat_interval = per_chat_interval
+        self._worker_count = workers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reset(None)
+
+    def _reset(self, loop) -> None:
+        self._loop = loop
+        self._queue: Optional[asyncio.PriorityQueue] = asyncio.PriorityQueue() if loop else None
+        self._seq = itertools.count()
+        self._bots: dict[str, Any] = {}
+        self._buckets: dict[str, Any] = {}
+        self._redis = None
+        # (token, chat_id) -> messages waiting for that chat; the head is in flight
+        self._chats: dict[tuple, deque] = {}
+        self._last_sent: dict[tuple, float] = {}
+        self._workers: list[asyncio.Task] = []
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        # Queues, buckets and HTTP clients belong to one event loop. Callers
+        # that use asyncio.run() per job (owner-bot scheduler) get a fresh set.
+        self._reset(loop)
+        self._workers = [loop.create_task(self._worker()) for _ in range(self._worker_count)]
+
+    def get_bot(self, token: str):
+        """Pooled Bot for ``token`` (created once per event loop)."""
+        bot = self._bots.get(token)
+        if bot is None:
+            bot = self._bots[token] = self._bot_factory(token)
+        return bot
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def submit(
+        self,
+        token: str,
+        chat_id,
+        text: str,
+        priority: int = PRIORITY_NORMAL,
+        plain_fallback: bool = True,
+        **options,
+    ) -> asyncio.Future:
+        """
+        Queue a message and return a future for the sent Message.
+        ``options`` are passed through to Bot.send_message. If Telegram cannot
+        parse the markup, the message is resent as plain text (plain_fallback).
+        """
+        if not token:
+            raise ValueError("Bot token not configured")
+        self._ensure_started()
+        message = OutboundMessage(
+            token=token,
+            chat_id=chat_id,
+            text=text,
+            priority=priority,
+            future=self._loop.create_future(),
+            options=options,
+            plain_fallback=plain_fallback,
+        )
+        key = (token, chat_id)
+        pending = self._chats.get(key)
+        if pending:
+            # Chat already has messages queued or in flight: keep order
+            pending.append(message)
+        else:
+            self._chats[key] = deque([message])
+            self._schedule(key)
+        return message.future
+
+    async def send(self, token: str, chat_id, text: str, priority: int = PRIORITY_NORMAL, **options):
+        """Queue a message and wait until it is delivered (raises on failure)."""
+        return await self.submit(token, chat_id, text, priority=priority, **options)
+
+    def cancel_queued(self, futures) -> list[asyncio.Future]:
+        """
+        Cancel the messages of ``futures`` that are still queued. Returns the
+        futures of those being sent right now, which cannot be taken back.
+        """
+        wanted = set(futures)
+        in_flight = []
+        for pending in self._chats.values():
+            for message in pending:
+                if message.future not in wanted or message.future.done():
+                    continue
+                if message.sending:
+                    in_flight.append(message.future)
+                else:
+                    message.future.cancel()
+        return in_flight
+
+    def stats(self) -> dict:
+        return {
+            "queued_chats": self._queue.qsize() if self._queue else 0,
+            "pending_messages": sum(len(q) for q in self._chats.values()),
+            "bots": len(self._bots),
+        }
+
+    async def close(self) -> None:
+        """Stop the workers; undelivered messages fail with CancelledError."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        for pending in self._chats.values():
+            for message in pending:
+                if not message.future.done():
+                    message.future.cancel()
+        if self._redis is not None:
+            try:
+                await self._redis.aclose()
+            except Exception:
+                pass
+        self._reset(None)
+
+    # ------------------------------------------------------------------
+    # Delivery
+    # ------------------------------------------------------------------
+
+    def _schedule(self, key: tuple, delay: float = 0.0) -> None:
+        if delay > 0:
+            self._loop.call_later(delay, self._schedule, key)
+            return
+        pending = self._chats.get(key)
+        if pending:
+            self._queue.put_nowait((pending[0].priority, next(self._seq), key))
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, key = await self._queue.get()
+            try:
+                await self._deliver(key)
+            except Exception as exc:
+                # Never let one bad message take a worker down
+                logger.error("telegram_outbound: delivery error for %s: %s", key[1], exc)
+                self._finish(key, error=exc)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, key: tuple) -> None:
+        pending = self._chats.get(key)
+        if not pending:
+            return
+        wait = self._per_chat_interval - (time.monotonic() - self._last_sent.get(key, 0.0))
+        if wait > 0:
+            self._schedule(key, wait)
+            return
+
+        message = pending[0]
+        if message.future.cancelled():
+            # The sender gave up on it (e.g. its job timed out): never send it late
+            self._finish(key)
+            return
+        bucket = self._buckets.get(message.token)
+        if bucket is None:
+            bucket = self._buckets[message.token] = self._make_bucket(message.token)
+        await bucket.acquire()
+        if message.future.cancelled():
+            self._finish(key)
+            return
+
+        retry_in = None
+        message.attempts += 1
+        message.sending = True
+        try:
+            result = await self.get_bot(message.token).send_message(
+                chat_id=message.chat_id, text=message.text, **message.options
+            )
+        except RetryAfter as exc:
+            # 429: pause every sender on this token; throttling is not a failed attempt
+            retry_in = _retry_after_seconds(exc)
+            bucket.pause(retry_in)
+            message.attempts -= 1
+        except BadRequest as exc:
+            if message.plain_fallback and message.options.get("parse_mode") and "parse" in str(exc).lower():
+                message.options.pop("parse_mode")
+                retry_in = 0.0
+            else:
+                self._finish(key, error=exc)
+        except Forbidden as exc:
+            # Chat blocked the bot: retrying cannot help
+            self._finish(key, error=exc)
+        except NetworkError as exc:
+            if message.attempts < MAX_ATTEMPTS:
+                retry_in = float(2 ** message.attempts)
+            else:
+                self._finish(key, error=exc)
+        else:
+            self._finish(key, result=result)
+        finally:
+            message.sending = False
+
+        self._mark_sent(key)
+        if retry_in is not None:
+            self._schedule(key, max(retry_in, self._per_chat_interval))
+
+    def _make_bucket(self, token: str):
+        """Shared Redis bucket for ``token``, or a local one at this process's share."""
+        local = TokenBucket(self._rate / SENDER_PROCESSES)
+        if self._redis is None and self._redis_factory is not None:
+            try:
+                self._redis = self._redis_factory()
+            except Exception as exc:
+                logger.warning("telegram_outbound: Redis unavailable for rate limits: %s", exc)
+                self._redis_factory = None
+        if self._redis is None:
+            return local
+        return SharedTokenBucket(self._redis, token, self._rate, local)
+
+    def _mark_sent(self, key: tuple) -> None:
+        if len(self._last_sent) > MAX_TRACKED_CHATS:
+            cutoff = time.monotonic() - self._per_chat_interval
+            self._last_sent = {k: t for k, t in self._last_sent.items() if t > cutoff}
+        self._last_sent[key] = time.monotonic()
+
+    def _finish(self, key: tuple, result=None, error: Optional[BaseException] = None) -> None:
+        """Resolve the head message of a chat and queue the next one."""
+        pending = self._chats.get(key)
+        if not pending:
+            return
+        message = pending.popleft()
+        if not message.future.done():
+            if error is not None:
+                message.future.set_exception(error)
+            else:
+                message.future.set_result(result)
+        if pending:
+            self._schedule(key, self._per_chat_interval)
+        else:
+            del self._chats[key]
+
+
+# Shared instance for every sender in this process
+outbound = TelegramOutbound()
@@ -0,0 +1,81 @@
+"""
+Cache invalidation events shared by BazaarOps services.
+
+Any change to a store's sellable catalog (stock or price updates, orders
+that reduce stock) bumps a per-store catalog version in Redis and
+publishes the store id on CATALOG_CHANNEL:
+
+- the customer bot marks its in-memory catalog stale when the channel fires
+  and revalidates it against customer-service's product listing ETag.
+
+Changes to customer rows the customer bot caches (profile edits, credit
+suspension / limits, VIP flags) are published on CUSTOMER_CHANNEL as JSON:
+{"customer_ids": [...]} or {"telegram_chat_id": ..., "store_id": ...}.
+
+Everything degrades to a no-op when Redis is unavailable; consumers then
+rely on their TTLs.
+"""
+
+import json
+import logging
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = "catalog_version:{store_id}"
+CATALOG_CHANNEL = "catalog.invalidated"
+CUSTOMER_CHANNEL = "customer.invalidated"
+
+
+def _get_redis():
+    try:
+        from redis_client import get_sync_client
+        return get_sync_client()
+    except Exception as exc:
+        logger.debug("Redis unavailable for cache events: %s", exc)
+        return None
+
+
+def bump_catalog_version(store_id: str, redis_client=None) -> Optional[int]:
+    """Increment the store's catalog version and notify subscribers."""
+    if not store_id:
+        return None
+    redis = redis_client or _get_redis()
+    if redis is None:
+        return None
+    try:
+        pipe = redis.pipeline()
+        pipe.incr(CATALOG_VERSION_KEY.format(store_id=store_id))
+        pipe.publish(CATALOG_CHANNEL, store_id)
+        version, _ = pipe.execute()
+        return int(version)
+    except Exception as exc:
+        logger.warning("bump_catalog_version error: %s", exc)
+        return None
+
+
+def get_catalog_version(store_id: str, redis_client=None) -> Optional[int]:
+    """Current catalog version (0 if never bumped), or None without Redis."""
+    redis = redis_client or _get_redis()
+    if redis is None:
+        return None
+    try:
+        value = redis.get(CATALOG_VERSION_KEY.format(store_id=store_id))
+        return int(value or 0)
+    except Exception as exc:
+        logger.warning("get_catalog_version error: %s", exc)
+        return None
+
+
+def publish_customers_changed(customer_ids: Iterable[str], redis_client=None) -> None:
+    """Tell customer caches that these customers' rows changed."""
+    ids = [str(i) for i in customer_ids if i]
+    if not ids:
+        return
+    redis = redis_client or _get_redis()
+    if redis is None:
+        return
+    try:
+        redis.publish(CUSTOMER_CHANNEL, json.dumps({"customer_ids": ids}))
+    except Exception as exc:
+        logger.warning("publish_customers_changed error: %s", exc)
@@ -220,51 +220,64 @@ class EventSubscriber:
 # Default stub handlers
 # ---------------------------------------------------------------------------
 
+def _invalidate_credit_risk(event: Event) -> None:
+    """Drop the store's cached default-risk predictions (4.7)."""
+    try:
+        from agents.credit_scoring_engine import invalidate_store_risk
+        invalidate_store_risk(event.store_id)
+    except Exception as exc:
+        logger.warning("credit risk invalidation error: %s", exc)
+
+
+def _invalidate_catalog(event: Event) -> None:
+    """Stock changed: cached product catalogs must revalidate."""
+    try:
+        from cache_events import bump_catalog_version
+        bump_catalog_version(event.store_id)
+    except Exception as exc:
+        logger.warning("catalog invalidation error: %s", exc)
+
+
 def handle_order_created(event: Event) -> None:
     logger.info("[order.created] event_id=%s store_id=%s data=%s", event.event_id, event.store_id, event.data)
+    _invalidate_credit_risk(event)
 
 
 def handle_order_updated(event: Event) -> None:
     logger.info("[order.updated] event_id=%s store_id=%s data=%s", event.event_id, event.store_id, event.data)
+    _invalidate_credit_risk(event)
 
 
 def handle_order_completed(event: Event) -> None:
     logger.info("[order.completed] event_id=%s store_id=%s data=%s", event.event_id, event.store_id, event.data)
+    _invalidate_credit_risk(event)
 
 
 def handle_payment_received(event: Event) -> None:
     """Recalculate credit score when a payment is received (4.9)."""
     logger.info("[payment.received] event_id=%s store_id=%s data=%s", event.event_id, event.store_id, event.data)
+    _invalidate_credit_risk(event)
     customer_id = (event.data or {}).get("customer_id")
     if not customer_id:
         return
     try:
         import os
         from supabase import create_client
-        from agents.intelligent_credit_agent import (
-            calculate_credit_score,
-            calculate_credit_limit,
-            auto_restore_credit,
-        )
+        from agents.credit_scoring_engine import rescore_customers
+
         supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
-        new_score = calculate_credit_score(customer_id, db_conn=supabase)
-        new_limit = calculate_credit_limit(new_score)
-        supabase.table("customers").update(
-            {"credit_score": int(new_score), "credit_limit": new_limit}
-        ).eq("id", customer_id).execute()
-        # Auto-restore credit if it was suspended
-        customer_result = (
-            supabase.table("customers")
-            .select("credit_suspended")
-            .eq("id", customer_id)
-            .single()
-            .execute()
+        # Incremental rescore: two grouped reads, one bulk write only if the
+        # score/limit changed; also auto-restores suspended credit (4.6.2).
+        result = rescore_customers(
+            event.store_id, [customer_id], restore_suspended=True, db_conn=supabase
         )
-        if customer_result.data and customer_result.data.get("credit_suspended"):
-            auto_restore_credit(customer_id, db_conn=supabase)
+        score = result["scores"].get(customer_id, {})
         logger.info(
-            "Credit score updated for customer %s: score=%.1f limit=%.0f",
-            customer_id, new_score, new_limit,
+            "Credit score updated for customer %s: score=%s limit=%s restored=%s",
+            customer_id,
+            score.get("credit_score"),
+            score.get("credit_limit"),
+            customer_id in result.get("restored", []),
         )
     except Exception as exc:
         logger.error("handle_payment_received credit update error: %s", exc)
@@ -272,14 +285,17 @@ def handle_payment_received(event: Event) -> None:
 
 def handle_payment_overdue(event: Event) -> None:
     logger.info("[payment.overdue] event_id=%s store_id=%s data=%s", event.event_id, event.store_id, event.data)
+    _invalidate_credit_risk(event)
 
 
 def handle_inventory_low(event: Event) -> None:
     logger.info("[inventory.low] event_id=%s store_id=%s data=%s", event.event_id, event.store_id, event.data)
+    _invalidate_catalog(event)
 
 
 def handle_inventory_critical(event: Event) -> None:
     logger.info("[inventory.critical] event_id=%s store_id=%s data=%s", event.event_id, event.store_id, event.data)
+    _invalidate_catalog(event)
 
 
 def handle_customer_inactive(event: Event) -> None:
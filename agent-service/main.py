@@ -1,3 +1,4 @@
+import os
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -89,52 +90,99 @@ async def health():
 # 6.7 Scheduler job for daily BI report at 9 PM
 # ---------------------------------------------------------------------------
 
-async def _run_daily_bi_reports():
-    """Run BI reports for all active stores. Called by scheduler at 9 PM."""
+# Replicas of agent-service share the BI job: stores are sharded between them
+# and each (store, day) report is claimed once (agents/scheduler_leases.py)
+BI_REPORT_TIME_UTC = "21:00"
+BI_REPORT_CONCURRENCY = 5
+BI_REPORT_WINDOW_SECONDS = 10 * 60
+
+
+async def _load_bi_stores():
+    """All stores, for the daily BI report."""
     from supabase import create_client
-    from agents.bi_agent import generate_bi_report
 
     supabase = create_client(
         os.getenv("SUPABASE_URL"),
         os.getenv("SUPABASE_KEY"),
     )
+    stores = await asyncio.to_thread(supabase.table("stores").select("id").execute)
+    return stores.data or []
+
+
+async def _run_bi_report(store: dict):
+    from agents.bi_agent import generate_bi_report
+
+    await generate_bi_report(store["id"])
+    print(f"✅ BI report sent for store {store['id']}")
+
+
+def _build_bi_scheduler():
+    from agents.scheduler_leases import ReplicaCoordinator
+    from agents.store_scheduler import StoreJob, StoreJobScheduler
+
     try:
-        stores = supabase.table("stores").select("id").execute()
-        store_ids = [s["id"] for s in (stores.data or [])]
+        from redis_client import get_async_client
+        redis = get_async_client()
     except Exception as exc:
-        print(f"❌ BI scheduler: could not fetch stores: {exc}")
-        return
+        print(f"⚠️ BI scheduler: Redis unavailable, running as a single replica: {exc}")
+        redis = None
 
-    for store_id in store_ids:
-        try:
-            await generate_bi_report(store_id)
-            print(f"✅ BI report sent for store {store_id}")
-        except Exception as exc:
-            print(f"❌ BI report failed for store {store_id}: {exc}")
+    scheduler = StoreJobScheduler(
+        _load_bi_stores,
+        clock=lambda: datetime.now(timezone.utc),
+        coordinator=ReplicaCoordinator(redis, group="agent-service-bi"),
+    )
+    scheduler.add(StoreJob(
+        "bi_reports", [BI_REPORT_TIME_UTC], _run_bi_report,
+        concurrency=BI_REPORT_CONCURRENCY,
+        window_seconds=BI_REPORT_WINDOW_SECONDS,
+    ))
+    return scheduler
 
 
 async def _bi_scheduler_loop():
-    """Background loop that fires daily BI reports at 21:00 local time."""
-    while True:
-        now = datetime.now(timezone.utc)
-        # Target: 21:00 UTC (9 PM)
-        target_hour = 21
-        seconds_until = ((target_hour - now.hour) % 24) * 3600 - now.minute * 60 - now.second
-        if seconds_until <= 0:
-            seconds_until += 86400
-        print(f"⏰ BI scheduler: next run in {seconds_until // 3600}h {(seconds_until % 3600) // 60}m")
-        await asyncio.sleep(seconds_until)
-        print("📊 Running daily BI reports...")
-        await _run_daily_bi_reports()
+    """Background loop that fires daily BI reports at 21:00 UTC."""
+    await _build_bi_scheduler().run_forever()
 
 
 @app.on_event("startup")
 async def start_bi_scheduler():
     """Start the BI report scheduler on app startup."""
-    asyncio.create_task(_bi_scheduler_loop())
+    app.state.bi_scheduler_task = asyncio.create_task(_bi_scheduler_loop())
     print("⏰ BI report scheduler started (daily at 9 PM UTC)")
 
 
+# ---------------------------------------------------------------------------
+# 8.3.3 Delivery of queued / batched notifications
+# ---------------------------------------------------------------------------
+
+@app.on_event("startup")
+async def start_notification_scheduler():
+    """Start delivering scheduled customer notifications."""
+    from agents.notification_scheduler import notification_scheduler
+    try:
+        await notification_scheduler.start()
+    except Exception as exc:
+        print(f"⚠️ Notification scheduler not started: {exc}")
+
+
+@app.on_event("shutdown")
+async def stop_notification_scheduler():
+    from agents.notification_scheduler import notification_scheduler
+    from agents.telegram_outbound import outbound
+    await notification_scheduler.stop()
+    await outbound.close()
+
+
+@app.on_event("shutdown")
+async def stop_bi_scheduler():
+    """Cancel the BI loop so this replica leaves the group and releases its lease."""
+    task = getattr(app.state, "bi_scheduler_task", None)
+    if task:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
 @app.post("/api/bi/run-report/{store_id}")
 async def trigger_bi_report(store_id: str):
     """Manually trigger a BI report for a store."""
@@ -0,0 +1,84 @@
+-- Migration 011: Bulk credit scoring functions
+-- Grouped aggregates so a whole store can be scored in two queries, plus a
+-- single-statement bulk write for changed scores/limits.
+-- Idempotent: safe to run multiple times
+
+CREATE INDEX IF NOT EXISTS idx_orders_customer_id ON orders (customer_id);
+
+-- Per-customer order aggregates (one row per customer of the store, including
+-- customers without orders) together with their current credit columns.
+CREATE OR REPLACE FUNCTION credit_order_aggregates(
+    p_store_id     UUID,
+    p_customer_ids UUID[] DEFAULT NULL
+)
+RETURNS TABLE (
+    customer_id      UUID,
+    credit_score     INTEGER,
+    credit_limit     DECIMAL,
+    credit_suspended BOOLEAN,
+    order_count      BIGINT,
+    total_spent      DECIMAL
+)
+LANGUAGE sql STABLE AS $$
+    SELECT c.id,
+           c.credit_score,
+           c.credit_limit,
+           COALESCE(c.credit_suspended, FALSE),
+           COUNT(o.id),
+           COALESCE(SUM(o.total_amount), 0)
+    FROM customers c
+    LEFT JOIN orders o ON o.customer_id = c.id
+    WHERE c.store_id = p_store_id
+      AND (p_customer_ids IS NULL OR c.id = ANY (p_customer_ids))
+    GROUP BY c.id;
+$$;
+
+-- Per-customer payment aggregates. on_time_payments uses the same 7-day rule
+-- as calculate_credit_score; late_payments counts the was_late flag.
+CREATE OR REPLACE FUNCTION credit_payment_aggregates(
+    p_store_id     UUID,
+    p_customer_ids UUID[] DEFAULT NULL
+)
+RETURNS TABLE (
+    customer_id      UUID,
+    total_payments   BIGINT,
+    on_time_payments BIGINT,
+    late_payments    BIGINT
+)
+LANGUAGE sql STABLE AS $$
+    SELECT ph.customer_id,
+           COUNT(*),
+           COUNT(*) FILTER (WHERE COALESCE(ph.days_to_payment, 0) <= 7),
+           COUNT(*) FILTER (WHERE ph.was_late)
+    FROM payment_history ph
+    JOIN customers c ON c.id = ph.customer_id
+    WHERE c.store_id = p_store_id
+      AND (p_customer_ids IS NULL OR c.id = ANY (p_customer_ids))
+    GROUP BY ph.customer_id;
+$$;
+
+-- Bulk write: p_updates is a JSON array of
+--   {"id": uuid, "credit_score": int, "credit_limit": number, "credit_suspended": bool|null}
+-- A null credit_suspended leaves the current flag untouched.
+CREATE OR REPLACE FUNCTION apply_credit_scores(p_updates JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    updated_count INTEGER;
+BEGIN
+    UPDATE customers c
+    SET credit_score     = u.credit_score,
+        credit_limit     = u.credit_limit,
+        credit_suspended = COALESCE(u.credit_suspended, c.credit_suspended)
+    FROM jsonb_to_recordset(p_updates) AS u (
+        id               UUID,
+        credit_score     INTEGER,
+        credit_limit     DECIMAL,
+        credit_suspended BOOLEAN
+    )
+    WHERE c.id = u.id;
+
+    GET DIAGNOSTICS updated_count = ROW_COUNT;
+    RETURN updated_count;
+END;
+$$;
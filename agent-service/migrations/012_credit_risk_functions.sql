@@ -0,0 +1,28 @@
+-- Migration 012: Store-wide default-risk aggregates
+-- Overdue unpaid orders per customer so predict_default_risk_bulk can score a
+-- whole store in one pass instead of one query per customer.
+-- Idempotent: safe to run multiple times
+
+CREATE INDEX IF NOT EXISTS idx_orders_store_unpaid
+    ON orders (store_id, created_at)
+    WHERE payment_status = 'unpaid';
+
+-- Unpaid orders created on or before p_cutoff, grouped by customer
+CREATE OR REPLACE FUNCTION credit_overdue_aggregates(
+    p_store_id UUID,
+    p_cutoff   TIMESTAMPTZ
+)
+RETURNS TABLE (
+    customer_id    UUID,
+    overdue_orders BIGINT
+)
+LANGUAGE sql STABLE AS $$
+    SELECT o.customer_id,
+           COUNT(*)
+    FROM orders o
+    WHERE o.store_id = p_store_id
+      AND o.payment_status = 'unpaid'
+      AND o.created_at <= p_cutoff
+      AND o.customer_id IS NOT NULL
+    GROUP BY o.customer_id;
+$$;
@@ -0,0 +1,18 @@
+-- Migration 013: Per-store product/unit synonyms for the NLP normalizer
+-- Task 5.1.4: Hindi/English mix — store-specific vocabulary on top of the
+-- built-in HINDI_PRODUCT_MAP / HINDI_UNIT_MAP
+-- Idempotent: safe to run multiple times
+
+CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+
+-- store_synonyms: "term" in a customer message is rewritten to "replacement"
+CREATE TABLE IF NOT EXISTS store_synonyms (
+    id              UUID         PRIMARY KEY DEFAULT uuid_generate_v4(),
+    store_id        UUID         NOT NULL REFERENCES stores(id) ON DELETE CASCADE,
+    term            VARCHAR(100) NOT NULL,      -- e.g. "kaju"
+    replacement     VARCHAR(100) NOT NULL,      -- e.g. "cashew"
+    created_at      TIMESTAMP    DEFAULT NOW(),
+    UNIQUE (store_id, term)
+);
+
+CREATE INDEX IF NOT EXISTS idx_store_synonyms_store_id ON store_synonyms (store_id);
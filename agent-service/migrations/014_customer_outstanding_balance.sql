@@ -0,0 +1,119 @@
+-- Migration 014: Maintained outstanding credit balance per customer
+-- customers.outstanding_balance is the sum of the customer's unpaid credit
+-- orders, kept current by a trigger on orders in the same transaction as the
+-- order insert / payment update. check_credit_availability answers a credit
+-- checkout from the customer row alone, whatever the order history size.
+-- Idempotent: safe to run multiple times
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS is_credit BOOLEAN DEFAULT FALSE;
+ALTER TABLE customers ADD COLUMN IF NOT EXISTS outstanding_balance DECIMAL NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_orders_customer_unpaid_credit
+    ON orders (customer_id)
+    WHERE payment_status = 'unpaid' AND is_credit;
+
+-- ---------------------------------------------------------------------------
+-- Trigger function: maintain_outstanding_balance
+-- ---------------------------------------------------------------------------
+-- An order counts towards the balance while it is a credit order with
+-- payment_status 'unpaid'. Only the difference is applied, so the customer
+-- row is touched once per relevant change and concurrent orders serialise on
+-- its row lock.
+
+CREATE OR REPLACE FUNCTION maintain_outstanding_balance()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    old_due DECIMAL := 0;
+    new_due DECIMAL := 0;
+BEGIN
+    IF TG_OP <> 'INSERT' AND OLD.is_credit AND OLD.payment_status = 'unpaid' THEN
+        old_due := COALESCE(OLD.total_amount, 0);
+    END IF;
+    IF TG_OP <> 'DELETE' AND NEW.is_credit AND NEW.payment_status = 'unpaid' THEN
+        new_due := COALESCE(NEW.total_amount, 0);
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        IF old_due <> 0 THEN
+            UPDATE customers SET outstanding_balance = outstanding_balance - old_due
+            WHERE id = OLD.customer_id;
+        END IF;
+    ELSIF TG_OP = 'UPDATE' AND OLD.customer_id IS DISTINCT FROM NEW.customer_id THEN
+        IF old_due <> 0 THEN
+            UPDATE customers SET outstanding_balance = outstanding_balance - old_due
+            WHERE id = OLD.customer_id;
+        END IF;
+        IF new_due <> 0 THEN
+            UPDATE customers SET outstanding_balance = outstanding_balance + new_due
+            WHERE id = NEW.customer_id;
+        END IF;
+    ELSIF new_due <> old_due THEN
+        UPDATE customers SET outstanding_balance = outstanding_balance + new_due - old_due
+        WHERE id = NEW.customer_id;
+    END IF;
+
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS orders_outstanding_balance_trigger ON orders;
+CREATE TRIGGER orders_outstanding_balance_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF payment_status, total_amount, is_credit, customer_id ON orders
+    FOR EACH ROW
+    EXECUTE FUNCTION maintain_outstanding_balance();
+
+-- Backfill (and repair) every balance from the orders table
+UPDATE customers c
+SET outstanding_balance = COALESCE((
+    SELECT SUM(o.total_amount)
+    FROM orders o
+    WHERE o.customer_id = c.id
+      AND o.payment_status = 'unpaid'
+      AND o.is_credit
+), 0);
+
+-- ---------------------------------------------------------------------------
+-- check_credit_availability: one call per credit checkout
+-- ---------------------------------------------------------------------------
+-- reason is 'suspended', 'no_credit', 'limit_exceeded' or 'ok'.
+-- No row is returned for an unknown customer.
+
+CREATE OR REPLACE FUNCTION check_credit_availability(
+    p_customer_id UUID,
+    p_order_total DECIMAL DEFAULT 0
+)
+RETURNS TABLE (
+    credit_limit        DECIMAL,
+    credit_score        INTEGER,
+    credit_suspended    BOOLEAN,
+    outstanding_balance DECIMAL,
+    available_credit    DECIMAL,
+    allowed             BOOLEAN,
+    reason              TEXT
+)
+LANGUAGE sql STABLE AS $$
+    SELECT c.credit_limit,
+           c.credit_score,
+           c.credit_suspended,
+           c.outstanding_balance,
+           c.credit_limit - c.outstanding_balance,
+           c.reason = 'ok',
+           c.reason
+    FROM (
+        SELECT COALESCE(cu.credit_limit, 0)          AS credit_limit,
+               COALESCE(cu.credit_score, 50)         AS credit_score,
+               COALESCE(cu.credit_suspended, FALSE)  AS credit_suspended,
+               cu.outstanding_balance,
+               CASE
+                   WHEN COALESCE(cu.credit_suspended, FALSE) THEN 'suspended'
+                   WHEN COALESCE(cu.credit_limit, 0) <= 0 THEN 'no_credit'
+                   WHEN p_order_total > COALESCE(cu.credit_limit, 0) - cu.outstanding_balance
+                       THEN 'limit_exceeded'
+                   ELSE 'ok'
+               END AS reason
+        FROM customers cu
+        WHERE cu.id = p_customer_id
+    ) c;
+$$;
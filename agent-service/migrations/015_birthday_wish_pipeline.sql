@@ -0,0 +1,67 @@
+-- Migration 015: Birthday wish pipeline
+-- Birthday messages are generated overnight into birthday_messages, one row
+-- per customer and day. At send time pending_birthday_wishes returns, in one
+-- query, every customer with a birthday that day who has a Telegram chat and
+-- has not been wished yet (anti-join on birthday_wishes_sent), together with
+-- the store name and the prepared message.
+-- Idempotent: safe to run multiple times
+
+CREATE TABLE IF NOT EXISTS birthday_messages (
+    customer_id     UUID         REFERENCES customers(id) ON DELETE CASCADE,
+    wish_date       DATE         NOT NULL,
+    store_id        UUID         REFERENCES stores(id) ON DELETE CASCADE,
+    message_text    TEXT         NOT NULL,
+    generated_at    TIMESTAMP    DEFAULT NOW(),
+    PRIMARY KEY (customer_id, wish_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_birthday_messages_store_date ON birthday_messages (store_id, wish_date);
+
+CREATE INDEX IF NOT EXISTS idx_customers_store_birthday
+    ON customers (store_id, birthday)
+    WHERE telegram_chat_id IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_birthday_wishes_customer_sent_at
+    ON birthday_wishes_sent (customer_id, sent_at);
+
+-- ---------------------------------------------------------------------------
+-- pending_birthday_wishes: customers still to be wished on p_wish_date
+-- ---------------------------------------------------------------------------
+-- p_since is the start of the day in the sender's clock (a wish sent at or
+-- after it counts as sent). p_store_id NULL covers every store.
+-- message_text is NULL until the overnight job has prepared one.
+
+CREATE OR REPLACE FUNCTION pending_birthday_wishes(
+    p_wish_date DATE,
+    p_since     TIMESTAMP,
+    p_store_id  UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    customer_id      UUID,
+    name             TEXT,
+    telegram_chat_id TEXT,
+    store_id         UUID,
+    store_name       TEXT,
+    message_text     TEXT
+)
+LANGUAGE sql STABLE AS $$
+    SELECT c.id,
+           c.name::TEXT,
+           c.telegram_chat_id::TEXT,
+           c.store_id,
+           s.name::TEXT,
+           m.message_text
+    FROM customers c
+    LEFT JOIN stores s ON s.id = c.store_id
+    LEFT JOIN birthday_messages m
+           ON m.customer_id = c.id AND m.wish_date = p_wish_date
+    WHERE c.birthday = to_char(p_wish_date, 'MM-DD')
+      AND c.telegram_chat_id IS NOT NULL
+      AND (p_store_id IS NULL OR c.store_id = p_store_id)
+      AND NOT EXISTS (
+          SELECT 1
+          FROM birthday_wishes_sent w
+          WHERE w.customer_id = c.id
+            AND w.sent_at >= p_since
+      );
+$$;
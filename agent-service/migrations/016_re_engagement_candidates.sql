@@ -0,0 +1,85 @@
+-- Migration 016: Set-based re-engagement candidates
+-- One query each for the customers due a first re-engagement message and
+-- those due a follow-up, so a re-engagement run costs a fixed number of
+-- round-trips whatever the number of at-risk customers.
+-- Idempotent: safe to run multiple times
+
+CREATE INDEX IF NOT EXISTS idx_re_engagement_customer_store_sent_at
+    ON re_engagement_messages (customer_id, store_id, sent_at);
+
+CREATE INDEX IF NOT EXISTS idx_re_engagement_store_pending_first
+    ON re_engagement_messages (store_id, sent_at)
+    WHERE message_number = 1 AND NOT responded;
+
+-- ---------------------------------------------------------------------------
+-- re_engagement_first_candidates
+-- ---------------------------------------------------------------------------
+-- At-risk customers of the store with a Telegram chat who have had no
+-- re-engagement message from the store since p_since.
+
+CREATE OR REPLACE FUNCTION re_engagement_first_candidates(
+    p_store_id UUID,
+    p_since    TIMESTAMP
+)
+RETURNS TABLE (
+    customer_id      UUID,
+    name             TEXT,
+    telegram_chat_id TEXT,
+    last_order_date  TIMESTAMPTZ
+)
+LANGUAGE sql STABLE AS $$
+    SELECT c.id,
+           c.name::TEXT,
+           c.telegram_chat_id::TEXT,
+           c.last_order_date::TIMESTAMPTZ
+    FROM customers c
+    WHERE c.store_id = p_store_id
+      AND c.churn_risk_level IS NOT NULL
+      AND c.telegram_chat_id IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1
+          FROM re_engagement_messages r
+          WHERE r.customer_id = c.id
+            AND r.store_id = p_store_id
+            AND r.sent_at >= p_since
+      );
+$$;
+
+-- ---------------------------------------------------------------------------
+-- re_engagement_followup_candidates
+-- ---------------------------------------------------------------------------
+-- Customers of the store with an unanswered first message sent at or before
+-- p_sent_before and no follow-up yet. One row per customer.
+
+CREATE OR REPLACE FUNCTION re_engagement_followup_candidates(
+    p_store_id    UUID,
+    p_sent_before TIMESTAMP
+)
+RETURNS TABLE (
+    customer_id      UUID,
+    name             TEXT,
+    telegram_chat_id TEXT,
+    last_order_date  TIMESTAMPTZ
+)
+LANGUAGE sql STABLE AS $$
+    SELECT DISTINCT ON (c.id)
+           c.id,
+           c.name::TEXT,
+           c.telegram_chat_id::TEXT,
+           c.last_order_date::TIMESTAMPTZ
+    FROM re_engagement_messages first_msg
+    JOIN customers c ON c.id = first_msg.customer_id
+    WHERE first_msg.store_id = p_store_id
+      AND first_msg.message_number = 1
+      AND NOT first_msg.responded
+      AND first_msg.sent_at <= p_sent_before
+      AND c.telegram_chat_id IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1
+          FROM re_engagement_messages followup
+          WHERE followup.customer_id = c.id
+            AND followup.store_id = p_store_id
+            AND followup.message_number = 2
+      )
+    ORDER BY c.id;
+$$;
@@ -0,0 +1,33 @@
+-- Migration 017: Atomic inventory decrement for orders
+-- decrement_inventory subtracts an order's quantities in one UPDATE
+-- (quantity = quantity - ordered), so concurrent orders for the same product
+-- can no longer overwrite each other's read-then-write. Stock is not clamped
+-- at zero: a negative quantity is an oversell the owner has to resolve, and
+-- the new quantities are returned so the caller can report it.
+-- Idempotent: safe to run multiple times
+
+-- ---------------------------------------------------------------------------
+-- decrement_inventory
+-- ---------------------------------------------------------------------------
+-- p_items: [{"product_id": "...", "quantity": 2}, ...], one entry per product.
+-- Returns the new quantity of every inventory row that was updated.
+
+CREATE OR REPLACE FUNCTION decrement_inventory(
+    p_store_id UUID,
+    p_items    JSONB
+)
+RETURNS TABLE (
+    product_id UUID,
+    quantity   DECIMAL
+)
+LANGUAGE sql VOLATILE AS $$
+    UPDATE inventory i
+    SET quantity = i.quantity - x.quantity
+    FROM jsonb_to_recordset(p_items) AS x (
+        product_id UUID,
+        quantity   DECIMAL
+    )
+    WHERE i.store_id = p_store_id
+      AND i.product_id = x.product_id
+    RETURNING i.product_id, i.quantity::DECIMAL;
+$$;
@@ -0,0 +1,196 @@
+"""
+Per-customer order suggestions kept up to date on order creation.
+
+The customer bot offers "Same as last time?" (the customer's last order) and
+"Your usual order" (their most frequently ordered products). Both are
+maintained incrementally in one Redis hash per customer, so the bot reads
+them with a single HMGET instead of scanning order history:
+
+- order_suggestions:{customer_id}   hash
+    last_order_id    id of the last recorded order (makes recording idempotent)
+    last_order       JSON list of its items
+                     (product_id, product_name, quantity, unit_price)
+    usual            JSON list of the top USUAL_ORDER_SIZE products
+                     (product_id, product_name, count)
+    count:{pid}      number of orders containing the product
+    name:{pid}       latest product name seen for it
+
+customer-service calls ``record_order`` after creating an order. Recording
+only updates an existing hash: a summary built from one order would hide the
+customer's history. When the key is missing (orders placed before this
+existed, an expired or flushed key) the reader rebuilds it from the orders
+table, new order included, with ``build_suggestions`` and saves it with
+SEED_SUGGESTIONS_LUA, which never overwrites a key recorded in the meantime.
+
+Everything degrades to a no-op when Redis is unavailable.
+"""
+
+import json
+import logging
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+SUGGESTIONS_KEY = "order_suggestions:{customer_id}"
+SUGGESTIONS_TTL_SECONDS = 180 * 24 * 3600   # 180 days, refreshed by every order
+USUAL_ORDER_SIZE = 3
+# Orders read when rebuilding a missing summary from the database
+BACKFILL_ORDER_LIMIT = 200
+
+# KEYS[1] suggestions hash
+# ARGV[1] order id  ARGV[2] last order items (JSON)  ARGV[3] top N  ARGV[4] ttl
+# ARGV[5..] product_id, product_name pairs (one per distinct product)
+# Returns 0 if the order was already recorded or the hash is not seeded yet.
+RECORD_ORDER_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+if redis.call('HGET', KEYS[1], 'last_order_id') == ARGV[1] then return 0 end
+for i = 5, #ARGV, 2 do
+  redis.call('HINCRBY', KEYS[1], 'count:' .. ARGV[i], 1)
+  redis.call('HSET', KEYS[1], 'name:' .. ARGV[i], ARGV[i + 1])
+end
+local fields = redis.call('HGETALL', KEYS[1])
+local counts = {}
+for i = 1, #fields, 2 do
+  if string.sub(fields[i], 1, 6) == 'count:' then
+    table.insert(counts, {string.sub(fields[i], 7), tonumber(fields[i + 1])})
+  end
+end
+table.sort(counts, function(a, b)
+  if a[2] == b[2] then return a[1] < b[1] end
+  return a[2] > b[2]
+end)
+local usual = {}
+for i = 1, math.min(tonumber(ARGV[3]), #counts) do
+  local pid = counts[i][1]
+  usual[i] = {
+    product_id = pid,
+    product_name = redis.call('HGET', KEYS[1], 'name:' .. pid),
+    count = counts[i][2],
+  }
+end
+local encoded = '[]'
+if #usual > 0 then encoded = cjson.encode(usual) end
+redis.call('HSET', KEYS[1], 'last_order_id', ARGV[1], 'last_order', ARGV[2], 'usual', encoded)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+# KEYS[1] suggestions hash
+# ARGV[1] ttl  ARGV[2..] field, value pairs. Returns 0 if the key already exists.
+SEED_SUGGESTIONS_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+for i = 2, #ARGV, 2 do
+  redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+def suggestions_key(customer_id: str) -> str:
+    return SUGGESTIONS_KEY.format(customer_id=customer_id)
+
+
+def _get_redis():
+    try:
+        from redis_client import get_sync_client
+        return get_sync_client()
+    except Exception as exc:
+        logger.debug("Redis unavailable for order suggestions: %s", exc)
+        return None
+
+
+def _order_item(item: dict) -> dict:
+    return {
+        "product_id": item.get("product_id"),
+        "product_name": item.get("product_name"),
+        "quantity": item.get("quantity", 1),
+        "unit_price": item.get("unit_price", 0),
+    }
+
+
+def _distinct_products(items: Iterable[dict]) -> dict:
+    """product_id -> product_name, in order of first appearance."""
+    products: dict = {}
+    for item in items:
+        product_id = item.get("product_id")
+        if product_id and product_id not in products:
+            products[product_id] = item.get("product_name") or ""
+    return products
+
+
+def record_order_args(order_id: str, items: list, top_n: int = USUAL_ORDER_SIZE,
+                      ttl: int = SUGGESTIONS_TTL_SECONDS) -> list:
+    """ARGV for RECORD_ORDER_LUA."""
+    args = [str(order_id), json.dumps([_order_item(i) for i in items]), top_n, ttl]
+    for product_id, name in _distinct_products(items).items():
+        args.extend([str(product_id), name])
+    return args
+
+
+def record_order(customer_id: str, order_id: str, items: list, redis_client=None) -> bool:
+    """
+    Fold a new order into the customer's suggestions. Returns True if
+    recorded; False if already recorded or the summary is not seeded yet
+    (the next read rebuilds it from the orders table).
+    """
+    if not customer_id or not order_id or not items:
+        return False
+    redis = redis_client or _get_redis()
+    if redis is None:
+        return False
+    try:
+        script = redis.register_script(RECORD_ORDER_LUA)
+        return bool(script(keys=[suggestions_key(customer_id)],
+                           args=record_order_args(order_id, items)))
+    except Exception as exc:
+        logger.warning("record_order suggestions error: %s", exc)
+        return False
+
+
+def build_suggestions(orders: list, top_n: int = USUAL_ORDER_SIZE) -> dict:
+    """
+    Summary hash fields from order rows, newest first, each shaped like
+    ``{"id": ..., "order_items": [...]}``. Works for customers without orders.
+    """
+    counts: dict = {}
+    names: dict = {}
+    for order in orders:
+        for product_id, name in _distinct_products(order.get("order_items") or []).items():
+            counts[product_id] = counts.get(product_id, 0) + 1
+            names[product_id] = names.get(product_id) or name
+
+    top = sorted(counts, key=lambda pid: (-counts[pid], str(pid)))[:top_n]
+    last = orders[0] if orders else {}
+    fields = {
+        "last_order_id": str(last.get("id") or ""),
+        "last_order": json.dumps([_order_item(i) for i in last.get("order_items") or []]),
+        "usual": json.dumps([
+            {"product_id": pid, "product_name": names[pid], "count": counts[pid]} for pid in top
+        ]),
+    }
+    for product_id, count in counts.items():
+        fields[f"count:{product_id}"] = str(count)
+        fields[f"name:{product_id}"] = names[product_id]
+    return fields
+
+
+def seed_args(fields: dict, ttl: int = SUGGESTIONS_TTL_SECONDS) -> list:
+    """ARGV for SEED_SUGGESTIONS_LUA."""
+    args: list = [ttl]
+    for name, value in fields.items():
+        args.extend([name, value])
+    return args
+
+
+def decode_suggestions(last_order_raw, usual_raw) -> dict:
+    """``{"last_order": list | None, "usual": list | None}`` from the hash values."""
+    def _list(raw):
+        try:
+            value = json.loads(raw) if raw else None
+        except (TypeError, ValueError):
+            return None
+        # cjson encodes an empty Lua table as {}
+        return value if isinstance(value, list) and value else None
+
+    return {"last_order": _list(last_order_raw), "usual": _list(usual_raw)}
@@ -27,6 +27,7 @@ REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
 # ---------------------------------------------------------------------------
 
 _sync_pool: ConnectionPool | None = None
+_sync_binary_pool: ConnectionPool | None = None
 _async_pool: AsyncConnectionPool | None = None
 
 
@@ -41,6 +42,17 @@ def _get_sync_pool() -> ConnectionPool:
     return _sync_pool
 
 
+def _get_sync_binary_pool() -> ConnectionPool:
+    global _sync_binary_pool
+    if _sync_binary_pool is None:
+        _sync_binary_pool = ConnectionPool.from_url(
+            REDIS_URL,
+            max_connections=10,
+            decode_responses=False,
+        )
+    return _sync_binary_pool
+
+
 def _get_async_pool() -> AsyncConnectionPool:
     global _async_pool
     if _async_pool is None:
@@ -61,6 +73,11 @@ def get_sync_client() -> redis.Redis:
     return redis.Redis(connection_pool=_get_sync_pool())
 
 
+def get_sync_binary_client() -> redis.Redis:
+    """Return a synchronous Redis client that returns raw bytes (packed values)."""
+    return redis.Redis(connection_pool=_get_sync_binary_pool())
+
+
 def get_async_client() -> aioredis.Redis:
     """Return an async Redis client backed by the shared connection pool."""
     return aioredis.Redis(connection_pool=_get_async_pool())
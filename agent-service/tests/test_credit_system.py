@@ -6,12 +6,15 @@ Covers:
 - Credit limit tiers
 - Collection strategy selection by days overdue
 - Auto-suspend logic
-- Default prediction
+- Set-based collection cycle
+- Default prediction (single customer and store-wide batch)
 - Collection rate monitoring
+- Bulk vectorized rescoring (credit_scoring_engine)
 """
 
 from __future__ import annotations
 
+import json
 import sys
 import os
 from unittest.mock import MagicMock, patch
@@ -29,6 +32,17 @@ from agents.intelligent_credit_agent import (
     auto_restore_credit,
     get_optimal_reminder_time,
     get_collection_metrics,
+    run_collection_cycle,
+)
+from agents.credit_scoring_engine import (
+    RISK_CACHE_KEY,
+    default_probability_from_aggregates,
+    invalidate_store_risk,
+    limit_from_scores,
+    predict_default_risk_bulk,
+    rescore_customers,
+    rescore_store,
+    score_from_aggregates,
 )
 from events.monitoring import CollectionRateMonitor
 
@@ -175,6 +189,107 @@ class TestCalculateCreditLimit:
         assert calculate_credit_limit(49.0) == 0.0
 
 
+# ---------------------------------------------------------------------------
+# 4.1 / 4.2 Bulk scoring engine
+# ---------------------------------------------------------------------------
+
+def _make_rpc_mock(order_rows, payment_rows, overdue_rows=None):
+    """Supabase mock whose rpc() serves the aggregate functions and records writes."""
+    mock = MagicMock()
+    writes = []
+
+    def rpc_side_effect(name, params):
+        call = MagicMock()
+        if name == "credit_order_aggregates":
+            call.execute.return_value = MagicMock(data=order_rows)
+        elif name == "credit_payment_aggregates":
+            call.execute.return_value = MagicMock(data=payment_rows)
+        elif name == "credit_overdue_aggregates":
+            call.execute.return_value = MagicMock(data=overdue_rows or [])
+        else:
+            writes.append((name, params))
+            call.execute.return_value = MagicMock(data=len(order_rows))
+        return call
+
+    mock.rpc.side_effect = rpc_side_effect
+    return mock, writes
+
+
+class TestBulkScoringEngine:
+    def test_vectorized_score_matches_scalar_formula(self):
+        scores = score_from_aggregates(
+            [0, 10, 10, 10], [0, 10, 0, 5], [0, 0, 20, 1], [0, 0, 0, 10000]
+        )
+        assert list(scores) == pytest.approx([50.0, 80.0, 30.0, 60.5])
+
+    def test_vectorized_score_is_clamped(self):
+        scores = score_from_aggregates([20, 20], [20, 0], [40, 0], [200000, 0])
+        assert scores[0] == pytest.approx(100.0)
+        assert scores[1] == pytest.approx(20.0)
+
+    def test_vectorized_limits(self):
+        limits = limit_from_scores([100, 70, 69.9, 50, 49.9, 0])
+        assert list(limits) == [5000.0, 5000.0, 2000.0, 2000.0, 0.0, 0.0]
+
+    def test_rescore_store_writes_only_changed_rows(self):
+        order_rows = [
+            # Unchanged: base score 50, limit 2000
+            {"customer_id": "c1", "credit_score": 50, "credit_limit": 2000,
+             "credit_suspended": False, "order_count": 0, "total_spent": 0},
+            # Changed: all on-time payments push score to 80
+            {"customer_id": "c2", "credit_score": 50, "credit_limit": 2000,
+             "credit_suspended": False, "order_count": 0, "total_spent": 0},
+        ]
+        payment_rows = [
+            {"customer_id": "c2", "total_payments": 10, "on_time_payments": 10, "late_payments": 0},
+        ]
+        mock_db, writes = _make_rpc_mock(order_rows, payment_rows)
+
+        result = rescore_store("store-1", db_conn=mock_db)
+
+        assert result["customers_scored"] == 2
+        assert result["customers_updated"] == 1
+        assert len(writes) == 1
+        name, params = writes[0]
+        assert name == "apply_credit_scores"
+        updates = json.loads(params["p_updates"])
+        assert updates == [
+            {"id": "c2", "credit_score": 80, "credit_limit": 5000.0, "credit_suspended": None}
+        ]
+
+    def test_rescore_store_skips_write_when_nothing_changed(self):
+        order_rows = [
+            {"customer_id": "c1", "credit_score": 50, "credit_limit": 2000,
+             "credit_suspended": False, "order_count": 0, "total_spent": 0},
+        ]
+        mock_db, writes = _make_rpc_mock(order_rows, [])
+        result = rescore_store("store-1", db_conn=mock_db)
+        assert result["customers_updated"] == 0
+        assert writes == []
+
+    def test_rescore_store_returns_error_on_failure(self):
+        mock_db = MagicMock()
+        mock_db.rpc.side_effect = Exception("DB error")
+        result = rescore_store("store-1", db_conn=mock_db)
+        assert "error" in result
+
+    def test_rescore_customers_restores_suspended_credit(self):
+        order_rows = [
+            {"customer_id": "c1", "credit_score": 50, "credit_limit": 2000,
+             "credit_suspended": True, "order_count": 0, "total_spent": 0},
+        ]
+        mock_db, writes = _make_rpc_mock(order_rows, [])
+
+        result = rescore_customers("store-1", ["c1"], restore_suspended=True, db_conn=mock_db)
+
+        assert result["restored"] == ["c1"]
+        assert result["scores"]["c1"] == {"credit_score": 50, "credit_limit": 2000.0}
+        updates = json.loads(writes[0][1]["p_updates"])
+        assert updates[0]["credit_suspended"] is False
+        order_call = mock_db.rpc.call_args_list[0]
+        assert order_call.args[1]["p_customer_ids"] == ["c1"]
+
+
 # ---------------------------------------------------------------------------
 # 4.4 Collection Strategy
 # ---------------------------------------------------------------------------
@@ -233,6 +348,96 @@ class TestGetCollectionStrategy:
             assert "reminder_type" in strategy
 
 
+class TestRunCollectionCycle:
+    def _days_ago(self, days):
+        from datetime import datetime, timedelta, timezone
+        return (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+    def _make_db(self, orders, sent_reminders=None, suspended_rows=None):
+        mock_db = MagicMock()
+        tables = {
+            "orders": MagicMock(),
+            "payment_reminders": MagicMock(),
+            "customers": MagicMock(),
+        }
+        orders_chain = tables["orders"].select.return_value
+        orders_chain.eq.return_value = orders_chain
+        orders_chain.execute.return_value = MagicMock(data=orders)
+
+        reminders = tables["payment_reminders"]
+        reminders.select.return_value.in_.return_value.execute.return_value = MagicMock(
+            data=sent_reminders or []
+        )
+
+        customers = tables["customers"]
+        customers.update.return_value.in_.return_value.eq.return_value.execute.return_value = (
+            MagicMock(data=suspended_rows or [])
+        )
+        mock_db.table.side_effect = lambda name: tables[name]
+        return mock_db, tables
+
+    def test_suspends_each_customer_once(self):
+        orders = [
+            {"id": f"o{i}", "customer_id": "c1", "total_amount": 100, "created_at": self._days_ago(40)}
+            for i in range(10)
+        ]
+        mock_db, tables = self._make_db(orders, suspended_rows=[{"id": "c1"}])
+
+        result = run_collection_cycle("store-1", db_conn=mock_db)
+
+        customers = tables["customers"]
+        customers.update.assert_called_once_with({"credit_suspended": True})
+        customers.update.return_value.in_.assert_called_once_with("id", ["c1"])
+        assert result["suspended_count"] == 1
+        assert result["orders_processed"] == 10
+
+    def test_bulk_inserts_reminders(self):
+        orders = [
+            {"id": "o1", "customer_id": "c1", "total_amount": 100, "created_at": self._days_ago(2)},
+            {"id": "o2", "customer_id": "c2", "total_amount": 200, "created_at": self._days_ago(10)},
+        ]
+        mock_db, tables = self._make_db(orders)
+
+        result = run_collection_cycle("store-1", db_conn=mock_db)
+
+        insert = tables["payment_reminders"].insert
+        insert.assert_called_once()
+        rows = insert.call_args.args[0]
+        assert [r["reminder_type"] for r in rows] == ["friendly", "firm"]
+        assert result["reminders_sent"] == 2
+        tables["customers"].update.assert_not_called()
+
+    def test_skips_reminders_already_sent_for_tier(self):
+        orders = [
+            {"id": "o1", "customer_id": "c1", "total_amount": 100, "created_at": self._days_ago(2)},
+            {"id": "o2", "customer_id": "c2", "total_amount": 200, "created_at": self._days_ago(10)},
+        ]
+        sent = [
+            {"order_id": "o1", "reminder_type": "friendly"},
+            # An earlier tier does not suppress the current one
+            {"order_id": "o2", "reminder_type": "neutral"},
+        ]
+        mock_db, tables = self._make_db(orders, sent_reminders=sent)
+
+        result = run_collection_cycle("store-1", db_conn=mock_db)
+
+        rows = tables["payment_reminders"].insert.call_args.args[0]
+        assert [r["order_id"] for r in rows] == ["o2"]
+        assert result["reminders_sent"] == 1
+        assert result["reminders_skipped"] == 1
+
+    def test_no_writes_when_nothing_new(self):
+        orders = [
+            {"id": "o1", "customer_id": "c1", "total_amount": 100, "created_at": self._days_ago(2)},
+        ]
+        mock_db, tables = self._make_db(
+            orders, sent_reminders=[{"order_id": "o1", "reminder_type": "friendly"}]
+        )
+        result = run_collection_cycle("store-1", db_conn=mock_db)
+        tables["payment_reminders"].insert.assert_not_called()
+        assert result["reminders_sent"] == 0
+
+
 # ---------------------------------------------------------------------------
 # 4.6 Auto-Suspend / Auto-Restore
 # ---------------------------------------------------------------------------
@@ -378,6 +583,79 @@ class TestPredictDefaultRisk:
         assert 0.0 <= result["default_probability"] <= 1.0
 
 
+class _FakeCache:
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+
+class TestPredictDefaultRiskBulk:
+    ORDER_ROWS = [
+        {"customer_id": "good", "credit_score": 80, "credit_limit": 5000,
+         "credit_suspended": False, "order_count": 5, "total_spent": 5000},
+        {"customer_id": "bad", "credit_score": 25, "credit_limit": 0,
+         "credit_suspended": True, "order_count": 3, "total_spent": 900},
+        {"customer_id": "new", "credit_score": None, "credit_limit": 0,
+         "credit_suspended": False, "order_count": 0, "total_spent": 0},
+    ]
+    PAYMENT_ROWS = [
+        {"customer_id": "good", "total_payments": 5, "on_time_payments": 5, "late_payments": 0},
+        {"customer_id": "bad", "total_payments": 10, "on_time_payments": 0, "late_payments": 10},
+    ]
+
+    def test_vectorized_probability_matches_single_customer_path(self):
+        payments = [{"days_to_payment": 20, "was_late": True}] * 10
+        single = predict_default_risk(
+            "cust-1",
+            db_conn=TestPredictDefaultRisk()._make_db(
+                credit_score=25, suspended=True, payment_history=payments
+            ),
+        )
+        bulk = default_probability_from_aggregates([25], [True], [10], [10], [0])
+        assert single["default_probability"] == pytest.approx(float(bulk[0]))
+
+    def test_sorted_by_probability_with_overdue_orders(self):
+        mock_db, _ = _make_rpc_mock(
+            self.ORDER_ROWS, self.PAYMENT_ROWS,
+            overdue_rows=[{"customer_id": "bad", "overdue_orders": 2}],
+        )
+        results = predict_default_risk_bulk("store-1", db_conn=mock_db, cache=_FakeCache())
+
+        assert [r["customer_id"] for r in results] == ["bad", "new", "good"]
+        bad = results[0]
+        assert bad["risk_level"] == "high"
+        assert bad["default_probability"] == pytest.approx(1.0)
+        assert bad["overdue_orders"] == 2
+        assert "overdue_orders_2" in bad["risk_indicators"]
+        assert bad["recommended_action"] == "suspend_credit_and_contact_immediately"
+        # Missing score is treated as the default 50
+        assert results[1]["credit_score"] is None
+        assert results[1]["default_probability"] == pytest.approx(0.2)
+
+    def test_result_cached_until_invalidated(self):
+        cache = _FakeCache()
+        mock_db, _ = _make_rpc_mock(self.ORDER_ROWS, self.PAYMENT_ROWS)
+
+        first = predict_default_risk_bulk("store-1", db_conn=mock_db, cache=cache)
+        calls = mock_db.rpc.call_count
+        second = predict_default_risk_bulk("store-1", db_conn=mock_db, cache=cache)
+        assert second == first
+        assert mock_db.rpc.call_count == calls
+
+        invalidate_store_risk("store-1", cache=cache)
+        assert RISK_CACHE_KEY.format(store_id="store-1") not in cache.store
+        predict_default_risk_bulk("store-1", db_conn=mock_db, cache=cache)
+        assert mock_db.rpc.call_count == calls * 2
+
+
 # ---------------------------------------------------------------------------
 # 4.12 Collection Rate Monitor
 # ---------------------------------------------------------------------------
@@ -32,6 +32,9 @@ from agents.notification_orchestrator import (
     get_priority_value,
     is_within_send_window,
     personalize_message,
+    batch_store_notifications,
+    get_cached_notification_preferences,
+    reserve_notification_slot,
     update_notification_preferences,
 )
 
@@ -46,6 +49,54 @@ def _make_supabase_mock():
     return mock
 
 
+class _FakeRedis:
+    """Sync Redis stub that emulates the fatigue Lua script, GET/SET/DELETE and
+    the schedule pipeline (ZADD/ZREM/HDEL/PUBLISH)."""
+
+    def __init__(self):
+        self.store: dict[str, str] = {}
+        self.ttls: dict[str, int] = {}
+        self.zsets: dict[str, dict[str, float]] = {}
+
+    def pipeline(self):
+        return self
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, *members):
+        for m in members:
+            self.zsets.get(key, {}).pop(m, None)
+
+    def hdel(self, key, *fields):
+        pass
+
+    def publish(self, channel, message):
+        pass
+
+    def execute(self):
+        return []
+
+    def eval(self, script, numkeys, key, limit, ttl, force):
+        count = int(self.store.get(key, 0))
+        if count >= int(limit) and force != "1":
+            return -1
+        count += 1
+        self.store[key] = str(count)
+        if count == 1:
+            self.ttls[key] = int(ttl)
+        return count
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+
 def _notification_rows(count: int, responded: bool = False) -> list[dict]:
     return [
         {
@@ -187,6 +238,66 @@ class TestFatiguePrevention:
         assert count == 2
 
 
+class TestRedisFatigueCounter:
+    """8.2.1 Redis-backed fatigue gate and cached preferences."""
+
+    def test_reserve_counts_until_limit(self):
+        redis = _FakeRedis()
+        results = [reserve_notification_slot("cust-1", redis_client=redis) for _ in range(4)]
+        assert results == [True] * MAX_MESSAGES_PER_DAY + [False]
+        key = next(iter(redis.store))
+        assert key.startswith("notif_fatigue:cust-1:")
+        assert redis.ttls[key] > 0
+
+    def test_force_counts_over_limit(self):
+        redis = _FakeRedis()
+        for _ in range(MAX_MESSAGES_PER_DAY):
+            reserve_notification_slot("cust-1", redis_client=redis)
+        assert reserve_notification_slot("cust-1", force=True, redis_client=redis) is True
+        assert int(next(iter(redis.store.values()))) == MAX_MESSAGES_PER_DAY + 1
+
+    def test_reserve_returns_none_on_redis_error(self):
+        redis = MagicMock()
+        redis.eval.side_effect = ConnectionError("down")
+        assert reserve_notification_slot("cust-1", redis_client=redis) is None
+
+    def test_send_uses_redis_counter_instead_of_history_scan(self):
+        mock = _make_supabase_mock()
+        mock.table.return_value.insert.return_value.execute.return_value.data = [{"id": "n1"}]
+        mock.table.return_value.select.return_value.eq.return_value.single.return_value \
+            .execute.return_value.data = {}
+        redis = _FakeRedis()
+        orchestrator = NotificationOrchestrator(supabase=mock, redis_client=redis)
+
+        with patch("agents.notification_orchestrator.is_within_send_window", return_value=True):
+            statuses = [
+                orchestrator.send_notification("cust-1", "Hi!", priority="medium")["status"]
+                for _ in range(MAX_MESSAGES_PER_DAY + 1)
+            ]
+
+        assert statuses == ["sent"] * MAX_MESSAGES_PER_DAY + ["queued"]
+        # notification_history was never scanned to count today's messages
+        mock.table.return_value.select.return_value.eq.return_value.gte.assert_not_called()
+
+    def test_preferences_cached_after_first_load(self):
+        mock = _make_supabase_mock()
+        mock.table.return_value.select.return_value.eq.return_value.single.return_value \
+            .execute.return_value.data = {"tone_preference": "formal"}
+        redis = _FakeRedis()
+
+        first = get_cached_notification_preferences("cust-1", db_conn=mock, redis_client=redis)
+        second = get_cached_notification_preferences("cust-1", db_conn=mock, redis_client=redis)
+
+        assert first == second == {"tone_preference": "formal"}
+        assert mock.table.call_count == 1
+
+    def test_update_preferences_invalidates_cache(self):
+        redis = _FakeRedis()
+        redis.set("notif_prefs:cust-1", "{}")
+        update_notification_preferences("cust-1", ["hey"], db_conn=_make_supabase_mock(), redis_client=redis)
+        assert "notif_prefs:cust-1" not in redis.store
+
+
 # ---------------------------------------------------------------------------
 # 8.3 Message Batching
 # ---------------------------------------------------------------------------
@@ -258,6 +369,102 @@ class TestMessageBatching:
         assert ":" in result["scheduled_time"]
 
 
+class TestStoreBatchFlush:
+    """8.3 Store-wide batch flush."""
+
+    def _make_db(self, pending, responses=None, inserted=None):
+        mock = MagicMock()
+        history = mock.table.return_value
+        history.select.return_value.eq.return_value.eq.return_value.execute.return_value = (
+            MagicMock(data=pending)
+        )
+        history.select.return_value.in_.return_value.eq.return_value.not_.is_.return_value \
+            .execute.return_value = MagicMock(data=responses or [])
+        history.insert.return_value.execute.return_value = MagicMock(data=inserted or [])
+        history.update.return_value.in_.return_value.eq.return_value.execute.return_value = (
+            MagicMock(data=[{"id": row["id"]} for row in pending])
+        )
+        return mock
+
+    def test_groups_by_customer_with_bulk_writes(self):
+        pending = [
+            {"id": "n1", "customer_id": "c1", "message": "A", "priority": "low"},
+            {"id": "n2", "customer_id": "c1", "message": "B", "priority": "high"},
+            {"id": "n3", "customer_id": "c2", "message": "C", "priority": "medium"},
+        ]
+        responses = [
+            {"customer_id": "c1", "response_hour": 11},
+            {"customer_id": "c1", "response_hour": 11},
+            {"customer_id": "c2", "response_hour": 23},
+        ]
+        mock = self._make_db(pending, responses, inserted=[{"id": "b1"}, {"id": "b2"}])
+        redis = _FakeRedis()
+
+        result = batch_store_notifications("store-1", db_conn=mock, redis_client=redis)
+
+        assert result["customers_batched"] == 2
+        assert result["notifications_batched"] == 3
+        history = mock.table.return_value
+        history.update.assert_called_once_with({"status": "batched"})
+        history.update.return_value.in_.assert_called_once_with("id", ["n1", "n2", "n3"])
+        history.update.return_value.in_.return_value.eq.assert_called_once_with("status", "queued")
+        history.insert.assert_called_once()
+        batch_rows = history.insert.call_args.args[0]
+        by_customer = {r["customer_id"]: r for r in batch_rows}
+        # Highest priority message first in the combined text
+        assert by_customer["c1"]["message"].startswith("1. B")
+        assert by_customer["c1"]["priority"] == "high"
+        assert all(r["status"] == "scheduled" for r in batch_rows)
+
+        scheduled = redis.zsets["notif_schedule"]
+        assert set(scheduled) == {"b1", "b2"}
+        hour_b1 = datetime.fromtimestamp(scheduled["b1"], tz=timezone.utc).hour
+        hour_b2 = datetime.fromtimestamp(scheduled["b2"], tz=timezone.utc).hour
+        assert hour_b1 == 11
+        assert hour_b2 == SEND_WINDOW_END - 1  # clamped into the send window
+
+    def test_batch_rebuilt_from_rows_still_queued(self):
+        pending = [
+            {"id": "n1", "customer_id": "c1", "message": "A", "priority": "low"},
+            {"id": "n2", "customer_id": "c1", "message": "B", "priority": "high"},
+            {"id": "n3", "customer_id": "c2", "message": "C", "priority": "medium"},
+        ]
+        mock = self._make_db(pending, inserted=[{"id": "b1"}, {"id": "b2"}])
+        history = mock.table.return_value
+        # n2 and n3 were sent by the delivery scheduler while batching
+        history.update.return_value.in_.return_value.eq.return_value.execute.return_value = (
+            MagicMock(data=[{"id": "n1"}])
+        )
+        redis = _FakeRedis()
+
+        result = batch_store_notifications("store-1", db_conn=mock, redis_client=redis)
+
+        assert result["customers_batched"] == 1
+        assert result["notifications_batched"] == 1
+        history.update.assert_any_call({"message": "A", "priority": "low"})
+        history.update.return_value.eq.assert_called_once_with("id", "b1")
+        history.delete.return_value.in_.assert_called_once_with("id", ["b2"])
+        assert set(redis.zsets["notif_schedule"]) == {"b1"}
+
+    def test_failed_insert_leaves_originals_queued(self):
+        pending = [{"id": "n1", "customer_id": "c1", "message": "A", "priority": "low"}]
+        mock = self._make_db(pending)
+        mock.table.return_value.insert.return_value.execute.side_effect = RuntimeError("db down")
+        redis = _FakeRedis()
+
+        result = batch_store_notifications("store-1", db_conn=mock, redis_client=redis)
+
+        assert "error" in result
+        mock.table.return_value.update.assert_not_called()
+        assert not redis.zsets.get("notif_schedule")
+
+    def test_nothing_queued(self):
+        mock = self._make_db([])
+        result = batch_store_notifications("store-1", db_conn=mock, redis_client=_FakeRedis())
+        assert result["customers_batched"] == 0
+        mock.table.return_value.insert.assert_not_called()
+
+
 # ---------------------------------------------------------------------------
 # 8.4 Personalization
 # ---------------------------------------------------------------------------
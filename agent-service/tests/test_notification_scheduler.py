@@ -0,0 +1,240 @@
+"""
+Tests for the notification delivery scheduler (8.3.3).
+"""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+from agents.notification_scheduler import (
+    ATTEMPTS_KEY,
+    INFLIGHT_KEY,
+    MAX_ATTEMPTS,
+    RESERVED_KEY,
+    SCHEDULE_KEY,
+    NotificationDeliveryScheduler,
+    next_send_time,
+)
+from agents.notification_orchestrator import FATIGUE_KEY, MAX_MESSAGES_PER_DAY
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+class _FakeAsyncRedis:
+    """Async Redis stub covering the zset/hash calls used during delivery."""
+
+    def __init__(self):
+        self.zsets: dict[str, dict[str, float]] = {SCHEDULE_KEY: {}, INFLIGHT_KEY: {}}
+        self.hashes: dict[str, dict[str, int]] = {ATTEMPTS_KEY: {}}
+        self.counters: dict[str, int] = {}
+
+    async def eval(self, script, numkeys, key, limit, ttl, force):
+        """The daily fatigue script."""
+        count = self.counters.get(key, 0)
+        if count >= int(limit) and force != "1":
+            return -1
+        self.counters[key] = count + 1
+        return count + 1
+
+    async def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    async def zrem(self, key, *members):
+        for m in members:
+            self.zsets.get(key, {}).pop(m, None)
+
+    async def hdel(self, key, *fields):
+        for f in fields:
+            self.hashes.get(key, {}).pop(f, None)
+
+    async def hincrby(self, key, field, amount):
+        h = self.hashes.setdefault(key, {})
+        h[field] = h.get(field, 0) + amount
+        return h[field]
+
+    async def hmget(self, key, fields):
+        h = self.hashes.get(key, {})
+        return [h.get(f) for f in fields]
+
+    async def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def _make_db(rows):
+    mock = MagicMock()
+    mock.table.return_value.select.return_value.in_.return_value.execute.return_value = (
+        MagicMock(data=rows)
+    )
+    return mock
+
+
+def _row(nid, status="queued", chat_id="111", priority="medium"):
+    return {
+        "id": nid,
+        "customer_id": "c1",
+        "priority": priority,
+        "message": f"msg {nid}",
+        "status": status,
+        "customers": {"telegram_chat_id": chat_id},
+    }
+
+
+# ---------------------------------------------------------------------------
+# Tests
+# ---------------------------------------------------------------------------
+
+class TestNextSendTime:
+    def test_later_today(self):
+        now = datetime(2024, 1, 1, 7, 30, tzinfo=timezone.utc)
+        assert next_send_time("18:00", now=now) == datetime(2024, 1, 1, 18, 0, tzinfo=timezone.utc)
+
+    def test_rolls_to_tomorrow_when_passed(self):
+        now = datetime(2024, 1, 1, 22, 0, tzinfo=timezone.utc)
+        assert next_send_time("18:00", now=now) == datetime(2024, 1, 2, 18, 0, tzinfo=timezone.utc)
+
+    def test_skip_today(self):
+        now = datetime(2024, 1, 1, 7, 0, tzinfo=timezone.utc)
+        assert next_send_time("18:00", now=now, skip_today=True).day == 2
+
+
+class TestDeliverBatch:
+    def test_sends_and_marks_sent_in_one_update(self):
+        redis = _FakeAsyncRedis()
+        redis.zsets[INFLIGHT_KEY] = {"n1": 1.0, "n2": 1.0}
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+        db = _make_db([_row("n1"), _row("n2")])
+        scheduler = NotificationDeliveryScheduler(supabase=db, redis_client=redis, bot=bot)
+
+        result = run(scheduler.deliver_batch(["n1", "n2"]))
+
+        assert result == {"sent": 2, "failed": 0, "skipped": 0}
+        assert bot.send_message.await_count == 2
+        update = db.table.return_value.update
+        update.assert_called_once()
+        assert update.call_args.args[0]["status"] == "sent"
+        update.return_value.in_.assert_called_once_with("id", ["n1", "n2"])
+        assert redis.zsets[INFLIGHT_KEY] == {}
+
+    def test_skips_rows_already_batched(self):
+        redis = _FakeAsyncRedis()
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+        db = _make_db([_row("n1", status="batched")])
+        scheduler = NotificationDeliveryScheduler(supabase=db, redis_client=redis, bot=bot)
+
+        result = run(scheduler.deliver_batch(["n1"]))
+
+        assert result["skipped"] == 1
+        bot.send_message.assert_not_awaited()
+
+    def test_failed_send_is_rescheduled_then_given_up(self):
+        redis = _FakeAsyncRedis()
+        bot = MagicMock()
+        bot.send_message = AsyncMock(side_effect=RuntimeError("telegram down"))
+        db = _make_db([_row("n1")])
+        scheduler = NotificationDeliveryScheduler(supabase=db, redis_client=redis, bot=bot)
+
+        run(scheduler.deliver_batch(["n1"]))
+        assert "n1" in redis.zsets[SCHEDULE_KEY]
+
+        for _ in range(MAX_ATTEMPTS - 1):
+            result = run(scheduler.deliver_batch(["n1"]))
+        assert result["failed"] == 1
+        statuses = [c.args[0]["status"] for c in db.table.return_value.update.call_args_list]
+        assert statuses[-1] == "failed"
+
+    def test_missing_chat_id_marks_failed(self):
+        redis = _FakeAsyncRedis()
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+        db = _make_db([_row("n1", chat_id=None)])
+        scheduler = NotificationDeliveryScheduler(supabase=db, redis_client=redis, bot=bot)
+
+        result = run(scheduler.deliver_batch(["n1"]))
+
+        assert result["failed"] == 1
+        bot.send_message.assert_not_awaited()
+
+    def test_deliveries_count_against_the_daily_limit(self):
+        redis = _FakeAsyncRedis()
+        redis.zsets[INFLIGHT_KEY] = {"n1": 1.0, "n2": 1.0}
+        day = datetime.now(timezone.utc).strftime("%Y%m%d")
+        fatigue_key = FATIGUE_KEY.format(customer_id="c1", day=day)
+        redis.counters[fatigue_key] = MAX_MESSAGES_PER_DAY
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+        db = _make_db([_row("n1"), _row("n2", priority="critical")])
+        scheduler = NotificationDeliveryScheduler(supabase=db, redis_client=redis, bot=bot)
+
+        result = run(scheduler.deliver_batch(["n1", "n2"]))
+
+        # Critical overrides the limit (still counted); medium waits for tomorrow
+        assert result == {"sent": 1, "failed": 0, "skipped": 0}
+        assert redis.counters[fatigue_key] == MAX_MESSAGES_PER_DAY + 1
+        assert "n1" in redis.zsets[SCHEDULE_KEY]
+        assert redis.zsets[INFLIGHT_KEY] == {}
+
+    def test_retries_do_not_take_another_slot(self):
+        redis = _FakeAsyncRedis()
+        day = datetime.now(timezone.utc).strftime("%Y%m%d")
+        fatigue_key = FATIGUE_KEY.format(customer_id="c1", day=day)
+        bot = MagicMock()
+        bot.send_message = AsyncMock(side_effect=[RuntimeError("telegram down"), None])
+        db = _make_db([_row("n1")])
+        scheduler = NotificationDeliveryScheduler(supabase=db, redis_client=redis, bot=bot)
+
+        run(scheduler.deliver_batch(["n1"]))
+        result = run(scheduler.deliver_batch(["n1"]))
+
+        assert result["sent"] == 1
+        assert redis.counters[fatigue_key] == 1
+        assert "n1" not in redis.hashes[RESERVED_KEY]
+
+
+class TestStartup:
+    def test_start_retries_until_redis_answers(self, monkeypatch):
+        monkeypatch.setattr("agents.notification_scheduler.STARTUP_RETRY_SECONDS", 0.01)
+        redis = _FakeAsyncRedis()
+        scheduler = NotificationDeliveryScheduler(redis_client=redis)
+        calls = []
+
+        async def requeue_expired():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ConnectionError("redis down")
+            return 0
+
+        async def idle():
+            await asyncio.sleep(3600)
+
+        scheduler.requeue_expired = requeue_expired
+        scheduler._listen_for_wakeups = idle
+        scheduler._sleep_until_next = idle
+        scheduler.pop_due = AsyncMock(return_value=[])
+
+        async def scenario():
+            await scheduler.start()
+            assert not scheduler._running
+            for _ in range(100):
+                if scheduler._running:
+                    break
+                await asyncio.sleep(0.01)
+            running = scheduler._running
+            await scheduler.stop()
+            return running
+
+        assert run(scenario()) is True
+        assert len(calls) == 3
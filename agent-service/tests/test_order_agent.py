@@ -0,0 +1,160 @@
+"""
+Tests for idempotent order processing in OrderAgent.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from agents.order_agent import CLAIM_NEW, CLAIM_STOCK_ADJUSTED
+from events.event_bus import Event
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+class _FakeAsyncRedis:
+    """Async Redis stub supporting SET NX, DELETE and the claim script."""
+
+    def __init__(self):
+        self.store: dict[str, str] = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+    async def delete(self, key):
+        return 1 if self.store.pop(key, None) is not None else 0
+
+    async def eval(self, script, numkeys, key, ttl, resumable, held, fresh):
+        # Same steps as order_agent._CLAIM_LUA
+        state = self.store.get(key)
+        if state is not None and state != resumable:
+            return None
+        self.store[key] = held
+        return state or fresh
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def agent():
+    with patch("agents.order_agent.create_client") as mock_create:
+        mock_create.return_value = MagicMock()
+        from agents.order_agent import OrderAgent
+        a = OrderAgent(redis_client=_FakeAsyncRedis())
+    return a
+
+
+def _order_event(inventory_adjusted: bool = True) -> Event:
+    return Event(
+        type="order_created",
+        store_id="store-1",
+        payload={
+            "order_id": "order-12345678",
+            "items": [{"product_id": "p1", "quantity": 2}, {"product_id": "p2", "quantity": 1}],
+            "status": "confirmed",
+            "inventory_adjusted": inventory_adjusted,
+        },
+    )
+
+
+# ---------------------------------------------------------------------------
+# Tests
+# ---------------------------------------------------------------------------
+
+class TestOrderAgentIdempotency:
+    def test_claim_order_only_once(self, agent):
+        assert run(agent.claim_order("o1")) == CLAIM_NEW
+        assert run(agent.claim_order("o1")) is None
+
+    def test_release_allows_reclaim(self, agent):
+        run(agent.claim_order("o1"))
+        run(agent.release_order("o1"))
+        assert run(agent.claim_order("o1")) == CLAIM_NEW
+
+    def test_local_claims_when_redis_fails(self, agent):
+        broken = MagicMock()
+        broken.eval = AsyncMock(side_effect=ConnectionError("down"))
+        agent._redis = broken
+        assert run(agent.claim_order("o2")) == CLAIM_NEW
+        assert run(agent.claim_order("o2")) is None
+
+    def test_duplicate_event_is_skipped(self, agent):
+        with patch("agents.order_agent.event_bus.publish", new=AsyncMock()) as publish:
+            run(agent.handle_order(_order_event()))
+            run(agent.handle_order(_order_event()))
+        assert publish.await_count == 1
+
+    def test_does_not_touch_stock_when_already_adjusted(self, agent):
+        with patch("agents.order_agent.event_bus.publish", new=AsyncMock()):
+            run(agent.handle_order(_order_event(inventory_adjusted=True)))
+        tables = [c.args[0] for c in agent.supabase.table.call_args_list]
+        assert "inventory" not in tables
+        # Order already confirmed by customer-service — no status write either
+        assert "orders" not in tables
+
+    def test_single_inventory_event_per_order(self, agent):
+        with patch("agents.order_agent.event_bus.publish", new=AsyncMock()) as publish:
+            run(agent.handle_order(_order_event()))
+        event = publish.await_args.args[0]
+        assert event.type == "inventory_updated"
+        assert event.payload["product_ids"] == ["p1", "p2"]
+
+    def test_adjusts_stock_for_legacy_producers(self, agent):
+        agent.supabase.rpc.return_value.execute.return_value = MagicMock(
+            data=[{"product_id": "p1", "quantity": 8}, {"product_id": "p2", "quantity": -1}]
+        )
+        with patch("agents.order_agent.event_bus.publish", new=AsyncMock()):
+            run(agent.handle_order(_order_event(inventory_adjusted=False)))
+        name, params = agent.supabase.rpc.call_args.args
+        assert name == "decrement_inventory"
+        assert params["p_store_id"] == "store-1"
+        assert json.loads(params["p_items"]) == [
+            {"product_id": "p1", "quantity": 2.0},
+            {"product_id": "p2", "quantity": 1.0},
+        ]
+        # One atomic statement: no read-then-write on the inventory table
+        tables = [c.args[0] for c in agent.supabase.table.call_args_list]
+        assert "inventory" not in tables
+
+    def test_failure_releases_claim(self, agent):
+        with patch(
+            "agents.order_agent.event_bus.publish",
+            new=AsyncMock(side_effect=RuntimeError("boom")),
+        ):
+            run(agent.handle_order(_order_event()))
+        assert run(agent.claim_order("order-12345678")) == CLAIM_NEW
+
+    def test_failure_after_stock_update_resumes_without_touching_stock(self, agent):
+        with patch(
+            "agents.order_agent.event_bus.publish",
+            new=AsyncMock(side_effect=RuntimeError("boom")),
+        ):
+            run(agent.handle_order(_order_event(inventory_adjusted=False)))
+        assert agent.supabase.rpc.call_count == 1
+
+        with patch("agents.order_agent.event_bus.publish", new=AsyncMock()) as publish:
+            run(agent.handle_order(_order_event(inventory_adjusted=False)))
+        # The retry is finalized, but stock is reduced only once
+        assert publish.await_count == 1
+        assert agent.supabase.rpc.call_count == 1
+
+    def test_resumable_claim_is_not_handed_out_twice(self, agent):
+        run(agent.claim_order("o3"))
+        run(agent.release_order("o3", CLAIM_STOCK_ADJUSTED))
+        assert run(agent.claim_order("o3")) == CLAIM_STOCK_ADJUSTED
+        assert run(agent.claim_order("o3")) is None
@@ -0,0 +1,133 @@
+"""
+Tests for precomputed response-hour histograms (8.1.2 / 4.5).
+"""
+
+from __future__ import annotations
+
+from unittest.mock import MagicMock
+
+from agents.response_histogram import (
+    HISTOGRAM_KEY,
+    decode_histogram,
+    encode_histogram,
+    get_cached_hour_counts,
+    get_histograms,
+    record_response,
+    to_hour_counts,
+)
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+class _FakeBinaryRedis:
+    """Binary Redis stub: MGET/SET NX pipeline plus the record Lua script."""
+
+    def __init__(self):
+        self.store: dict[str, bytes] = {}
+        self.mget_calls = 0
+
+    def mget(self, keys):
+        self.mget_calls += 1
+        return [self.store.get(k) for k in keys]
+
+    def pipeline(self):
+        return self
+
+    def set(self, key, value, nx=False):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+    def execute(self):
+        return []
+
+    def eval(self, script, numkeys, key, field):
+        if key not in self.store:
+            return None
+        counts = decode_histogram(self.store[key])
+        hour = int(field.lstrip("#"))
+        counts[hour] = min(counts[hour] + 1, 0xFFFF)
+        self.store[key] = encode_histogram(counts)
+        return [counts[hour]]
+
+
+def _make_db(rows):
+    mock = MagicMock()
+    mock.table.return_value.select.return_value.in_.return_value.eq.return_value \
+        .not_.is_.return_value.execute.return_value = MagicMock(data=rows)
+    return mock
+
+
+# ---------------------------------------------------------------------------
+# Tests
+# ---------------------------------------------------------------------------
+
+class TestEncoding:
+    def test_round_trip(self):
+        counts = [0] * 24
+        counts[9], counts[18] = 3, 70000
+        decoded = decode_histogram(encode_histogram(counts))
+        assert decoded[9] == 3
+        assert decoded[18] == 0xFFFF  # saturates like BITFIELD OVERFLOW SAT
+        assert len(encode_histogram(counts)) == 48
+
+    def test_short_value_is_padded(self):
+        # BITFIELD only allocates up to the highest touched counter
+        assert decode_histogram(b"\x00\x02") == [2] + [0] * 23
+
+    def test_missing_key(self):
+        assert decode_histogram(None) is None
+
+    def test_to_hour_counts_is_sparse(self):
+        assert to_hour_counts([0, 2] + [0] * 22) == {1: 2}
+
+
+class TestGetHistograms:
+    def test_segment_lookup_is_one_mget(self):
+        redis = _FakeBinaryRedis()
+        for cid, hour in (("c1", 10), ("c2", 19)):
+            counts = [0] * 24
+            counts[hour] = 4
+            redis.store[HISTOGRAM_KEY.format(customer_id=cid)] = encode_histogram(counts)
+        db = _make_db([])
+
+        result = get_histograms(["c1", "c2"], db_conn=db, redis_client=redis)
+
+        assert redis.mget_calls == 1
+        assert to_hour_counts(result["c1"]) == {10: 4}
+        assert to_hour_counts(result["c2"]) == {19: 4}
+        db.table.assert_not_called()
+
+    def test_missing_histograms_backfilled_once(self):
+        redis = _FakeBinaryRedis()
+        db = _make_db([
+            {"customer_id": "c1", "response_hour": 14},
+            {"customer_id": "c1", "response_hour": 14},
+        ])
+
+        first = get_histograms(["c1", "c2"], db_conn=db, redis_client=redis)
+        assert to_hour_counts(first["c1"]) == {14: 2}
+        assert first["c2"] == [0] * 24
+
+        # Both customers (including the one without responses) are now cached
+        get_histograms(["c1", "c2"], db_conn=db, redis_client=redis)
+        assert db.table.call_count == 1
+
+    def test_record_response_increments_existing_histogram(self):
+        redis = _FakeBinaryRedis()
+        redis.store[HISTOGRAM_KEY.format(customer_id="c1")] = encode_histogram([0] * 24)
+        assert record_response("c1", 20, redis_client=redis) is True
+        assert get_cached_hour_counts("c1", db_conn=_make_db([]), redis_client=redis) == {20: 1}
+
+    def test_cached_hour_counts_none_when_redis_unreachable(self):
+        redis = MagicMock()
+        redis.mget.side_effect = ConnectionError("refused")
+        db = _make_db([{"customer_id": "c1", "response_hour": 14}])
+        assert get_cached_hour_counts("c1", db_conn=db, redis_client=redis) is None
+        db.table.assert_not_called()
+
+    def test_record_response_rejects_invalid_hour(self):
+        assert record_response("c1", 24, redis_client=_FakeBinaryRedis()) is False
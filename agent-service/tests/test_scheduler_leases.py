@@ -0,0 +1,167 @@
+"""
+Tests for scheduler replica coordination (leader lease, shards, claims).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+from datetime import datetime
+
+import pytest
+
+from agents.scheduler_leases import LeaderLease, ReplicaCoordinator, rendezvous_owner
+from agents.store_scheduler import StoreJob, StoreJobScheduler
+
+STORES = [{"id": f"store-{i}", "name": f"Store {i}"} for i in range(40)]
+FIRED_AT = datetime(2024, 5, 1, 21, 0)
+
+
+def _scheduler(coordinator) -> StoreJobScheduler:
+    async def load():
+        return STORES
+    return StoreJobScheduler(load, rng=random.Random(3), coordinator=coordinator)
+
+
+def _recording_job(calls: list, name: str = "daily_reports") -> StoreJob:
+    async def run_store(store):
+        await asyncio.sleep(0)
+        calls.append(store["id"])
+    # Short timeout: the leader sweeps once window + timeout has passed
+    return StoreJob(name, ["21:00"], run_store, concurrency=8, store_timeout=0.3)
+
+
+# ---------------------------------------------------------------------------
+# Without Redis: a single replica
+# ---------------------------------------------------------------------------
+
+class TestSingleReplica:
+    def test_rendezvous_owner_is_stable_and_spreads_keys(self):
+        members = ["a", "b", "c"]
+        owners = [rendezvous_owner(s["id"], members) for s in STORES]
+        assert owners == [rendezvous_owner(s["id"], list(reversed(members))) for s in STORES]
+        assert set(owners) == set(members)
+        # Removing a member only moves that member's keys
+        for store, owner in zip(STORES, owners):
+            if owner != "c":
+                assert rendezvous_owner(store["id"], ["a", "b"]) == owner
+
+    def test_local_coordinator_runs_every_store_once_per_firing(self):
+        calls: list = []
+        coordinator = ReplicaCoordinator(None, member_id="solo")
+        scheduler = _scheduler(coordinator)
+        job = _recording_job(calls)
+
+        async def scenario():
+            await coordinator.start()
+            first = await scheduler.run_job(job, fired_at=FIRED_AT)
+            again = await scheduler.run_job(job, fired_at=FIRED_AT)
+            await coordinator.stop()
+            return first, again
+
+        first, again = asyncio.run(scenario())
+        assert sorted(calls) == sorted(s["id"] for s in STORES)
+        assert first.succeeded == len(STORES)
+        # Same firing again (restart, duplicate trigger): everything is skipped
+        assert again.skipped == len(STORES) and again.succeeded == 0
+
+
+# ---------------------------------------------------------------------------
+# Several replicas sharing (fake) Redis
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+class TestReplicas:
+    def test_only_one_leader_at_a_time(self, redis):
+        async def scenario():
+            first = LeaderLease(redis, "g", "one", ttl_seconds=5)
+            second = LeaderLease(redis, "g", "two", ttl_seconds=5)
+            results = [await first.try_acquire(), await second.try_acquire(), await first.try_acquire()]
+            await first.release()
+            results.append(await second.try_acquire())
+            return results, first.is_leader, second.is_leader
+
+        results, first_leads, second_leads = asyncio.run(scenario())
+        assert results == [True, False, True, True]
+        assert not first_leads and second_leads
+
+    def test_replicas_split_stores_without_duplicates(self, redis):
+        calls: list = []
+        coordinators = [ReplicaCoordinator(redis, group="g", member_id=m) for m in ("r1", "r2", "r3")]
+        schedulers = [_scheduler(c) for c in coordinators]
+
+        async def scenario():
+            for c in coordinators:
+                await c.start()
+            runs = await asyncio.gather(*(
+                s.run_job(_recording_job(calls), fired_at=FIRED_AT) for s in schedulers
+            ))
+            for c in coordinators:
+                await c.stop()
+            return runs
+
+        runs = asyncio.run(scenario())
+        assert sorted(calls) == sorted(s["id"] for s in STORES)
+        # Every replica did real work
+        assert all(run.succeeded > 0 for run in runs)
+        assert sum(run.succeeded for run in runs) == len(STORES)
+
+    def test_leader_sweeps_the_shard_of_a_vanished_replica(self, redis):
+        calls: list = []
+        leader = ReplicaCoordinator(redis, group="g", member_id="alive")
+        scheduler = _scheduler(leader)
+
+        async def scenario():
+            # "gone" still looks alive in the members set but never runs its shard
+            await redis.zadd("sched:members:g", {"gone": 10 ** 12})
+            await leader.start()
+            run = await scheduler.run_job(_recording_job(calls), fired_at=FIRED_AT)
+            await leader.stop()
+            return run
+
+        run = asyncio.run(scenario())
+        assert sorted(calls) == sorted(s["id"] for s in STORES)
+        assert run.succeeded == len(STORES)
+
+    def test_leader_waits_for_the_deadline_before_sweeping(self, redis):
+        calls: list = []
+        leader = ReplicaCoordinator(redis, group="g", member_id="leader")
+        late = ReplicaCoordinator(redis, group="g", member_id="late")
+
+        async def scenario():
+            await leader.start()
+            await late.start()
+            leader_run = asyncio.create_task(
+                _scheduler(leader).run_job(_recording_job(calls), fired_at=FIRED_AT))
+            # The other replica starts its share after the leader's shard is done
+            await asyncio.sleep(0.1)
+            late_run = await _scheduler(late).run_job(_recording_job(calls), fired_at=FIRED_AT)
+            runs = await leader_run, late_run
+            await late.stop()
+            await leader.stop()
+            return runs
+
+        leader_run, late_run = asyncio.run(scenario())
+        assert sorted(calls) == sorted(s["id"] for s in STORES)
+        late_shard = [s for s in STORES if rendezvous_owner(s["id"], ["late", "leader"]) == "late"]
+        assert late_run.succeeded == len(late_shard) > 0
+        assert leader_run.succeeded == len(STORES) - len(late_shard)
+
+    def test_claims_are_per_job_and_firing(self, redis):
+        coordinator = ReplicaCoordinator(redis, group="g", member_id="r1")
+
+        async def scenario():
+            return [
+                await coordinator.claim("daily_reports", "s1", "2024-05-01T21:00", 60),
+                await coordinator.claim("daily_reports", "s1", "2024-05-01T21:00", 60),
+                await coordinator.claim("ai_credit_analysis", "s1", "2024-05-01T21:00", 60),
+                await coordinator.claim("daily_reports", "s1", "2024-05-02T21:00", 60),
+            ]
+
+        assert asyncio.run(scenario()) == [True, False, True, True]
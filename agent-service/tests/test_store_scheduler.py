@@ -0,0 +1,124 @@
+"""
+Tests for the owner bot's per-store job scheduler.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from datetime import datetime
+
+from agents.store_scheduler import StoreJob, StoreJobScheduler, plan_offsets
+
+
+def _stores(count: int) -> list[dict]:
+    return [{"id": f"s{i}", "name": f"Store {i}"} for i in range(count)]
+
+
+def _scheduler(stores: list[dict]) -> StoreJobScheduler:
+    async def load():
+        return stores
+    return StoreJobScheduler(load, rng=random.Random(7))
+
+
+# ---------------------------------------------------------------------------
+# Planning
+# ---------------------------------------------------------------------------
+
+class TestPlanning:
+    def test_offsets_one_jittered_slot_per_store(self):
+        offsets = plan_offsets(4, 8.0, random.Random(1))
+        assert len(offsets) == 4
+        for i, offset in enumerate(offsets):
+            assert 2 * i <= offset <= 2 * (i + 1)
+
+    def test_no_window_starts_everything_at_once(self):
+        assert plan_offsets(3, 0) == [0.0, 0.0, 0.0]
+        assert plan_offsets(0, 60) == []
+
+    def test_next_fire_picks_the_earliest_upcoming_time(self):
+        job = StoreJob("inv", ["10:00", "16:00"], run_store=None)
+        assert job.next_fire(datetime(2024, 5, 1, 9, 0)) == datetime(2024, 5, 1, 10, 0)
+        assert job.next_fire(datetime(2024, 5, 1, 10, 0)) == datetime(2024, 5, 1, 16, 0)
+        assert job.next_fire(datetime(2024, 5, 1, 17, 0)) == datetime(2024, 5, 2, 10, 0)
+
+
+# ---------------------------------------------------------------------------
+# Runs
+# ---------------------------------------------------------------------------
+
+class TestRunJob:
+    def test_bounded_concurrency_and_all_stores_processed(self):
+        seen, in_flight, peak = [], 0, 0
+
+        async def run_store(store):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            seen.append(store["id"])
+
+        scheduler = _scheduler(_stores(20))
+        job = StoreJob("reports", ["21:00"], run_store, concurrency=5)
+        run = asyncio.run(scheduler.run_job(job))
+
+        assert sorted(seen) == sorted(s["id"] for s in _stores(20))
+        assert peak == 5
+        assert run.succeeded == 20 and run.stores == 20
+        assert scheduler.last_run("reports") is run
+
+    def test_store_starts_are_spread_over_the_window(self):
+        starts = []
+
+        async def run_store(store):
+            starts.append(time.monotonic())
+
+        job = StoreJob("spread", ["09:00"], run_store, concurrency=10, window_seconds=0.2)
+        began = time.monotonic()
+        asyncio.run(_scheduler(_stores(4)).run_job(job))
+
+        assert starts == sorted(starts)
+        assert starts[-1] - began >= 0.15
+
+    def test_timeouts_and_failures_do_not_stop_the_run(self):
+        async def run_store(store):
+            if store["id"] == "s0":
+                await asyncio.sleep(1)
+            if store["id"] == "s1":
+                raise RuntimeError("boom")
+            if store["id"] == "s2":
+                return False
+            return True
+
+        job = StoreJob("mixed", ["10:00"], run_store, concurrency=4, store_timeout=0.05)
+        run = asyncio.run(_scheduler(_stores(5)).run_job(job))
+
+        assert (run.succeeded, run.failed, run.timed_out) == (2, 2, 1)
+        assert run.as_dict()["slowest_store_seconds"] >= 0.05
+
+    def test_overlapping_run_of_the_same_job_is_skipped(self):
+        async def run_store(store):
+            await asyncio.sleep(0.05)
+
+        scheduler = _scheduler(_stores(2))
+        job = StoreJob("slow", ["10:00"], run_store)
+
+        async def scenario():
+            return await asyncio.gather(scheduler.run_job(job), scheduler.run_job(job))
+
+        first, second = asyncio.run(scenario())
+        assert first.succeeded == 2
+        assert second is None
+
+    def test_store_loader_failure_yields_empty_run(self):
+        async def load():
+            raise RuntimeError("db down")
+
+        async def run_store(store):
+            raise AssertionError("not called")
+
+        run = asyncio.run(StoreJobScheduler(load).run_job(StoreJob("x", ["10:00"], run_store)))
+        assert run.stores == 0
+        assert StoreJobScheduler(load).stats() == {"running": [], "leader": True, "last_runs": {}}
@@ -0,0 +1,221 @@
+"""
+Tests for the shared Telegram outbound service.
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from telegram.error import BadRequest, Forbidden, RetryAfter  # noqa: E402
+
+from agents.telegram_outbound import (  # noqa: E402
+    PRIORITY_BULK,
+    PRIORITY_CRITICAL,
+    SharedTokenBucket,
+    TelegramOutbound,
+    TokenBucket,
+)
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+class _FakeBot:
+    """Records send_message calls; ``errors`` maps text -> exceptions to raise in turn."""
+
+    def __init__(self, errors: dict | None = None):
+        self.sent: list[tuple] = []
+        self.errors = {k: list(v) for k, v in (errors or {}).items()}
+
+    async def send_message(self, chat_id, text, **options):
+        pending = self.errors.get(text)
+        if pending:
+            raise pending.pop(0)
+        self.sent.append((chat_id, text, options))
+        return {"chat_id": chat_id, "text": text}
+
+
+def _outbound(bot: _FakeBot, workers: int = 1) -> TelegramOutbound:
+    return TelegramOutbound(
+        bot_factory=lambda token: bot, redis_factory=None,
+        rate=1000, per_chat_interval=0.01, workers=workers,
+    )
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+# ---------------------------------------------------------------------------
+# Tests
+# ---------------------------------------------------------------------------
+
+class TestTelegramOutbound:
+    def test_send_returns_message(self):
+        bot = _FakeBot()
+
+        async def scenario():
+            service = _outbound(bot)
+            result = await service.send("token", 1, "hello", parse_mode="Markdown")
+            await service.close()
+            return result
+
+        assert run(scenario()) == {"chat_id": 1, "text": "hello"}
+        assert bot.sent == [(1, "hello", {"parse_mode": "Markdown"})]
+
+    def test_critical_messages_jump_the_queue(self):
+        bot = _FakeBot()
+
+        async def scenario():
+            service = _outbound(bot)
+            futures = [service.submit("token", chat, f"promo {chat}", priority=PRIORITY_BULK)
+                       for chat in range(1, 4)]
+            futures.append(service.submit("token", 99, "alert", priority=PRIORITY_CRITICAL))
+            await asyncio.gather(*futures)
+            await service.close()
+
+        run(scenario())
+        # The first promo may already be in flight; the alert beats the rest
+        texts = [text for _, text, _ in bot.sent]
+        assert texts.index("alert") <= 1
+
+    def test_messages_to_one_chat_keep_their_order(self):
+        bot = _FakeBot()
+
+        async def scenario():
+            service = _outbound(bot, workers=4)
+            futures = [service.submit("token", 7, f"m{i}") for i in range(5)]
+            await asyncio.gather(*futures)
+            await service.close()
+
+        run(scenario())
+        assert [text for _, text, _ in bot.sent] == [f"m{i}" for i in range(5)]
+
+    def test_retry_after_pauses_and_resends(self):
+        bot = _FakeBot(errors={"hi": [RetryAfter(0)]})
+
+        async def scenario():
+            service = _outbound(bot)
+            await service.send("token", 1, "hi")
+            await service.close()
+
+        run(scenario())
+        assert bot.sent == [(1, "hi", {})]
+
+    def test_markdown_parse_error_falls_back_to_plain_text(self):
+        bot = _FakeBot(errors={"*bad": [BadRequest("Can't parse entities")]})
+
+        async def scenario():
+            service = _outbound(bot)
+            await service.send("token", 1, "*bad", parse_mode="Markdown")
+            await service.close()
+
+        run(scenario())
+        assert bot.sent == [(1, "*bad", {})]
+
+    def test_cancelled_message_is_not_sent(self):
+        bot = _FakeBot()
+
+        async def scenario():
+            service = _outbound(bot)
+            first = service.submit("token", 1, "first")
+            second = service.submit("token", 1, "second")
+            second.cancel()
+            third = service.submit("token", 1, "third")
+            await asyncio.gather(first, third)
+            await service.close()
+
+        run(scenario())
+        assert [text for _, text, _ in bot.sent] == ["first", "third"]
+
+    def test_cancel_queued_keeps_messages_in_flight(self):
+        bot = _FakeBot()
+        release = asyncio.Event()
+        send = bot.send_message
+
+        async def slow_send(chat_id, text, **options):
+            if text == "first":
+                await release.wait()
+            return await send(chat_id, text, **options)
+
+        bot.send_message = slow_send
+
+        async def scenario():
+            service = _outbound(bot, workers=2)
+            first = service.submit("token", 1, "first")
+            second = service.submit("token", 1, "second")
+            await asyncio.sleep(0.05)
+            in_flight = service.cancel_queued([first, second])
+            release.set()
+            await first
+            await asyncio.sleep(0.05)
+            await service.close()
+            return in_flight, second
+
+        in_flight, second = run(scenario())
+        assert len(in_flight) == 1
+        assert second.cancelled()
+        assert [text for _, text, _ in bot.sent] == ["first"]
+
+    def test_blocked_chat_fails_without_retry(self):
+        bot = _FakeBot(errors={"hi": [Forbidden("bot was blocked by the user")]})
+
+        async def scenario():
+            service = _outbound(bot)
+            try:
+                with pytest.raises(Forbidden):
+                    await service.send("token", 1, "hi")
+            finally:
+                await service.close()
+
+        run(scenario())
+        assert bot.sent == []
+
+    def test_missing_token_is_rejected(self):
+        async def scenario():
+            with pytest.raises(ValueError):
+                _outbound(_FakeBot()).submit("", 1, "hi")
+
+        run(scenario())
+
+
+class TestSharedTokenBucket:
+    """The bot rate limit is shared by every process through Redis."""
+
+    def test_processes_share_one_bucket(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+
+        async def scenario():
+            redis = fakeredis.FakeAsyncRedis()
+            # Two processes sending with the same token
+            buckets = [
+                SharedTokenBucket(redis, "token", rate=20, capacity=2, local=TokenBucket(1000))
+                for _ in range(2)
+            ]
+            start = asyncio.get_running_loop().time()
+            await asyncio.gather(*(b.acquire() for b in buckets for _ in range(3)))
+            return asyncio.get_running_loop().time() - start
+
+        # 6 tokens, burst of 2, then 4 more at 20/s
+        assert run(scenario()) >= 0.15
+
+    def test_falls_back_to_local_bucket_when_redis_fails(self):
+        class _BrokenRedis:
+            async def eval(self, *args):
+                raise ConnectionError("down")
+
+        local = TokenBucket(1000)
+        bucket = SharedTokenBucket(_BrokenRedis(), "token", rate=20, local=local)
+
+        async def scenario():
+            await bucket.acquire()
+            await bucket.acquire()
+
+        run(scenario())
+        assert local._tokens < local.capacity
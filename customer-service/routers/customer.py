@@ -1,11 +1,51 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+from pathlib import Path
+from email.utils import parsedate_to_datetime
 from services.db_service import db
+from services.catalog_snapshot import (
+    CatalogSnapshotStore,
+    MIN_COMPRESS_BYTES,
+    PRODUCT_FIELDS,
+    compress,
+    pick_encoding,
+)
+import asyncio
 import os
+import sys
 import httpx    
 router = APIRouter(prefix="/api/customer", tags=["customer"])
 
+MAX_PAGE_SIZE = 500
+
+# Formatted, pre-serialized product listings per store
+catalog_snapshots = CatalogSnapshotStore(db.get_products)
+
+
+def _bump_catalog_version(store_id: str):
+    """Tell catalog caches (customer bot) that the store's stock changed."""
+    try:
+        agent_path = Path(__file__).parent.parent.parent / "agent-service"
+        if str(agent_path) not in sys.path:
+            sys.path.append(str(agent_path))
+        from cache_events import bump_catalog_version
+        bump_catalog_version(store_id)
+    except Exception as e:
+        print(f"⚠️ Could not publish catalog invalidation: {e}")
+
+
+def _record_order_suggestions(customer_id: str, order_id: str, items: list):
+    """Fold the order into the customer's "last order" / "usual order" summary."""
+    try:
+        agent_path = Path(__file__).parent.parent.parent / "agent-service"
+        if str(agent_path) not in sys.path:
+            sys.path.append(str(agent_path))
+        from order_suggestions import record_order
+        record_order(customer_id, order_id, items)
+    except Exception as e:
+        print(f"⚠️ Could not update order suggestions: {e}")
+
 # Data models for validation
 class OrderItem(BaseModel):
     product_id: str
@@ -20,47 +60,79 @@ class CreateOrderRequest(BaseModel):
 
 # Endpoint to get products
 @router.get("/products/{store_id}")
-async def get_products(store_id: str):
+async def get_products(
+    store_id: str,
+    request: Request,
+    fields: Optional[str] = Query(None, description="Comma-separated product fields, e.g. name,price"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+):
     """
     Get all available products
     
+    Served from an in-memory snapshot of the store's catalog. Responses carry
+    ETag and Last-Modified; send them back as If-None-Match / If-Modified-Since
+    to get a 304 when nothing changed. Bodies are gzip/brotli compressed when
+    the client accepts it. ``fields`` projects each product (product_id is
+    always included) and ``offset``/``limit`` page through large catalogs.
+    
     Try it: http://localhost:8002/api/customer/products/your-store-id
     """
-    print(f"📦 Getting products for store: {store_id}")
-    
-    products = db.get_products(store_id)
+    projection = _parse_fields(fields)
+    snapshot = await catalog_snapshots.get(store_id)
     
-    # Supabase may return relation as "products" or "product"
-    product_info_key = "products"  # will try "product" if needed
-    formatted_products = []
-    for item in products:
-        try:
-            info = item.get("products") or item.get("product")
-            if not info:
-                print(f"   [api] row missing products/product. keys={list(item.keys())}")
-                continue
-            # Handle both list (one-to-many) and dict (many-to-one)
-            if isinstance(info, list):
-                info = info[0] if info else {}
-            formatted_products.append({
-                "product_id": str(item.get("product_id", "")),
-                "name": info.get("name", ""),
-                "description": info.get("description") or "",
-                "unit": info.get("unit", "unit"),
-                "price": float(item.get("unit_price", 0)),
-                "available": float(item.get("quantity", 0))
-            })
-        except Exception as e:
-            print(f"   [api] format error for row: {e}. keys={list(item.keys())}")
+    etag = catalog_snapshots.variant_etag(snapshot, projection, offset, limit)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": snapshot.last_modified_http,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if _not_modified(request, etag, snapshot.last_modified):
+        return Response(status_code=304, headers=headers)
     
-    print(f"   [api] returning {len(formatted_products)} products")
+    body = catalog_snapshots.render(snapshot, projection, offset, limit)
+    encoding = pick_encoding(request.headers.get("accept-encoding"))
+    if encoding and len(body) >= MIN_COMPRESS_BYTES:
+        if body is snapshot.body:
+            body = snapshot.encoded_body(encoding)
+        else:
+            body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
     
-    return {
-        "success": True,
-        "store_id": store_id,
-        "products": formatted_products,
-        "count": len(formatted_products)
-    }
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[tuple]:
+    """Validate a ``fields`` projection; None means every field."""
+    if not fields:
+        return None
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in PRODUCT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown product fields: {', '.join(unknown)}. Allowed: {', '.join(PRODUCT_FIELDS)}"
+        )
+    return tuple(dict.fromkeys(["product_id", *requested]))
+
+
+def _not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    """Evaluate If-None-Match (preferred) or If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: W/"x" matches "x"
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have one-second resolution
+        return int(last_modified) <= since
+    return False
 
 # Endpoint to place order
 @router.post("/order/{store_id}")
@@ -103,7 +175,16 @@ async def place_order(store_id: str, order: CreateOrderRequest):
     
     if not order_id:
         raise HTTPException(status_code=500, detail="Could not create order")
-        # Trigger agent service
+    
+    # create_order reduced stock: cached catalogs are out of date
+    catalog_snapshots.invalidate(store_id)
+    # Sync Redis call: keep an unreachable server off the event loop
+    await asyncio.to_thread(_bump_catalog_version, store_id)
+    await asyncio.to_thread(
+        _record_order_suggestions, customer["id"], order_id, [item.dict() for item in order.items]
+    )
+    
+    # Trigger agent service
     try:
         async with httpx.AsyncClient() as client:
             await client.post(
@@ -115,7 +196,10 @@ async def place_order(store_id: str, order: CreateOrderRequest):
                         "order_id": order_id,
                         "customer_id": customer["id"],
                         "items": [item.dict() for item in order.items],
-                        "is_credit": order.is_credit
+                        "is_credit": order.is_credit,
+                        "status": "confirmed",
+                        # create_order already reduced stock; the agent must not repeat it
+                        "inventory_adjusted": True
                     }
                 },
                 timeout=5.0
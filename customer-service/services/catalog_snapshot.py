@@ -0,0 +1,251 @@
+"""
+Catalog snapshots for GET /api/customer/products/{store_id}
+
+Each store's product listing is formatted once and kept in memory together
+with its orjson-serialized body and any gzip / brotli encodings built so
+far. Requests for the full listing are answered from those bytes; field
+projections and pages are sliced from the formatted list.
+
+A snapshot is rebuilt when:
+- the store's catalog version in Redis (agent-service/cache_events.py)
+  moved, i.e. an order or inventory update went through a service, or
+- it is older than SNAPSHOT_TTL_SECONDS, which covers inventory edits the
+  owner dashboard writes straight to Supabase.
+
+The ETag is a hash of the formatted products, so clients keep their 304s
+across rebuilds that did not change anything.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from pathlib import Path
+from typing import Callable, Optional
+
+import orjson
+
+try:
+    import brotli
+    _BROTLI_AVAILABLE = True
+except ImportError:
+    _BROTLI_AVAILABLE = False
+
+# Allow importing cache_events / redis_client from agent-service
+_agent_path = Path(__file__).parent.parent.parent / "agent-service"
+if str(_agent_path) not in sys.path:
+    sys.path.append(str(_agent_path))
+
+try:
+    from cache_events import get_catalog_version
+except ImportError:
+    def get_catalog_version(store_id: str, redis_client=None) -> Optional[int]:
+        return None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TTL_SECONDS = 30
+# Redis is asked for the catalog version at most this often per store
+VERSION_CHECK_SECONDS = 1.0
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+PRODUCT_FIELDS = ("product_id", "name", "description", "unit", "price", "available")
+
+
+def format_products(rows: list[dict]) -> list[dict]:
+    """Flatten inventory rows joined with products into the API shape."""
+    formatted = []
+    for item in rows:
+        try:
+            # Supabase may return the relation as "products" or "product"
+            info = item.get("products") or item.get("product")
+            if not info:
+                continue
+            # Handle both list (one-to-many) and dict (many-to-one)
+            if isinstance(info, list):
+                info = info[0] if info else {}
+            formatted.append({
+                "product_id": str(item.get("product_id", "")),
+                "name": info.get("name", ""),
+                "description": info.get("description") or "",
+                "unit": info.get("unit", "unit"),
+                "price": float(item.get("unit_price", 0)),
+                "available": float(item.get("quantity", 0)),
+            })
+        except Exception as e:
+            logger.warning("Skipping inventory row %s: %s", item.get("product_id"), e)
+    return formatted
+
+
+def pick_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best supported content coding from an Accept-Encoding header."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for coding in (("br",) if _BROTLI_AVAILABLE else ()) + ("gzip",):
+        if accepted.get(coding, accepted.get("*", 0)) > 0:
+            return coding
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+@dataclass
+class CatalogSnapshot:
+    store_id: str
+    products: list[dict]
+    etag: str
+    last_modified: float                # epoch seconds of the last content change
+    catalog_version: Optional[int] = None
+    built_at: float = 0.0               # monotonic
+    version_checked_at: float = 0.0     # monotonic
+    body: bytes = b""
+    _encoded: dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def last_modified_http(self) -> str:
+        return formatdate(self.last_modified, usegmt=True)
+
+    def encoded_body(self, encoding: Optional[str]) -> bytes:
+        """Full listing body in ``encoding``, compressed once per snapshot."""
+        if encoding is None:
+            return self.body
+        cached = self._encoded.get(encoding)
+        if cached is None:
+            cached = self._encoded[encoding] = compress(self.body, encoding)
+        return cached
+
+
+def _listing(store_id: str, products: list[dict], total: int, **page) -> bytes:
+    return orjson.dumps({
+        "success": True,
+        "store_id": store_id,
+        "products": products,
+        "count": len(products),
+        "total": total,
+        **page,
+    })
+
+
+class CatalogSnapshotStore:
+    """Per-store snapshots, rebuilt once per change (single flight per store)."""
+
+    def __init__(
+        self,
+        loader: Callable[[str], list[dict]],
+        ttl_seconds: float = SNAPSHOT_TTL_SECONDS,
+    ):
+        self._loader = loader
+        self.ttl_seconds = ttl_seconds
+        self._snapshots: dict[str, CatalogSnapshot] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    async def _is_current(self, snapshot: Optional[CatalogSnapshot]) -> bool:
+        if snapshot is None:
+            return False
+        now = time.monotonic()
+        if now - snapshot.built_at >= self.ttl_seconds:
+            return False
+        if now - snapshot.version_checked_at < VERSION_CHECK_SECONDS:
+            return True
+        snapshot.version_checked_at = now
+        # Sync Redis call: keep an unreachable server off the event loop
+        version = await asyncio.to_thread(get_catalog_version, snapshot.store_id)
+        return version is None or version == snapshot.catalog_version
+
+    async def get(self, store_id: str) -> CatalogSnapshot:
+        snapshot = self._snapshots.get(store_id)
+        if await self._is_current(snapshot):
+            return snapshot
+        lock = self._locks.setdefault(store_id, asyncio.Lock())
+        async with lock:
+            snapshot = self._snapshots.get(store_id)
+            if snapshot is not None and time.monotonic() - snapshot.built_at < VERSION_CHECK_SECONDS:
+                # Rebuilt by the request we waited for
+                return snapshot
+            return await self._rebuild(store_id, snapshot)
+
+    async def _rebuild(self, store_id: str, previous: Optional[CatalogSnapshot]) -> CatalogSnapshot:
+        # Read the version first: a bump during the load triggers another rebuild
+        version = await asyncio.to_thread(get_catalog_version, store_id)
+        rows = await asyncio.to_thread(self._loader, store_id)
+        products = format_products(rows)
+        digest = hashlib.sha1(orjson.dumps(products, option=orjson.OPT_SORT_KEYS)).hexdigest()[:16]
+        etag = f'W/"{digest}"'
+        now = time.monotonic()
+
+        if previous is not None and previous.etag == etag:
+            # Nothing changed: keep the encoded bodies and Last-Modified
+            previous.catalog_version = version
+            previous.built_at = previous.version_checked_at = now
+            return previous
+
+        snapshot = CatalogSnapshot(
+            store_id=store_id,
+            products=products,
+            etag=etag,
+            last_modified=time.time(),
+            catalog_version=version,
+            built_at=now,
+            version_checked_at=now,
+            body=_listing(store_id, products, len(products)),
+        )
+        self._snapshots[store_id] = snapshot
+        return snapshot
+
+    def invalidate(self, store_id: Optional[str] = None) -> None:
+        """Rebuild on next request (this process only; others follow Redis)."""
+        snapshots = [self._snapshots.get(store_id)] if store_id else list(self._snapshots.values())
+        for snapshot in snapshots:
+            if snapshot is not None:
+                snapshot.built_at = 0.0
+
+    # ------------------------------------------------------------------
+    # Projections and pages
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def variant_etag(snapshot: CatalogSnapshot, fields: Optional[tuple], offset: int, limit: Optional[int]) -> str:
+        """ETag of a projected / paginated view of ``snapshot``."""
+        if fields is None and offset == 0 and limit is None:
+            return snapshot.etag
+        key = f"{snapshot.etag}|{','.join(fields or ())}|{offset}|{limit}"
+        return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:16]}"'
+
+    @staticmethod
+    def render(snapshot: CatalogSnapshot, fields: Optional[tuple], offset: int, limit: Optional[int]) -> bytes:
+        """Serialized body for a projected / paginated view of ``snapshot``."""
+        if fields is None and offset == 0 and limit is None:
+            return snapshot.body
+        end = None if limit is None else offset + limit
+        products = snapshot.products[offset:end]
+        if fields is not None:
+            products = [{name: p[name] for name in fields} for p in products]
+        return _listing(
+            snapshot.store_id, products, len(snapshot.products), offset=offset, limit=limit
+        )
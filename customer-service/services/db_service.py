@@ -20,11 +20,7 @@ class DatabaseService:
                 .gt("quantity", 0)\
                 .execute()
             
-            data = response.data or []
-            print(f"   [db] get_products store_id={store_id!r} -> {len(data)} rows")
-            if data:
-                print(f"   [db] first row keys: {list(data[0].keys())}")
-            return data
+            return response.data or []
         except Exception as e:
             print(f"❌ Error getting products: {e}")
             import traceback
@@ -75,6 +71,7 @@ class DatabaseService:
                 "customer_id": customer_id,
                 "total_amount": total_amount,
                 "status": "confirmed",
+                "is_credit": is_credit,
                 "payment_status": "unpaid" if is_credit else "paid"
             }
             
@@ -84,9 +81,9 @@ class DatabaseService:
             
             order_id = order_response.data[0]["id"]
             
-            # Create order items
-            for item in items:
-                item_data = {
+            # Create order items in a single insert
+            items_data = [
+                {
                     "order_id": order_id,
                     "product_id": item["product_id"],
                     "product_name": item["product_name"],
@@ -94,7 +91,10 @@ class DatabaseService:
                     "unit_price": item["unit_price"],
                     "subtotal": item["quantity"] * item["unit_price"]
                 }
-                supabase.table("order_items").insert(item_data).execute()
+                for item in items
+            ]
+            if items_data:
+                supabase.table("order_items").insert(items_data).execute()
             
             # Reduce inventory for each item
             print(f"📦 Reducing inventory for order {order_id}...")
@@ -180,7 +180,7 @@ Feel free to browse and order anytime!`
       const result = await response.json()
 
       if (result.success) {
-        setPromoStatus(`✅ Message sent to ${customers.length} customers!`)
+        setPromoStatus(`✅ Message queued for ${result.total} customers!`)
         setPromoMessage('')
       } else {
         setPromoStatus(`❌ Failed to send messages: ${result.message}`)
@@ -5,7 +5,7 @@ Provides credit score, payment history, at-risk customers, and suspend/restore.
 
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from supabase import create_client
 import os
 import sys
@@ -13,6 +13,13 @@ from pathlib import Path
 
 router = APIRouter(prefix="/api/owner/credit", tags=["credit"])
 
+_RISK_LEVEL_RANK = {"low": 0, "medium": 1, "high": 2}
+_AT_RISK_SORT_KEYS = {
+    "default_probability": (lambda p: p["default_probability"], True),
+    "credit_score": (lambda p: p["credit_score"] if p["credit_score"] is not None else -1, False),
+    "overdue_orders": (lambda p: p["overdue_orders"], True),
+}
+
 
 def _get_supabase():
     return create_client(
@@ -21,6 +28,40 @@ def _get_supabase():
     )
 
 
+def _get_credit_engine_module():
+    """Import credit_scoring_engine from agent-service/agents."""
+    agent_path = Path(__file__).parent.parent.parent / "agent-service" / "agents"
+    if str(agent_path) not in sys.path:
+        sys.path.insert(0, str(agent_path))
+    import credit_scoring_engine
+    return credit_scoring_engine
+
+
+def _publish_customers_changed(customer_ids: list):
+    """Tell customer caches (customer bot) that these customers' credit changed."""
+    try:
+        agent_path = Path(__file__).parent.parent.parent / "agent-service"
+        if str(agent_path) not in sys.path:
+            sys.path.append(str(agent_path))
+        from cache_events import publish_customers_changed
+        publish_customers_changed(customer_ids)
+    except Exception as e:
+        print(f"⚠️ Could not publish customer invalidation: {e}")
+
+
+def _get_customer_store_id(supabase, customer_id: str) -> str:
+    result = (
+        supabase.table("customers")
+        .select("store_id")
+        .eq("id", customer_id)
+        .limit(1)
+        .execute()
+    )
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return result.data[0]["store_id"]
+
+
 # ---------------------------------------------------------------------------
 # GET /api/owner/credit/score/{customer_id}
 # ---------------------------------------------------------------------------
@@ -55,60 +96,46 @@ async def update_credit_limit(customer_id: str):
     """Recalculate and update credit score and limit for a customer."""
     try:
         supabase = _get_supabase()
+        engine = _get_credit_engine_module()
+        store_id = _get_customer_store_id(supabase, customer_id)
 
-        # Fetch payment history
-        ph_result = (
-            supabase.table("payment_history")
-            .select("days_to_payment, was_late")
-            .eq("customer_id", customer_id)
-            .execute()
-        )
-        payment_history = ph_result.data or []
-
-        # Fetch orders
-        orders_result = (
-            supabase.table("orders")
-            .select("id, total_amount")
-            .eq("customer_id", customer_id)
-            .execute()
-        )
-        orders = orders_result.data or []
-
-        # Calculate score
-        base_score = 50.0
-        total_payments = len(payment_history)
-        if total_payments > 0:
-            on_time = sum(1 for p in payment_history if (p.get("days_to_payment") or 0) <= 7)
-            late = total_payments - on_time
-            payment_score = ((on_time - late) / total_payments) * 30
-        else:
-            payment_score = 0.0
-
-        order_count = len(orders)
-        frequency_score = min(order_count / 2, 10.0)
-        total_spent = sum(float(o.get("total_amount", 0)) for o in orders)
-        spending_score = min(total_spent / 1000, 10.0)
-
-        new_score = max(0.0, min(100.0, base_score + payment_score + frequency_score + spending_score))
-
-        # Determine limit
-        if new_score >= 70:
-            new_limit = 5000.0
-        elif new_score >= 50:
-            new_limit = 2000.0
-        else:
-            new_limit = 0.0
-
-        supabase.table("customers").update(
-            {"credit_score": int(new_score), "credit_limit": new_limit}
-        ).eq("id", customer_id).execute()
+        result = engine.rescore_customers(store_id, [customer_id], db_conn=supabase)
+        score = result["scores"].get(customer_id)
+        if score is None:
+            raise HTTPException(status_code=404, detail="Customer not found")
 
         return {
             "success": True,
             "customer_id": customer_id,
-            "credit_score": int(new_score),
-            "credit_limit": new_limit,
+            "credit_score": score["credit_score"],
+            "credit_limit": score["credit_limit"],
+        }
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
+# ---------------------------------------------------------------------------
+# POST /api/owner/credit/rescore/{store_id}
+# ---------------------------------------------------------------------------
+
+@router.post("/rescore/{store_id}")
+async def rescore_store_credit(store_id: str):
+    """Bulk-recalculate credit scores and limits for every customer of a store."""
+    try:
+        engine = _get_credit_engine_module()
+        result = engine.rescore_store(store_id, db_conn=_get_supabase())
+        if "error" in result:
+            raise HTTPException(status_code=500, detail=result["error"])
+        return {
+            "success": True,
+            "store_id": store_id,
+            "customers_scored": result["customers_scored"],
+            "customers_updated": result["customers_updated"],
         }
+    except HTTPException:
+        raise
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
@@ -145,31 +172,75 @@ async def get_payment_history(customer_id: str):
 # ---------------------------------------------------------------------------
 
 @router.get("/at-risk/{store_id}")
-async def get_at_risk_customers(store_id: str):
-    """Return customers with high default risk for a store."""
+async def get_at_risk_customers(
+    store_id: str,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=200),
+    sort_by: str = Query("default_probability"),
+    min_risk_level: str = Query("medium"),
+):
+    """
+    Return customers with high default risk for a store (4.7).
+
+    Risk is predicted for the whole store in one batch and cached until the
+    next payment or order event; this endpoint pages through that result.
+    """
+    if sort_by not in _AT_RISK_SORT_KEYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort_by. Must be one of: {', '.join(_AT_RISK_SORT_KEYS)}",
+        )
+    if min_risk_level not in _RISK_LEVEL_RANK:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid min_risk_level. Must be one of: {', '.join(_RISK_LEVEL_RANK)}",
+        )
     try:
         supabase = _get_supabase()
+        engine = _get_credit_engine_module()
+        predictions = engine.predict_default_risk_bulk(store_id, db_conn=supabase)
 
-        # Customers with low credit score or suspended credit
-        result = (
-            supabase.table("customers")
-            .select("id, name, phone, credit_score, credit_limit, credit_suspended")
-            .eq("store_id", store_id)
-            .execute()
-        )
-        customers = result.data or []
-
+        min_rank = _RISK_LEVEL_RANK[min_risk_level]
         at_risk = [
-            c for c in customers
-            if c.get("credit_suspended") or (c.get("credit_score") or 50) < 50
+            p for p in predictions if _RISK_LEVEL_RANK[p["risk_level"]] >= min_rank
         ]
+        key, reverse = _AT_RISK_SORT_KEYS[sort_by]
+        if sort_by != "default_probability":  # predictions come sorted by risk
+            at_risk.sort(key=key, reverse=reverse)
+
+        start = (page - 1) * page_size
+        page_items = at_risk[start:start + page_size]
+
+        # Names/phones only for the customers on this page
+        if page_items:
+            result = (
+                supabase.table("customers")
+                .select("id, name, phone")
+                .in_("id", [p["customer_id"] for p in page_items])
+                .execute()
+            )
+            contacts = {c["id"]: c for c in result.data or []}
+            page_items = [
+                {
+                    "id": p["customer_id"],
+                    "name": contacts.get(p["customer_id"], {}).get("name"),
+                    "phone": contacts.get(p["customer_id"], {}).get("phone"),
+                    **p,
+                }
+                for p in page_items
+            ]
 
         return {
             "success": True,
             "store_id": store_id,
-            "at_risk_customers": at_risk,
+            "at_risk_customers": page_items,
             "count": len(at_risk),
+            "page": page,
+            "page_size": page_size,
+            "total_pages": (len(at_risk) + page_size - 1) // page_size,
         }
+    except HTTPException:
+        raise
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
@@ -183,9 +254,12 @@ async def suspend_credit(customer_id: str):
     """Manually suspend credit for a customer."""
     try:
         supabase = _get_supabase()
-        supabase.table("customers").update(
+        result = supabase.table("customers").update(
             {"credit_suspended": True}
         ).eq("id", customer_id).execute()
+        for row in result.data or []:
+            _get_credit_engine_module().invalidate_store_risk(row.get("store_id"))
+        _publish_customers_changed([customer_id])
         return {"success": True, "customer_id": customer_id, "credit_suspended": True}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
@@ -200,54 +274,25 @@ async def restore_credit(customer_id: str):
     """Restore credit for a customer after payment."""
     try:
         supabase = _get_supabase()
+        engine = _get_credit_engine_module()
+        store_id = _get_customer_store_id(supabase, customer_id)
 
-        # Recalculate score
-        ph_result = (
-            supabase.table("payment_history")
-            .select("days_to_payment, was_late")
-            .eq("customer_id", customer_id)
-            .execute()
+        result = engine.rescore_customers(
+            store_id, [customer_id], restore_suspended=True, db_conn=supabase
         )
-        payment_history = ph_result.data or []
-        orders_result = (
-            supabase.table("orders")
-            .select("id, total_amount")
-            .eq("customer_id", customer_id)
-            .execute()
-        )
-        orders = orders_result.data or []
-
-        base_score = 50.0
-        total_payments = len(payment_history)
-        if total_payments > 0:
-            on_time = sum(1 for p in payment_history if (p.get("days_to_payment") or 0) <= 7)
-            late = total_payments - on_time
-            payment_score = ((on_time - late) / total_payments) * 30
-        else:
-            payment_score = 0.0
-
-        order_count = len(orders)
-        frequency_score = min(order_count / 2, 10.0)
-        total_spent = sum(float(o.get("total_amount", 0)) for o in orders)
-        spending_score = min(total_spent / 1000, 10.0)
-
-        new_score = max(0.0, min(100.0, base_score + payment_score + frequency_score + spending_score))
-        new_limit = 5000.0 if new_score >= 70 else (2000.0 if new_score >= 50 else 0.0)
-
-        supabase.table("customers").update(
-            {
-                "credit_suspended": False,
-                "credit_score": int(new_score),
-                "credit_limit": new_limit,
-            }
-        ).eq("id", customer_id).execute()
+        score = result["scores"].get(customer_id)
+        if score is None:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        _publish_customers_changed([customer_id])
 
         return {
             "success": True,
             "customer_id": customer_id,
             "credit_suspended": False,
-            "credit_score": int(new_score),
-            "credit_limit": new_limit,
+            "credit_score": score["credit_score"],
+            "credit_limit": score["credit_limit"],
         }
+    except HTTPException:
+        raise
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
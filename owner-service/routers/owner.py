@@ -2,10 +2,25 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 from services.db_service import db
+from pathlib import Path
+import asyncio
 import os
+import sys
 
 router = APIRouter(prefix="/api/owner", tags=["owner"])
 
+
+def _bump_catalog_version(store_id: str):
+    """Tell catalog caches (customer bot) that the store's stock changed."""
+    try:
+        agent_path = Path(__file__).parent.parent.parent / "agent-service"
+        if str(agent_path) not in sys.path:
+            sys.path.append(str(agent_path))
+        from cache_events import bump_catalog_version
+        bump_catalog_version(store_id)
+    except Exception as e:
+        print(f"⚠️ Could not publish catalog invalidation: {e}")
+
 # Data models
 class InventoryUpdate(BaseModel):
     product_id: str
@@ -82,6 +97,9 @@ async def update_inventory(store_id: str, update: InventoryUpdate):
     if not result:
         raise HTTPException(status_code=500, detail="Could not update inventory")
     
+    # Sync Redis call: keep an unreachable server off the event loop
+    await asyncio.to_thread(_bump_catalog_version, store_id)
+    
     return {
         "success": True,
         "message": "Inventory updated",
@@ -178,6 +196,15 @@ async def update_payment_status(order_id: str, update: dict):
     if not result:
         raise HTTPException(status_code=500, detail="Could not update payment status")
     
+    # Payments change default risk, drop the store's cached predictions
+    try:
+        from routers.credit import _get_credit_engine_module
+        engine = _get_credit_engine_module()
+        for order in result:
+            engine.invalidate_store_risk(order.get("store_id"))
+    except Exception as e:
+        print(f"⚠️ Could not invalidate credit risk cache: {e}")
+    
     return {
         "success": True,
         "message": "Payment status updated",
@@ -257,55 +284,47 @@ class PromoMessage(BaseModel):
 @router.post("/send-promo")
 async def send_promotional_message(promo: PromoMessage):
     """
-    Send promotional message to all customers via Telegram
+    Queue a promotional message to customers via Telegram.
+
+    Delivery runs in the background at Telegram's rate limits; poll
+    GET /api/owner/send-promo/{job_id} for progress.
     """
-    import httpx
-    from telegram import Bot
+    from services.broadcast_service import broadcast_service
     
-    print(f"📢 Sending promo to {len(promo.customer_ids)} customers")
+    print(f"📢 Queueing promo to {len(promo.customer_ids)} customers")
     
     try:
-        # Get customer bot token
-        bot_token = os.getenv("CUSTOMER_BOT_TOKEN")
-        if not bot_token:
-            raise HTTPException(status_code=500, detail="Bot token not configured")
-        
-        bot = Bot(token=bot_token)
-        
-        success_count = 0
-        failed_count = 0
-        
-        # Send to each customer
-        for chat_id in promo.customer_ids:
-            try:
-                # Try with Markdown first, fallback to plain text if it fails
-                try:
-                    await bot.send_message(
-                        chat_id=chat_id,
-                        text=promo.message,
-                        parse_mode='Markdown'
-                    )
-                except:
-                    # If Markdown fails, send as plain text
-                    await bot.send_message(
-                        chat_id=chat_id,
-                        text=promo.message
-                    )
-                success_count += 1
-            except Exception as e:
-                print(f"❌ Failed to send to {chat_id}: {e}")
-                failed_count += 1
-        
-        return {
-            "success": True,
-            "message": f"Sent to {success_count} customers, {failed_count} failed",
-            "sent": success_count,
-            "failed": failed_count
-        }
-        
+        job = broadcast_service.submit(promo.store_id, promo.message, promo.customer_ids)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
-        print(f"❌ Error sending promo: {e}")
+        print(f"❌ Error queueing promo: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    return {
+        "success": True,
+        "message": f"Promo queued for {job.total} customers",
+        "job_id": job.job_id,
+        "total": job.total,
+        "status": job.status
+    }
+
+
+@router.get("/send-promo/{job_id}")
+async def get_promo_progress(job_id: str):
+    """
+    Get delivery progress of a promotional broadcast
+    """
+    from services.broadcast_service import broadcast_service
+    
+    job = broadcast_service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Broadcast job not found")
+    
+    return {
+        "success": True,
+        **job.to_dict()
+    }
 
 
 # AI Agent Manual Trigger endpoint
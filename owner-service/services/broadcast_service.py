@@ -0,0 +1,158 @@
+"""
+Broadcast service for promotional Telegram messages.
+
+A broadcast is submitted as a background job and returns a job id at once.
+Messages are handed to the shared Telegram outbound service
+(agent-service/agents/telegram_outbound.py) at bulk priority. That service
+owns the pooled bot, the global and per-chat rate limits, and 429
+handling. Job progress is kept in memory and can be polled by id.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+MAX_JOBS_KEPT = 100
+MAX_ERRORS_KEPT = 20
+
+
+def _get_outbound_module():
+    """Import telegram_outbound from agent-service/agents."""
+    agent_path = Path(__file__).parent.parent.parent / "agent-service" / "agents"
+    if str(agent_path) not in sys.path:
+        sys.path.insert(0, str(agent_path))
+    import telegram_outbound
+    return telegram_outbound
+
+
+@dataclass
+class BroadcastJob:
+    """Progress of one broadcast."""
+
+    job_id: str
+    store_id: str
+    total: int
+    sent: int = 0
+    failed: int = 0
+    status: str = "queued"  # queued | running | completed | failed
+    created_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    errors: list = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "store_id": self.store_id,
+            "status": self.status,
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "pending": self.total - self.sent - self.failed,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "errors": self.errors,
+        }
+
+
+class BroadcastService:
+    """Runs promo broadcasts as background jobs."""
+
+    def __init__(self, outbound=None):
+        self._outbound = outbound
+        self._jobs: "OrderedDict[str, BroadcastJob]" = OrderedDict()
+        self._tasks: set = set()
+
+    # ------------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------------
+
+    def submit(self, store_id: str, message: str, chat_ids: list) -> BroadcastJob:
+        """Register a broadcast and start delivering it in the background."""
+        token = os.getenv("CUSTOMER_BOT_TOKEN", "").strip()
+        if not token:
+            raise RuntimeError("Bot token not configured")
+        # Duplicate chat ids would hit the per-chat limit and annoy customers
+        recipients = [c for c in dict.fromkeys(chat_ids) if c]
+        job = BroadcastJob(job_id=str(uuid.uuid4()), store_id=store_id, total=len(recipients))
+        self._jobs[job.job_id] = job
+        while len(self._jobs) > MAX_JOBS_KEPT:
+            self._jobs.popitem(last=False)
+
+        task = asyncio.create_task(self._run(job, token, message, recipients))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[BroadcastJob]:
+        return self._jobs.get(job_id)
+
+    async def _run(self, job: BroadcastJob, token: str, message: str, chat_ids: list) -> None:
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc).isoformat()
+        try:
+            outbound_module = _get_outbound_module()
+            outbound = self._outbound or outbound_module.outbound
+            priority = outbound_module.PRIORITY_BULK
+            options = {"parse_mode": "Markdown"}
+            futures = []
+            if chat_ids:
+                # The first send checks the markup. On a parse error the whole
+                # job switches to plain text once, instead of every message
+                # failing and being resent by the outbound fallback.
+                probe = outbound.submit(
+                    token, chat_ids[0], message, priority=priority, plain_fallback=False, **options
+                )
+                await asyncio.gather(probe, return_exceptions=True)
+                if self._is_parse_error(probe, outbound_module.BadRequest):
+                    print(f"⚠️ Broadcast {job.job_id[:8]}: Markdown rejected, sending as plain text")
+                    options = {}
+                    futures.append(self._send(job, outbound, token, chat_ids[0], message, priority, options))
+                else:
+                    self._record(job, chat_ids[0], probe)
+            for chat_id in chat_ids[1:]:
+                futures.append(self._send(job, outbound, token, chat_id, message, priority, options))
+            await asyncio.gather(*futures, return_exceptions=True)
+            job.status = "completed"
+        except Exception as e:
+            print(f"❌ Broadcast {job.job_id[:8]} aborted: {e}")
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.now(timezone.utc).isoformat()
+            print(f"📢 Broadcast {job.job_id[:8]}: {job.sent} sent, {job.failed} failed")
+
+    def _send(self, job: BroadcastJob, outbound, token: str, chat_id, message: str,
+              priority: int, options: dict) -> asyncio.Future:
+        future = outbound.submit(
+            token, chat_id, message, priority=priority, plain_fallback=False, **options
+        )
+        future.add_done_callback(lambda f, c=chat_id: self._record(job, c, f))
+        return future
+
+    @staticmethod
+    def _is_parse_error(future: asyncio.Future, bad_request: type) -> bool:
+        if future.cancelled():
+            return False
+        error = future.exception()
+        return isinstance(error, bad_request) and "parse" in str(error).lower()
+
+    @staticmethod
+    def _record(job: BroadcastJob, chat_id, future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            job.sent += 1
+            return
+        job.failed += 1
+        if len(job.errors) < MAX_ERRORS_KEPT:
+            error = "cancelled" if future.cancelled() else str(future.exception())
+            job.errors.append({"chat_id": chat_id, "error": error})
+
+
+# Shared instance used by the owner router
+broadcast_service = BroadcastService()
@@ -0,0 +1,55 @@
+"""
+Micro-benchmark: single-pass SynonymNormalizer vs the per-entry re.sub loop
+Task 5.1.4 (Hindi/English normalization)
+
+Run from telegram-bots/customer-bot:
+    python benchmarks/normalizer_benchmark.py
+"""
+
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from nlp_order_parser import (  # noqa: E402
+    HINDI_PRODUCT_MAP,
+    HINDI_UNIT_MAP,
+    normalize_hindi_english,
+)
+
+MESSAGES = [
+    "mujhe 2 kilo chawal aur 1 kg cheeni chahiye",
+    "1 litr doodh, 500 gram paneer aur 2 packet namak bhejo",
+    "aata 5 kilo, tel 1 ltr, haldi 100 gram, jeera 50 gm",
+    "what is the price of basmati rice today?",
+]
+NUMBER = 20_000
+
+
+def legacy_normalize(text: str) -> str:
+    """The previous implementation: one re.sub per map entry."""
+    text_lower = text.lower()
+    for hindi, english in HINDI_PRODUCT_MAP.items():
+        text_lower = re.sub(r"\b" + hindi + r"\b", english, text_lower)
+    for hindi_unit, eng_unit in HINDI_UNIT_MAP.items():
+        text_lower = re.sub(r"\b" + hindi_unit + r"\b", eng_unit, text_lower)
+    return text_lower
+
+
+def _per_message_us(fn) -> float:
+    seconds = timeit.timeit(lambda: [fn(m) for m in MESSAGES], number=NUMBER)
+    return seconds / (NUMBER * len(MESSAGES)) * 1e6
+
+
+def main() -> None:
+    legacy = _per_message_us(legacy_normalize)
+    single_pass = _per_message_us(normalize_hindi_english)
+    print(f"legacy re.sub loop : {legacy:8.2f} µs/message")
+    print(f"single-pass regex  : {single_pass:8.2f} µs/message")
+    print(f"speedup            : {legacy / single_pass:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,7 @@ from telegram.ext import (
 )
 from dotenv import load_dotenv
 from pathlib import Path
-import httpx
+import asyncio
 import os
 import re
 import logging
@@ -26,6 +26,14 @@ CUSTOMER_SERVICE_URL = os.getenv("CUSTOMER_SERVICE_URL", "http://localhost:8002"
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 BOT_TOKEN = os.getenv("CUSTOMER_BOT_TOKEN", "").strip()
+# Set WEBHOOK_URL (public https base URL) to receive updates by webhook instead of polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip()
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip() or None
+PORT = int(os.getenv("PORT", 8080))
+# Updates handled at the same time (one at a time per chat)
+MAX_CONCURRENT_UPDATES = int(os.getenv("BOT_MAX_CONCURRENT_UPDATES", "256"))
+# HTTP connections for replies to Telegram
+BOT_CONNECTION_POOL_SIZE = int(os.getenv("BOT_CONNECTION_POOL_SIZE", "64"))
 
 if not BOT_TOKEN:
     raise SystemExit("Missing CUSTOMER_BOT_TOKEN in .env")
@@ -33,16 +41,23 @@ if not BOT_TOKEN:
 from supabase import create_client
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Product catalogs + shared HTTP client for customer-service
+from catalog_cache import CatalogCache
+from customer_cache import CustomerCache
+from session_store import SessionStore
+from update_processor import PerChatUpdateProcessor
+catalog_cache = CatalogCache(CUSTOMER_SERVICE_URL)
+
 # NLP components (5.1 - 5.6)
 try:
     from nlp_order_parser import ConversationalOrderParser
     from conversation_manager import (
-        ConversationManager,
+        AsyncConversationManager,
         STATE_BROWSING, STATE_ORDERING, STATE_AWAITING_CLARIFICATION,
         STATE_CONFIRMING, STATE_CONFIRMED,
     )
-    _nlp_parser = ConversationalOrderParser()
-    _conv_manager = ConversationManager()
+    _nlp_parser = ConversationalOrderParser(supabase_client=supabase)
+    _conv_manager = AsyncConversationManager()
     NLP_ENABLED = bool(os.getenv("ANTHROPIC_API_KEY") or os.getenv("ENABLE_CONVERSATIONAL_AI", "true").lower() == "true")
     logger.info("✅ NLP components loaded (enabled=%s)", NLP_ENABLED)
 except ImportError as e:
@@ -51,8 +66,20 @@ except ImportError as e:
     _conv_manager = None
     NLP_ENABLED = False
 
-# Store user sessions
-user_sessions = {}
+# User sessions (store binding, onboarding answers), shared across replicas
+async def _lookup_store_binding(telegram_user_id):
+    """Most recent store the user registered with (session lost or expired)."""
+    result = await asyncio.to_thread(
+        supabase.table("customers")
+        .select("store_id")
+        .eq("telegram_chat_id", str(telegram_user_id))
+        .order("created_at", desc=True)
+        .limit(1)
+        .execute
+    )
+    return result.data[0]["store_id"] if result.data else None
+
+sessions = SessionStore(store_loader=_lookup_store_binding)
 
 # Conversation states
 ASKING_NAME, ASKING_PHONE, ASKING_ADDRESS, ASKING_BIRTHDAY = range(4)
@@ -66,14 +93,35 @@ def get_store_name(store_id):
     except:
         return "Our Store"
 
+# Customer rows, cached per (telegram user, store)
+async def _load_customer(telegram_user_id, store_id):
+    # Supabase client is sync: keep the event loop free for other chats
+    result = await asyncio.to_thread(
+        supabase.table("customers").select("*").eq("telegram_chat_id", str(telegram_user_id)).eq("store_id", store_id).limit(1).execute
+    )
+    return result.data[0] if result.data else None
+
+customer_cache = CustomerCache(_load_customer)
+
 # Check if customer exists
 async def get_customer_data(telegram_user_id, store_id):
     try:
-        customer = supabase.table("customers").select("*").eq("telegram_chat_id", str(telegram_user_id)).eq("store_id", store_id).single().execute()
-        return customer.data if customer.data else None
-    except:
+        return await customer_cache.get(telegram_user_id, store_id)
+    except Exception as e:
+        logger.warning("Customer lookup failed: %s", e)
         return None
 
+# Credit checkout: one RPC over the maintained outstanding balance
+async def check_credit(customer_id, order_total):
+    result = await asyncio.to_thread(
+        supabase.rpc(
+            "check_credit_availability",
+            {"p_customer_id": customer_id, "p_order_total": float(order_total)},
+        ).execute
+    )
+    rows = result.data or []
+    return rows[0] if rows else {"allowed": False, "reason": "no_credit", "credit_limit": 0}
+
 # Main menu keyboard
 def get_main_menu():
     return ReplyKeyboardMarkup([
@@ -93,9 +141,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         store_name = get_store_name(store_id)
         
         # Save store_id in session
-        if user_id not in user_sessions:
-            user_sessions[user_id] = {}
-        user_sessions[user_id]["store_id"] = store_id
+        await sessions.update(user_id, store_id=store_id)
         
         # Check if customer already registered
         customer = await get_customer_data(user_id, store_id)
@@ -138,7 +184,7 @@ async def get_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Please enter a valid name (at least 2 characters):")
         return ASKING_NAME
     
-    user_sessions[user_id]["name"] = name
+    await sessions.update(user_id, name=name)
     
     await update.message.reply_text(
         f"Great, {name}! 👍\n\n"
@@ -159,7 +205,7 @@ async def get_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return ASKING_PHONE
     
-    user_sessions[user_id]["phone"] = f"+91{phone}"
+    await sessions.update(user_id, phone=f"+91{phone}")
     
     await update.message.reply_text(
         "📍 Finally, what's your delivery address?\n\n"
@@ -176,7 +222,7 @@ async def get_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Please enter a complete address (at least 10 characters):")
         return ASKING_ADDRESS
     
-    user_sessions[user_id]["address"] = address
+    await sessions.update(user_id, address=address)
     
     # 3.2.2 Ask for birthday (optional)
     await update.message.reply_text(
@@ -204,17 +250,17 @@ async def get_birthday(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return ASKING_BIRTHDAY
     
-    user_sessions[user_id]["birthday"] = birthday
+    session = await sessions.update(user_id, birthday=birthday)
     
     try:
-        store_id = user_sessions[user_id]["store_id"]
+        store_id = session["store_id"]
         store_name = get_store_name(store_id)
         
         customer_data = {
             "store_id": store_id,
-            "name": user_sessions[user_id]["name"],
-            "phone": user_sessions[user_id]["phone"],
-            "address": user_sessions[user_id]["address"],
+            "name": session["name"],
+            "phone": session["phone"],
+            "address": session["address"],
             "telegram_chat_id": str(user_id),
             "telegram_username": update.effective_user.username,
         }
@@ -222,6 +268,7 @@ async def get_birthday(update: Update, context: ContextTypes.DEFAULT_TYPE):
             customer_data["birthday"] = birthday
         
         supabase.table("customers").insert(customer_data).execute()
+        await customer_cache.publish_invalidation(user_id, store_id)
         
         birthday_msg = f"\n🎂 Birthday saved: {birthday}" if birthday else ""
         
@@ -246,11 +293,11 @@ async def get_birthday(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def view_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
-    if user_id not in user_sessions or "store_id" not in user_sessions[user_id]:
+    store_id = await sessions.get_store_id(user_id)
+    if not store_id:
         await update.message.reply_text("⚠️ Please start the bot using your store link first.")
         return
     
-    store_id = user_sessions[user_id]["store_id"]
     customer = await get_customer_data(user_id, store_id)
     
     if not customer:
@@ -291,12 +338,13 @@ async def save_edit_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return EDIT_NAME
     
     try:
-        store_id = user_sessions[user_id]["store_id"]
+        store_id = await sessions.get_store_id(user_id)
         supabase.table("customers")\
             .update({"name": new_name})\
             .eq("telegram_chat_id", str(user_id))\
             .eq("store_id", store_id)\
             .execute()
+        await customer_cache.publish_invalidation(user_id, store_id)
         
         await update.message.reply_text(
             f"✅ Name updated to: {new_name}",
@@ -324,12 +372,13 @@ async def save_edit_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return EDIT_PHONE
     
     try:
-        store_id = user_sessions[user_id]["store_id"]
+        store_id = await sessions.get_store_id(user_id)
         supabase.table("customers")\
             .update({"phone": f"+91{phone}"})\
             .eq("telegram_chat_id", str(user_id))\
             .eq("store_id", store_id)\
             .execute()
+        await customer_cache.publish_invalidation(user_id, store_id)
         
         await update.message.reply_text(
             f"✅ Phone updated to: +91{phone}",
@@ -357,12 +406,13 @@ async def save_edit_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return EDIT_ADDRESS
     
     try:
-        store_id = user_sessions[user_id]["store_id"]
+        store_id = await sessions.get_store_id(user_id)
         supabase.table("customers")\
             .update({"address": address})\
             .eq("telegram_chat_id", str(user_id))\
             .eq("store_id", store_id)\
             .execute()
+        await customer_cache.publish_invalidation(user_id, store_id)
         
         await update.message.reply_text(
             f"✅ Address updated!",
@@ -403,28 +453,17 @@ async def view_stores(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def view_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
-    if user_id not in user_sessions or "store_id" not in user_sessions[user_id]:
+    store_id = await sessions.get_store_id(user_id)
+    if not store_id:
         await update.message.reply_text("⚠️ Please start the bot using your store link first.")
         return
     
-    store_id = user_sessions[user_id]["store_id"]
     store_name = get_store_name(store_id)
     
     await update.message.reply_text("📦 Fetching products...")
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{CUSTOMER_SERVICE_URL}/api/customer/products/{store_id}",
-                timeout=10.0
-            )
-            data = response.json()
-        
-        if not data.get("success"):
-            await update.message.reply_text("❌ Could not fetch products")
-            return
-        
-        products = data.get("products", [])
+        products = await catalog_cache.get_products(store_id)
         
         if not products:
             await update.message.reply_text("No products available.")
@@ -449,11 +488,11 @@ async def view_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def place_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
-    if user_id not in user_sessions or "store_id" not in user_sessions[user_id]:
+    store_id = await sessions.get_store_id(user_id)
+    if not store_id:
         await update.message.reply_text("⚠️ Please start the bot using your store link first.")
         return
     
-    store_id = user_sessions[user_id]["store_id"]
     customer = await get_customer_data(user_id, store_id)
     
     if not customer:
@@ -476,16 +515,9 @@ async def place_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await update.message.reply_text(f"🔄 Processing order for {quantity} {product_name}...")
         
-        # Get products
-        async with httpx.AsyncClient() as client:
-            products_response = await client.get(
-                f"{CUSTOMER_SERVICE_URL}/api/customer/products/{store_id}"
-            )
-            products_data = products_response.json()
-        
         # Find matching product
         matching_product = None
-        for product in products_data.get("products", []):
+        for product in await catalog_cache.get_products(store_id):
             if product_name.lower() in product["name"].lower():
                 matching_product = product
                 break
@@ -535,11 +567,11 @@ async def handle_payment_callback(update: Update, context: ContextTypes.DEFAULT_
     
     user_id = update.effective_user.id
     
-    if user_id not in user_sessions or "store_id" not in user_sessions[user_id]:
+    store_id = await sessions.get_store_id(user_id)
+    if not store_id:
         await query.edit_message_text("⚠️ Session expired. Please start again.")
         return
     
-    store_id = user_sessions[user_id]["store_id"]
     customer = await get_customer_data(user_id, store_id)
     
     if not customer:
@@ -555,20 +587,22 @@ async def handle_payment_callback(update: Update, context: ContextTypes.DEFAULT_
         
         is_credit = (payment_type == "credit")
         
+        # Get product details
+        matching_product = await catalog_cache.get_product(store_id, product_id)
+        
+        if not matching_product:
+            await query.edit_message_text("❌ Product not found.")
+            return
+        
         # Credit enforcement (4.3): check limit before allowing credit order
         if is_credit:
             try:
-                customer_credit = supabase.table("customers")\
-                    .select("credit_limit, credit_suspended, credit_score")\
-                    .eq("id", customer["id"])\
-                    .single()\
-                    .execute()
-                credit_data = customer_credit.data or {}
-                credit_limit = float(credit_data.get("credit_limit") or 0)
-                credit_suspended = bool(credit_data.get("credit_suspended", False))
+                order_total = float(quantity) * float(matching_product["price"])
+                credit = await check_credit(customer["id"], order_total)
+                reason = credit.get("reason")
 
                 # 4.3.3 Block if credit suspended
-                if credit_suspended:
+                if reason == "suspended":
                     await query.edit_message_text(
                         "❌ *Credit Unavailable*\n\n"
                         "Your credit account is currently suspended due to an overdue payment.\n"
@@ -578,53 +612,25 @@ async def handle_payment_callback(update: Update, context: ContextTypes.DEFAULT_
                     )
                     return
 
-                # Calculate outstanding credit balance
-                outstanding_result = supabase.table("orders")\
-                    .select("total_amount")\
-                    .eq("customer_id", customer["id"])\
-                    .eq("payment_status", "unpaid")\
-                    .eq("is_credit", True)\
-                    .execute()
-                outstanding = sum(
-                    float(o.get("total_amount", 0))
-                    for o in (outstanding_result.data or [])
-                )
-
-                # Get product details for total calculation
-                async with httpx.AsyncClient() as client:
-                    products_response = await client.get(
-                        f"{CUSTOMER_SERVICE_URL}/api/customer/products/{store_id}"
-                    )
-                    products_data = products_response.json()
-
-                order_product = None
-                for product in products_data.get("products", []):
-                    if product["product_id"] == product_id:
-                        order_product = product
-                        break
-
-                order_total = float(quantity) * float(order_product["price"]) if order_product else 0.0
-                available_credit = credit_limit - outstanding
-
                 # 4.3.2 Show available credit
-                if credit_limit == 0:
+                if reason == "no_credit":
                     await query.edit_message_text(
                         "❌ *Credit Not Available*\n\n"
                         "Your credit score is too low for credit orders.\n"
-                        f"Credit Score: {credit_data.get('credit_score', 50)}/100\n\n"
+                        f"Credit Score: {credit.get('credit_score', 50)}/100\n\n"
                         "Please pay with cash or improve your payment history.",
                         parse_mode='Markdown'
                     )
                     return
 
                 # 4.3.3 Block if limit exceeded
-                if order_total > available_credit:
+                if reason == "limit_exceeded":
                     await query.edit_message_text(
                         f"❌ *Credit Limit Exceeded*\n\n"
                         f"Order Total: ₹{order_total:.0f}\n"
-                        f"Available Credit: ₹{available_credit:.0f}\n"
-                        f"Credit Limit: ₹{credit_limit:.0f}\n"
-                        f"Outstanding Balance: ₹{outstanding:.0f}\n\n"
+                        f"Available Credit: ₹{float(credit['available_credit']):.0f}\n"
+                        f"Credit Limit: ₹{float(credit['credit_limit']):.0f}\n"
+                        f"Outstanding Balance: ₹{float(credit['outstanding_balance']):.0f}\n\n"
                         f"Please pay with cash or clear some outstanding balance first.",
                         parse_mode='Markdown'
                     )
@@ -632,23 +638,6 @@ async def handle_payment_callback(update: Update, context: ContextTypes.DEFAULT_
             except Exception as credit_err:
                 print(f"⚠️ Credit check error (allowing order): {credit_err}")
         
-        # Get product details
-        async with httpx.AsyncClient() as client:
-            products_response = await client.get(
-                f"{CUSTOMER_SERVICE_URL}/api/customer/products/{store_id}"
-            )
-            products_data = products_response.json()
-        
-        matching_product = None
-        for product in products_data.get("products", []):
-            if product["product_id"] == product_id:
-                matching_product = product
-                break
-        
-        if not matching_product:
-            await query.edit_message_text("❌ Product not found.")
-            return
-        
         # Place order
         order_data = {
             "customer_phone": customer["phone"],
@@ -663,13 +652,12 @@ async def handle_payment_callback(update: Update, context: ContextTypes.DEFAULT_
             "is_credit": is_credit
         }
         
-        async with httpx.AsyncClient() as client:
-            order_response = await client.post(
-                f"{CUSTOMER_SERVICE_URL}/api/customer/order/{store_id}",
-                json=order_data,
-                timeout=10.0
-            )
-            order_result = order_response.json()
+        order_response = await catalog_cache.http.post(
+            f"/api/customer/order/{store_id}",
+            json=order_data,
+            timeout=10.0
+        )
+        order_result = order_response.json()
         
         if order_result.get("success"):
             payment_status = "💳 Credit (Pay Later)" if is_credit else "💵 Cash on Delivery"
@@ -701,11 +689,11 @@ async def handle_payment_callback(update: Update, context: ContextTypes.DEFAULT_
 async def view_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
-    if user_id not in user_sessions or "store_id" not in user_sessions[user_id]:
+    store_id = await sessions.get_store_id(user_id)
+    if not store_id:
         await update.message.reply_text("⚠️ Please start the bot using your store link first.")
         return
     
-    store_id = user_sessions[user_id]["store_id"]
     customer = await get_customer_data(user_id, store_id)
     
     if not customer:
@@ -752,25 +740,27 @@ async def handle_nlp_message(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user_id = update.effective_user.id
     text = update.message.text
 
-    if user_id not in user_sessions or "store_id" not in user_sessions[user_id]:
+    store_id = await sessions.get_store_id(user_id)
+    if not store_id:
         return False
 
-    store_id = user_sessions[user_id]["store_id"]
     customer = await get_customer_data(user_id, store_id)
     if not customer:
         return False
 
-    # 5.4.4 Handle follow-up messages — check if awaiting clarification
-    conv_state = _conv_manager.get_state(user_id)
-    if conv_state == STATE_AWAITING_CLARIFICATION:
-        return await _handle_clarification_response(update, context, user_id, store_id, customer, text)
+    # 5.4.2 Add user message to history; returns the whole context in one round-trip
+    conv_context = await _conv_manager.add_message(user_id, "user", text)
 
-    # 5.4.2 Add user message to history
-    conv_context = _conv_manager.add_message(user_id, "user", text)
+    # 5.4.4 Handle follow-up messages — check if awaiting clarification
+    if conv_context.get("state") == STATE_AWAITING_CLARIFICATION:
+        return await _handle_clarification_response(
+            update, context, user_id, store_id, customer, text,
+            conv_context.get("pending_clarification"),
+        )
 
     # Parse with NLP
     try:
-        parsed = await _nlp_parser.parse_order(text, conv_context)
+        parsed = await _nlp_parser.parse_order(text, conv_context, store_id=store_id)
     except Exception as exc:
         logger.error("NLP parse error: %s", exc)
         return False  # 5.9 fallback
@@ -784,18 +774,16 @@ async def handle_nlp_message(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     # Fetch store products for matching
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                f"{CUSTOMER_SERVICE_URL}/api/customer/products/{store_id}", timeout=10.0
-            )
-            products_data = resp.json()
-        store_products = products_data.get("products", [])
+        catalog = await catalog_cache.get_entry(store_id)
+        store_products = catalog.products
     except Exception as exc:
         logger.error("Failed to fetch products for NLP matching: %s", exc)
         return False
 
     # 5.2 Fuzzy product matching
-    match_results = _nlp_parser.match_products(items, store_products)
+    match_results = _nlp_parser.match_products(
+        items, store_products, store_id=store_id, catalog_version=catalog.etag
+    )
 
     # 5.3.1 Detect ambiguous / not-found items
     not_found = [r for r in match_results if r["status"] == "not_found"]
@@ -825,7 +813,7 @@ async def handle_nlp_message(update: Update, context: ContextTypes.DEFAULT_TYPE)
             label = f"{i}. {p['name']} — ₹{p['price']}/{p.get('unit', 'pcs')}"
             keyboard.append([InlineKeyboardButton(label, callback_data=f"nlp_pick_{i-1}")])
 
-        _conv_manager.set_pending_clarification(user_id, {
+        await _conv_manager.set_pending_clarification(user_id, {
             "item": first["item"],
             "options": [o["product"] for o in options],
             "remaining_items": [r["matches"][0]["product"] for r in remaining_matched],
@@ -852,18 +840,17 @@ async def handle_nlp_message(update: Update, context: ContextTypes.DEFAULT_TYPE)
             "unit": item.get("unit", product.get("unit", "pcs")),
             "unit_price": product.get("price", 0),
         })
-        _conv_manager.add_to_cart(user_id, cart_items[-1])
+    # Cart update and state change in a single round-trip
+    cart = await _conv_manager.add_items_to_cart(user_id, cart_items, state=STATE_CONFIRMING)
 
     # 5.5.1 "Same as last time?" — offer for repeat customers
-    last_order = _conv_manager.get_last_order_suggestion(customer["id"], supabase)
+    last_order = await _conv_manager.get_last_order_suggestion(customer["id"], supabase)
     same_as_last_btn = []
     if last_order:
         same_as_last_btn = [[InlineKeyboardButton("🔄 Same as last time?", callback_data="nlp_same_as_last")]]
 
     # Show order confirmation (5.6.3)
-    cart = _conv_manager.get_cart(user_id)
     summary = _conv_manager.format_cart_summary(cart)
-    _conv_manager.set_state(user_id, STATE_CONFIRMING)
 
     keyboard = [
         [
@@ -889,11 +876,11 @@ async def _handle_clarification_response(
     store_id: str,
     customer: dict,
     text: str,
+    clarification: dict | None,
 ) -> bool:
     """5.3.3 Handle user selection for ambiguous product."""
-    clarification = _conv_manager.get_pending_clarification(user_id)
     if not clarification:
-        _conv_manager.set_state(user_id, STATE_BROWSING)
+        await _conv_manager.set_state(user_id, STATE_BROWSING)
         return False
 
     options = clarification.get("options", [])
@@ -913,15 +900,13 @@ async def _handle_clarification_response(
 
     selected_product = options[choice_idx]
     item = clarification["item"]
-
-    _conv_manager.add_to_cart(user_id, {
+    cart_item = {
         "product_id": selected_product.get("product_id"),
         "product_name": selected_product.get("name"),
         "quantity": item.get("quantity", 1),
         "unit": item.get("unit", selected_product.get("unit", "pcs")),
         "unit_price": selected_product.get("price", 0),
-    })
-    _conv_manager.clear_pending_clarification(user_id)
+    }
 
     # Check if more ambiguous items remain
     remaining_ambiguous = clarification.get("remaining_ambiguous", [])
@@ -934,12 +919,17 @@ async def _handle_clarification_response(
             label = f"{i}. {p['name']} — ₹{p['price']}/{p.get('unit', 'pcs')}"
             keyboard.append([InlineKeyboardButton(label, callback_data=f"nlp_pick_{i-1}")])
 
-        _conv_manager.set_pending_clarification(user_id, {
-            "item": next_ambiguous["item"],
-            "options": [o["product"] for o in options_next],
-            "remaining_items": clarification.get("remaining_items", []),
-            "remaining_ambiguous": remaining_ambiguous[1:],
-        })
+        await _conv_manager.add_items_to_cart(
+            user_id,
+            [cart_item],
+            pending_clarification={
+                "item": next_ambiguous["item"],
+                "options": [o["product"] for o in options_next],
+                "remaining_items": clarification.get("remaining_items", []),
+                "remaining_ambiguous": remaining_ambiguous[1:],
+            },
+            state=STATE_AWAITING_CLARIFICATION,
+        )
         product_name = next_ambiguous["item"]["product"]
         await update.message.reply_text(
             f"Got it! Now, which *{product_name}* did you want?",
@@ -949,9 +939,10 @@ async def _handle_clarification_response(
         return True
 
     # All resolved — show cart confirmation
-    cart = _conv_manager.get_cart(user_id)
+    cart = await _conv_manager.add_items_to_cart(
+        user_id, [cart_item], pending_clarification=None, state=STATE_CONFIRMING
+    )
     summary = _conv_manager.format_cart_summary(cart)
-    _conv_manager.set_state(user_id, STATE_CONFIRMING)
 
     keyboard = [
         [
@@ -976,11 +967,11 @@ async def handle_nlp_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id = update.effective_user.id
     data = query.data
 
-    if user_id not in user_sessions or "store_id" not in user_sessions[user_id]:
+    store_id = await sessions.get_store_id(user_id)
+    if not store_id:
         await query.edit_message_text("⚠️ Session expired. Please /start again.")
         return
 
-    store_id = user_sessions[user_id]["store_id"]
     customer = await get_customer_data(user_id, store_id)
     if not customer:
         await query.edit_message_text("❌ Profile not found.")
@@ -989,7 +980,7 @@ async def handle_nlp_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     # 5.3.3 Product selection from ambiguity resolution
     if data.startswith("nlp_pick_"):
         idx = int(data.split("_")[-1])
-        clarification = _conv_manager.get_pending_clarification(user_id)
+        clarification = await _conv_manager.get_pending_clarification(user_id)
         if not clarification:
             await query.edit_message_text("⚠️ Session expired.")
             return
@@ -1001,14 +992,13 @@ async def handle_nlp_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
 
         selected_product = options[idx]
         item = clarification["item"]
-        _conv_manager.add_to_cart(user_id, {
+        cart_item = {
             "product_id": selected_product.get("product_id"),
             "product_name": selected_product.get("name"),
             "quantity": item.get("quantity", 1),
             "unit": item.get("unit", selected_product.get("unit", "pcs")),
             "unit_price": selected_product.get("price", 0),
-        })
-        _conv_manager.clear_pending_clarification(user_id)
+        }
 
         remaining_ambiguous = clarification.get("remaining_ambiguous", [])
         if remaining_ambiguous:
@@ -1019,12 +1009,17 @@ async def handle_nlp_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
                 p = opt["product"]
                 label = f"{i}. {p['name']} — ₹{p['price']}/{p.get('unit', 'pcs')}"
                 keyboard.append([InlineKeyboardButton(label, callback_data=f"nlp_pick_{i-1}")])
-            _conv_manager.set_pending_clarification(user_id, {
-                "item": next_item["item"],
-                "options": [o["product"] for o in options_next],
-                "remaining_items": clarification.get("remaining_items", []),
-                "remaining_ambiguous": remaining_ambiguous[1:],
-            })
+            await _conv_manager.add_items_to_cart(
+                user_id,
+                [cart_item],
+                pending_clarification={
+                    "item": next_item["item"],
+                    "options": [o["product"] for o in options_next],
+                    "remaining_items": clarification.get("remaining_items", []),
+                    "remaining_ambiguous": remaining_ambiguous[1:],
+                },
+                state=STATE_AWAITING_CLARIFICATION,
+            )
             product_name = next_item["item"]["product"]
             await query.edit_message_text(
                 f"Got it! Now, which *{product_name}* did you want?",
@@ -1034,9 +1029,10 @@ async def handle_nlp_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
             return
 
         # Show cart confirmation
-        cart = _conv_manager.get_cart(user_id)
+        cart = await _conv_manager.add_items_to_cart(
+            user_id, [cart_item], pending_clarification=None, state=STATE_CONFIRMING
+        )
         summary = _conv_manager.format_cart_summary(cart)
-        _conv_manager.set_state(user_id, STATE_CONFIRMING)
         keyboard = [
             [
                 InlineKeyboardButton("✅ Confirm (Cash)", callback_data="nlp_confirm_cash"),
@@ -1053,21 +1049,25 @@ async def handle_nlp_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     # 5.5.1 Same as last time
     if data == "nlp_same_as_last":
-        last_items = _conv_manager.get_last_order_suggestion(customer["id"], supabase)
+        last_items = await _conv_manager.get_last_order_suggestion(customer["id"], supabase)
         if not last_items:
             await query.edit_message_text("No previous order found.")
             return
-        _conv_manager.clear_cart(user_id)
-        for item in last_items:
-            _conv_manager.add_to_cart(user_id, {
-                "product_id": item.get("product_id"),
-                "product_name": item.get("product_name"),
-                "quantity": item.get("quantity", 1),
-                "unit_price": item.get("unit_price", 0),
-            })
-        cart = _conv_manager.get_cart(user_id)
+        await _conv_manager.clear_cart(user_id)
+        cart = await _conv_manager.add_items_to_cart(
+            user_id,
+            [
+                {
+                    "product_id": item.get("product_id"),
+                    "product_name": item.get("product_name"),
+                    "quantity": item.get("quantity", 1),
+                    "unit_price": item.get("unit_price", 0),
+                }
+                for item in last_items
+            ],
+            state=STATE_CONFIRMING,
+        )
         summary = _conv_manager.format_cart_summary(cart)
-        _conv_manager.set_state(user_id, STATE_CONFIRMING)
         keyboard = [
             [
                 InlineKeyboardButton("✅ Confirm (Cash)", callback_data="nlp_confirm_cash"),
@@ -1085,7 +1085,7 @@ async def handle_nlp_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Confirm order (cash or credit)
     if data in ("nlp_confirm_cash", "nlp_confirm_credit"):
         is_credit = data == "nlp_confirm_credit"
-        cart = _conv_manager.get_cart(user_id)
+        cart = await _conv_manager.get_cart(user_id)
         if not cart:
             await query.edit_message_text("Your cart is empty.")
             return
@@ -1093,34 +1093,22 @@ async def handle_nlp_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         # Credit enforcement check
         if is_credit:
             try:
-                credit_data = supabase.table("customers")\
-                    .select("credit_limit, credit_suspended, credit_score")\
-                    .eq("id", customer["id"]).single().execute().data or {}
-                credit_limit = float(credit_data.get("credit_limit") or 0)
-                credit_suspended = bool(credit_data.get("credit_suspended", False))
+                total = sum(float(i.get("unit_price", 0)) * float(i.get("quantity", 1)) for i in cart)
+                credit = await check_credit(customer["id"], total)
+                reason = credit.get("reason")
 
-                if credit_suspended:
+                if reason == "suspended":
                     await query.edit_message_text(
                         "❌ Your credit is suspended. Please pay with cash or clear your balance.",
                         parse_mode="Markdown",
                     )
                     return
-
-                total = sum(float(i.get("unit_price", 0)) * float(i.get("quantity", 1)) for i in cart)
-                outstanding_result = supabase.table("orders")\
-                    .select("total_amount")\
-                    .eq("customer_id", customer["id"])\
-                    .eq("payment_status", "unpaid")\
-                    .eq("is_credit", True).execute()
-                outstanding = sum(float(o.get("total_amount", 0)) for o in (outstanding_result.data or []))
-                available_credit = credit_limit - outstanding
-
-                if credit_limit == 0:
+                if reason == "no_credit":
                     await query.edit_message_text("❌ Credit not available. Please pay with cash.")
                     return
-                if total > available_credit:
+                if reason == "limit_exceeded":
                     await query.edit_message_text(
-                        f"❌ Credit limit exceeded.\nOrder: ₹{total:.0f} | Available: ₹{available_credit:.0f}\n"
+                        f"❌ Credit limit exceeded.\nOrder: ₹{total:.0f} | Available: ₹{float(credit['available_credit']):.0f}\n"
                         "Please pay with cash or reduce your order.",
                         parse_mode="Markdown",
                     )
@@ -1144,19 +1132,17 @@ async def handle_nlp_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                order_response = await client.post(
-                    f"{CUSTOMER_SERVICE_URL}/api/customer/order/{store_id}",
-                    json=order_data,
-                    timeout=10.0,
-                )
-                order_result = order_response.json()
+            order_response = await catalog_cache.http.post(
+                f"/api/customer/order/{store_id}",
+                json=order_data,
+                timeout=10.0,
+            )
+            order_result = order_response.json()
 
             if order_result.get("success"):
                 payment_label = "💳 Credit (Pay Later)" if is_credit else "💵 Cash on Delivery"
                 total = sum(float(i.get("unit_price", 0)) * float(i.get("quantity", 1)) for i in cart)
-                _conv_manager.clear_cart(user_id)
-                _conv_manager.set_state(user_id, STATE_CONFIRMED)
+                await _conv_manager.update(user_id, current_cart=[], state=STATE_CONFIRMED)
                 await query.edit_message_text(
                     f"✅ *Order Placed Successfully!*\n\n"
                     f"Order ID: `{order_result['order_id'][:8]}...`\n"
@@ -1179,7 +1165,7 @@ async def handle_nlp_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     # 5.5.3 Modify order
     if data == "nlp_modify":
-        cart = _conv_manager.get_cart(user_id)
+        cart = await _conv_manager.get_cart(user_id)
         if not cart:
             await query.edit_message_text("Your cart is empty.")
             return
@@ -1188,14 +1174,13 @@ async def handle_nlp_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
             lines.append(f"{i}. {item.get('product_name')} — {item.get('quantity')} {item.get('unit', 'pcs')}")
         lines.append("\nType the item number and new quantity, e.g. *1 3* to change item 1 to quantity 3.")
         lines.append("Type *0* to remove an item.")
-        _conv_manager.set_state(user_id, STATE_ORDERING)
+        await _conv_manager.set_state(user_id, STATE_ORDERING)
         await query.edit_message_text("\n".join(lines), parse_mode="Markdown")
         return
 
     # Cancel
     if data == "nlp_cancel":
-        _conv_manager.clear_cart(user_id)
-        _conv_manager.set_state(user_id, STATE_BROWSING)
+        await _conv_manager.clear_cart(user_id)
         await query.edit_message_text("❌ Order cancelled.")
         await context.bot.send_message(
             chat_id=query.message.chat_id,
@@ -1228,12 +1213,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif "🛍️" in text or "place order" in text.lower():
         # 5.5.2 "Your usual order?" suggestion for repeat customers
         user_id = update.effective_user.id
-        if NLP_ENABLED and _conv_manager and user_id in user_sessions:
-            store_id = user_sessions[user_id].get("store_id")
+        if NLP_ENABLED and _conv_manager:
+            store_id = await sessions.get_store_id(user_id)
             if store_id:
                 customer = await get_customer_data(user_id, store_id)
                 if customer:
-                    usual = _conv_manager.get_usual_order(customer["id"], supabase)
+                    usual = await _conv_manager.get_usual_order(customer["id"], supabase)
                     if usual:
                         names = ", ".join(u.get("product_name", "") for u in usual)
                         keyboard = [
@@ -1291,10 +1276,31 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return ConversationHandler.END
 
+async def _start_cache_listeners(application: Application):
+    catalog_cache.start_listener()
+    customer_cache.start_listener()
+
+
+async def _close_caches(application: Application):
+    await catalog_cache.aclose()
+    await customer_cache.aclose()
+
+
 def main():
     print("🤖 Starting Customer Bot...")
     
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        # Chats are served in parallel; each chat's updates stay in order
+        .concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .connection_pool_size(BOT_CONNECTION_POOL_SIZE)
+        .post_init(_start_cache_listeners)
+        .post_shutdown(_close_caches)
+    )
+    if WEBHOOK_URL:
+        builder = builder.updater(None)
+    application = builder.build()
     
     # Onboarding conversation
     onboarding_handler = ConversationHandler(
@@ -1347,7 +1353,18 @@ def main():
     print("📱 Share: https://t.me/BazaarOpsCustomerHelpBot?start=STORE_ID")
     print("Press Ctrl+C to stop")
     
-    application.run_polling()
+    if WEBHOOK_URL:
+        import uvicorn
+        from webhook_server import build_webhook_app
+        
+        print(f"🌐 Webhook mode on port {PORT}")
+        uvicorn.run(
+            build_webhook_app(application, WEBHOOK_URL, WEBHOOK_SECRET),
+            host="0.0.0.0",
+            port=PORT,
+        )
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
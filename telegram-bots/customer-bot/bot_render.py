@@ -1,12 +1,15 @@
 """
 Customer Bot with HTTP Server for Render Free Tier
 Runs bot + dummy HTTP server on PORT
+
+With WEBHOOK_URL set the bot serves its webhook and health checks from one
+ASGI app on PORT (see webhook_server.py), so no Flask thread is started.
 """
 import os
 import asyncio
 from threading import Thread
 from flask import Flask
-from bot import main as run_bot
+from bot import main as run_bot, WEBHOOK_URL
 
 # Get PORT from Render
 PORT = int(os.getenv("PORT", 8080))
@@ -33,11 +36,13 @@ def run_telegram_bot():
 if __name__ == "__main__":
     print(f"🚀 Starting Customer Bot on port {PORT}")
     
-    # Start Flask in background thread
-    flask_thread = Thread(target=run_flask, daemon=True)
-    flask_thread.start()
+    # Webhook mode serves health checks itself on PORT
+    if not WEBHOOK_URL:
+        # Start Flask in background thread
+        flask_thread = Thread(target=run_flask, daemon=True)
+        flask_thread.start()
+        print(f"✅ HTTP server running on port {PORT}")
     
-    print(f"✅ HTTP server running on port {PORT}")
     print("🤖 Starting Telegram bot...")
     
     # Run bot in main thread
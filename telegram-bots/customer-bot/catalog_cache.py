@@ -0,0 +1,167 @@
+"""
+Catalog Cache - per-store product lists kept in memory by the customer bot
+
+Products come from customer-service GET /api/customer/products/{store_id}
+over one long-lived httpx.AsyncClient. A cached catalog is served from
+memory while fresh. After that it is revalidated with If-None-Match, and
+an unchanged catalog costs a 304 with no body. Inventory changes published
+on the catalog.invalidated Redis channel (agent-service/cache_events.py)
+mark a store's entry stale immediately.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+# Allow importing redis_client / cache_events from agent-service
+_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(_root / "agent-service"))
+
+try:
+    from cache_events import CATALOG_CHANNEL
+    from redis_client import get_async_client as _get_async_redis
+    _REDIS_AVAILABLE = True
+except ImportError:
+    CATALOG_CHANNEL = "catalog.invalidated"
+    _REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Served from memory without revalidation for this long
+FRESH_SECONDS = 60
+HTTP_TIMEOUT_SECONDS = 10.0
+MAX_CONNECTIONS = 20
+
+
+@dataclass
+class CatalogEntry:
+    products: list[dict]
+    etag: Optional[str] = None
+    checked_at: float = 0.0
+    by_id: dict[str, dict] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.by_id = {p.get("product_id"): p for p in self.products}
+
+
+class CatalogCache:
+    """Per-store catalogs with conditional revalidation and push invalidation."""
+
+    def __init__(self, base_url: str, fresh_seconds: float = FRESH_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self.fresh_seconds = fresh_seconds
+        self._client: Optional[httpx.AsyncClient] = None
+        self._entries: dict[str, CatalogEntry] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """Shared client for all customer-service calls (connection reuse)."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=HTTP_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS),
+            )
+        return self._client
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    async def get_entry(self, store_id: str) -> CatalogEntry:
+        entry = self._entries.get(store_id)
+        if entry and time.monotonic() - entry.checked_at < self.fresh_seconds:
+            return entry
+        # One revalidation per store at a time; others wait for its result
+        lock = self._locks.setdefault(store_id, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(store_id)
+            if entry and time.monotonic() - entry.checked_at < self.fresh_seconds:
+                return entry
+            return await self._fetch(store_id, entry)
+
+    async def get_products(self, store_id: str) -> list[dict]:
+        return (await self.get_entry(store_id)).products
+
+    async def get_product(self, store_id: str, product_id: str) -> Optional[dict]:
+        return (await self.get_entry(store_id)).by_id.get(product_id)
+
+    async def _fetch(self, store_id: str, entry: Optional[CatalogEntry]) -> CatalogEntry:
+        headers = {"If-None-Match": entry.etag} if entry and entry.etag else {}
+        try:
+            response = await self.http.get(f"/api/customer/products/{store_id}", headers=headers)
+            if response.status_code == 304 and entry is not None:
+                entry.checked_at = time.monotonic()
+                return entry
+            response.raise_for_status()
+            data = response.json()
+        except Exception as exc:
+            if entry is not None:
+                logger.warning("Catalog refresh failed for %s, serving stale copy: %s", store_id, exc)
+                return entry
+            raise
+        fresh = CatalogEntry(
+            products=data.get("products", []),
+            etag=response.headers.get("ETag"),
+            checked_at=time.monotonic(),
+        )
+        self._entries[store_id] = fresh
+        return fresh
+
+    # ------------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------------
+
+    def invalidate(self, store_id: Optional[str] = None) -> None:
+        """Force revalidation on next use (the stale copy stays as a fallback)."""
+        entries = [self._entries.get(store_id)] if store_id else list(self._entries.values())
+        for entry in entries:
+            if entry is not None:
+                entry.checked_at = 0.0
+
+    def start_listener(self) -> None:
+        """Subscribe to catalog invalidations (call from the running event loop)."""
+        if not _REDIS_AVAILABLE or (self._listener and not self._listener.done()):
+            return
+        self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = None
+            try:
+                pubsub = _get_async_redis().pubsub()
+                await pubsub.subscribe(CATALOG_CHANNEL)
+                logger.info("Catalog cache listening on %s", CATALOG_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.invalidate(message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # Missed events are covered by FRESH_SECONDS revalidation
+                logger.warning("Catalog invalidation listener error: %s", exc)
+                self.invalidate()
+                await asyncio.sleep(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+    async def aclose(self) -> None:
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
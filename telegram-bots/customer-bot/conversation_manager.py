@@ -3,10 +3,24 @@ Conversation Manager - Context management and smart features
 Task 5.4: Context management (Redis, last 5 messages, cart, follow-ups)
 Task 5.5: Smart features (same as last time, usual order, modifications)
 Task 5.6.2: Conversation state machine
+
+Redis layout (one user = two keys, both expiring after CONTEXT_TTL_SECONDS):
+- conversation:v2:{user_id}           hash, one JSON-encoded value per field
+                                      (state, current_cart, pending_clarification, ...)
+- conversation:v2:{user_id}:messages  list capped at the last MAX_MESSAGES
+
+Field updates are pipelined and cart changes run as Lua scripts, so every
+manager call is a single Redis round-trip. AsyncConversationManager offers
+the same operations on redis.asyncio for the bot's event loop.
+
+"Same as last time?" and "usual order" suggestions come from the
+order_suggestions:{customer_id} hash that customer-service maintains on
+every order (agent-service/order_suggestions.py).
 """
 
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import os
@@ -20,11 +34,21 @@ _root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(_root / "agent-service"))
 
 try:
+    from redis_client import get_async_client as _get_async_redis
     from redis_client import get_sync_client as _get_redis
     _REDIS_AVAILABLE = True
 except ImportError:
     _REDIS_AVAILABLE = False
 
+from order_suggestions import (
+    BACKFILL_ORDER_LIMIT,
+    SEED_SUGGESTIONS_LUA,
+    build_suggestions,
+    decode_suggestions,
+    seed_args,
+    suggestions_key,
+)
+
 logger = logging.getLogger(__name__)
 
 # Conversation states (5.6.2 state machine)
@@ -35,6 +59,7 @@ STATE_CONFIRMING = "confirming"
 STATE_CONFIRMED = "confirmed"
 
 CONTEXT_TTL_SECONDS = 3600  # 1 hour
+MAX_MESSAGES = 5            # 5.4.2
 
 # Cache whether Redis is reachable (avoid repeated failed connection attempts)
 _redis_reachable: bool | None = None
@@ -59,15 +84,253 @@ def _check_redis_reachable() -> bool:
     return _redis_reachable
 
 
-class ConversationManager:
+# ---------------------------------------------------------------------------
+# Lua cart operations (atomic read-modify-write inside Redis)
+# ---------------------------------------------------------------------------
+
+# KEYS[1] context hash
+# ARGV[1] items (JSON list)  ARGV[2] extra fields (JSON object of encoded values)
+# ARGV[3] ttl  ARGV[4] encoded updated_at  ARGV[5] encoded STATE_ORDERING
+# Returns the encoded cart.
+_ADD_TO_CART_LUA = """
+local raw = redis.call('HGET', KEYS[1], 'current_cart')
+local cart = {}
+if raw then
+  local decoded = cjson.decode(raw)
+  if type(decoded) == 'table' then cart = decoded end
+end
+local added = false
+for _, item in ipairs(cjson.decode(ARGV[1])) do
+  local found = false
+  for _, existing in ipairs(cart) do
+    if existing['product_id'] == item['product_id'] then
+      existing['quantity'] = (tonumber(existing['quantity']) or 0) + (tonumber(item['quantity']) or 1)
+      found = true
+      break
+    end
+  end
+  if not found then
+    table.insert(cart, item)
+    added = true
+  end
+end
+local encoded = '[]'
+if #cart > 0 then encoded = cjson.encode(cart) end
+redis.call('HSET', KEYS[1], 'current_cart', encoded, 'updated_at', ARGV[4])
+if added then redis.call('HSET', KEYS[1], 'state', ARGV[5]) end
+for field, value in pairs(cjson.decode(ARGV[2])) do
+  redis.call('HSET', KEYS[1], field, value)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return encoded
+"""
+
+# KEYS[1] context hash
+# ARGV[1] product_id  ARGV[2] new quantity (<= 0 removes)  ARGV[3] ttl
+# ARGV[4] encoded updated_at. Returns 1 if the product was in the cart.
+_MODIFY_CART_LUA = """
+local raw = redis.call('HGET', KEYS[1], 'current_cart')
+if not raw then return 0 end
+local cart = cjson.decode(raw)
+if type(cart) ~= 'table' then return 0 end
+local quantity = tonumber(ARGV[2])
+for i, item in ipairs(cart) do
+  if tostring(item['product_id']) == ARGV[1] then
+    if quantity <= 0 then
+      table.remove(cart, i)
+    else
+      item['quantity'] = quantity
+    end
+    local encoded = '[]'
+    if #cart > 0 then encoded = cjson.encode(cart) end
+    redis.call('HSET', KEYS[1], 'current_cart', encoded, 'updated_at', ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return 1
+  end
+end
+return 0
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _decode(raw, default=None):
+    if raw is None:
+        return default
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return default
+
+
+class _ConversationStore:
+    """Key layout, encoding and in-memory fallback shared by both managers."""
+
+    def __init__(self):
+        self._memory: dict[str, dict] = {}  # fallback in-memory store
+        self._scripts: dict[str, object] = {}
+
+    # ------------------------------------------------------------------
+    # 5.4.1 Store conversation context in Redis
+    # ------------------------------------------------------------------
+
+    def _context_key(self, user_id: int | str) -> str:
+        return f"conversation:v2:{user_id}"
+
+    def _messages_key(self, user_id: int | str) -> str:
+        return f"conversation:v2:{user_id}:messages"
+
+    @staticmethod
+    def _empty_context() -> dict:
+        return {
+            "last_messages": [],   # 5.4.2 last 5 messages
+            "current_cart": [],    # 5.4.3 current cart
+            "state": STATE_BROWSING,
+            "last_products_viewed": [],
+            "pending_clarification": None,  # 5.3 ambiguity resolution
+            "updated_at": None,
+        }
+
+    def _build_context(self, fields: dict, messages: list) -> dict:
+        """Context dict from a HGETALL result and the message list."""
+        context = self._empty_context()
+        for name, raw in (fields or {}).items():
+            context[name] = _decode(raw, context.get(name))
+        # cjson encodes an empty Lua table as {}
+        if not isinstance(context["current_cart"], list):
+            context["current_cart"] = []
+        context["last_messages"] = [m for m in (_decode(raw) for raw in messages or []) if m]
+        return context
+
+    @staticmethod
+    def _encode_fields(fields: dict) -> dict:
+        encoded = {name: json.dumps(value) for name, value in fields.items()}
+        encoded["updated_at"] = json.dumps(_now())
+        return encoded
+
+    @staticmethod
+    def _new_message(role: str, content: str) -> dict:
+        return {"role": role, "content": content, "timestamp": _now()}
+
+    def _script(self, redis, name: str, source: str):
+        script = self._scripts.get(name)
+        if script is None:
+            script = self._scripts[name] = redis.register_script(source)
+        return script
+
+    def _cart_args(self, items: list, fields: dict) -> list:
+        encoded = self._encode_fields(fields)
+        updated_at = encoded.pop("updated_at")
+        return [
+            json.dumps(items), json.dumps(encoded), CONTEXT_TTL_SECONDS,
+            updated_at, json.dumps(STATE_ORDERING),
+        ]
+
+    # ------------------------------------------------------------------
+    # In-memory fallback (same semantics as the Redis path)
+    # ------------------------------------------------------------------
+
+    def _mem_context(self, user_id: int | str) -> dict:
+        key = self._context_key(user_id)
+        context = self._memory.get(key)
+        if context is None:
+            context = self._memory[key] = self._empty_context()
+        return context
+
+    def _mem_add_message(self, user_id: int | str, message: dict) -> dict:
+        context = self._mem_context(user_id)
+        context["last_messages"] = (context["last_messages"] + [message])[-MAX_MESSAGES:]
+        context["updated_at"] = message["timestamp"]
+        return json.loads(json.dumps(context))
+
+    def _mem_update(self, user_id: int | str, fields: dict) -> None:
+        context = self._mem_context(user_id)
+        context.update(json.loads(json.dumps(fields)))
+        context["updated_at"] = _now()
+
+    def _mem_add_to_cart(self, user_id: int | str, items: list, fields: dict) -> list:
+        context = self._mem_context(user_id)
+        cart = context["current_cart"]
+        for item in json.loads(json.dumps(items)):
+            existing = next((c for c in cart if c.get("product_id") == item.get("product_id")), None)
+            if existing is not None:
+                existing["quantity"] = existing.get("quantity", 0) + item.get("quantity", 1)
+            else:
+                cart.append(item)
+                context["state"] = STATE_ORDERING
+        self._mem_update(user_id, fields)
+        return json.loads(json.dumps(cart))
+
+    def _mem_modify_cart_item(self, user_id: int | str, product_id: str, new_quantity: float) -> bool:
+        context = self._mem_context(user_id)
+        cart = context["current_cart"]
+        for item in cart:
+            if item.get("product_id") == product_id:
+                if new_quantity <= 0:
+                    cart.remove(item)
+                else:
+                    item["quantity"] = new_quantity
+                context["updated_at"] = _now()
+                return True
+        return False
+
+    # ------------------------------------------------------------------
+    # 5.5.1 / 5.5.2 Smart features — last order / usual order
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _load_suggestion_fields(customer_id: str, supabase_client) -> dict | None:
+        """Rebuild the suggestions hash from the customer's recent orders (one query)."""
+        try:
+            result = (
+                supabase_client.table("orders")
+                .select("id, order_items(product_id, product_name, quantity, unit_price)")
+                .eq("customer_id", customer_id)
+                .order("created_at", desc=True)
+                .limit(BACKFILL_ORDER_LIMIT)
+                .execute()
+            )
+            return build_suggestions(result.data or [])
+        except Exception as exc:
+            logger.error("order suggestions backfill error: %s", exc)
+            return None
+
+    @staticmethod
+    def _suggestions_from_fields(fields: dict | None) -> dict:
+        if not fields:
+            return {"last_order": None, "usual": None}
+        return decode_suggestions(fields.get("last_order"), fields.get("usual"))
+
+    # ------------------------------------------------------------------
+    # Cart summary helper
+    # ------------------------------------------------------------------
+
+    def format_cart_summary(self, cart: list) -> str:
+        """Format cart items as a readable string."""
+        if not cart:
+            return "Your cart is empty."
+        lines = ["🛒 *Your Cart:*\n"]
+        total = 0.0
+        for i, item in enumerate(cart, 1):
+            name = item.get("product_name", item.get("name", "Unknown"))
+            qty = item.get("quantity", 1)
+            unit = item.get("unit", "pcs")
+            price = float(item.get("unit_price", item.get("price", 0)))
+            subtotal = qty * price
+            total += subtotal
+            lines.append(f"{i}. {name} — {qty} {unit} × ₹{price} = ₹{subtotal:.0f}")
+        lines.append(f"\n*Total: ₹{total:.0f}*")
+        return "\n".join(lines)
+
+
+class ConversationManager(_ConversationStore):
     """
     Manages per-user conversation context stored in Redis.
     Falls back to in-memory dict if Redis is unavailable.
     """
 
-    def __init__(self):
-        self._memory: dict[str, dict] = {}  # fallback in-memory store
-
     def _redis(self):
         if not _check_redis_reachable():
             return None
@@ -79,127 +342,130 @@ class ConversationManager:
         return None
 
     # ------------------------------------------------------------------
-    # 5.4.1 Store conversation context in Redis
+    # 5.4.1 Context access
     # ------------------------------------------------------------------
 
-    def _context_key(self, user_id: int | str) -> str:
-        return f"conversation:{user_id}"
-
     def get_context(self, user_id: int | str) -> dict:
         """Load conversation context for a user."""
-        key = self._context_key(user_id)
         redis = self._redis()
         if redis:
             try:
-                raw = redis.get(key)
-                if raw:
-                    return json.loads(raw)
+                pipe = redis.pipeline(transaction=False)
+                pipe.hgetall(self._context_key(user_id))
+                pipe.lrange(self._messages_key(user_id), 0, -1)
+                fields, messages = pipe.execute()
+                return self._build_context(fields, messages)
             except Exception as exc:
                 logger.warning("get_context Redis error: %s", exc)
 
         # Fallback to memory
-        return self._memory.get(key, self._empty_context())
-
-    def save_context(self, user_id: int | str, context: dict) -> None:
-        """Persist conversation context."""
-        key = self._context_key(user_id)
-        context["updated_at"] = datetime.now(timezone.utc).isoformat()
+        return json.loads(json.dumps(self._mem_context(user_id)))
 
+    def update(self, user_id: int | str, **fields) -> None:
+        """Set several context fields in one round-trip."""
         redis = self._redis()
         if redis:
             try:
-                redis.setex(key, CONTEXT_TTL_SECONDS, json.dumps(context))
+                key = self._context_key(user_id)
+                pipe = redis.pipeline(transaction=False)
+                pipe.hset(key, mapping=self._encode_fields(fields))
+                pipe.expire(key, CONTEXT_TTL_SECONDS)
+                pipe.execute()
                 return
             except Exception as exc:
-                logger.warning("save_context Redis error: %s", exc)
-
-        self._memory[key] = context
+                logger.warning("update_context Redis error: %s", exc)
+        self._mem_update(user_id, fields)
 
     def clear_context(self, user_id: int | str) -> None:
         """Clear conversation context (e.g., after order placed)."""
-        key = self._context_key(user_id)
         redis = self._redis()
         if redis:
             try:
-                redis.delete(key)
+                redis.delete(self._context_key(user_id), self._messages_key(user_id))
             except Exception:
                 pass
-        self._memory.pop(key, None)
+        self._memory.pop(self._context_key(user_id), None)
 
-    @staticmethod
-    def _empty_context() -> dict:
-        return {
-            "last_messages": [],   # 5.4.2 last 5 messages
-            "current_cart": [],    # 5.4.3 current cart
-            "state": STATE_BROWSING,
-            "last_products_viewed": [],
-            "pending_clarification": None,  # 5.3 ambiguity resolution
-            "updated_at": None,
-        }
+    def _get_field(self, user_id: int | str, name: str, default=None):
+        redis = self._redis()
+        if redis:
+            try:
+                return _decode(redis.hget(self._context_key(user_id), name), default)
+            except Exception as exc:
+                logger.warning("get_context Redis error: %s", exc)
+        value = self._mem_context(user_id).get(name, default)
+        return json.loads(json.dumps(value))
 
     # ------------------------------------------------------------------
     # 5.4.2 Maintain last 5 messages
     # ------------------------------------------------------------------
 
     def add_message(self, user_id: int | str, role: str, content: str) -> dict:
-        """Add a message to the conversation history (max 5)."""
-        context = self.get_context(user_id)
-        messages = context.get("last_messages", [])
-        messages.append({
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-        })
-        # Keep only last 5
-        context["last_messages"] = messages[-5:]
-        self.save_context(user_id, context)
-        return context
+        """Add a message to the history (max 5) and return the updated context."""
+        message = self._new_message(role, content)
+        redis = self._redis()
+        if redis:
+            try:
+                key, messages_key = self._context_key(user_id), self._messages_key(user_id)
+                pipe = redis.pipeline(transaction=False)
+                pipe.rpush(messages_key, json.dumps(message))
+                pipe.ltrim(messages_key, -MAX_MESSAGES, -1)
+                pipe.hset(key, "updated_at", json.dumps(message["timestamp"]))
+                pipe.expire(messages_key, CONTEXT_TTL_SECONDS)
+                pipe.expire(key, CONTEXT_TTL_SECONDS)
+                pipe.hgetall(key)
+                pipe.lrange(messages_key, 0, -1)
+                results = pipe.execute()
+                return self._build_context(results[-2], results[-1])
+            except Exception as exc:
+                logger.warning("add_message Redis error: %s", exc)
+        return self._mem_add_message(user_id, message)
 
     # ------------------------------------------------------------------
     # 5.4.3 Track current cart
     # ------------------------------------------------------------------
 
-    def add_to_cart(self, user_id: int | str, item: dict) -> dict:
-        """Add a matched product to the cart."""
-        context = self.get_context(user_id)
-        cart = context.get("current_cart", [])
+    def add_items_to_cart(self, user_id: int | str, items: list, **fields) -> list:
+        """
+        Add products to the cart (quantities of products already in it are
+        increased) and set ``fields``, atomically. Returns the cart.
+        """
+        redis = self._redis()
+        if redis:
+            try:
+                script = self._script(redis, "add_to_cart", _ADD_TO_CART_LUA)
+                raw = script(
+                    keys=[self._context_key(user_id)],
+                    args=self._cart_args(items, fields),
+                    client=redis,
+                )
+                cart = _decode(raw, [])
+                return cart if isinstance(cart, list) else []
+            except Exception as exc:
+                logger.warning("add_to_cart Redis error: %s", exc)
+        return self._mem_add_to_cart(user_id, items, fields)
 
-        # Check if product already in cart — update quantity
-        product_id = item.get("product_id")
-        for existing in cart:
-            if existing.get("product_id") == product_id:
-                existing["quantity"] = existing.get("quantity", 0) + item.get("quantity", 1)
-                context["current_cart"] = cart
-                self.save_context(user_id, context)
-                return context
-
-        cart.append(item)
-        context["current_cart"] = cart
-        context["state"] = STATE_ORDERING
-        self.save_context(user_id, context)
-        return context
+    def add_to_cart(self, user_id: int | str, item: dict) -> list:
+        """Add a matched product to the cart."""
+        return self.add_items_to_cart(user_id, [item])
 
     def clear_cart(self, user_id: int | str) -> None:
         """Clear the cart after order is placed."""
-        context = self.get_context(user_id)
-        context["current_cart"] = []
-        context["state"] = STATE_BROWSING
-        self.save_context(user_id, context)
+        self.update(user_id, current_cart=[], state=STATE_BROWSING)
 
     def get_cart(self, user_id: int | str) -> list:
-        return self.get_context(user_id).get("current_cart", [])
+        cart = self._get_field(user_id, "current_cart", [])
+        return cart if isinstance(cart, list) else []
 
     # ------------------------------------------------------------------
     # 5.6.2 State machine transitions
     # ------------------------------------------------------------------
 
     def set_state(self, user_id: int | str, state: str) -> None:
-        context = self.get_context(user_id)
-        context["state"] = state
-        self.save_context(user_id, context)
+        self.update(user_id, state=state)
 
     def get_state(self, user_id: int | str) -> str:
-        return self.get_context(user_id).get("state", STATE_BROWSING)
+        return self._get_field(user_id, "state", STATE_BROWSING)
 
     # ------------------------------------------------------------------
     # 5.3 Ambiguity resolution — store pending clarification
@@ -214,80 +480,13 @@ class ConversationManager:
             "remaining_items": [...],  # other items still to process
         }
         """
-        context = self.get_context(user_id)
-        context["pending_clarification"] = clarification
-        context["state"] = STATE_AWAITING_CLARIFICATION
-        self.save_context(user_id, context)
+        self.update(user_id, pending_clarification=clarification, state=STATE_AWAITING_CLARIFICATION)
 
     def get_pending_clarification(self, user_id: int | str) -> dict | None:
-        return self.get_context(user_id).get("pending_clarification")
+        return self._get_field(user_id, "pending_clarification")
 
     def clear_pending_clarification(self, user_id: int | str) -> None:
-        context = self.get_context(user_id)
-        context["pending_clarification"] = None
-        self.save_context(user_id, context)
-
-    # ------------------------------------------------------------------
-    # 5.5.1 / 5.5.2 Smart features — last order / usual order
-    # ------------------------------------------------------------------
-
-    def get_last_order_suggestion(self, customer_id: str, supabase_client) -> list | None:
-        """
-        5.5.1 Fetch the customer's last order items for "Same as last time?" suggestion.
-        Returns list of order items or None if no previous orders.
-        """
-        try:
-            result = (
-                supabase_client.table("orders")
-                .select("id, order_items(product_id, product_name, quantity, unit_price)")
-                .eq("customer_id", customer_id)
-                .order("created_at", desc=True)
-                .limit(1)
-                .execute()
-            )
-            orders = result.data or []
-            if not orders:
-                return None
-            items = orders[0].get("order_items") or []
-            return items if items else None
-        except Exception as exc:
-            logger.error("get_last_order_suggestion error: %s", exc)
-            return None
-
-    def get_usual_order(self, customer_id: str, supabase_client) -> list | None:
-        """
-        5.5.2 Determine the customer's "usual order" based on most frequently ordered items.
-        Returns top 3 most ordered products or None.
-        """
-        try:
-            result = (
-                supabase_client.table("order_items")
-                .select("product_id, product_name, quantity")
-                .eq("orders.customer_id", customer_id)
-                .execute()
-            )
-            items = result.data or []
-            if not items:
-                return None
-
-            # Count frequency per product
-            freq: dict[str, dict] = {}
-            for item in items:
-                pid = item.get("product_id")
-                if pid:
-                    if pid not in freq:
-                        freq[pid] = {"product_name": item.get("product_name"), "count": 0, "product_id": pid}
-                    freq[pid]["count"] += 1
-
-            if not freq:
-                return None
-
-            # Return top 3
-            top = sorted(freq.values(), key=lambda x: x["count"], reverse=True)[:3]
-            return top
-        except Exception as exc:
-            logger.error("get_usual_order error: %s", exc)
-            return None
+        self.update(user_id, pending_clarification=None)
 
     # ------------------------------------------------------------------
     # 5.5.3 Handle order modifications
@@ -295,40 +494,229 @@ class ConversationManager:
 
     def modify_cart_item(self, user_id: int | str, product_id: str, new_quantity: float) -> bool:
         """Modify quantity of an item in the cart. Returns True if found and updated."""
-        context = self.get_context(user_id)
-        cart = context.get("current_cart", [])
-        for item in cart:
-            if item.get("product_id") == product_id:
-                if new_quantity <= 0:
-                    cart.remove(item)
-                else:
-                    item["quantity"] = new_quantity
-                context["current_cart"] = cart
-                self.save_context(user_id, context)
-                return True
-        return False
+        redis = self._redis()
+        if redis:
+            try:
+                script = self._script(redis, "modify_cart", _MODIFY_CART_LUA)
+                found = script(
+                    keys=[self._context_key(user_id)],
+                    args=[str(product_id), new_quantity, CONTEXT_TTL_SECONDS, json.dumps(_now())],
+                    client=redis,
+                )
+                return bool(found)
+            except Exception as exc:
+                logger.warning("modify_cart_item Redis error: %s", exc)
+        return self._mem_modify_cart_item(user_id, product_id, new_quantity)
 
     def remove_from_cart(self, user_id: int | str, product_id: str) -> bool:
         """Remove an item from the cart."""
         return self.modify_cart_item(user_id, product_id, 0)
 
     # ------------------------------------------------------------------
-    # Cart summary helper
+    # 5.5.1 / 5.5.2 Last order / usual order
     # ------------------------------------------------------------------
 
-    def format_cart_summary(self, cart: list) -> str:
-        """Format cart items as a readable string."""
-        if not cart:
-            return "Your cart is empty."
-        lines = ["🛒 *Your Cart:*\n"]
-        total = 0.0
-        for i, item in enumerate(cart, 1):
-            name = item.get("product_name", item.get("name", "Unknown"))
-            qty = item.get("quantity", 1)
-            unit = item.get("unit", "pcs")
-            price = float(item.get("unit_price", item.get("price", 0)))
-            subtotal = qty * price
-            total += subtotal
-            lines.append(f"{i}. {name} — {qty} {unit} × ₹{price} = ₹{subtotal:.0f}")
-        lines.append(f"\n*Total: ₹{total:.0f}*")
-        return "\n".join(lines)
+    def get_order_suggestions(self, customer_id: str, supabase_client) -> dict:
+        """
+        ``{"last_order": [...] | None, "usual": [...] | None}`` for the customer,
+        read from the precomputed order_suggestions hash in one lookup.
+        """
+        key = suggestions_key(customer_id)
+        redis = self._redis()
+        if redis:
+            try:
+                last_order, usual = redis.hmget(key, "last_order", "usual")
+                if last_order is not None or usual is not None:
+                    return decode_suggestions(last_order, usual)
+            except Exception as exc:
+                logger.warning("Redis order suggestions error: %s", exc)
+                redis = None
+
+        fields = self._load_suggestion_fields(customer_id, supabase_client)
+        if fields is not None and redis:
+            try:
+                self._script(redis, "seed_suggestions", SEED_SUGGESTIONS_LUA)(
+                    keys=[key], args=seed_args(fields))
+            except Exception as exc:
+                logger.warning("Redis order suggestions seed error: %s", exc)
+        return self._suggestions_from_fields(fields)
+
+    def get_last_order_suggestion(self, customer_id: str, supabase_client) -> list | None:
+        """5.5.1 Items of the customer's last order, for "Same as last time?"."""
+        return self.get_order_suggestions(customer_id, supabase_client)["last_order"]
+
+    def get_usual_order(self, customer_id: str, supabase_client) -> list | None:
+        """5.5.2 The customer's top 3 most frequently ordered products."""
+        return self.get_order_suggestions(customer_id, supabase_client)["usual"]
+
+
+class AsyncConversationManager(_ConversationStore):
+    """
+    ConversationManager for asyncio callers (the bot's handlers), backed by
+    redis.asyncio so context calls never block the event loop. Same methods,
+    as coroutines; format_cart_summary stays sync.
+    """
+
+    def _redis(self):
+        if not _check_redis_reachable():
+            return None
+        try:
+            return _get_async_redis()
+        except Exception:
+            return None
+
+    async def get_context(self, user_id: int | str) -> dict:
+        """Load conversation context for a user."""
+        redis = self._redis()
+        if redis:
+            try:
+                pipe = redis.pipeline(transaction=False)
+                pipe.hgetall(self._context_key(user_id))
+                pipe.lrange(self._messages_key(user_id), 0, -1)
+                fields, messages = await pipe.execute()
+                return self._build_context(fields, messages)
+            except Exception as exc:
+                logger.warning("get_context Redis error: %s", exc)
+        return json.loads(json.dumps(self._mem_context(user_id)))
+
+    async def update(self, user_id: int | str, **fields) -> None:
+        """Set several context fields in one round-trip."""
+        redis = self._redis()
+        if redis:
+            try:
+                key = self._context_key(user_id)
+                pipe = redis.pipeline(transaction=False)
+                pipe.hset(key, mapping=self._encode_fields(fields))
+                pipe.expire(key, CONTEXT_TTL_SECONDS)
+                await pipe.execute()
+                return
+            except Exception as exc:
+                logger.warning("update_context Redis error: %s", exc)
+        self._mem_update(user_id, fields)
+
+    async def clear_context(self, user_id: int | str) -> None:
+        redis = self._redis()
+        if redis:
+            try:
+                await redis.delete(self._context_key(user_id), self._messages_key(user_id))
+            except Exception:
+                pass
+        self._memory.pop(self._context_key(user_id), None)
+
+    async def _get_field(self, user_id: int | str, name: str, default=None):
+        redis = self._redis()
+        if redis:
+            try:
+                return _decode(await redis.hget(self._context_key(user_id), name), default)
+            except Exception as exc:
+                logger.warning("get_context Redis error: %s", exc)
+        value = self._mem_context(user_id).get(name, default)
+        return json.loads(json.dumps(value))
+
+    async def add_message(self, user_id: int | str, role: str, content: str) -> dict:
+        """Add a message to the history (max 5) and return the updated context."""
+        message = self._new_message(role, content)
+        redis = self._redis()
+        if redis:
+            try:
+                key, messages_key = self._context_key(user_id), self._messages_key(user_id)
+                pipe = redis.pipeline(transaction=False)
+                pipe.rpush(messages_key, json.dumps(message))
+                pipe.ltrim(messages_key, -MAX_MESSAGES, -1)
+                pipe.hset(key, "updated_at", json.dumps(message["timestamp"]))
+                pipe.expire(messages_key, CONTEXT_TTL_SECONDS)
+                pipe.expire(key, CONTEXT_TTL_SECONDS)
+                pipe.hgetall(key)
+                pipe.lrange(messages_key, 0, -1)
+                results = await pipe.execute()
+                return self._build_context(results[-2], results[-1])
+            except Exception as exc:
+                logger.warning("add_message Redis error: %s", exc)
+        return self._mem_add_message(user_id, message)
+
+    async def add_items_to_cart(self, user_id: int | str, items: list, **fields) -> list:
+        """Add products to the cart and set ``fields`` atomically; returns the cart."""
+        redis = self._redis()
+        if redis:
+            try:
+                script = self._script(redis, "add_to_cart", _ADD_TO_CART_LUA)
+                raw = await script(
+                    keys=[self._context_key(user_id)],
+                    args=self._cart_args(items, fields),
+                    client=redis,
+                )
+                cart = _decode(raw, [])
+                return cart if isinstance(cart, list) else []
+            except Exception as exc:
+                logger.warning("add_to_cart Redis error: %s", exc)
+        return self._mem_add_to_cart(user_id, items, fields)
+
+    async def add_to_cart(self, user_id: int | str, item: dict) -> list:
+        return await self.add_items_to_cart(user_id, [item])
+
+    async def clear_cart(self, user_id: int | str) -> None:
+        await self.update(user_id, current_cart=[], state=STATE_BROWSING)
+
+    async def get_cart(self, user_id: int | str) -> list:
+        cart = await self._get_field(user_id, "current_cart", [])
+        return cart if isinstance(cart, list) else []
+
+    async def set_state(self, user_id: int | str, state: str) -> None:
+        await self.update(user_id, state=state)
+
+    async def get_state(self, user_id: int | str) -> str:
+        return await self._get_field(user_id, "state", STATE_BROWSING)
+
+    async def set_pending_clarification(self, user_id: int | str, clarification: dict) -> None:
+        await self.update(user_id, pending_clarification=clarification, state=STATE_AWAITING_CLARIFICATION)
+
+    async def get_pending_clarification(self, user_id: int | str) -> dict | None:
+        return await self._get_field(user_id, "pending_clarification")
+
+    async def clear_pending_clarification(self, user_id: int | str) -> None:
+        await self.update(user_id, pending_clarification=None)
+
+    async def modify_cart_item(self, user_id: int | str, product_id: str, new_quantity: float) -> bool:
+        redis = self._redis()
+        if redis:
+            try:
+                script = self._script(redis, "modify_cart", _MODIFY_CART_LUA)
+                found = await script(
+                    keys=[self._context_key(user_id)],
+                    args=[str(product_id), new_quantity, CONTEXT_TTL_SECONDS, json.dumps(_now())],
+                    client=redis,
+                )
+                return bool(found)
+            except Exception as exc:
+                logger.warning("modify_cart_item Redis error: %s", exc)
+        return self._mem_modify_cart_item(user_id, product_id, new_quantity)
+
+    async def remove_from_cart(self, user_id: int | str, product_id: str) -> bool:
+        return await self.modify_cart_item(user_id, product_id, 0)
+
+    async def get_order_suggestions(self, customer_id: str, supabase_client) -> dict:
+        key = suggestions_key(customer_id)
+        redis = self._redis()
+        if redis:
+            try:
+                last_order, usual = await redis.hmget(key, "last_order", "usual")
+                if last_order is not None or usual is not None:
+                    return decode_suggestions(last_order, usual)
+            except Exception as exc:
+                logger.warning("Redis order suggestions error: %s", exc)
+                redis = None
+
+        fields = await asyncio.to_thread(self._load_suggestion_fields, customer_id, supabase_client)
+        if fields is not None and redis:
+            try:
+                await self._script(redis, "seed_suggestions", SEED_SUGGESTIONS_LUA)(
+                    keys=[key], args=seed_args(fields))
+            except Exception as exc:
+                logger.warning("Redis order suggestions seed error: %s", exc)
+        return self._suggestions_from_fields(fields)
+
+    async def get_last_order_suggestion(self, customer_id: str, supabase_client) -> list | None:
+        return (await self.get_order_suggestions(customer_id, supabase_client))["last_order"]
+
+    async def get_usual_order(self, customer_id: str, supabase_client) -> list | None:
+        return (await self.get_order_suggestions(customer_id, supabase_client))["usual"]
@@ -0,0 +1,222 @@
+"""
+Customer Cache - the customer row behind each (telegram user, store) pair
+
+Handlers look the shopper up on almost every update (NLP messages,
+callbacks, "usual order"). Rows are kept in an in-process LRU for
+CUSTOMER_TTL_SECONDS, and concurrent lookups for the same user share one
+query. "Not registered" is cached briefly so onboarding users do not hit
+the database on every message.
+
+Entries are dropped early when:
+- the bot edits the profile or registers the user (``invalidate``), and
+- another service or replica publishes on customer.invalidated
+  (agent-service/cache_events.py): credit suspension / limits, VIP flags,
+  profile edits made on another replica.
+
+An invalidation that arrives while the row is being loaded bumps the key's
+generation, and the loaded (possibly stale) row is then not cached.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable, Optional
+
+# Allow importing redis_client / cache_events from agent-service
+_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(_root / "agent-service"))
+
+try:
+    from cache_events import CUSTOMER_CHANNEL
+    from redis_client import get_async_client as _get_async_redis
+    _REDIS_AVAILABLE = True
+except ImportError:
+    CUSTOMER_CHANNEL = "customer.invalidated"
+    _REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER_TTL_SECONDS = 120
+# "Not registered" answers expire quickly: onboarding may finish on another replica
+MISSING_TTL_SECONDS = 10
+MAX_CACHED_CUSTOMERS = 10_000
+
+CustomerLoader = Callable[[str, str], Awaitable[Optional[dict]]]
+
+
+class CustomerCache:
+    """Per-(telegram_id, store_id) customer rows with TTL and push invalidation."""
+
+    def __init__(
+        self,
+        loader: CustomerLoader,
+        ttl: float = CUSTOMER_TTL_SECONDS,
+        missing_ttl: float = MISSING_TTL_SECONDS,
+        max_entries: int = MAX_CACHED_CUSTOMERS,
+    ):
+        self._loader = loader
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.max_entries = max_entries
+        # (telegram_id, store_id) -> (expires_at, row or None)
+        self._entries: "OrderedDict[tuple, tuple[float, Optional[dict]]]" = OrderedDict()
+        self._by_customer_id: dict[str, tuple] = {}
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        # Bumped by invalidations of a key while its load is in flight
+        self._generations: dict[tuple, int] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self.metrics = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(telegram_id, store_id) -> tuple:
+        return (str(telegram_id), str(store_id))
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    async def get(self, telegram_id, store_id) -> Optional[dict]:
+        """The customer row (a copy), or None if the user is not registered."""
+        key = self._key(telegram_id, store_id)
+        cached = self._entries.get(key)
+        if cached and time.monotonic() < cached[0]:
+            self._entries.move_to_end(key)
+            self.metrics["hits"] += 1
+            return dict(cached[1]) if cached[1] else None
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            row = await asyncio.shield(pending)
+            return dict(row) if row else None
+
+        self.metrics["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generations.get(key, 0)
+        try:
+            row = await self._loader(*key)
+        except Exception as exc:
+            future.set_exception(exc)
+            # Nobody else may be waiting; mark the exception retrieved
+            future.exception()
+            raise
+        else:
+            if self._generations.get(key, 0) == generation:
+                self._store(key, row)
+            future.set_result(row)
+        finally:
+            self._inflight.pop(key, None)
+            self._generations.pop(key, None)
+        return dict(row) if row else None
+
+    def _store(self, key: tuple, row: Optional[dict]) -> None:
+        ttl = self.ttl if row else self.missing_ttl
+        self._entries[key] = (time.monotonic() + ttl, row)
+        self._entries.move_to_end(key)
+        if row and row.get("id"):
+            self._by_customer_id[str(row["id"])] = key
+        while len(self._entries) > self.max_entries:
+            old_key, (_, old_row) = self._entries.popitem(last=False)
+            if old_row and old_row.get("id"):
+                self._by_customer_id.pop(str(old_row["id"]), None)
+
+    # ------------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------------
+
+    def _bump(self, keys: Iterable[tuple]) -> None:
+        """Keep loads in flight for ``keys`` from caching what they read."""
+        for key in keys:
+            if key in self._inflight:
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def invalidate(self, telegram_id, store_id=None) -> None:
+        """Drop the user's entry for ``store_id`` (or for every store)."""
+        telegram_id = str(telegram_id)
+        if store_id is not None:
+            keys = [self._key(telegram_id, store_id)]
+        else:
+            keys = [key for key in [*self._entries, *self._inflight] if key[0] == telegram_id]
+        self._bump(keys)
+        for key in keys:
+            _, row = self._entries.pop(key, (None, None))
+            if row and row.get("id"):
+                self._by_customer_id.pop(str(row["id"]), None)
+
+    def invalidate_customers(self, customer_ids: Iterable[str]) -> None:
+        unmapped = False
+        for customer_id in customer_ids:
+            key = self._by_customer_id.pop(str(customer_id), None)
+            if key is not None:
+                self._entries.pop(key, None)
+                self._bump([key])
+            else:
+                unmapped = True
+        if unmapped:
+            # The customer may be one whose row is being loaded right now
+            self._bump(list(self._inflight))
+
+    async def publish_invalidation(self, telegram_id, store_id) -> None:
+        """Invalidate locally and on the other bot replicas."""
+        self.invalidate(telegram_id, store_id)
+        if not _REDIS_AVAILABLE:
+            return
+        try:
+            await _get_async_redis().publish(
+                CUSTOMER_CHANNEL,
+                json.dumps({"telegram_chat_id": str(telegram_id), "store_id": str(store_id)}),
+            )
+        except Exception as exc:
+            logger.warning("Customer invalidation publish failed: %s", exc)
+
+    def _apply(self, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except (TypeError, ValueError):
+            return
+        if event.get("customer_ids"):
+            self.invalidate_customers(event["customer_ids"])
+        if event.get("telegram_chat_id"):
+            self.invalidate(event["telegram_chat_id"], event.get("store_id"))
+
+    def start_listener(self) -> None:
+        """Subscribe to customer invalidations (call from the running event loop)."""
+        if not _REDIS_AVAILABLE or (self._listener and not self._listener.done()):
+            return
+        self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = None
+            try:
+                pubsub = _get_async_redis().pubsub()
+                await pubsub.subscribe(CUSTOMER_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._apply(message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # Missed events are covered by the TTL; start clean anyway
+                logger.warning("Customer invalidation listener error: %s", exc)
+                self._bump(list(self._inflight))
+                self._entries.clear()
+                self._by_customer_id.clear()
+                await asyncio.sleep(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+    async def aclose(self) -> None:
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
@@ -7,17 +7,57 @@ Task 5.3: Ambiguity resolution
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
 import logging
 import os
 import re
+import sys
 import time
+from collections import OrderedDict
+from pathlib import Path
 from typing import Optional
 
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
+
+# Allow importing redis_client from agent-service
+_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(_root / "agent-service"))
+
+try:
+    from redis_client import get_async_client as _get_async_redis
+    _REDIS_AVAILABLE = True
+except ImportError:
+    _REDIS_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# LLM call limits (5.1.1) — a slow API must not stall every chat
+LLM_TIMEOUT_SECONDS = float(os.getenv("NLP_LLM_TIMEOUT_SECONDS", "8"))
+LLM_MAX_RETRIES = 1
+
+# Parse result cache: normalized message + recent context -> parsed JSON
+PARSE_CACHE_KEY = "nlp_parse:{digest}"
+PARSE_CACHE_TTL_SECONDS = 6 * 3600
+CACHE_TIMEOUT_SECONDS = 0.2
+CACHE_RETRY_AFTER_SECONDS = 60
+
+# 5.9 Regex item pattern: optional number + optional unit + product name
+_ITEM_PATTERN = re.compile(
+    r"(\d+(?:\.\d+)?)\s*(kg|g|l|ltr|litre|liter|pcs|pkt|doz|kilo|gram|piece|packet)?\s+([a-zA-Z\s]+?)(?:,|and|$)",
+    re.IGNORECASE,
+)
+
+# Words that mean the regex parse may have missed intent or context
+_FAST_PATH_STOPWORDS = {
+    "aur", "chahiye", "mujhe", "bhejo", "dena", "do", "de", "please", "want", "need",
+    "send", "give", "me", "my", "the", "of", "for", "price", "cost", "available",
+    "stock", "status", "order", "instead", "not", "no", "remove", "cancel", "change",
+    "same", "usual", "again", "more", "less", "only", "also",
+}
+_FAST_PATH_MAX_PRODUCT_WORDS = 3
+
 # ---------------------------------------------------------------------------
 # Hindi/English unit mappings (5.1.4)
 # ---------------------------------------------------------------------------
@@ -85,14 +125,65 @@ HINDI_PRODUCT_MAP = {
 }
 
 
-def normalize_hindi_english(text: str) -> str:
+class SynonymNormalizer:
+    """
+    Rewrites every known term in a single pass.
+
+    All terms are compiled into one alternation regex (longest first, so
+    "kilo gram" wins over "kilo"). Matched text is replaced from the map and
+    never rescanned.
+    """
+
+    def __init__(self, mapping: dict[str, str]):
+        self.mapping = {term.lower().strip(): value for term, value in mapping.items() if term.strip()}
+        terms = sorted(self.mapping, key=len, reverse=True)
+        self._pattern = (
+            re.compile(r"\b(?:" + "|".join(re.escape(t) for t in terms) + r")\b")
+            if terms else None
+        )
+
+    def normalize(self, text: str) -> str:
+        text_lower = text.lower()
+        if self._pattern is None:
+            return text_lower
+        return self._pattern.sub(lambda m: self.mapping[m.group(0)], text_lower)
+
+    def extend(self, synonyms: dict[str, str]) -> "SynonymNormalizer":
+        """New normalizer with extra (e.g. per-store) synonyms taking precedence."""
+        return SynonymNormalizer({**self.mapping, **synonyms})
+
+
+DEFAULT_NORMALIZER = SynonymNormalizer({**HINDI_UNIT_MAP, **HINDI_PRODUCT_MAP})
+
+
+def normalize_hindi_english(text: str, normalizer: Optional[SynonymNormalizer] = None) -> str:
     """Normalize Hindi words to English equivalents for better matching."""
-    text_lower = text.lower()
-    for hindi, english in HINDI_PRODUCT_MAP.items():
-        text_lower = re.sub(r"\b" + hindi + r"\b", english, text_lower)
-    for hindi_unit, eng_unit in HINDI_UNIT_MAP.items():
-        text_lower = re.sub(r"\b" + hindi_unit + r"\b", eng_unit, text_lower)
-    return text_lower
+    return (normalizer or DEFAULT_NORMALIZER).normalize(text)
+
+
+# Per-store synonyms are reloaded at most this often
+STORE_SYNONYM_TTL_SECONDS = 300
+# Stores whose normalizers are kept (least recently used are dropped)
+MAX_STORE_NORMALIZERS = 1000
+
+
+def load_store_synonyms(store_id: str, supabase) -> dict[str, str]:
+    """Read a store's custom synonyms (store_synonyms table) as {term: replacement}."""
+    try:
+        result = (
+            supabase.table("store_synonyms")
+            .select("term, replacement")
+            .eq("store_id", store_id)
+            .execute()
+        )
+    except Exception as exc:
+        logger.error("load_store_synonyms error: %s", exc)
+        return {}
+    return {
+        row["term"].lower(): row["replacement"].lower()
+        for row in result.data or []
+        if row.get("term") and row.get("replacement")
+    }
 
 
 # ---------------------------------------------------------------------------
@@ -105,24 +196,64 @@ class ConversationalOrderParser:
     Handles intent detection (5.1.2) and entity extraction (5.1.3).
     """
 
-    def __init__(self):
+    def __init__(self, supabase_client=None):
+        self.supabase = supabase_client
+        # store_id -> (loaded_at, SynonymNormalizer), LRU order
+        self._store_normalizers: "OrderedDict[str, tuple[float, SynonymNormalizer]]" = OrderedDict()
+
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             logger.warning("ANTHROPIC_API_KEY not set — NLP parser will be unavailable")
             self.claude_client = None
         else:
-            self.claude_client = Anthropic(api_key=api_key)
+            self.claude_client = AsyncAnthropic(
+                api_key=api_key,
+                timeout=LLM_TIMEOUT_SECONDS,
+                max_retries=LLM_MAX_RETRIES,
+            )
+
+        self._redis = None
+        self._cache_disabled_until = 0.0
 
         # NLP performance monitoring (5.10)
         self._parse_count = 0
         self._parse_errors = 0
         self._total_latency_ms = 0.0
+        self._cache_hits = 0
+        self._fast_path_hits = 0
+
+    # ------------------------------------------------------------------
+    # 5.1.4 Store-specific normalization
+    # ------------------------------------------------------------------
+
+    async def get_normalizer(self, store_id: Optional[str] = None) -> SynonymNormalizer:
+        """Default normalizer extended with the store's synonyms (cached with a TTL)."""
+        if not store_id or self.supabase is None:
+            return DEFAULT_NORMALIZER
+        cached = self._store_normalizers.get(store_id)
+        now = time.monotonic()
+        if cached and now - cached[0] < STORE_SYNONYM_TTL_SECONDS:
+            self._store_normalizers.move_to_end(store_id)
+            return cached[1]
+        # Sync Supabase query: keep it off the bot's event loop
+        synonyms = await asyncio.to_thread(load_store_synonyms, store_id, self.supabase)
+        normalizer = DEFAULT_NORMALIZER.extend(synonyms) if synonyms else DEFAULT_NORMALIZER
+        self._store_normalizers[store_id] = (now, normalizer)
+        self._store_normalizers.move_to_end(store_id)
+        while len(self._store_normalizers) > MAX_STORE_NORMALIZERS:
+            self._store_normalizers.popitem(last=False)
+        return normalizer
 
     # ------------------------------------------------------------------
     # 5.1.2 Intent detection + 5.1.3 Entity extraction
     # ------------------------------------------------------------------
 
-    async def parse_order(self, user_message: str, context: dict | None = None) -> dict:
+    async def parse_order(
+        self,
+        user_message: str,
+        context: dict | None = None,
+        store_id: Optional[str] = None,
+    ) -> dict:
         """
         Parse a natural language order message.
 
@@ -135,10 +266,17 @@ class ConversationalOrderParser:
             }
         """
         # 5.1.4 Normalize Hindi/English mix first
-        normalized = normalize_hindi_english(user_message)
+        normalized = normalize_hindi_english(user_message, await self.get_normalizer(store_id))
 
+        # Fast path: plain "2 kg rice, 1 l milk" needs no LLM
+        regex_result = self._fallback_parse(user_message, normalized)
         if self.claude_client is None:
-            return self._fallback_parse(user_message, normalized)
+            return regex_result
+        if self._is_unambiguous(normalized, regex_result):
+            self._fast_path_hits += 1
+            regex_result.pop("fallback", None)
+            regex_result["fast_path"] = True
+            return regex_result
 
         context_str = ""
         if context and context.get("last_messages"):
@@ -147,6 +285,17 @@ class ConversationalOrderParser:
                 f"- {m.get('role', 'user')}: {m.get('content', '')}" for m in recent
             )
 
+        cache_key = PARSE_CACHE_KEY.format(
+            digest=hashlib.sha1(f"{normalized}\x00{context_str}".encode()).hexdigest()
+        )
+        cached = await self._cache_get(cache_key)
+        if cached is not None:
+            self._cache_hits += 1
+            cached["raw_message"] = user_message
+            cached["normalized_message"] = normalized
+            cached["cached"] = True
+            return cached
+
         prompt = f"""Parse this customer order message and extract products, quantities, and units.
 The customer may use Hindi words mixed with English (e.g., "2 kilo chawal" means "2 kg rice").
 {context_str}
@@ -175,7 +324,7 @@ Rules:
 
         start_ms = time.monotonic() * 1000
         try:
-            response = self.claude_client.messages.create(
+            response = await self.claude_client.messages.create(
                 model="claude-sonnet-4-5",
                 max_tokens=500,
                 messages=[{"role": "user", "content": prompt}],
@@ -190,6 +339,7 @@ Rules:
             raw_text = re.sub(r"\s*```$", "", raw_text)
 
             parsed = json.loads(raw_text)
+            await self._cache_set(cache_key, parsed)
             parsed["raw_message"] = user_message
             parsed["normalized_message"] = normalized
             return parsed
@@ -197,11 +347,75 @@ Rules:
         except json.JSONDecodeError as exc:
             logger.error("parse_order: JSON decode error: %s", exc)
             self._parse_errors += 1
-            return self._fallback_parse(user_message, normalized)
+            return regex_result
         except Exception as exc:
             logger.error("parse_order: Claude API error: %s", exc)
             self._parse_errors += 1
-            return self._fallback_parse(user_message, normalized)
+            return regex_result
+
+    # ------------------------------------------------------------------
+    # Fast path + parse cache
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _is_unambiguous(normalized: str, parsed: dict) -> bool:
+        """
+        True when the regex parse explains the whole message: only
+        "qty [unit] product" segments, short product names and no words
+        that hint at questions, modifications or references to context.
+        """
+        if parsed.get("intent") != "place_order" or not parsed.get("items"):
+            return False
+        leftover = re.sub(r"\band\b", " ", _ITEM_PATTERN.sub(" ", normalized))
+        if re.search(r"\w", leftover):
+            return False
+        for item in parsed["items"]:
+            words = item["product"].lower().split()
+            if not words or len(words) > _FAST_PATH_MAX_PRODUCT_WORDS:
+                return False
+            if _FAST_PATH_STOPWORDS.intersection(words):
+                return False
+        return True
+
+    def _get_redis(self):
+        if time.monotonic() < self._cache_disabled_until:
+            return None
+        if self._redis is None and _REDIS_AVAILABLE:
+            try:
+                self._redis = _get_async_redis()
+            except Exception:
+                return None
+        return self._redis
+
+    def _cache_unavailable(self, exc: Exception) -> None:
+        logger.debug("Parse cache unavailable: %s", exc)
+        self._cache_disabled_until = time.monotonic() + CACHE_RETRY_AFTER_SECONDS
+
+    async def _cache_get(self, key: str) -> Optional[dict]:
+        redis = self._get_redis()
+        if redis is None:
+            return None
+        try:
+            raw = await asyncio.wait_for(redis.get(key), CACHE_TIMEOUT_SECONDS)
+        except Exception as exc:
+            self._cache_unavailable(exc)
+            return None
+        try:
+            return json.loads(raw) if raw else None
+        except (TypeError, ValueError):
+            return None
+
+    async def _cache_set(self, key: str, parsed: dict) -> None:
+        redis = self._get_redis()
+        if redis is None:
+            return
+        value = json.dumps({"intent": parsed.get("intent"), "items": parsed.get("items", [])})
+        try:
+            await asyncio.wait_for(
+                redis.set(key, value, ex=PARSE_CACHE_TTL_SECONDS), CACHE_TIMEOUT_SECONDS
+            )
+        except Exception as exc:
+            self._cache_unavailable(exc)
 
     def _fallback_parse(self, user_message: str, normalized: str) -> dict:
         """
@@ -209,9 +423,7 @@ Rules:
         Handles simple patterns like "2kg rice", "1 litre milk".
         """
         items = []
-        # Pattern: optional number + optional unit + product name
-        pattern = r"(\d+(?:\.\d+)?)\s*(kg|g|l|ltr|litre|liter|pcs|pkt|doz|kilo|gram|piece|packet)?\s+([a-zA-Z\s]+?)(?:,|and|$)"
-        matches = re.findall(pattern, normalized, re.IGNORECASE)
+        matches = _ITEM_PATTERN.findall(normalized)
 
         for qty_str, unit, product in matches:
             product = product.strip()
@@ -245,12 +457,22 @@ Rules:
     # 5.2 Product matching with fuzzy algorithm
     # ------------------------------------------------------------------
 
-    def match_products(self, parsed_items: list[dict], store_products: list[dict]) -> list[dict]:
+    def match_products(
+        self,
+        parsed_items: list[dict],
+        store_products: list[dict],
+        store_id: Optional[str] = None,
+        catalog_version: Optional[str] = None,
+    ) -> list[dict]:
         """
         5.2.1 Fuzzy matching against store products.
         5.2.2 Handles typos and variations.
         5.2.3 Threshold: 70%.
 
+        Candidates come from the store's trigram ProductIndex (built once per
+        catalog), so only a short list is scored per item. ``catalog_version``
+        (the catalog ETag) lets an unchanged catalog skip re-hashing.
+
         Returns list of match results:
             {
                 "item": original parsed item,
@@ -259,32 +481,21 @@ Rules:
             }
         """
         try:
-            from fuzzywuzzy import fuzz
+            from product_index import ProductIndex, get_product_index
         except ImportError:
-            logger.warning("fuzzywuzzy not installed — using simple string matching")
+            logger.warning("rapidfuzz not installed — using simple string matching")
             return self._simple_match_products(parsed_items, store_products)
 
-        results = []
-        THRESHOLD = 70
+        if store_id:
+            index = get_product_index(
+                store_id, store_products, HINDI_PRODUCT_MAP, version=catalog_version
+            )
+        else:
+            index = ProductIndex(store_products, HINDI_PRODUCT_MAP)
 
+        results = []
         for item in parsed_items:
-            query = item.get("product", "").lower().strip()
-            candidates = []
-
-            for product in store_products:
-                name = product.get("name", "").lower()
-                # Use multiple fuzz strategies and take the best
-                score = max(
-                    fuzz.ratio(query, name),
-                    fuzz.partial_ratio(query, name),
-                    fuzz.token_sort_ratio(query, name),
-                    # Also compare against individual words in the product name
-                    max((fuzz.ratio(query, word) for word in name.split()), default=0),
-                )
-                if score >= THRESHOLD:
-                    candidates.append({"product": product, "score": score})
-
-            candidates.sort(key=lambda x: x["score"], reverse=True)
+            candidates = index.search(item.get("product", ""))
 
             if not candidates:
                 status = "not_found"
@@ -303,7 +514,7 @@ Rules:
         return results
 
     def _simple_match_products(self, parsed_items: list[dict], store_products: list[dict]) -> list[dict]:
-        """Simple substring matching fallback when fuzzywuzzy is unavailable."""
+        """Simple substring matching fallback when rapidfuzz is unavailable."""
         results = []
         for item in parsed_items:
             query = item.get("product", "").lower().strip()
@@ -337,4 +548,6 @@ Rules:
             "total_errors": self._parse_errors,
             "error_rate_pct": round(error_rate, 2),
             "avg_latency_ms": round(avg_latency, 1),
+            "cache_hits": self._cache_hits,
+            "fast_path_hits": self._fast_path_hits,
         }
@@ -0,0 +1,199 @@
+"""
+Product Index - Shortlist-then-score product matching
+Task 5.2: Product matching with fuzzy algorithm (threshold 70%)
+
+Each store's catalog is indexed once. Every product name, plus its Hindi
+and English alias variants from HINDI_PRODUCT_MAP, goes into a word
+inverted index, and the catalog vocabulary into a character-trigram index
+so typos still find their word. A query is narrowed to a short candidate
+list through the two indexes, and only that list is scored with rapidfuzz
+``process.extract`` using the parser's four similarity measures, which
+keeps matching well under a millisecond on 10k-product catalogs.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from rapidfuzz import fuzz, process
+
+THRESHOLD = 70
+SHORTLIST_SIZE = 50
+# Catalog words considered per query word (typos / partial words)
+SIMILAR_WORDS = 5
+MAX_CACHED_STORES = 64
+
+
+def _trigrams(word: str) -> set[str]:
+    """Padded trigrams, so short words and typos still share grams."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _combined_score(query: str, choice: str, *, score_cutoff: Optional[float] = None, **kwargs) -> float:
+    """Best of ratio / partial / token-sort / per-word ratio (5.2.1, 5.2.2)."""
+    score = max(
+        fuzz.ratio(query, choice),
+        fuzz.partial_ratio(query, choice),
+        fuzz.token_sort_ratio(query, choice),
+        max((fuzz.ratio(query, word) for word in choice.split()), default=0),
+    )
+    if score_cutoff is not None and score < score_cutoff:
+        return 0
+    return score
+
+
+class ProductIndex:
+    """Trigram inverted index over one store's product names and aliases."""
+
+    def __init__(self, products: list[dict], aliases: Optional[dict[str, str]] = None):
+        """``aliases`` maps Hindi words to English (HINDI_PRODUCT_MAP)."""
+        self.products = products
+        aliases = aliases or {}
+        self._aliases = aliases
+        self._to_english = self._compile(aliases)
+        english_to_hindi: dict[str, list[str]] = {}
+        for hindi, english in aliases.items():
+            if hindi != english:
+                english_to_hindi.setdefault(english, []).append(hindi)
+        self._english_to_hindi = english_to_hindi
+        self._to_hindi = self._compile({e: e for e in english_to_hindi})
+
+        # key -> searchable text; key -> product position
+        self._texts: list[str] = []
+        self._owner: list[int] = []
+        # catalog word -> keys containing it; trigram -> catalog words
+        self._word_postings: dict[str, set[int]] = {}
+        self._gram_postings: dict[str, list[str]] = {}
+        for position, product in enumerate(products):
+            for text in self._variants(product.get("name", "").lower().strip()):
+                key = len(self._texts)
+                self._texts.append(text)
+                self._owner.append(position)
+                for word in text.split():
+                    self._word_postings.setdefault(word, set()).add(key)
+        for word in self._word_postings:
+            for gram in _trigrams(word):
+                self._gram_postings.setdefault(gram, []).append(word)
+
+    @staticmethod
+    def _compile(terms) -> Optional[re.Pattern]:
+        if not terms:
+            return None
+        alternation = "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True))
+        return re.compile(r"\b(?:" + alternation + r")\b")
+
+    def _normalize(self, text: str) -> str:
+        if self._to_english is None:
+            return text
+        return self._to_english.sub(lambda m: self._aliases[m.group(0)], text)
+
+    def _variants(self, name: str) -> list[str]:
+        """Name, its English form, and one Hindi form per alias of an English term."""
+        if not name:
+            return []
+        variants = [name]
+        english = self._normalize(name)
+        if english != name:
+            variants.append(english)
+        if self._to_hindi is not None:
+            for term in set(self._to_hindi.findall(english)):
+                for hindi in self._english_to_hindi[term]:
+                    variants.append(re.sub(r"\b" + re.escape(term) + r"\b", hindi, english))
+        return list(dict.fromkeys(variants))
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def _similar_words(self, word: str) -> list[str]:
+        """Catalog words close to ``word``, found through the trigram index."""
+        if word in self._word_postings:
+            return [word]
+        grams: Counter = Counter()
+        for gram in _trigrams(word):
+            grams.update(self._gram_postings.get(gram, ()))
+        if not grams:
+            return []
+        candidates = [w for w, _ in grams.most_common(SHORTLIST_SIZE)]
+        return [
+            match for match, _, _ in process.extract(
+                word, candidates, scorer=fuzz.ratio, score_cutoff=THRESHOLD, limit=SIMILAR_WORDS
+            )
+        ]
+
+    def _shortlist(self, query: str) -> dict[int, str]:
+        """Keys sharing the most (fuzzily) matching words with the query."""
+        word_keys = []
+        for word in dict.fromkeys(query.split()):
+            keys: set[int] = set()
+            for similar in self._similar_words(word):
+                keys |= self._word_postings[similar]
+            if keys:
+                word_keys.append(keys)
+        if not word_keys:
+            return {}
+        # Keys matching every word need no ranking; otherwise rank by overlap
+        common = set.intersection(*word_keys)
+        if len(common) >= SHORTLIST_SIZE:
+            shortlist = sorted(common)[:SHORTLIST_SIZE]
+        else:
+            hits: Counter = Counter()
+            for keys in word_keys:
+                hits.update(keys)
+            shortlist = [key for key, _ in hits.most_common(SHORTLIST_SIZE)]
+        return {key: self._texts[key] for key in shortlist}
+
+    def search(self, query: str, threshold: int = THRESHOLD) -> list[dict]:
+        """Return [{"product": ..., "score": int}] above threshold, best first."""
+        query = self._normalize(query.lower().strip())
+        if not query:
+            return []
+        choices = self._shortlist(query)
+        if not choices:
+            return []
+        best: dict[int, int] = {}
+        for _, score, key in process.extract(
+            query, choices, scorer=_combined_score, score_cutoff=threshold, limit=None
+        ):
+            position = self._owner[key]
+            best[position] = max(best.get(position, 0), int(round(score)))
+        ranked = sorted(best.items(), key=lambda kv: kv[1], reverse=True)
+        return [{"product": self.products[position], "score": score} for position, score in ranked]
+
+
+# ---------------------------------------------------------------------------
+# Per-store cache
+# ---------------------------------------------------------------------------
+
+_indexes: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def _catalog_signature(products: list[dict]) -> int:
+    return hash(tuple((p.get("product_id"), p.get("name")) for p in products))
+
+
+def get_product_index(
+    store_id: str,
+    products: list[dict],
+    aliases: Optional[dict[str, str]] = None,
+    version: Optional[str] = None,
+) -> ProductIndex:
+    """
+    Return the store's index, rebuilding it only when the catalog changed.
+    ``version`` (e.g. a catalog ETag) skips hashing the product list.
+    """
+    signature = version if version is not None else _catalog_signature(products)
+    cached = _indexes.get(store_id)
+    if cached and cached[0] == signature:
+        _indexes.move_to_end(store_id)
+        cached[1].products = products
+        return cached[1]
+    index = ProductIndex(products, aliases)
+    _indexes[store_id] = (signature, index)
+    _indexes.move_to_end(store_id)
+    while len(_indexes) > MAX_CACHED_STORES:
+        _indexes.popitem(last=False)
+    return index
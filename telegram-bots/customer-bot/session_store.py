@@ -0,0 +1,223 @@
+"""
+Session Store - per-user bot session state shared by all bot replicas
+
+A session holds the user's current store binding (store_id) and the
+onboarding answers collected so far. Sessions live in a Redis hash per
+user (bot_session:{user_id}, refreshed TTL on every write). A small
+in-process LRU sits in front of it, so a user chatting away resolves their
+session without a network call. Local copies are trusted for
+LOCAL_TTL_SECONDS only, because another replica may rebind the user to a
+different store. Writes merge into the shared hash and bring back the whole
+session in the same round-trip, so a replica that never saw the user still
+ends up with the fields other replicas saved.
+
+When neither the LRU nor Redis knows the user (first contact after a
+restart, or an expired session), ``get_store_id`` asks ``store_loader``,
+normally a lookup of the user's most recent ``customers`` row, and saves
+the answer.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Protocol
+
+# Allow importing redis_client from agent-service
+_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(_root / "agent-service"))
+
+try:
+    from redis_client import get_async_client as _get_async_redis
+    _REDIS_AVAILABLE = True
+except ImportError:
+    _REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL_SECONDS = 30 * 24 * 3600   # 30 days
+LOCAL_TTL_SECONDS = 30
+MAX_LOCAL_SESSIONS = 10_000
+# Skip the backend for this long after an error instead of failing every call
+BACKEND_RETRY_SECONDS = 60
+
+
+class SessionBackend(Protocol):
+    async def load(self, user_id: int | str) -> dict: ...
+    async def save(self, user_id: int | str, fields: dict) -> dict: ...
+    async def delete(self, user_id: int | str) -> None: ...
+
+
+class MemorySessionBackend:
+    """Process-local backend (single replica, tests, Redis not installed)."""
+
+    def __init__(self):
+        self._sessions: dict[str, dict] = {}
+
+    async def load(self, user_id: int | str) -> dict:
+        return dict(self._sessions.get(str(user_id), {}))
+
+    async def save(self, user_id: int | str, fields: dict) -> dict:
+        session = self._sessions.setdefault(str(user_id), {})
+        session.update(fields)
+        return dict(session)
+
+    async def delete(self, user_id: int | str) -> None:
+        self._sessions.pop(str(user_id), None)
+
+
+class RedisSessionBackend:
+    """One hash per user; values are JSON-encoded so None survives."""
+
+    def __init__(self, redis_factory: Optional[Callable] = None, ttl_seconds: int = SESSION_TTL_SECONDS):
+        self._redis_factory = redis_factory or _get_async_redis
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def _key(user_id: int | str) -> str:
+        return f"bot_session:{user_id}"
+
+    async def load(self, user_id: int | str) -> dict:
+        raw = await self._redis_factory().hgetall(self._key(user_id))
+        return {field: json.loads(value) for field, value in (raw or {}).items()}
+
+    async def save(self, user_id: int | str, fields: dict) -> dict:
+        """Merge ``fields`` into the hash; returns the whole stored session."""
+        key = self._key(user_id)
+        pipe = self._redis_factory().pipeline(transaction=False)
+        pipe.hset(key, mapping={field: json.dumps(value) for field, value in fields.items()})
+        pipe.expire(key, self.ttl_seconds)
+        pipe.hgetall(key)
+        *_, raw = await pipe.execute()
+        return {field: json.loads(value) for field, value in (raw or {}).items()}
+
+    async def delete(self, user_id: int | str) -> None:
+        await self._redis_factory().delete(self._key(user_id))
+
+
+def default_backend() -> SessionBackend:
+    return RedisSessionBackend() if _REDIS_AVAILABLE else MemorySessionBackend()
+
+
+class SessionStore:
+    """Bot sessions: in-process LRU in front of a shared backend."""
+
+    def __init__(
+        self,
+        backend: Optional[SessionBackend] = None,
+        store_loader: Optional[Callable[[int | str], Awaitable[Optional[str]]]] = None,
+        local_ttl: float = LOCAL_TTL_SECONDS,
+        max_local: int = MAX_LOCAL_SESSIONS,
+    ):
+        self.backend = backend or default_backend()
+        self._store_loader = store_loader
+        self.local_ttl = local_ttl
+        self.max_local = max_local
+        # user_id -> (loaded_at, session)
+        self._local: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._backend_down_until = 0.0
+        self.metrics = {"local_hits": 0, "backend_loads": 0, "store_lookups": 0}
+
+    # ------------------------------------------------------------------
+    # Local LRU
+    # ------------------------------------------------------------------
+
+    def _remember(self, user_id: str, session: dict) -> None:
+        self._local[user_id] = (time.monotonic(), session)
+        self._local.move_to_end(user_id)
+        while len(self._local) > self.max_local:
+            self._local.popitem(last=False)
+
+    def _backend_usable(self) -> bool:
+        return time.monotonic() >= self._backend_down_until
+
+    def _backend_failed(self, operation: str, exc: Exception) -> None:
+        logger.warning("Session backend %s failed, using local sessions for %ss: %s",
+                       operation, BACKEND_RETRY_SECONDS, exc)
+        self._backend_down_until = time.monotonic() + BACKEND_RETRY_SECONDS
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    async def _load_shared(self, key: str) -> Optional[dict]:
+        """Session from the backend (remembered locally), or None if it is unavailable."""
+        if not self._backend_usable():
+            return None
+        try:
+            session = await self.backend.load(key)
+        except Exception as exc:
+            self._backend_failed("load", exc)
+            return None
+        self.metrics["backend_loads"] += 1
+        self._remember(key, session)
+        return session
+
+    async def _get(self, key: str) -> tuple[dict, bool]:
+        """(session, served from the local copy)."""
+        cached = self._local.get(key)
+        if cached and time.monotonic() - cached[0] < self.local_ttl:
+            self._local.move_to_end(key)
+            self.metrics["local_hits"] += 1
+            return dict(cached[1]), True
+        session = await self._load_shared(key)
+        if session is not None:
+            return dict(session), False
+        # Backend unavailable: a stale local copy beats no session
+        return (dict(cached[1]), True) if cached else ({}, False)
+
+    async def get(self, user_id: int | str) -> dict:
+        """The user's session (a copy; change it through ``update``)."""
+        session, _ = await self._get(str(user_id))
+        return session
+
+    async def update(self, user_id: int | str, **fields) -> dict:
+        """Set session fields in the backend (and locally); returns the whole session."""
+        key = str(user_id)
+        if self._backend_usable():
+            try:
+                # The backend merges, so fields saved by other replicas are kept
+                session = await self.backend.save(key, fields)
+                self._remember(key, session)
+                return dict(session)
+            except Exception as exc:
+                self._backend_failed("save", exc)
+        cached = self._local.get(key)
+        session = {**(cached[1] if cached else {}), **fields}
+        self._remember(key, session)
+        return dict(session)
+
+    async def delete(self, user_id: int | str) -> None:
+        key = str(user_id)
+        self._local.pop(key, None)
+        if self._backend_usable():
+            try:
+                await self.backend.delete(key)
+            except Exception as exc:
+                self._backend_failed("delete", exc)
+
+    async def get_store_id(self, user_id: int | str) -> Optional[str]:
+        """Store the user is shopping at, restoring the binding if the session is gone."""
+        key = str(user_id)
+        session, local = await self._get(key)
+        if "store_id" not in session and local:
+            # The local copy may predate a binding saved by another replica
+            session = await self._load_shared(key) or session
+        # A None store_id is a recent failed lookup (kept locally only)
+        if "store_id" in session or self._store_loader is None:
+            return session.get("store_id")
+        self.metrics["store_lookups"] += 1
+        try:
+            store_id = await self._store_loader(user_id)
+        except Exception as exc:
+            logger.warning("Store binding lookup failed for %s: %s", user_id, exc)
+            return None
+        if store_id:
+            await self.update(user_id, store_id=store_id)
+        else:
+            self._remember(key, {**session, "store_id": None})
+        return store_id
@@ -0,0 +1,90 @@
+"""
+Tests for the customer bot's per-store catalog cache
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+# Add customer-bot directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from catalog_cache import CatalogCache
+
+
+PRODUCTS = [
+    {"product_id": "p1", "name": "Basmati Rice", "price": 80, "unit": "kg", "available": 50},
+    {"product_id": "p2", "name": "White Sugar", "price": 45, "unit": "kg", "available": 30},
+]
+
+
+def _cache_with(handler, fresh_seconds=60):
+    """CatalogCache whose HTTP client is served by ``handler``."""
+    requests = []
+
+    def record(request):
+        requests.append(request)
+        return handler(request)
+
+    cache = CatalogCache("http://customer-service", fresh_seconds=fresh_seconds)
+    cache._client = httpx.AsyncClient(
+        base_url=cache.base_url, transport=httpx.MockTransport(record)
+    )
+    return cache, requests
+
+
+def _catalog_handler(request):
+    if request.headers.get("if-none-match") == 'W/"v1"':
+        return httpx.Response(304, headers={"ETag": 'W/"v1"'})
+    return httpx.Response(200, json={"success": True, "products": PRODUCTS}, headers={"ETag": 'W/"v1"'})
+
+
+class TestCatalogCache:
+    def test_fresh_catalog_served_from_memory(self):
+        cache, requests = _cache_with(_catalog_handler)
+
+        async def scenario():
+            await cache.get_products("s1")
+            return await cache.get_product("s1", "p2")
+
+        product = asyncio.run(scenario())
+        assert product["name"] == "White Sugar"
+        assert len(requests) == 1
+
+    def test_invalidated_catalog_revalidates_with_etag(self):
+        cache, requests = _cache_with(_catalog_handler)
+
+        async def scenario():
+            first = await cache.get_entry("s1")
+            cache.invalidate("s1")
+            second = await cache.get_entry("s1")
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert second is first
+        assert requests[1].headers["if-none-match"] == 'W/"v1"'
+
+    def test_stale_copy_served_when_service_fails(self):
+        calls = {"n": 0}
+
+        def flaky(request):
+            calls["n"] += 1
+            if calls["n"] > 1:
+                return httpx.Response(503)
+            return _catalog_handler(request)
+
+        cache, _ = _cache_with(flaky, fresh_seconds=0)
+
+        async def scenario():
+            await cache.get_products("s1")
+            return await cache.get_products("s1")
+
+        assert asyncio.run(scenario()) == PRODUCTS
+
+    def test_first_fetch_failure_raises(self):
+        cache, _ = _cache_with(lambda request: httpx.Response(500))
+        with pytest.raises(httpx.HTTPStatusError):
+            asyncio.run(cache.get_products("s1"))
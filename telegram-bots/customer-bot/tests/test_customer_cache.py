@@ -0,0 +1,108 @@
+"""
+Tests for the customer bot's customer row cache
+"""
+
+import sys
+import asyncio
+import json
+from pathlib import Path
+
+# Add customer-bot directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from customer_cache import CustomerCache
+
+
+CUSTOMERS = {("101", "s1"): {"id": "c1", "name": "Asha", "telegram_chat_id": "101", "store_id": "s1"}}
+
+
+def _cache(**kwargs):
+    calls = []
+
+    async def loader(telegram_id, store_id):
+        calls.append((telegram_id, store_id))
+        await asyncio.sleep(0)
+        row = CUSTOMERS.get((telegram_id, store_id))
+        return dict(row) if row else None
+
+    return CustomerCache(loader, **kwargs), calls
+
+
+class TestCustomerCache:
+    def test_repeat_lookups_cost_one_query(self):
+        cache, calls = _cache()
+
+        async def scenario():
+            concurrent = await asyncio.gather(*(cache.get(101, "s1") for _ in range(5)))
+            return concurrent + [await cache.get(101, "s1")]
+
+        rows = asyncio.run(scenario())
+        assert all(row["name"] == "Asha" for row in rows)
+        assert calls == [("101", "s1")]
+
+    def test_unregistered_user_cached_briefly(self):
+        cache, calls = _cache(missing_ttl=0)
+
+        async def scenario():
+            return [await cache.get(999, "s1"), await cache.get(999, "s1")]
+
+        assert asyncio.run(scenario()) == [None, None]
+        assert len(calls) == 2
+
+    def test_profile_edit_invalidates(self):
+        cache, calls = _cache()
+
+        async def scenario():
+            await cache.get(101, "s1")
+            await cache.publish_invalidation(101, "s1")
+            await cache.get(101, "s1")
+
+        asyncio.run(scenario())
+        assert len(calls) == 2
+
+    def test_credit_event_invalidates_by_customer_id(self):
+        cache, calls = _cache()
+
+        async def scenario():
+            await cache.get(101, "s1")
+            cache._apply(json.dumps({"customer_ids": ["c1"]}))
+            await cache.get(101, "s1")
+
+        asyncio.run(scenario())
+        assert len(calls) == 2
+
+    def test_returned_rows_are_copies(self):
+        cache, _ = _cache()
+
+        async def scenario():
+            row = await cache.get(101, "s1")
+            row["name"] = "changed"
+            return await cache.get(101, "s1")
+
+        assert asyncio.run(scenario())["name"] == "Asha"
+
+    def test_invalidation_during_load_is_not_overwritten(self):
+        cache, calls = _cache()
+
+        async def scenario():
+            load = asyncio.create_task(cache.get(101, "s1"))
+            await asyncio.sleep(0)  # loader has started reading the old row
+            cache.invalidate(101, "s1")
+            await load
+            await cache.get(101, "s1")
+
+        asyncio.run(scenario())
+        assert len(calls) == 2
+
+    def test_customer_event_during_load_is_not_overwritten(self):
+        cache, calls = _cache()
+
+        async def scenario():
+            load = asyncio.create_task(cache.get(101, "s1"))
+            await asyncio.sleep(0)
+            cache._apply(json.dumps({"customer_ids": ["c1"]}))
+            await load
+            await cache.get(101, "s1")
+
+        asyncio.run(scenario())
+        assert len(calls) == 2
@@ -14,11 +14,13 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from nlp_order_parser import (
     ConversationalOrderParser,
+    SynonymNormalizer,
     normalize_hindi_english,
     HINDI_PRODUCT_MAP,
     HINDI_UNIT_MAP,
 )
 from conversation_manager import (
+    AsyncConversationManager,
     ConversationManager,
     STATE_BROWSING,
     STATE_ORDERING,
@@ -94,6 +96,47 @@ class TestHindiEnglishNormalization:
         assert "rice" in result
         assert "sugar" in result
 
+    def test_longest_term_wins(self):
+        result = normalize_hindi_english("2 kilo gram rice")
+        assert result == "2 kg rice"
+
+    def test_replacements_are_not_rescanned(self):
+        normalizer = SynonymNormalizer({"a": "b", "b": "c"})
+        assert normalizer.normalize("a b") == "b c"
+
+    def test_store_synonyms_extend_defaults(self):
+        normalizer = SynonymNormalizer({"chawal": "rice"}).extend({"kaju": "cashew"})
+        assert normalizer.normalize("1 kg kaju aur 2 kg chawal") == "1 kg cashew aur 2 kg rice"
+
+    def test_parser_uses_store_synonyms(self):
+        from unittest.mock import MagicMock
+        db = MagicMock()
+        db.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {"term": "Kaju", "replacement": "cashew"}
+        ]
+        parser = ConversationalOrderParser(supabase_client=db)
+        normalized = asyncio.run(parser.get_normalizer("store-1")).normalize("kaju chawal")
+        assert normalized == "cashew rice"
+        # Cached: the second lookup does not hit the DB again
+        asyncio.run(parser.get_normalizer("store-1"))
+        assert db.table.call_count == 1
+
+    def test_store_normalizer_cache_is_bounded(self, monkeypatch):
+        from unittest.mock import MagicMock
+        import nlp_order_parser
+        monkeypatch.setattr(nlp_order_parser, "MAX_STORE_NORMALIZERS", 2)
+        db = MagicMock()
+        db.table.return_value.select.return_value.eq.return_value.execute.return_value.data = []
+        parser = ConversationalOrderParser(supabase_client=db)
+
+        async def scenario():
+            for store_id in ("s1", "s2", "s1", "s3"):
+                await parser.get_normalizer(store_id)
+
+        asyncio.run(scenario())
+        # s2 was least recently used
+        assert list(parser._store_normalizers) == ["s1", "s3"]
+
 
 # ---------------------------------------------------------------------------
 # 5.2 Fuzzy product matching tests
@@ -325,6 +368,61 @@ class TestConversationManager:
         assert "205" in summary  # 2*80 + 1*45 = 205
 
 
+# ---------------------------------------------------------------------------
+# 5.1.1 Async LLM parsing: fast path and parse cache
+# ---------------------------------------------------------------------------
+
+class _FakeAsyncRedis:
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+
+
+def _llm_parser(parser, reply='{"intent": "place_order", "items": [{"product": "rice", "quantity": 2, "unit": "kg"}]}'):
+    from unittest.mock import AsyncMock, MagicMock
+    response = MagicMock()
+    response.content = [MagicMock(text=reply)]
+    parser.claude_client = MagicMock()
+    parser.claude_client.messages.create = AsyncMock(return_value=response)
+    parser._redis = _FakeAsyncRedis()
+    return parser
+
+
+class TestAsyncParsing:
+    def test_simple_order_skips_llm(self, parser):
+        _llm_parser(parser)
+        result = asyncio.run(parser.parse_order("2 kg rice, 1 l milk"))
+        assert result["fast_path"] is True
+        assert [i["product"] for i in result["items"]] == ["rice", "milk"]
+        parser.claude_client.messages.create.assert_not_awaited()
+
+    def test_conversational_message_uses_llm(self, parser):
+        _llm_parser(parser)
+        result = asyncio.run(parser.parse_order("mujhe 2 kilo chawal chahiye"))
+        assert result["items"][0]["product"] == "rice"
+        parser.claude_client.messages.create.assert_awaited_once()
+
+    def test_repeated_phrasing_served_from_cache(self, parser):
+        _llm_parser(parser)
+        asyncio.run(parser.parse_order("mujhe 2 kilo chawal chahiye"))
+        result = asyncio.run(parser.parse_order("Mujhe 2 KILO chawal chahiye"))
+        assert result["cached"] is True
+        assert parser.claude_client.messages.create.await_count == 1
+        assert parser.get_performance_metrics()["cache_hits"] == 1
+
+    def test_llm_error_falls_back_to_regex(self, parser):
+        from unittest.mock import AsyncMock
+        _llm_parser(parser)
+        parser.claude_client.messages.create = AsyncMock(side_effect=TimeoutError("timed out"))
+        result = asyncio.run(parser.parse_order("mujhe 2 kilo chawal chahiye"))
+        assert result.get("fallback") is True
+
+
 # ---------------------------------------------------------------------------
 # 5.10 NLP performance monitoring tests
 # ---------------------------------------------------------------------------
@@ -414,3 +512,36 @@ class TestNLPAccuracy:
 
         accuracy = correct / len(test_cases) * 100
         assert accuracy >= 90, f"Product extraction accuracy {accuracy:.1f}% below 90%"
+
+
+class TestAsyncConversationManager:
+    """AsyncConversationManager (in-memory fallback) mirrors the sync API."""
+
+    def test_add_message_returns_context(self):
+        manager = AsyncConversationManager()
+        ctx = asyncio.run(manager.add_message(2001, "user", "2kg rice"))
+        assert ctx["state"] == STATE_BROWSING
+        assert ctx["last_messages"][-1]["content"] == "2kg rice"
+
+    def test_add_items_to_cart_sets_fields_in_one_call(self):
+        manager = AsyncConversationManager()
+        item = {"product_id": "p1", "product_name": "Rice", "quantity": 2, "unit": "kg", "unit_price": 80}
+
+        async def scenario():
+            await manager.set_pending_clarification(2002, {"item": {"product": "rice"}, "options": []})
+            cart = await manager.add_items_to_cart(
+                2002, [item, {**item, "quantity": 1}],
+                pending_clarification=None, state=STATE_CONFIRMING,
+            )
+            return cart, await manager.get_context(2002)
+
+        cart, ctx = asyncio.run(scenario())
+        assert cart == [{**item, "quantity": 3}]
+        assert ctx["state"] == STATE_CONFIRMING
+        assert ctx["pending_clarification"] is None
+
+    def test_returned_context_is_a_copy(self):
+        manager = AsyncConversationManager()
+        ctx = asyncio.run(manager.add_message(2003, "user", "hi"))
+        ctx["current_cart"].append({"product_id": "x"})
+        assert asyncio.run(manager.get_cart(2003)) == []
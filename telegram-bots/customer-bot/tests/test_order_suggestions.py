@@ -0,0 +1,175 @@
+"""
+Tests for precomputed "last order" / "usual order" suggestions
+(agent-service/order_suggestions.py and the conversation managers).
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add customer-bot directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conversation_manager import AsyncConversationManager, ConversationManager
+from order_suggestions import (
+    SEED_SUGGESTIONS_LUA,
+    build_suggestions,
+    decode_suggestions,
+    record_order,
+    seed_args,
+    suggestions_key,
+)
+
+
+def _item(pid, name, quantity=1, price=10):
+    return {"product_id": pid, "product_name": name, "quantity": quantity, "unit_price": price}
+
+
+# Newest first, as the backfill query returns them
+ORDERS = [
+    {"id": "o3", "order_items": [_item("rice", "Rice", 2, 80), _item("salt", "Salt")]},
+    {"id": "o2", "order_items": [_item("rice", "Rice"), _item("oil", "Oil"), _item("oil", "Oil")]},
+    {"id": "o1", "order_items": [_item("rice", "Rice"), _item("oil", "Oil"), _item("milk", "Milk")]},
+]
+
+
+class _FakeQuery:
+    def __init__(self, rows, calls):
+        self._rows = rows
+        self.calls = calls
+
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            self.calls.append((name, args))
+            return self
+        return record
+
+    def execute(self):
+        return type("Result", (), {"data": self._rows})()
+
+
+class _FakeSupabase:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def table(self, name):
+        self.calls.append(("table", (name,)))
+        return _FakeQuery(self.rows, self.calls)
+
+
+class TestBuildSuggestions:
+    def test_last_order_and_top_products(self):
+        fields = build_suggestions(ORDERS)
+        decoded = decode_suggestions(fields["last_order"], fields["usual"])
+        assert fields["last_order_id"] == "o3"
+        assert decoded["last_order"][0] == _item("rice", "Rice", 2, 80)
+        # Frequency counts orders containing the product, not item rows
+        assert [(u["product_id"], u["count"]) for u in decoded["usual"]] == [
+            ("rice", 3), ("oil", 2), ("milk", 1),
+        ]
+        assert fields["count:oil"] == "2"
+
+    def test_customer_without_orders(self):
+        fields = build_suggestions([])
+        assert decode_suggestions(fields["last_order"], fields["usual"]) == {
+            "last_order": None, "usual": None,
+        }
+
+    def test_decode_tolerates_lua_empty_table(self):
+        assert decode_suggestions("{}", "{}") == {"last_order": None, "usual": None}
+
+
+class TestManagerFallback:
+    """Without Redis the managers rebuild suggestions with one joined query."""
+
+    def test_sync_manager_queries_orders_by_customer(self):
+        supabase = _FakeSupabase(ORDERS)
+        manager = ConversationManager()
+        assert manager.get_usual_order("c1", supabase)[0]["product_id"] == "rice"
+        assert ("table", ("orders",)) in supabase.calls
+        assert ("eq", ("customer_id", "c1")) in supabase.calls
+        assert manager.get_last_order_suggestion("c1", supabase)[1]["product_id"] == "salt"
+
+    def test_async_manager(self):
+        manager = AsyncConversationManager()
+        suggestions = asyncio.run(manager.get_order_suggestions("c1", _FakeSupabase(ORDERS)))
+        assert len(suggestions["usual"]) == 3
+        assert suggestions["last_order"][0]["product_id"] == "rice"
+
+    def test_query_error_returns_no_suggestions(self):
+        class _Broken:
+            def table(self, name):
+                raise RuntimeError("db down")
+
+        assert ConversationManager().get_last_order_suggestion("c1", _Broken()) is None
+
+
+class TestRedisSummary:
+    """RECORD_ORDER_LUA / SEED_SUGGESTIONS_LUA against fakeredis with Lua support."""
+
+    @pytest.fixture
+    def redis(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        return fakeredis.FakeRedis(decode_responses=True)
+
+    @staticmethod
+    def _seed(redis, customer_id, orders):
+        redis.register_script(SEED_SUGGESTIONS_LUA)(
+            keys=[suggestions_key(customer_id)], args=seed_args(build_suggestions(orders)))
+
+    def test_record_order_updates_summary_incrementally(self, redis):
+        self._seed(redis, "c1", [])
+        for order in reversed(ORDERS):
+            assert record_order("c1", order["id"], order["order_items"], redis_client=redis)
+
+        key = suggestions_key("c1")
+        decoded = decode_suggestions(*redis.hmget(key, "last_order", "usual"))
+        expected = build_suggestions(ORDERS)
+        assert decoded == decode_suggestions(expected["last_order"], expected["usual"])
+        assert redis.ttl(key) > 0
+
+    def test_record_order_is_idempotent(self, redis):
+        items = ORDERS[0]["order_items"]
+        self._seed(redis, "c2", [])
+        assert record_order("c2", "o9", items, redis_client=redis)
+        assert not record_order("c2", "o9", items, redis_client=redis)
+        assert redis.hget(suggestions_key("c2"), "count:rice") == "1"
+
+    def test_manager_seeds_missing_key_once(self, redis, monkeypatch):
+        manager = ConversationManager()
+        monkeypatch.setattr(manager, "_redis", lambda: redis)
+        supabase = _FakeSupabase(ORDERS)
+
+        assert manager.get_usual_order("c3", supabase)[0]["product_id"] == "rice"
+        queries = len(supabase.calls)
+        # Served from the seeded hash, no second query
+        assert manager.get_last_order_suggestion("c3", supabase)[0]["product_id"] == "rice"
+        assert len(supabase.calls) == queries
+
+        # New orders build on the seeded counts
+        record_order("c3", "o4", [_item("oil", "Oil")], redis_client=redis)
+        record_order("c3", "o5", [_item("oil", "Oil")], redis_client=redis)
+        usual = json.loads(redis.hget(suggestions_key("c3"), "usual"))
+        assert usual[0] == {"product_id": "oil", "product_name": "Oil", "count": 4}
+
+    def test_record_before_first_read_keeps_history(self, redis, monkeypatch):
+        # Existing customer at deploy time: no hash yet, history in the DB
+        new_order = {"id": "o4", "order_items": [_item("salt", "Salt")]}
+        assert not record_order("c4", "o4", new_order["order_items"], redis_client=redis)
+        assert not redis.exists(suggestions_key("c4"))
+
+        manager = ConversationManager()
+        monkeypatch.setattr(manager, "_redis", lambda: redis)
+        supabase = _FakeSupabase([new_order] + ORDERS)
+        usual = manager.get_usual_order("c4", supabase)
+
+        assert ("table", ("orders",)) in supabase.calls
+        assert [(u["product_id"], u["count"]) for u in usual] == [
+            ("rice", 3), ("oil", 2), ("salt", 2),
+        ]
+        assert manager.get_last_order_suggestion("c4", supabase)[0]["product_id"] == "salt"
@@ -0,0 +1,63 @@
+"""
+Tests for the indexed product matcher (Task 5.2)
+"""
+
+import sys
+from pathlib import Path
+import pytest
+
+pytest.importorskip("rapidfuzz")
+
+# Add customer-bot directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from product_index import ProductIndex, get_product_index
+
+
+ALIASES = {"chawal": "rice", "cheeni": "sugar", "atta": "wheat flour"}
+
+SAMPLE_PRODUCTS = [
+    {"product_id": "p1", "name": "Basmati Rice", "price": 80, "unit": "kg"},
+    {"product_id": "p2", "name": "Regular Rice", "price": 50, "unit": "kg"},
+    {"product_id": "p3", "name": "White Sugar", "price": 45, "unit": "kg"},
+    {"product_id": "p4", "name": "Wheat Flour", "price": 35, "unit": "kg"},
+    {"product_id": "p5", "name": "Cheeni Sulphurless", "price": 55, "unit": "kg"},
+]
+
+
+def _ids(matches):
+    return [m["product"]["product_id"] for m in matches]
+
+
+class TestProductIndex:
+    def test_word_match_returns_all_products_with_word(self):
+        index = ProductIndex(SAMPLE_PRODUCTS, ALIASES)
+        matches = index.search("rice")
+        assert set(_ids(matches)) == {"p1", "p2"}
+        assert all(m["score"] == 100 for m in matches)
+
+    def test_typo_found_through_trigrams(self):
+        index = ProductIndex(SAMPLE_PRODUCTS, ALIASES)
+        assert "p1" in _ids(index.search("basmti"))
+
+    def test_hindi_query_matches_english_name(self):
+        index = ProductIndex(SAMPLE_PRODUCTS, ALIASES)
+        assert set(_ids(index.search("chawal"))) == {"p1", "p2"}
+        assert _ids(index.search("atta"))[0] == "p4"
+
+    def test_english_query_matches_hindi_name(self):
+        index = ProductIndex(SAMPLE_PRODUCTS, ALIASES)
+        assert set(_ids(index.search("sugar"))) == {"p3", "p5"}
+
+    def test_unrelated_query_not_found(self):
+        index = ProductIndex(SAMPLE_PRODUCTS, ALIASES)
+        assert index.search("xyz123") == []
+
+    def test_store_index_is_reused_until_catalog_changes(self):
+        first = get_product_index("store-1", SAMPLE_PRODUCTS, ALIASES)
+        assert get_product_index("store-1", list(SAMPLE_PRODUCTS), ALIASES) is first
+
+        changed = SAMPLE_PRODUCTS + [{"product_id": "p6", "name": "Rock Salt"}]
+        rebuilt = get_product_index("store-1", changed, ALIASES)
+        assert rebuilt is not first
+        assert _ids(rebuilt.search("salt")) == ["p6"]
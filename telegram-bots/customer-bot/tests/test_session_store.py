@@ -0,0 +1,120 @@
+"""
+Tests for the shared bot session store
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+# Add customer-bot directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from session_store import MemorySessionBackend, SessionStore
+
+
+class _CountingBackend(MemorySessionBackend):
+    def __init__(self):
+        super().__init__()
+        self.loads = 0
+
+    async def load(self, user_id):
+        self.loads += 1
+        return await super().load(user_id)
+
+
+class _BrokenBackend:
+    async def load(self, user_id):
+        raise ConnectionError("redis down")
+
+    async def save(self, user_id, fields):
+        raise ConnectionError("redis down")
+
+    async def delete(self, user_id):
+        raise ConnectionError("redis down")
+
+
+class TestSessionStore:
+    def test_hot_sessions_resolve_locally(self):
+        backend = _CountingBackend()
+        store = SessionStore(backend=backend)
+
+        async def scenario():
+            await store.update(1, store_id="s1")
+            return [await store.get_store_id(1) for _ in range(3)]
+
+        assert asyncio.run(scenario()) == ["s1", "s1", "s1"]
+        assert backend.loads == 0
+
+    def test_sessions_shared_between_replicas(self):
+        backend = MemorySessionBackend()
+        replica_a, replica_b = SessionStore(backend=backend), SessionStore(backend=backend)
+
+        async def scenario():
+            await replica_a.update(7, store_id="s1", name="Asha")
+            return await replica_b.get(7)
+
+        assert asyncio.run(scenario()) == {"store_id": "s1", "name": "Asha"}
+
+    def test_lost_binding_restored_from_loader(self):
+        lookups = []
+
+        async def loader(user_id):
+            lookups.append(user_id)
+            return "s9" if user_id == 5 else None
+
+        store = SessionStore(backend=MemorySessionBackend(), store_loader=loader)
+
+        async def scenario():
+            found = [await store.get_store_id(5), await store.get_store_id(5)]
+            missing = [await store.get_store_id(6), await store.get_store_id(6)]
+            return found, missing
+
+        found, missing = asyncio.run(scenario())
+        assert found == ["s9", "s9"]
+        assert missing == [None, None]
+        # One lookup per user: the answer (or its absence) is remembered
+        assert lookups == [5, 6]
+
+    def test_backend_outage_falls_back_to_local_sessions(self):
+        store = SessionStore(backend=_BrokenBackend(), local_ttl=0)
+
+        async def scenario():
+            await store.update(3, store_id="s2")
+            return await store.get_store_id(3)
+
+        assert asyncio.run(scenario()) == "s2"
+
+    def test_update_on_fresh_replica_keeps_shared_fields(self):
+        backend = MemorySessionBackend()
+
+        async def scenario():
+            await SessionStore(backend=backend).update(1, store_id="s1", name="X")
+            fresh = SessionStore(backend=backend)
+            session = await fresh.update(1, birthday=None)
+            return session, await fresh.get(1)
+
+        session, cached = asyncio.run(scenario())
+        assert session == {"store_id": "s1", "name": "X", "birthday": None}
+        assert cached == session
+
+    def test_shared_binding_checked_before_loader(self):
+        lookups = []
+
+        async def loader(user_id):
+            lookups.append(user_id)
+            return "stale"
+
+        backend = MemorySessionBackend()
+        replica_a = SessionStore(backend=backend, store_loader=loader)
+        replica_b = SessionStore(backend=backend, store_loader=loader)
+
+        async def scenario():
+            # replica_b caches a session without a binding, then replica_a binds
+            await replica_b.get(2)
+            await replica_a.update(2, store_id="s1")
+            return await replica_b.get_store_id(2), await backend.load(2)
+
+        store_id, shared = asyncio.run(scenario())
+        assert store_id == "s1"
+        assert shared["store_id"] == "s1"
+        assert lookups == []
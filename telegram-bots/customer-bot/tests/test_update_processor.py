@@ -0,0 +1,98 @@
+"""
+Tests for the per-chat concurrent update processor
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+import pytest
+
+pytest.importorskip("telegram")
+
+# Add customer-bot directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from telegram import Update
+
+from update_processor import PerChatUpdateProcessor
+
+
+def _update(update_id: int, chat_id: int) -> Update:
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+                "text": "hi",
+            },
+        },
+        None,
+    )
+
+
+class TestPerChatUpdateProcessor:
+    def test_chats_run_in_parallel_and_in_order_within_a_chat(self):
+        processor = PerChatUpdateProcessor(max_concurrent_updates=8)
+        log = []
+
+        async def handle(name, delay):
+            log.append(("start", name))
+            await asyncio.sleep(delay)
+            log.append(("end", name))
+
+        async def scenario():
+            await asyncio.gather(
+                processor.process_update(_update(1, 100), handle("a1", 0.05)),
+                processor.process_update(_update(2, 100), handle("a2", 0)),
+                processor.process_update(_update(3, 200), handle("b1", 0)),
+            )
+
+        asyncio.run(scenario())
+        # Chat 200 is not blocked behind chat 100's slow update
+        assert log.index(("end", "b1")) < log.index(("end", "a1"))
+        # Chat 100's second update starts only after the first finished
+        assert log.index(("end", "a1")) < log.index(("start", "a2"))
+        assert processor.active_chats == 0
+
+    def test_concurrency_is_bounded(self):
+        processor = PerChatUpdateProcessor(max_concurrent_updates=2)
+        running = {"now": 0, "peak": 0}
+
+        async def handle():
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            await asyncio.sleep(0.01)
+            running["now"] -= 1
+
+        async def scenario():
+            await asyncio.gather(*(
+                processor.process_update(_update(i, 1000 + i), handle()) for i in range(6)
+            ))
+
+        asyncio.run(scenario())
+        assert running["peak"] == 2
+
+    def test_queued_updates_of_one_chat_hold_no_slot(self):
+        processor = PerChatUpdateProcessor(max_concurrent_updates=2)
+        finished = {}
+
+        async def handle(name, delay):
+            await asyncio.sleep(delay)
+            finished[name] = asyncio.get_running_loop().time()
+
+        async def scenario():
+            began = asyncio.get_running_loop().time()
+            await asyncio.gather(
+                *(processor.process_update(_update(i, 100), handle(f"a{i}", 0.1)) for i in range(3)),
+                processor.process_update(_update(9, 200), handle("b", 0.1)),
+            )
+            return {name: at - began for name, at in finished.items()}
+
+        finished_at = asyncio.run(scenario())
+        # Chat 100's backlog runs in one slot; chat 200 gets the other at once
+        assert finished_at["b"] < 0.2
+        assert finished_at["a0"] < finished_at["a1"] < finished_at["a2"]
+        assert processor.active_chats == 0
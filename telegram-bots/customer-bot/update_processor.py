@@ -0,0 +1,80 @@
+"""
+Per-chat update processor for the customer bot
+
+With ``concurrent_updates`` PTB hands every update to the processor as soon
+as it arrives, so one shopper's slow Supabase or LLM call no longer holds up
+everybody else. Updates from the same chat still run one at a time and in
+arrival order, which the onboarding ConversationHandlers and the NLP cart
+flow rely on. The base class bounds the number of updates in flight; updates
+waiting behind their own chat do not count against it.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import deque
+from typing import Any, Awaitable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_UPDATES = 256
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Concurrent across chats, sequential (FIFO) within a chat."""
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        # chat -> coroutines waiting for it; the head is running
+        self._chats: dict[Any, deque] = {}
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Runs inside the base class's concurrency slot. A chat that already
+        # has an update running gets this one queued behind it and the slot
+        # is handed back at once, so each chat holds at most one slot and a
+        # chatty user cannot starve everybody else.
+        key = self._chat_key(update)
+        if key is None:
+            await coroutine
+            return
+        queue = self._chats.get(key)
+        if queue is not None:
+            queue.append(coroutine)
+            return
+        queue = self._chats[key] = deque([coroutine])
+        try:
+            while queue:
+                try:
+                    await queue[0]
+                except Exception:
+                    logger.exception("Update for chat %s failed", key)
+                finally:
+                    queue.popleft()
+        finally:
+            del self._chats[key]
+            for pending in queue:
+                # Cancelled mid-queue: the remaining updates never run
+                pending.close()
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._chats)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
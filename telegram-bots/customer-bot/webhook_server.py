@@ -0,0 +1,96 @@
+"""
+Webhook server for the customer bot
+
+One ASGI app (Starlette under uvicorn) receives Telegram's webhook calls
+and answers the health checks Render probes. Updates are put on the
+Application's update queue, and the concurrent update processor
+(update_processor.py) takes it from there, so the HTTP handler returns to
+Telegram right away.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/telegram/webhook"
+# Parallel HTTPS connections Telegram may open to deliver updates (max 100)
+WEBHOOK_MAX_CONNECTIONS = 100
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def default_secret(bot_token: str) -> str:
+    """Stable webhook secret derived from the bot token (A-Z, a-z, 0-9 only)."""
+    return hashlib.sha256(f"webhook:{bot_token}".encode()).hexdigest()[:32]
+
+
+def build_webhook_app(
+    application: Application,
+    webhook_url: str,
+    secret_token: Optional[str] = None,
+) -> Starlette:
+    """
+    ASGI app that registers ``webhook_url`` + WEBHOOK_PATH with Telegram on
+    startup and feeds incoming updates to ``application``.
+    ``application`` must be built with ``.updater(None)``.
+    """
+    secret_token = secret_token or default_secret(application.bot.token)
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette):
+        async with application:
+            if application.post_init:
+                await application.post_init(application)
+            await application.bot.set_webhook(
+                url=f"{webhook_url.rstrip('/')}{WEBHOOK_PATH}",
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+            await application.start()
+            logger.info("Customer bot webhook registered at %s%s", webhook_url, WEBHOOK_PATH)
+            try:
+                yield
+            finally:
+                await application.stop()
+                if application.post_shutdown:
+                    await application.post_shutdown(application)
+
+    async def telegram_webhook(request: Request) -> Response:
+        if request.headers.get(SECRET_HEADER) != secret_token:
+            return Response(status_code=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return Response(status_code=400)
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        return Response()
+
+    async def home(request: Request) -> JSONResponse:
+        return JSONResponse({"status": "running", "service": "customer-bot", "mode": "webhook"})
+
+    async def health(request: Request) -> JSONResponse:
+        return JSONResponse({
+            "status": "healthy" if application.running else "starting",
+            "pending_updates": application.update_queue.qsize(),
+        })
+
+    return Starlette(
+        routes=[
+            Route(WEBHOOK_PATH, telegram_webhook, methods=["POST"]),
+            Route("/", home),
+            Route("/health", health),
+        ],
+        lifespan=lifespan,
+    )
@@ -8,10 +8,10 @@ from __future__ import annotations
 import os
 import sys
 import json
+import asyncio
 from datetime import datetime, timezone, timedelta
 
-from anthropic import Anthropic
-from telegram import Bot
+from anthropic import AsyncAnthropic
 from supabase import create_client
 from dotenv import load_dotenv
 from pathlib import Path
@@ -20,22 +20,204 @@ from pathlib import Path
 root_dir = Path(__file__).parent.parent.parent.parent
 load_dotenv(dotenv_path=root_dir / ".env")
 
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+from agents.outbound import CUSTOMER_BOT_TOKEN, PRIORITY_BULK, outbound  # noqa: E402
+
+client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 supabase = create_client(
     os.getenv("SUPABASE_URL"),
     os.getenv("SUPABASE_KEY"),
 )
-bot = Bot(token=os.getenv("CUSTOMER_BOT_TOKEN", ""))
+
+
+# ---------------------------------------------------------------------------
+# Bulk sends with a sent-message log
+# ---------------------------------------------------------------------------
+# Birthday wishes and re-engagement messages are logged so that the next run
+# does not message the customer again. Rows are inserted in chunks while the
+# sends complete and the rest in a finally, so a run cut off by the
+# scheduler's store timeout still records every message that went out.
+# Messages still queued by then are cancelled and left for the next run.
+
+SENT_LOG_CHUNK_SIZE = 50
+# Longest wait, once a run is cut off, for the sends already in flight
+SENT_LOG_IN_FLIGHT_WAIT = 15
+
+
+def _insert_sent_rows(table: str, rows: list[dict]) -> None:
+    supabase.table(table).insert(rows).execute()
+
+
+async def _send_and_log(table: str, sends: list[tuple[dict, str, dict]]) -> tuple[list[dict], int]:
+    """
+    Send each (customer, message_text, row) at bulk priority and insert the
+    row of every delivered message into ``table``.
+
+    Returns the rows logged and the number of failed sends.
+    """
+    rows = {}
+    for customer, message_text, row in sends:
+        future = outbound.submit(
+            CUSTOMER_BOT_TOKEN,
+            customer["telegram_chat_id"],
+            message_text,
+            priority=PRIORITY_BULK,
+            parse_mode="Markdown",
+        )
+        rows[future] = (customer, row)
+
+    delivered: list[dict] = []
+    logged: list[dict] = []
+    failed = 0
+
+    def collect(done) -> None:
+        nonlocal failed
+        for future in done:
+            if future.cancelled():
+                continue
+            customer, row = rows[future]
+            if future.exception() is not None:
+                print(f"❌ Failed to send {table} message to {customer.get('name')}: {future.exception()}")
+                failed += 1
+            else:
+                delivered.append(row)
+
+    pending = set(rows)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            collect(done)
+            while len(delivered) >= SENT_LOG_CHUNK_SIZE:
+                chunk = delivered[:SENT_LOG_CHUNK_SIZE]
+                del delivered[:SENT_LOG_CHUNK_SIZE]
+                logged.extend(chunk)
+                await asyncio.to_thread(_insert_sent_rows, table, chunk)
+    finally:
+        # Queued messages are dropped; those already being sent are waited
+        # for, so that a message that reached the customer is always logged
+        in_flight = outbound.cancel_queued(pending)
+        try:
+            if in_flight:
+                await asyncio.shield(asyncio.wait(in_flight, timeout=SENT_LOG_IN_FLIGHT_WAIT))
+        finally:
+            collect([future for future in pending if future.done()])
+            if delivered:
+                logged.extend(delivered)
+                # Shielded: a second cancellation must not lose the last rows
+                await asyncio.shield(asyncio.to_thread(_insert_sent_rows, table, delivered))
+    return logged, failed
 
 
 # ---------------------------------------------------------------------------
 # 3.3 Birthday Wishes Automation
 # ---------------------------------------------------------------------------
+# The day's messages are written overnight (prepare_birthday_messages) into
+# birthday_messages, so the 9 AM job only reads them: one query finds every
+# customer still to be wished together with their prepared message
+# (pending_birthday_wishes, migration 015), the messages go out concurrently
+# through the rate-limited outbound sender and the sent wishes are logged
+# in chunks as they go out.
+
+# Claude calls in flight at once while preparing messages
+BIRTHDAY_LLM_CONCURRENCY = int(os.getenv("BIRTHDAY_LLM_CONCURRENCY", "8"))
+# A message missing at send time may hold the job up for at most this long
+BIRTHDAY_SEND_TIME_LLM_TIMEOUT = 10
+# Prepared messages older than this are deleted by the overnight job
+BIRTHDAY_MESSAGE_RETENTION_DAYS = 7
+
+
+def _birthday_day() -> tuple[datetime, str]:
+    """Start of today (local clock) and its ISO date."""
+    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today_start, today_start.date().isoformat()
+
+
+def _pending_birthday_wishes(store_id: str | None, today_start: datetime) -> list[dict]:
+    """Customers with a birthday today and a Telegram chat who were not wished yet."""
+    params = {
+        "p_wish_date": today_start.date().isoformat(),
+        "p_since": today_start.isoformat(),
+    }
+    if store_id:
+        params["p_store_id"] = store_id
+    return supabase.rpc("pending_birthday_wishes", params).execute().data or []
+
+
+def _birthday_template(customer_name: str, store_name: str) -> str:
+    return (
+        f"🎂 Happy Birthday, {customer_name}! "
+        f"Wishing you a wonderful day from all of us at {store_name}! 🎉"
+    )
+
+
+async def _generate_birthday_messages(customers: list[dict], timeout: float | None = None) -> dict:
+    """customer_id -> message for ``customers``, with bounded concurrent Claude calls."""
+    semaphore = asyncio.Semaphore(BIRTHDAY_LLM_CONCURRENCY)
+
+    async def generate(customer: dict) -> str:
+        async with semaphore:
+            return await _generate_birthday_message(
+                customer.get("name") or "there",
+                customer.get("store_name") or "our store",
+                timeout=timeout,
+            )
+
+    messages = await asyncio.gather(*(generate(c) for c in customers))
+    return {c["customer_id"]: text for c, text in zip(customers, messages)}
+
+
+async def prepare_birthday_messages(store_id: str | None = None) -> dict:
+    """
+    Overnight job: write today's birthday messages for customers who do not
+    have one yet, so send_birthday_wishes needs no Claude calls.
+
+    Returns:
+        dict with prepared_count and already_prepared_count.
+    """
+    today_start, wish_date = _birthday_day()
+    prepared_count = 0
+    already_prepared_count = 0
+
+    try:
+        pending = await asyncio.to_thread(_pending_birthday_wishes, store_id, today_start)
+        missing = [c for c in pending if not c.get("message_text")]
+        already_prepared_count = len(pending) - len(missing)
+
+        if missing:
+            messages = await _generate_birthday_messages(missing)
+            rows = [
+                {
+                    "customer_id": c["customer_id"],
+                    "wish_date": wish_date,
+                    "store_id": c.get("store_id"),
+                    "message_text": messages[c["customer_id"]],
+                }
+                for c in missing
+            ]
+            await asyncio.to_thread(
+                supabase.table("birthday_messages")
+                .upsert(rows, on_conflict="customer_id,wish_date")
+                .execute
+            )
+            prepared_count = len(rows)
+
+        cutoff = (today_start - timedelta(days=BIRTHDAY_MESSAGE_RETENTION_DAYS)).date().isoformat()
+        cleanup = supabase.table("birthday_messages").delete().lt("wish_date", cutoff)
+        if store_id:
+            cleanup = cleanup.eq("store_id", store_id)
+        await asyncio.to_thread(cleanup.execute)
+
+    except Exception as exc:
+        print(f"❌ prepare_birthday_messages error: {exc}")
+
+    print(f"🎂 Birthday messages: {prepared_count} prepared, {already_prepared_count} already ready")
+    return {"prepared_count": prepared_count, "already_prepared_count": already_prepared_count}
+
 
 async def send_birthday_wishes(store_id: str | None = None) -> dict:
     """
-    Daily cron job: query customers with today's birthday and send AI-generated
-    personalized messages via Telegram.  Logs each wish in birthday_wishes_sent.
+    Daily cron job: send today's birthday messages via Telegram and log each
+    wish in birthday_wishes_sent. Messages come from the overnight job; any
+    that are missing are generated now (short timeout, template fallback).
 
     Args:
         store_id: If provided, only process customers for that store.
@@ -44,78 +226,44 @@ async def send_birthday_wishes(store_id: str | None = None) -> dict:
     Returns:
         dict with sent_count and skipped_count.
     """
-    today = datetime.now().strftime("%m-%d")  # MM-DD format
+    today_start, _ = _birthday_day()
     sent_count = 0
     skipped_count = 0
 
     try:
-        # 3.3.2 Query customers with today's birthday
-        query = (
-            supabase.table("customers")
-            .select("id, name, telegram_chat_id, store_id, stores(name)")
-            .eq("birthday", today)
+        # 3.3.2 Customers with today's birthday not yet wished (one query)
+        customers = await asyncio.to_thread(_pending_birthday_wishes, store_id, today_start)
+        if not customers:
+            print("🎂 Birthday wishes: nobody to wish")
+            return {"sent_count": 0, "skipped_count": 0}
+
+        # 3.3.3 Prepared overnight; generate only what is missing
+        missing = [c for c in customers if not c.get("message_text")]
+        generated = (
+            await _generate_birthday_messages(missing, timeout=BIRTHDAY_SEND_TIME_LLM_TIMEOUT)
+            if missing else {}
         )
-        if store_id:
-            query = query.eq("store_id", store_id)
-
-        customers_result = query.execute()
-        customers = customers_result.data or []
-
-        for customer in customers:
-            chat_id = customer.get("telegram_chat_id")
-            if not chat_id:
-                skipped_count += 1
-                continue
-
-            # Check if we already sent a wish today
-            today_start = datetime.now().replace(
-                hour=0, minute=0, second=0, microsecond=0
-            ).isoformat()
-            already_sent = (
-                supabase.table("birthday_wishes_sent")
-                .select("id")
-                .eq("customer_id", customer["id"])
-                .gte("sent_at", today_start)
-                .execute()
-            )
-            if already_sent.data:
-                skipped_count += 1
-                continue
-
-            store_name = (
-                customer["stores"]["name"]
-                if customer.get("stores")
-                else "our store"
-            )
-
-            # 3.3.3 Generate personalized message with AI
-            message_text = await _generate_birthday_message(
-                customer["name"], store_name
-            )
-
-            # 3.3.4 Send via Telegram
-            try:
-                await bot.send_message(
-                    chat_id=chat_id,
-                    text=message_text,
-                    parse_mode="Markdown",
-                )
-
-                # 3.3.5 Log in birthday_wishes_sent table
-                supabase.table("birthday_wishes_sent").insert(
+        for customer in missing:
+            customer["message_text"] = generated[customer["customer_id"]]
+
+        # 3.3.4 Send via Telegram; the outbound service paces the sends
+        # 3.3.5 Log in birthday_wishes_sent table (in chunks as sends complete)
+        sent_rows, skipped_count = await _send_and_log(
+            "birthday_wishes_sent",
+            [
+                (
+                    customer,
+                    customer["message_text"],
                     {
-                        "customer_id": customer["id"],
-                        "message_text": message_text,
+                        "customer_id": customer["customer_id"],
+                        "message_text": customer["message_text"],
                         "responded": False,
-                    }
-                ).execute()
-
-                sent_count += 1
-                print(f"🎂 Birthday wish sent to {customer['name']}")
-
-            except Exception as send_exc:
-                print(f"❌ Failed to send birthday wish to {customer['name']}: {send_exc}")
-                skipped_count += 1
+                    },
+                )
+                for customer in customers
+            ],
+        )
+        sent_count = len(sent_rows)
 
     except Exception as exc:
         print(f"❌ send_birthday_wishes error: {exc}")
@@ -124,7 +272,9 @@ async def send_birthday_wishes(store_id: str | None = None) -> dict:
     return {"sent_count": sent_count, "skipped_count": skipped_count}
 
 
-async def _generate_birthday_message(customer_name: str, store_name: str) -> str:
+async def _generate_birthday_message(
+    customer_name: str, store_name: str, timeout: float | None = None
+) -> str:
     """Use Claude to generate a warm, personalized birthday message."""
     try:
         prompt = (
@@ -132,18 +282,18 @@ async def _generate_birthday_message(customer_name: str, store_name: str) -> str
             f"from {store_name}. Keep it friendly, personal, and under 3 sentences. "
             f"Include a birthday emoji. Do NOT offer any discounts or promotions."
         )
-        response = client.messages.create(
-            model="claude-haiku-4-5",
-            max_tokens=150,
-            messages=[{"role": "user", "content": prompt}],
+        response = await asyncio.wait_for(
+            client.messages.create(
+                model="claude-haiku-4-5",
+                max_tokens=150,
+                messages=[{"role": "user", "content": prompt}],
+            ),
+            timeout=timeout,
         )
         return response.content[0].text.strip()
     except Exception as exc:
         print(f"⚠️ AI message generation failed, using fallback: {exc}")
-        return (
-            f"🎂 Happy Birthday, {customer_name}! "
-            f"Wishing you a wonderful day from all of us at {store_name}! 🎉"
-        )
+        return _birthday_template(customer_name, store_name)
 
 
 # ---------------------------------------------------------------------------
@@ -177,6 +327,36 @@ async def get_birthday_redemption_rate(store_id: str) -> dict:
 # ---------------------------------------------------------------------------
 # 3.5 Re-engagement via Telegram
 # ---------------------------------------------------------------------------
+# Both candidate sets come from one query each (migration 016); messages are
+# rendered in memory, sent concurrently through the rate-limited outbound
+# sender and logged in chunks as they go out.
+
+# Days before an unanswered first message gets a follow-up, and the minimum
+# gap between first messages to the same customer
+RE_ENGAGEMENT_INTERVAL_DAYS = 7
+
+
+def _days_since(last_order_raw: str | None) -> int:
+    if not last_order_raw:
+        return 0
+    last_order_date = datetime.fromisoformat(last_order_raw.replace("Z", "+00:00"))
+    if last_order_date.tzinfo is None:
+        last_order_date = last_order_date.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - last_order_date).days
+
+
+def _re_engagement_candidates(store_id: str, cutoff: str) -> tuple[list[dict], list[dict]]:
+    """(first-message candidates, follow-up candidates) for the store."""
+    first = supabase.rpc(
+        "re_engagement_first_candidates",
+        {"p_store_id": store_id, "p_since": cutoff},
+    ).execute()
+    followup = supabase.rpc(
+        "re_engagement_followup_candidates",
+        {"p_store_id": store_id, "p_sent_before": cutoff},
+    ).execute()
+    return first.data or [], followup.data or []
+
 
 async def run_re_engagement(store_id: str) -> dict:
     """
@@ -187,129 +367,55 @@ async def run_re_engagement(store_id: str) -> dict:
     sent_followup = 0
 
     try:
-        # --- First messages for newly detected at-risk customers ---
-        at_risk_result = (
-            supabase.table("customers")
-            .select("id, name, telegram_chat_id, churn_risk_level, last_order_date")
-            .eq("store_id", store_id)
-            .not_.is_("churn_risk_level", "null")
-            .execute()
+        cutoff = (
+            datetime.now(timezone.utc) - timedelta(days=RE_ENGAGEMENT_INTERVAL_DAYS)
+        ).isoformat()
+        first_candidates, followup_candidates = await asyncio.to_thread(
+            _re_engagement_candidates, store_id, cutoff
         )
-        at_risk_customers = at_risk_result.data or []
-
-        for customer in at_risk_customers:
-            chat_id = customer.get("telegram_chat_id")
-            if not chat_id:
-                continue
 
-            # Check if we already sent a first message recently (within 7 days)
-            cutoff = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
-            existing = (
-                supabase.table("re_engagement_messages")
-                .select("id")
-                .eq("customer_id", customer["id"])
-                .eq("store_id", store_id)
-                .gte("sent_at", cutoff)
-                .execute()
+        # A customer due a follow-up gets only that message in this run
+        followup_ids = {c["customer_id"] for c in followup_candidates}
+        batch = [
+            (customer, 2) for customer in followup_candidates
+        ] + [
+            (customer, 1) for customer in first_candidates
+            if customer["customer_id"] not in followup_ids
+        ]
+        if not batch:
+            print("📨 Re-engagement: nobody to message")
+            return {"sent_first": 0, "sent_followup": 0}
+
+        # 3.5.1 Personalized messages (no discounts)
+        messages = [
+            _generate_reengagement_message(
+                customer.get("name") or "there",
+                _days_since(customer.get("last_order_date")),
+                message_number=message_number,
             )
-            if existing.data:
-                continue  # Already messaged recently
-
-            last_order_raw = customer.get("last_order_date")
-            days_since = 0
-            if last_order_raw:
-                last_order_date = datetime.fromisoformat(
-                    last_order_raw.replace("Z", "+00:00")
-                )
-                days_since = (datetime.now(timezone.utc) - last_order_date).days
-
-            # 3.5.1 Generate personalized message (no discounts)
-            message_text = _generate_reengagement_message(
-                customer["name"], days_since, message_number=1
-            )
-
-            try:
-                await bot.send_message(
-                    chat_id=chat_id,
-                    text=message_text,
-                    parse_mode="Markdown",
-                )
-                supabase.table("re_engagement_messages").insert(
+            for customer, message_number in batch
+        ]
+
+        # Logged in chunks as the sends complete
+        sent_rows, _ = await _send_and_log(
+            "re_engagement_messages",
+            [
+                (
+                    customer,
+                    message_text,
                     {
-                        "customer_id": customer["id"],
+                        "customer_id": customer["customer_id"],
                         "store_id": store_id,
-                        "message_number": 1,
+                        "message_number": message_number,
                         "message_text": message_text,
                         "responded": False,
-                    }
-                ).execute()
-                sent_first += 1
-                print(f"📨 Re-engagement msg 1 sent to {customer['name']}")
-            except Exception as send_exc:
-                print(f"❌ Failed to send re-engagement to {customer['name']}: {send_exc}")
-
-        # --- 3.5.3 Follow-up messages for non-responders after 7 days ---
-        followup_cutoff = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
-        pending_result = (
-            supabase.table("re_engagement_messages")
-            .select("id, customer_id, customers(name, telegram_chat_id, last_order_date)")
-            .eq("store_id", store_id)
-            .eq("message_number", 1)
-            .eq("responded", False)
-            .lte("sent_at", followup_cutoff)
-            .execute()
-        )
-        pending_followups = pending_result.data or []
-
-        for record in pending_followups:
-            # Check we haven't already sent message 2
-            already_followup = (
-                supabase.table("re_engagement_messages")
-                .select("id")
-                .eq("customer_id", record["customer_id"])
-                .eq("store_id", store_id)
-                .eq("message_number", 2)
-                .execute()
-            )
-            if already_followup.data:
-                continue
-
-            customer = record.get("customers", {})
-            chat_id = customer.get("telegram_chat_id")
-            if not chat_id:
-                continue
-
-            last_order_raw = customer.get("last_order_date")
-            days_since = 0
-            if last_order_raw:
-                last_order_date = datetime.fromisoformat(
-                    last_order_raw.replace("Z", "+00:00")
-                )
-                days_since = (datetime.now(timezone.utc) - last_order_date).days
-
-            message_text = _generate_reengagement_message(
-                customer.get("name", "there"), days_since, message_number=2
-            )
-
-            try:
-                await bot.send_message(
-                    chat_id=chat_id,
-                    text=message_text,
-                    parse_mode="Markdown",
+                    },
                 )
-                supabase.table("re_engagement_messages").insert(
-                    {
-                        "customer_id": record["customer_id"],
-                        "store_id": store_id,
-                        "message_number": 2,
-                        "message_text": message_text,
-                        "responded": False,
-                    }
-                ).execute()
-                sent_followup += 1
-                print(f"📨 Re-engagement follow-up sent to {customer.get('name')}")
-            except Exception as send_exc:
-                print(f"❌ Failed to send follow-up: {send_exc}")
+                for (customer, message_number), message_text in zip(batch, messages)
+            ],
+        )
+        sent_followup = sum(1 for row in sent_rows if row["message_number"] == 2)
+        sent_first = len(sent_rows) - sent_followup
 
     except Exception as exc:
         print(f"❌ run_re_engagement error: {exc}")
@@ -389,8 +495,6 @@ async def run_lifecycle_jobs(store_id: str) -> None:
 
 
 if __name__ == "__main__":
-    import asyncio
-
     if len(sys.argv) < 2:
         print("Usage: python customer_lifecycle_agent.py <store_id>")
         sys.exit(1)
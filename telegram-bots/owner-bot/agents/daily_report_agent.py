@@ -2,28 +2,29 @@
 AI-Powered Daily Report Agent - Uses Claude for intelligent business insights
 Analyzes daily performance and provides actionable recommendations
 """
+import asyncio
 import os
 from datetime import datetime, date
-from anthropic import Anthropic
-from telegram import Bot
+from anthropic import AsyncAnthropic
 from supabase import create_client
 from dotenv import load_dotenv
 import json
 
 load_dotenv()
 
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+from agents.outbound import OWNER_BOT_TOKEN, PRIORITY_REPORT, outbound
+
+client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 supabase = create_client(
     os.getenv("SUPABASE_URL"),
     os.getenv("SUPABASE_KEY")
 )
-bot = Bot(token=os.getenv("OWNER_BOT_TOKEN"))
 
 async def generate_daily_report(store_id: str):
     """Generate AI-powered daily sales report with insights"""
     try:
         # Get store details
-        store = supabase.table("stores").select("*").eq("id", store_id).single().execute()
+        store = await asyncio.to_thread(supabase.table("stores").select("*").eq("id", store_id).single().execute)
         
         if not store.data:
             return False
@@ -35,11 +36,13 @@ async def generate_daily_report(store_id: str):
         today = date.today().isoformat()
         
         # Get today's orders with details
-        orders = supabase.table("orders")\
-            .select("*, order_items(*, products(name, category_id, categories(name)))")\
-            .eq("store_id", store_id)\
-            .gte("created_at", today)\
-            .execute()
+        orders = await asyncio.to_thread(
+            supabase.table("orders")
+            .select("*, order_items(*, products(name, category_id, categories(name)))")
+            .eq("store_id", store_id)
+            .gte("created_at", today)
+            .execute
+        )
         
         if not orders.data:
             simple_message = f"""
@@ -49,7 +52,7 @@ No orders today.
 
 💡 *AI Suggestion:* Consider promoting your products or reaching out to regular customers!
 """
-            await bot.send_message(chat_id=chat_id, text=simple_message, parse_mode='Markdown')
+            await outbound.send(OWNER_BOT_TOKEN, chat_id, simple_message, priority=PRIORITY_REPORT, parse_mode='Markdown')
             return True
         
         # Calculate stats
@@ -104,7 +107,7 @@ Provide:
 
 Format as a clear, motivating Telegram message with emojis. Keep it concise but insightful."""
 
-        message = client.messages.create(
+        message = await client.messages.create(
             model="claude-sonnet-4-5",
             max_tokens=1024,
             messages=[{
@@ -127,9 +130,11 @@ Format as a clear, motivating Telegram message with emojis. Keep it concise but
 {ai_insights}
 """
         
-        await bot.send_message(
-            chat_id=chat_id,
-            text=final_report,
+        await outbound.send(
+            OWNER_BOT_TOKEN,
+            chat_id,
+            final_report,
+            priority=PRIORITY_REPORT,
             parse_mode='Markdown'
         )
         
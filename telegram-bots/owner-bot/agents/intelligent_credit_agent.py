@@ -2,9 +2,9 @@
 Intelligent Credit Analyzer - Uses Claude AI for credit risk assessment
 Provides personalized collection strategies and payment predictions
 """
+import asyncio
 import os
-from anthropic import Anthropic
-from telegram import Bot
+from anthropic import AsyncAnthropic
 from supabase import create_client
 from dotenv import load_dotenv
 from datetime import datetime
@@ -12,18 +12,19 @@ import json
 
 load_dotenv()
 
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+from agents.outbound import OWNER_BOT_TOKEN, PRIORITY_REPORT, outbound
+
+client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 supabase = create_client(
     os.getenv("SUPABASE_URL"),
     os.getenv("SUPABASE_KEY")
 )
-bot = Bot(token=os.getenv("OWNER_BOT_TOKEN"))
 
 async def analyze_credit_with_ai(store_id: str):
     """Use Claude to analyze credit patterns and provide collection strategies"""
     try:
         # Get store details
-        store = supabase.table("stores").select("*").eq("id", store_id).single().execute()
+        store = await asyncio.to_thread(supabase.table("stores").select("*").eq("id", store_id).single().execute)
         if not store.data:
             return False
         
@@ -32,11 +33,13 @@ async def analyze_credit_with_ai(store_id: str):
             return False
         
         # Get credit orders (unpaid orders)
-        orders = supabase.table("orders")\
-            .select("*, customers(name, phone)")\
-            .eq("store_id", store_id)\
-            .eq("payment_status", "unpaid")\
-            .execute()
+        orders = await asyncio.to_thread(
+            supabase.table("orders")
+            .select("*, customers(name, phone)")
+            .eq("store_id", store_id)
+            .eq("payment_status", "unpaid")
+            .execute
+        )
         
         if not orders.data or len(orders.data) == 0:
             print(f"✅ No credit orders for store {store_id}")
@@ -79,7 +82,7 @@ Provide:
 Format as a clear, actionable Telegram message with emojis.
 Be professional but empathetic - these are small business relationships."""
 
-        message = client.messages.create(
+        message = await client.messages.create(
             model="claude-sonnet-4-5",
             max_tokens=1024,
             messages=[{
@@ -91,9 +94,11 @@ Be professional but empathetic - these are small business relationships."""
         ai_analysis = message.content[0].text
         
         # Send AI analysis
-        await bot.send_message(
-            chat_id=chat_id,
-            text=f"💳 *AI Credit Analysis*\n\n{ai_analysis}",
+        await outbound.send(
+            OWNER_BOT_TOKEN,
+            chat_id,
+            f"💳 *AI Credit Analysis*\n\n{ai_analysis}",
+            priority=PRIORITY_REPORT,
             parse_mode='Markdown'
         )
         
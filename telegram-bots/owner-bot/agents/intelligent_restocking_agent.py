@@ -2,9 +2,10 @@
 Intelligent Restocking Agent - Uses Claude AI for smart inventory decisions
 Analyzes patterns, predicts demand, and provides actionable insights
 """
+import asyncio
 import os
-from anthropic import Anthropic
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from anthropic import AsyncAnthropic
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from supabase import create_client
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
@@ -13,18 +14,19 @@ import json
 
 load_dotenv()
 
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+from agents.outbound import OWNER_BOT_TOKEN, PRIORITY_CRITICAL, PRIORITY_REPORT, outbound
+
+client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 supabase = create_client(
     os.getenv("SUPABASE_URL"),
     os.getenv("SUPABASE_KEY")
 )
-bot = Bot(token=os.getenv("OWNER_BOT_TOKEN"))
 
 async def analyze_inventory_with_ai(store_id: str):
     """Use Claude to analyze inventory and provide intelligent recommendations"""
     try:
         # Get store details
-        store = supabase.table("stores").select("*").eq("id", store_id).single().execute()
+        store = await asyncio.to_thread(supabase.table("stores").select("*").eq("id", store_id).single().execute)
         if not store.data:
             return False
         
@@ -33,18 +35,22 @@ async def analyze_inventory_with_ai(store_id: str):
             return False
         
         # Get inventory data
-        inventory = supabase.table("inventory")\
-            .select("*, products(name, supplier_name, supplier_whatsapp, cost_price, unit)")\
-            .eq("store_id", store_id)\
-            .execute()
+        inventory = await asyncio.to_thread(
+            supabase.table("inventory")
+            .select("*, products(name, supplier_name, supplier_whatsapp, cost_price, unit)")
+            .eq("store_id", store_id)
+            .execute
+        )
         
         # Get recent orders (last 30 days)
         month_ago = (datetime.now() - timedelta(days=30)).isoformat()
-        orders = supabase.table("order_items")\
-            .select("*, orders!inner(store_id, created_at), products(name)")\
-            .eq("orders.store_id", store_id)\
-            .gte("orders.created_at", month_ago)\
-            .execute()
+        orders = await asyncio.to_thread(
+            supabase.table("order_items")
+            .select("*, orders!inner(store_id, created_at), products(name)")
+            .eq("orders.store_id", store_id)
+            .gte("orders.created_at", month_ago)
+            .execute
+        )
         
         # Prepare data for Claude
         inventory_summary = []
@@ -91,7 +97,7 @@ Analyze this inventory data and provide:
 Format your response as a clear, actionable Telegram message with emojis.
 Keep it concise but insightful. Focus on actionable recommendations."""
 
-        message = client.messages.create(
+        message = await client.messages.create(
             model="claude-sonnet-4-5",
             max_tokens=1024,
             messages=[{
@@ -103,9 +109,11 @@ Keep it concise but insightful. Focus on actionable recommendations."""
         ai_analysis = message.content[0].text
         
         # Send AI analysis to owner
-        await bot.send_message(
-            chat_id=chat_id,
-            text=f"🤖 *AI Inventory Analysis*\n\n{ai_analysis}",
+        await outbound.send(
+            OWNER_BOT_TOKEN,
+            chat_id,
+            f"🤖 *AI Inventory Analysis*\n\n{ai_analysis}",
+            priority=PRIORITY_REPORT,
             parse_mode='Markdown'
         )
         
@@ -131,11 +139,13 @@ Keep it concise but insightful. Focus on actionable recommendations."""
                 keyboard = [[InlineKeyboardButton("📱 Contact Supplier", url=whatsapp_url)]]
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
-                await bot.send_message(
-                    chat_id=chat_id,
-                    text=f"⚠️ *Critical: {item['product']}*\n"
-                         f"Stock: {item['current_stock']:.0f} {item['unit']}\n"
-                         f"Suggested reorder: {reorder_qty:.0f} {item['unit']}",
+                await outbound.send(
+                    OWNER_BOT_TOKEN,
+                    chat_id,
+                    f"⚠️ *Critical: {item['product']}*\n"
+                    f"Stock: {item['current_stock']:.0f} {item['unit']}\n"
+                    f"Suggested reorder: {reorder_qty:.0f} {item['unit']}",
+                    priority=PRIORITY_CRITICAL,
                     parse_mode='Markdown',
                     reply_markup=reply_markup
                 )
@@ -0,0 +1,23 @@
+"""
+Shared Telegram outbound service for owner-bot agents.
+Loads agent-service/agents/telegram_outbound.py so every scheduled agent
+sends through one pooled bot with shared rate limits.
+"""
+import os
+import sys
+from pathlib import Path
+
+_agent_path = Path(__file__).parent.parent.parent.parent / "agent-service" / "agents"
+if str(_agent_path) not in sys.path:
+    sys.path.insert(0, str(_agent_path))
+
+from telegram_outbound import (  # noqa: E402
+    PRIORITY_BULK,
+    PRIORITY_CRITICAL,
+    PRIORITY_NORMAL,
+    PRIORITY_REPORT,
+    outbound,
+)
+
+OWNER_BOT_TOKEN = os.getenv("OWNER_BOT_TOKEN", "")
+CUSTOMER_BOT_TOKEN = os.getenv("CUSTOMER_BOT_TOKEN", "")
@@ -1,10 +1,21 @@
 """
 Agent Scheduler - Runs AI-powered agents at scheduled times
+
+All jobs share one asyncio event loop (agent-service/agents/store_scheduler.py).
+Each firing fans out over every store with a bounded worker pool, spreads
+store starts across the job's window with jitter and gives each store its
+own timeout, so a job's last store finishes within window + timeout of the
+scheduled time. Jobs due at the same time (the 10:00 ones) run side by side.
+
+Any number of scheduler processes (scheduler.py, scheduler_render.py) may
+run at once: they split the stores by shard through Redis and claim each
+(job, store, firing) before running it (agent-service/agents/scheduler_leases.py).
 """
 import os
 import asyncio
-import schedule
-import time
+import functools
+import importlib
+import logging
 from datetime import datetime
 from supabase import create_client
 from dotenv import load_dotenv
@@ -21,15 +32,41 @@ from agents.daily_report_agent import generate_daily_report
 from agents.intelligent_restocking_agent import analyze_inventory_with_ai
 from agents.intelligent_credit_agent import analyze_credit_with_ai
 from agents.customer_lifecycle_agent import (
+    prepare_birthday_messages,
     send_birthday_wishes,
     run_re_engagement,
 )
 
+# owner-bot has its own ``agents`` package, so agent-service modules are
+# loaded from agent-service/agents as top-level modules
+_agent_service_path = root_dir / "agent-service"
+for _path in (_agent_service_path, _agent_service_path / "agents"):
+    if str(_path) not in sys.path:
+        sys.path.append(str(_path))
+
+from store_scheduler import StoreJob, StoreJobScheduler  # noqa: E402
+from scheduler_leases import ReplicaCoordinator  # noqa: E402
+
+try:
+    from redis_client import get_async_client as _get_async_redis
+except ImportError:
+    _get_async_redis = None
+
+# Replicas with the same group share one set of jobs
+SCHEDULER_GROUP = os.getenv("SCHEDULER_GROUP", "owner-bot-scheduler")
+
 supabase = create_client(
     os.getenv("SUPABASE_URL"),
     os.getenv("SUPABASE_KEY")
 )
 
+# Stores processed at once per job, and the window store starts are spread over
+STORE_CONCURRENCY = int(os.getenv("SCHEDULER_STORE_CONCURRENCY", "10"))
+REPORT_WINDOW_SECONDS = int(os.getenv("SCHEDULER_REPORT_WINDOW_SECONDS", str(15 * 60)))
+# Nightly database jobs are heavier per store and nobody is waiting on them
+BATCH_CONCURRENCY = int(os.getenv("SCHEDULER_BATCH_CONCURRENCY", "4"))
+BATCH_WINDOW_SECONDS = 5 * 60
+
 def get_all_stores():
     """Get all active stores"""
     try:
@@ -40,158 +77,149 @@ def get_all_stores():
         return []
 
 
-async def run_daily_reports():
-    """Run daily reports for all stores at closing time"""
-    print(f"[{datetime.now()}] 🌙 Running end-of-day reports...")
-    stores = get_all_stores()
-    
-    for store in stores:
-        try:
-            await generate_daily_report(store['id'])
-            await asyncio.sleep(2)
-        except Exception as e:
-            print(f"Error running daily report for {store['name']}: {e}")
+async def load_stores():
+    return await asyncio.to_thread(get_all_stores)
 
 
-async def run_ai_inventory_analysis():
-    """Run AI-powered inventory analysis"""
-    print(f"[{datetime.now()}] 🤖 Running AI Inventory Analysis...")
-    stores = get_all_stores()
-    
-    for store in stores:
-        try:
-            await analyze_inventory_with_ai(store['id'])
-            await asyncio.sleep(3)
-        except Exception as e:
-            print(f"Error running AI analysis for {store['name']}: {e}")
+@functools.lru_cache(maxsize=None)
+def _agent_service_module(name: str):
+    return importlib.import_module(name)
 
 
-async def run_ai_credit_analysis():
-    """Run AI-powered credit analysis at closing time"""
-    print(f"[{datetime.now()}] 💳 Running AI Credit Analysis...")
-    stores = get_all_stores()
-    
-    for store in stores:
-        try:
-            await analyze_credit_with_ai(store['id'])
-            await asyncio.sleep(2)
-        except Exception as e:
-            print(f"Error running AI credit analysis for {store['name']}: {e}")
+# ---------------------------------------------------------------------------
+# Per-store job bodies
+# ---------------------------------------------------------------------------
 
+async def run_daily_report(store):
+    """End-of-day report for one store"""
+    return await generate_daily_report(store['id'])
 
-async def run_birthday_wishes():
-    """Send birthday wishes to customers at 9 AM"""
-    print(f"[{datetime.now()}] 🎂 Running Birthday Wishes...")
-    stores = get_all_stores()
 
-    for store in stores:
-        try:
-            await send_birthday_wishes(store['id'])
-            await asyncio.sleep(1)
-        except Exception as e:
-            print(f"Error sending birthday wishes for {store['name']}: {e}")
-
-
-async def run_vip_detection():
-    """Run VIP detection for all stores"""
-    print(f"[{datetime.now()}] ⭐ Running VIP Detection...")
-    import sys as _sys
-    import os as _os
-    agent_service_path = _os.path.join(
-        _os.path.dirname(__file__), "..", "..", "agent-service"
-    )
-    _sys.path.insert(0, agent_service_path)
-    try:
-        from agents.customer_lifecycle_agent import VIPDetector
-        detector = VIPDetector()
-        stores = get_all_stores()
-        for store in stores:
-            try:
-                result = detector.update_vip_flags(store['id'])
-                print(f"VIP update for {store['name']}: {result}")
-                await asyncio.sleep(1)
-            except Exception as e:
-                print(f"Error running VIP detection for {store['name']}: {e}")
-    except ImportError as e:
-        print(f"⚠️ Could not import VIPDetector: {e}")
-
-
-async def run_churn_prediction():
-    """Run churn prediction for all stores"""
-    print(f"[{datetime.now()}] 📉 Running Churn Prediction...")
-    import sys as _sys
-    import os as _os
-    agent_service_path = _os.path.join(
-        _os.path.dirname(__file__), "..", "..", "agent-service"
-    )
-    _sys.path.insert(0, agent_service_path)
-    try:
-        from agents.customer_lifecycle_agent import ChurnPredictor
-        predictor = ChurnPredictor()
-        stores = get_all_stores()
-        for store in stores:
-            try:
-                result = predictor.update_churn_risk(store['id'])
-                print(f"Churn update for {store['name']}: {result}")
-                await asyncio.sleep(1)
-            except Exception as e:
-                print(f"Error running churn prediction for {store['name']}: {e}")
-    except ImportError as e:
-        print(f"⚠️ Could not import ChurnPredictor: {e}")
-
-
-async def run_re_engagement_jobs():
-    """Run re-engagement messages for at-risk customers"""
-    print(f"[{datetime.now()}] 📨 Running Re-engagement Jobs...")
-    stores = get_all_stores()
-
-    for store in stores:
+async def run_ai_inventory_analysis(store):
+    """AI-powered inventory analysis for one store"""
+    return await analyze_inventory_with_ai(store['id'])
+
+
+async def run_ai_credit_analysis(store):
+    """AI-powered credit analysis for one store"""
+    return await analyze_credit_with_ai(store['id'])
+
+
+async def run_prepare_birthday_messages(store):
+    """Write today's birthday messages for one store ahead of the 9 AM send"""
+    return await prepare_birthday_messages(store['id'])
+
+
+async def run_birthday_wishes(store):
+    """Birthday wishes for one store's customers"""
+    return await send_birthday_wishes(store['id'])
+
+
+@functools.lru_cache(maxsize=None)
+def _vip_detector():
+    return _agent_service_module("customer_lifecycle_agent").VIPDetector()
+
+
+@functools.lru_cache(maxsize=None)
+def _churn_predictor():
+    return _agent_service_module("customer_lifecycle_agent").ChurnPredictor()
+
+
+async def run_vip_detection(store):
+    """VIP detection for one store"""
+    result = await asyncio.to_thread(_vip_detector().update_vip_flags, store['id'])
+    print(f"VIP update for {store['name']}: {result}")
+
+
+async def run_churn_prediction(store):
+    """Churn prediction for one store"""
+    result = await asyncio.to_thread(_churn_predictor().update_churn_risk, store['id'])
+    print(f"Churn update for {store['name']}: {result}")
+
+
+async def run_credit_rescore(store):
+    """Bulk-rescore credit scores and limits for one store"""
+    rescore_store = _agent_service_module("credit_scoring_engine").rescore_store
+    result = await asyncio.to_thread(rescore_store, store['id'], db_conn=supabase)
+    print(f"Credit rescore for {store['name']}: {result.get('customers_updated', 0)} updated")
+
+
+async def run_re_engagement_job(store):
+    """Re-engagement messages for one store's at-risk customers"""
+    return await run_re_engagement(store['id'])
+
+
+def build_coordinator() -> ReplicaCoordinator:
+    """Coordinate with other scheduler replicas through Redis (single replica without it)"""
+    redis = None
+    if _get_async_redis is not None:
         try:
-            await run_re_engagement(store['id'])
-            await asyncio.sleep(2)
+            redis = _get_async_redis()
         except Exception as e:
-            print(f"Error running re-engagement for {store['name']}: {e}")
+            print(f"⚠️ Redis unavailable, scheduling as a single replica: {e}")
+    return ReplicaCoordinator(redis, group=SCHEDULER_GROUP)
+
+
+def build_scheduler() -> StoreJobScheduler:
+    """Register all AI agent jobs"""
+    scheduler = StoreJobScheduler(load_stores, coordinator=build_coordinator())
+
+    def report_job(name, times, run_store, store_timeout=120):
+        return scheduler.add(StoreJob(
+            name, times, run_store,
+            concurrency=STORE_CONCURRENCY,
+            window_seconds=REPORT_WINDOW_SECONDS,
+            store_timeout=store_timeout,
+        ))
+
+    def batch_job(name, times, run_store):
+        return scheduler.add(StoreJob(
+            name, times, run_store,
+            concurrency=BATCH_CONCURRENCY,
+            window_seconds=BATCH_WINDOW_SECONDS,
+            store_timeout=300,
+        ))
 
-
-def schedule_jobs():
-    """Schedule all AI agent jobs"""
-    
     # AI Inventory Analysis - Twice daily (10 AM, 4 PM)
-    schedule.every().day.at("10:00").do(lambda: asyncio.run(run_ai_inventory_analysis()))
-    schedule.every().day.at("16:00").do(lambda: asyncio.run(run_ai_inventory_analysis()))
-    
+    report_job("ai_inventory_analysis", ["10:00", "16:00"], run_ai_inventory_analysis)
+
     # Daily report at closing time (9 PM)
-    schedule.every().day.at("21:00").do(lambda: asyncio.run(run_daily_reports()))
-    
+    report_job("daily_reports", ["21:00"], run_daily_report)
+
     # AI Credit analysis at closing time (9:05 PM)
-    schedule.every().day.at("21:05").do(lambda: asyncio.run(run_ai_credit_analysis()))
+    report_job("ai_credit_analysis", ["21:05"], run_ai_credit_analysis)
 
-    # 3.3.1 Birthday wishes at 9 AM daily
-    schedule.every().day.at("09:00").do(lambda: asyncio.run(run_birthday_wishes()))
+    # 3.3.1 Birthday messages prepared at 3 AM, sent at 9 AM daily
+    batch_job("birthday_messages", ["03:00"], run_prepare_birthday_messages)
+    report_job("birthday_wishes", ["09:00"], run_birthday_wishes, store_timeout=300)
 
     # 3.7 VIP detection - daily at 2 AM (low traffic)
-    schedule.every().day.at("02:00").do(lambda: asyncio.run(run_vip_detection()))
+    batch_job("vip_detection", ["02:00"], run_vip_detection)
 
     # 3.7 Churn prediction - daily at 2:05 AM
-    schedule.every().day.at("02:05").do(lambda: asyncio.run(run_churn_prediction()))
+    batch_job("churn_prediction", ["02:05"], run_churn_prediction)
+
+    # 4.1 Credit rescore - daily at 2:10 AM
+    batch_job("credit_rescore", ["02:10"], run_credit_rescore)
 
     # 3.5.3 Re-engagement messages - daily at 10 AM
-    schedule.every().day.at("10:00").do(lambda: asyncio.run(run_re_engagement_jobs()))
-    
+    report_job("re_engagement", ["10:00"], run_re_engagement_job, store_timeout=300)
+
     print("✅ AI Agent Scheduler started!")
     print("🤖 AI Inventory Analysis: 10:00 AM, 4:00 PM")
     print("🌙 End-of-Day Reports: 9:00 PM")
     print("💳 AI Credit Analysis: 9:05 PM")
-    print("🎂 Birthday Wishes: 9:00 AM")
+    print("🎂 Birthday Wishes: prepared 3:00 AM, sent 9:00 AM")
     print("⭐ VIP Detection: 2:00 AM")
     print("📉 Churn Prediction: 2:05 AM")
+    print("💳 Credit Rescore: 2:10 AM")
     print("📨 Re-engagement Messages: 10:00 AM")
+    print(f"⏱️ Reports reach every store within {(REPORT_WINDOW_SECONDS + 120) // 60} min "
+          f"({STORE_CONCURRENCY} stores at a time)")
+    return scheduler
 
 
 if __name__ == "__main__":
-    schedule_jobs()
-    
-    # Keep running
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    print(f"[{datetime.now()}] 🚀 Starting agent scheduler")
+    asyncio.run(build_scheduler().run_forever())